@@ -4,9 +4,11 @@ import time
 import json
 import asyncio
 import signal
+import tempfile
+import threading
 from datetime import datetime, timedelta, date
 from zoneinfo import ZoneInfo
-from typing import Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 from collections import deque
 from dataclasses import dataclass
 import urllib.request
@@ -20,13 +22,10 @@ from telethon.tl import functions as tl_functions
 
 from tg_to_sheets import (
     sheets_client,
-    get_or_create_worksheet,
     ensure_headers,
     build_chat_link_app,
     normalize_username,
     normalize_text,
-    acquire_lock,
-    release_lock,
     CONTACT_TEXT,
     INTEREST_TEXT,
     DATING_TEXT,
@@ -47,6 +46,7 @@ from tg_to_sheets import (
     REFERRAL_TEXT,
 )
 from auto_reply_classifiers import (
+    CombinedTurnClassifier,
     Intent,
     classify_intent,
     is_continue_phrase as is_continue_phrase_impl,
@@ -69,13 +69,32 @@ from auto_reply_state import (
     StepState as StepStateStore,
     adjust_to_followup_window,
 )
-from gspread.exceptions import APIError
+from gspread.exceptions import APIError, WorksheetNotFound
 from registration_ingest import (
     build_message_link as build_registration_message_link,
     is_media_registration_message,
     parse_registration_message,
 )
-from sheets_queue import SheetsQueueStore, calculate_backoff_sec
+from sheets_session import SpreadsheetSession, apply_header_column_fix, col_letter
+from lazy_resource import LazyResource
+from sheet_index import CellPatchBuffer, PeerRowCache, SheetRowIndex, WriteGeneration
+from registration_pipeline import DriveUploadIndex, SettlingWorkPool, stream_sha256, telegram_media_key
+from form_import_reader import FormResponsesReader, IdleBackoff, TouchNotifier
+from message_cache import PeerMessageCache
+from peer_actor import PeerActorPool, PeerTurnCancelled
+from reply_coalescer import AdaptiveCoalescer
+from speculative_answers import SpeculativeAnswers
+from send_scheduler import PRIORITY_FOLLOWUP, PRIORITY_LIVE, OutboundScheduler
+from http_pool import JsonHttpPool
+from file_lock import FileLock, acquire_lock, lock_wait_stats, release_lock
+from owner_registry import OwnerRegistry as CrossAccountOwnerStore
+from sheets_queue import (
+    SheetsQueueStore,
+    calculate_backoff_sec,
+    is_poison_error,
+    is_transient_error,
+    merge_event_payload,
+)
 from flow_engine import (
     BALANCE_CHECKPOINT_AFTER_COMPANY_INTRO_OFFER_VOICE,
     BALANCE_CHECKPOINT_AFTER_SCHEDULE_CONFIRM_QUESTION,
@@ -109,9 +128,10 @@ from faq_service import (
     build_voice_text_recap_blocks,
     normalize_question,
 )
-from content_dispatcher import dispatch_content, validate_content_env
+from content_dispatcher import DispatchProgress, dispatch_content, validate_content_env
 from candidate_notes import append_candidate_answers
-from faq_learning import build_question_log
+from faq_learning import ClusterStat, FAQQuestionStats, build_question_log
+from question_clusters import QuestionClusterIndex
 from followup_training import get_return_examples
 from v2_state import V2EnrollmentStore, V2RuntimeStore
 from hr_filter_store import HrFilterStore, HrForwardDeduper
@@ -138,6 +158,10 @@ AUTO_REPLY_LOCK = os.environ.get("AUTO_REPLY_LOCK", "/opt/tg_leads/.auto_reply.l
 AUTO_REPLY_LOCK_TTL = int(os.environ.get("AUTO_REPLY_LOCK_TTL", "300"))
 REPLY_DEBOUNCE_SEC = float(os.environ.get("REPLY_DEBOUNCE_SEC", "3"))
 SCREENING_REPLY_DEBOUNCE_SEC = float(os.environ.get("SCREENING_REPLY_DEBOUNCE_SEC", "0.5"))
+COALESCE_MIN_SEC = float(os.environ.get("COALESCE_MIN_SEC", "0.5"))
+COALESCE_MAX_HOLD_SEC = float(os.environ.get("COALESCE_MAX_HOLD_SEC", "10"))
+COALESCE_TYPING_TTL_SEC = float(os.environ.get("COALESCE_TYPING_TTL_SEC", "6"))
+SPECULATIVE_ANSWERS_ENABLED = os.environ.get("SPECULATIVE_ANSWERS_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
 BOT_REPLY_DELAY_SEC = float(os.environ.get("BOT_REPLY_DELAY_SEC", "5"))
 QUESTION_GAP_SEC = float(os.environ.get("QUESTION_GAP_SEC", "5"))
 QUESTION_RESPONSE_DELAY_SEC = float(os.environ.get("QUESTION_RESPONSE_DELAY_SEC", "10"))
@@ -154,8 +178,11 @@ V2_FOLLOWUP_WINDOW_START_HOUR = int(os.environ.get("V2_FOLLOWUP_WINDOW_START_HOU
 V2_FOLLOWUP_WINDOW_END_HOUR = int(os.environ.get("V2_FOLLOWUP_WINDOW_END_HOUR", "19"))
 V2_MAX_REMINDERS_PER_PEER = int(os.environ.get("V2_MAX_REMINDERS_PER_PEER", "2"))
 SENT_MESSAGE_CACHE_LIMIT = int(os.environ.get("SENT_MESSAGE_CACHE_LIMIT", "200"))
-JOURNAL_MAX_LINES_PER_CHAT = int(os.environ.get("JOURNAL_MAX_LINES_PER_CHAT", "500"))
-JOURNAL_DEDUP_TAIL_LINES = int(os.environ.get("JOURNAL_DEDUP_TAIL_LINES", "10"))
+PEER_MESSAGE_CACHE_SIZE = int(os.environ.get("PEER_MESSAGE_CACHE_SIZE", "50"))
+SEND_RATE_PER_SEC = float(os.environ.get("SEND_RATE_PER_SEC", "1.0"))
+SEND_RATE_BURST = int(os.environ.get("SEND_RATE_BURST", "3"))
+SEND_WORKERS = int(os.environ.get("SEND_WORKERS", "4"))
+SEND_FLOOD_MAX_RETRIES = int(os.environ.get("SEND_FLOOD_MAX_RETRIES", "3"))
 SESSION_LOCK = os.environ.get("TELETHON_SESSION_LOCK", f"{SESSION_FILE}.lock")
 STATUS_PATH = os.environ.get("AUTO_REPLY_STATUS_PATH", "/opt/tg_leads/.auto_reply.status")
 FOLLOWUP_STATE_PATH = os.environ.get("AUTO_REPLY_FOLLOWUP_STATE_PATH", "/opt/tg_leads/.auto_reply.followup_state.json")
@@ -178,17 +205,25 @@ HISTORY_SHEET_PREFIX = os.environ.get("HISTORY_SHEET_PREFIX", "История")
 HISTORY_RETENTION_MONTHS = int(os.environ.get("HISTORY_RETENTION_MONTHS", "6"))
 PAUSED_STATE_PATH = os.environ.get("AUTO_REPLY_PAUSED_STATE_PATH", "/opt/tg_leads/.auto_reply.paused.json")
 CROSS_ACCOUNT_OWNER_STATE_PATH = os.environ.get("CROSS_ACCOUNT_OWNER_STATE_PATH", "/opt/tg_leads/state/lead_owner_map.json")
+CROSS_ACCOUNT_OWNER_DB_PATH = os.environ.get(
+    "CROSS_ACCOUNT_OWNER_DB_PATH",
+    f"{os.path.splitext(CROSS_ACCOUNT_OWNER_STATE_PATH)[0]}.sqlite",
+)
 ALT_GROUP_START_DELAY_SEC = float(os.environ.get("ALT_GROUP_START_DELAY_SEC", "300"))
 ALT_STRICT_GROUP_ONLY = os.environ.get("ALT_STRICT_GROUP_ONLY", "1").strip().lower() in {"1", "true", "yes", "on"}
 ALT_OWNER_CHECK_WITH_SHEET = os.environ.get("ALT_OWNER_CHECK_WITH_SHEET", "1").strip().lower() in {"1", "true", "yes", "on"}
 GROUP_LEADS_UPSERT_LOCK = os.environ.get("GROUP_LEADS_UPSERT_LOCK", "/opt/tg_leads/.group_leads_upsert.lock")
 REGISTRATION_UPSERT_LOCK = os.environ.get("REGISTRATION_UPSERT_LOCK", "/opt/tg_leads/.registration_upsert.lock")
+HEADER_FIX_LOCK_DIR = os.environ.get("HEADER_FIX_LOCK_DIR", "/opt/tg_leads")
 FORM_IMPORT_ENABLED = os.environ.get("FORM_IMPORT_ENABLED", "0").strip().lower() in {"1", "true", "yes", "on"}
 FORM_IMPORT_SPREADSHEET_ID = os.environ.get("FORM_IMPORT_SPREADSHEET_ID", "1ufUPD4tGpbvQWtEZH0QY8FP0_DhyB6FnlO8E7pjTEPc").strip()
 FORM_IMPORT_WORKSHEET_INDEX = int(os.environ.get("FORM_IMPORT_WORKSHEET_INDEX", "0"))
 FORM_IMPORT_POLL_SEC = float(os.environ.get("FORM_IMPORT_POLL_SEC", "30"))
+FORM_IMPORT_MAX_POLL_SEC = float(os.environ.get("FORM_IMPORT_MAX_POLL_SEC", "300"))
+FORM_IMPORT_HEADERS_MAX_AGE_SEC = float(os.environ.get("FORM_IMPORT_HEADERS_MAX_AGE_SEC", "600"))
 FORM_IMPORT_STATE_PATH = os.environ.get("FORM_IMPORT_STATE_PATH", os.path.join(STATE_DIR, "form_import_state.json"))
 FORM_IMPORT_CONTROL_PATH = os.environ.get("FORM_IMPORT_CONTROL_PATH", os.path.join(STATE_DIR, "form_import_control.json"))
+FORM_IMPORT_NOTIFY_PATH = os.environ.get("FORM_IMPORT_NOTIFY_PATH", os.path.join(STATE_DIR, "form_import_notify"))
 
 TODAY_HEADERS = [
     "Дата",
@@ -210,24 +245,6 @@ TODAY_HEADERS = [
     "Дата первого старта",
 ]
 
-HISTORY_HEADERS = [
-    "Имя",
-    "Username",
-    "Аккаунт",
-    "Автоответчик",
-    "Статус",
-    "Peer ID",
-    "Ссылка на чат",
-    "Входящее",
-    "Исходящее",
-    "Тип события",
-    "Создано",
-    "Обновлено",
-    "Время события",
-    "Дата",
-    "Журнал событий",
-]
-
 USERNAME_RE = re.compile(r"(?:@|t\.me/)([A-Za-z0-9_]{5,})")
 PHONE_RE = re.compile(r"\+?\d[\d\s\-\(\)]{9,}\d")
 MESSAGE_LINK_RE = re.compile(r"https?://t\.me/(c/)?([A-Za-z0-9_]+)/(\d+)")
@@ -244,15 +261,31 @@ DIALOG_REFUSAL_URL = os.environ.get("DIALOG_REFUSAL_URL", "http://127.0.0.1:3000
 DIALOG_REFUSAL_TIMEOUT_SEC = float(os.environ.get("DIALOG_REFUSAL_TIMEOUT_SEC", "15"))
 DIALOG_FORMAT_URL = os.environ.get("DIALOG_FORMAT_URL", "http://127.0.0.1:3000/format_choice")
 DIALOG_FORMAT_TIMEOUT_SEC = float(os.environ.get("DIALOG_FORMAT_TIMEOUT_SEC", "15"))
+DIALOG_CLASSIFY_URL = os.environ.get("DIALOG_CLASSIFY_URL", "http://127.0.0.1:3000/classify_turn")
+DIALOG_CLASSIFY_TIMEOUT_SEC = float(os.environ.get("DIALOG_CLASSIFY_TIMEOUT_SEC", "15"))
 STEP_STATE_PATH = os.environ.get("AUTO_REPLY_STEP_STATE_PATH", "/opt/tg_leads/.auto_reply.step_state.json")
 GROUP_LEADS_WORKSHEET = os.environ.get("GROUP_LEADS_WORKSHEET", "GroupLeads")
 HR_FILTERS_STATE_PATH = os.environ.get("HR_FILTERS_STATE_PATH", os.path.join(STATE_DIR, "hr_filters.json"))
 HR_FILTERS_CACHE_TTL_SEC = float(os.environ.get("HR_FILTERS_CACHE_TTL_SEC", "5"))
 HR_FORWARD_DEDUPE_PATH = os.environ.get("HR_FORWARD_DEDUPE_PATH", os.path.join(STATE_DIR, "hr_filter_forwards.json"))
+HR_FORWARD_DEDUPE_DB_PATH = os.environ.get(
+    "HR_FORWARD_DEDUPE_DB_PATH",
+    f"{os.path.splitext(HR_FORWARD_DEDUPE_PATH)[0]}.sqlite",
+)
 REGISTRATION_WORKSHEET = os.environ.get("REGISTRATION_WORKSHEET", "Регистрация")
 REGISTRATION_DRIVE_FOLDER_ID = os.environ.get("REGISTRATION_DRIVE_FOLDER_ID", "").strip()
 REGISTRATION_DOWNLOAD_DIR = os.environ.get("REGISTRATION_DOWNLOAD_DIR", "/opt/tg_leads/registration_docs")
 REGISTRATION_PARSE_DELAY_SEC = float(os.environ.get("REGISTRATION_PARSE_DELAY_SEC", "60"))
+REGISTRATION_WORKERS = int(os.environ.get("REGISTRATION_WORKERS", "2"))
+REGISTRATION_PERMISSIONS_FLUSH_SEC = float(os.environ.get("REGISTRATION_PERMISSIONS_FLUSH_SEC", "30"))
+REGISTRATION_PERMISSIONS_BATCH = int(os.environ.get("REGISTRATION_PERMISSIONS_BATCH", "20"))
+REGISTRATION_PERMISSIONS_MAX_ATTEMPTS = int(os.environ.get("REGISTRATION_PERMISSIONS_MAX_ATTEMPTS", "5"))
+REGISTRATION_UPLOAD_INDEX_PATH = os.environ.get(
+    "REGISTRATION_UPLOAD_INDEX_PATH", os.path.join(STATE_DIR, "registration_uploads.sqlite")
+)
+REGISTRATION_SPOOL_MAX_BYTES = int(os.environ.get("REGISTRATION_SPOOL_MAX_MB", "8")) * 1024 * 1024
+# Drive resumable uploads need chunks in multiples of 256 KiB.
+REGISTRATION_UPLOAD_CHUNK_BYTES = max(1, int(os.environ.get("REGISTRATION_UPLOAD_CHUNK_MB", "5"))) * 1024 * 1024
 SHEETS_QUEUE_PATH = os.environ.get("AUTO_REPLY_SHEETS_QUEUE_PATH", "/opt/tg_leads/.sheet_events.sqlite")
 SHEETS_QUEUE_FLUSH_SEC = float(os.environ.get("AUTO_REPLY_SHEETS_QUEUE_FLUSH_SEC", "1"))
 SHEETS_QUEUE_BATCH_SIZE = int(os.environ.get("AUTO_REPLY_SHEETS_QUEUE_BATCH_SIZE", "20"))
@@ -260,7 +293,11 @@ SHEETS_QUEUE_LOG_SEC = int(os.environ.get("AUTO_REPLY_SHEETS_QUEUE_LOG_SEC", "30
 SHEETS_QUEUE_STALL_SEC = float(
     os.environ.get("AUTO_REPLY_SHEETS_QUEUE_STALL_SEC", str(max(60, SHEETS_QUEUE_LOG_SEC * 2)))
 )
+SHEETS_QUEUE_MAX_ATTEMPTS = int(os.environ.get("AUTO_REPLY_SHEETS_QUEUE_MAX_ATTEMPTS", "12"))
+SHEETS_QUEUE_COMPACT_SEC = float(os.environ.get("AUTO_REPLY_SHEETS_QUEUE_COMPACT_SEC", "3600"))
+SHEETS_HTTP_POOL_SIZE = int(os.environ.get("SHEETS_HTTP_POOL_SIZE", "16"))
 TODAY_UPSERT_DEBOUNCE_SEC = float(os.environ.get("TODAY_UPSERT_DEBOUNCE_SEC", "3.0"))
+TODAY_UPSERT_COALESCE = os.environ.get("TODAY_UPSERT_COALESCE", "1").strip().lower() in {"1", "true", "yes", "on"}
 GROUP_LEADS_LOOKUP_CACHE_TTL_SEC = int(os.environ.get("GROUP_LEADS_LOOKUP_CACHE_TTL_SEC", "60"))
 CONTINUE_DELAY_SEC = float(os.environ.get("AUTO_REPLY_CONTINUE_DELAY_SEC", "0"))
 FLOW_V2_ENABLED = True
@@ -277,6 +314,14 @@ SCREENING_WAIT_SEC = float(os.environ.get("SCREENING_WAIT_SEC", "300"))
 SCHEDULE_SHIFT_WAIT_SEC = float(os.environ.get("SCHEDULE_SHIFT_WAIT_SEC", "300"))
 FAQ_QUESTIONS_WORKSHEET = os.environ.get("FAQ_QUESTIONS_WORKSHEET", "FAQ_Questions")
 FAQ_SUGGESTIONS_WORKSHEET = os.environ.get("FAQ_SUGGESTIONS_WORKSHEET", "FAQ_Suggestions")
+FAQ_STATS_PATH = os.environ.get("FAQ_STATS_PATH", os.path.join(STATE_DIR, "faq_questions.sqlite"))
+FAQ_FLUSH_SEC = float(os.environ.get("FAQ_FLUSH_SEC", "300"))
+FAQ_FLUSH_EVENTS = int(os.environ.get("FAQ_FLUSH_EVENTS", "50"))
+FAQ_FLUSH_RETRY_SEC = float(os.environ.get("FAQ_FLUSH_RETRY_SEC", "60"))
+FAQ_FLUSH_LOCK = os.environ.get("FAQ_FLUSH_LOCK", "/opt/tg_leads/.faq_flush.lock")
+FAQ_SUGGESTION_MIN_COUNT = int(os.environ.get("FAQ_SUGGESTION_MIN_COUNT", "3"))
+QUESTION_CLUSTERS_PATH = os.environ.get("QUESTION_CLUSTERS_PATH", os.path.join(STATE_DIR, "question_clusters.sqlite"))
+QUESTION_CLUSTER_THRESHOLD = float(os.environ.get("QUESTION_CLUSTER_THRESHOLD", "0.5"))
 LIKE_TRAINING_ENABLED = os.environ.get("LIKE_TRAINING_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
 LIKE_TRAINING_SHEET = os.environ.get("LIKE_TRAINING_SHEET", "FAQ_Likes_Train")
 LIKE_PAIR_WINDOW_SEC = float(os.environ.get("LIKE_PAIR_WINDOW_SEC", "30"))
@@ -937,6 +982,13 @@ def strip_question_trail(text: str) -> str:
 
 
 SENT_MESSAGES = {}
+PEER_MESSAGES = PeerMessageCache(capacity=max(12, PEER_MESSAGE_CACHE_SIZE))
+SEND_SCHEDULER = OutboundScheduler(
+    rate_per_sec=SEND_RATE_PER_SEC,
+    burst=SEND_RATE_BURST,
+    workers=SEND_WORKERS,
+    max_flood_retries=SEND_FLOOD_MAX_RETRIES,
+)
 PAUSE_CHECKER = None
 SHEETS_EVENT_ENQUEUER = None
 
@@ -1057,12 +1109,20 @@ def combine_answer_with_return_prompt(answer_text: str, return_prompt: str) -> s
     return answer or prompt
 
 
-def v2_incoming_buffer_reason(peer_id: int, sending_peers, processing_peers) -> str:
-    if int(peer_id or 0) in sending_peers:
-        return "send_lock"
-    if int(peer_id or 0) in processing_peers:
-        return "processing"
-    return ""
+@dataclass
+class IncomingTurn:
+    sender: Any
+    text: str
+    has_photo: bool = False
+    generation: int = 0
+    count: int = 1
+
+
+def merge_incoming_turns(first: IncomingTurn, second: IncomingTurn) -> Optional[IncomingTurn]:
+    if first.generation != second.generation or first.has_photo or second.has_photo:
+        return None
+    texts = [part for part in (first.text.strip(), second.text.strip()) if part]
+    return IncomingTurn(first.sender, "\n".join(texts), False, first.generation, first.count + second.count)
 
 
 def v2_question_response_messages(answer_text: str, return_prompt: str) -> Tuple[str, str]:
@@ -1085,13 +1145,31 @@ def is_neutral_ack(text: str) -> bool:
     return is_neutral_ack_impl(text)
 
 
-def enqueue_sheet_event(event_type: str, payload: dict):
+def today_upsert_coalesce_key(payload: dict) -> str:
+    if not TODAY_UPSERT_COALESCE:
+        return ""
+    try:
+        peer_id = int((payload or {}).get("peer_id") or 0)
+    except Exception:
+        peer_id = 0
+    return str(peer_id) if peer_id > 0 else ""
+
+
+def today_upsert_delay_sec(coalesce_key: str) -> float:
+    """A coalesced today_upsert waits out the debounce window so later snapshots merge into it."""
+    return max(0.0, TODAY_UPSERT_DEBOUNCE_SEC) if coalesce_key else 0.0
+
+
+def enqueue_sheet_event(event_type: str, payload: dict, coalesce_key: str = "", delay_sec: float = 0.0):
     global SHEETS_EVENT_ENQUEUER
     if not SHEETS_EVENT_ENQUEUER:
         return False
     try:
-        event_id = SHEETS_EVENT_ENQUEUER(event_type, payload)
-        print(f"SHEETS_QUEUE_ENQUEUE type={event_type} id={event_id}")
+        if coalesce_key:
+            event_id = SHEETS_EVENT_ENQUEUER(event_type, payload, coalesce_key=coalesce_key, delay_sec=delay_sec)
+        else:
+            event_id = SHEETS_EVENT_ENQUEUER(event_type, payload)
+        print(f"SHEETS_QUEUE_ENQUEUE type={event_type} id={event_id} coalesce_key={coalesce_key or '-'}")
         return True
     except Exception as err:
         print(f"⚠️ SHEETS_QUEUE_ENQUEUE_FAIL type={event_type}: {type(err).__name__}: {err}")
@@ -1109,8 +1187,37 @@ def is_clarify_uncertain_reply(text: str) -> bool:
     return False
 
 
-async def classify_candidate_intent(history: list, text: str, last_step: Optional[str]) -> Intent:
+async def _post_turn_classification(payload: dict) -> Optional[dict]:
+    try:
+        return await asyncio.to_thread(_post_json, DIALOG_CLASSIFY_URL, payload, DIALOG_CLASSIFY_TIMEOUT_SEC)
+    except (urllib.error.URLError, urllib.error.HTTPError, ValueError, OSError) as err:
+        print(f"⚠️ AI classify_turn error: {err}")
+        return None
+
+
+TURN_CLASSIFIER = CombinedTurnClassifier(_post_turn_classification)
+
+
+async def classify_turn_labels(peer_id: Optional[int], history: list, text: str, step_name: Optional[str]) -> Dict[str, Any]:
+    if not DIALOG_CLASSIFY_URL or not peer_id:
+        return {}
+    labels = await TURN_CLASSIFIER.classify(peer_id, history, text, step_name, REFUSAL_REASON_ALLOWED)
+    return labels or {}
+
+
+async def classify_candidate_intent(
+    history: list,
+    text: str,
+    last_step: Optional[str],
+    peer_id: Optional[int] = None,
+) -> Intent:
     async def _ai_client(hist: list, last_text: str) -> str:
+        labels = await classify_turn_labels(peer_id, hist, last_text, last_step)
+        label_intent = str(labels.get("intent") or "").strip().lower()
+        if labels.get("stop") is True and label_intent in {"", "other"}:
+            return "stop"
+        if label_intent:
+            return label_intent
         if DIALOG_INTENT_URL:
             payload = {"history": hist, "last_message": last_text}
             try:
@@ -1830,11 +1937,20 @@ def classify_refusal_reason_local(text: str, step_name: Optional[str] = None) ->
     return REFUSAL_REASON_OTHER
 
 
-async def classify_refusal_reason(history: list, text: str, step_name: Optional[str]) -> Dict[str, str]:
+async def classify_refusal_reason(
+    history: list,
+    text: str,
+    step_name: Optional[str],
+    peer_id: Optional[int] = None,
+) -> Dict[str, str]:
     raw_text = normalize_refusal_raw(text)
     if not raw_text:
         return {"reason": REFUSAL_REASON_OTHER, "raw_text": ""}
-    if DIALOG_REFUSAL_URL:
+    labels = await classify_turn_labels(peer_id, history, text, step_name)
+    reason_code = str(labels.get("refusal_reason") or "").strip().lower()
+    if reason_code in REFUSAL_REASON_ALLOWED:
+        return {"reason": reason_code, "raw_text": raw_text}
+    if DIALOG_REFUSAL_URL and not labels:
         payload = {
             "history": history,
             "last_message": raw_text,
@@ -1975,14 +2091,6 @@ def names_match(left: str, right: str) -> bool:
     return False
 
 
-def col_letter(col_idx: int) -> str:
-    result = []
-    while col_idx > 0:
-        col_idx, rem = divmod(col_idx - 1, 26)
-        result.append(chr(ord("A") + rem))
-    return "".join(reversed(result))
-
-
 def build_sheet_row_link(ws, row_idx: int, label: str) -> str:
     return f'=HYPERLINK("#gid={ws.id}&range=A{int(row_idx)}";"{label}")'
 
@@ -2011,30 +2119,56 @@ def find_row_in_values_by_peer(values: List[List[str]], peer_id: str, header_nam
     return None, None
 
 
-def remap_rows_by_headers(values: List[List[str]], target_headers: List[str]) -> List[List[str]]:
-    if not values:
-        return [target_headers[:]]
-    current_headers = [str(h or "").strip() for h in values[0]]
-    remapped = [target_headers[:]]
-    for row in values[1:]:
-        row_map = {}
-        for idx, header in enumerate(current_headers):
-            row_map[header] = row[idx] if idx < len(row) else ""
-        remapped.append([row_map.get(header, "") for header in target_headers])
-    return remapped
+def read_cached_header_row(session: Optional[SpreadsheetSession], ws) -> List[str]:
+    title = (ws.title or "").strip() if session is not None else ""
+    headers = session.header_row(title) if session is not None else None
+    if headers is None:
+        headers = [str(h or "").strip() for h in ws.row_values(1)]
+        if session is not None:
+            session.remember_header_row(title, headers)
+    return headers
 
 
-def write_full_worksheet_values(ws, values: List[List[str]]) -> None:
-    if not values:
-        return
-    width = max(len(row) for row in values)
-    padded = [list(row) + [""] * (width - len(row)) for row in values]
-    ws.clear()
-    ws.update(
-        range_name=f"A1:{col_letter(width)}{len(padded)}",
-        values=padded,
-        value_input_option="USER_ENTERED",
-    )
+def header_fix_lock(ws) -> FileLock:
+    """Cross-process lock for reordering one worksheet's columns and rewriting its row 1."""
+    name = re.sub(r"[^\w-]+", "_", (ws.title or "").strip()) or "sheet"
+    return FileLock(os.path.join(HEADER_FIX_LOCK_DIR, f".header_fix_{name}.lock"))
+
+
+def ensure_worksheet_header_prefix(
+    session: Optional[SpreadsheetSession],
+    ws,
+    target_headers: List[str],
+    move_columns: bool = True,
+) -> bool:
+    """Bring row 1 to `target_headers`; returns True when the sheet had to be changed.
+
+    With `move_columns` existing columns are moved server-side, so data rows are never
+    read or rewritten; without it only the header row is overwritten.
+    """
+    current = read_cached_header_row(session, ws)
+    if current[: len(target_headers)] == target_headers:
+        return False
+    title = (ws.title or "").strip()
+    # The cached row may predate another process's fix; moves planned from it would
+    # shuffle already-reordered columns, so plan only from row 1 read under the lock.
+    with header_fix_lock(ws):
+        current = [str(h or "").strip() for h in ws.row_values(1)]
+        if current[: len(target_headers)] == target_headers:
+            if session is not None:
+                session.remember_header_row(title, current)
+            return False
+        if not move_columns or not any(current):
+            ws.update(
+                range_name=f"A1:{col_letter(len(target_headers))}1",
+                values=[target_headers],
+                value_input_option="USER_ENTERED",
+            )
+        else:
+            apply_header_column_fix(ws, current, target_headers, drop_extra=True)
+    if session is not None:
+        session.remember_header_row(title, target_headers)
+    return True
 
 
 def parse_group_candidate_label(raw_value: str) -> Tuple[str, str]:
@@ -2289,102 +2423,6 @@ def v2_wait_followup_abort_reason(
     return None
 
 
-class CrossAccountOwnerStore:
-    def __init__(self, path: str):
-        self.path = path
-        self.lock_path = f"{path}.lock"
-
-    def _load(self) -> Dict[str, dict]:
-        if not self.path or not os.path.exists(self.path):
-            return {}
-        try:
-            with open(self.path, "r", encoding="utf-8") as f:
-                raw = json.load(f)
-        except (OSError, json.JSONDecodeError):
-            return {}
-        return raw if isinstance(raw, dict) else {}
-
-    def _save_atomic(self, data: Dict[str, dict]):
-        base = os.path.dirname(self.path)
-        if base:
-            os.makedirs(base, exist_ok=True)
-        tmp_path = f"{self.path}.tmp.{os.getpid()}.{int(time.time() * 1000)}"
-        with open(tmp_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=True)
-        os.replace(tmp_path, self.path)
-
-    def get_owner(self, peer_id: int) -> Optional[str]:
-        data = self._load()
-        rec = data.get(str(int(peer_id)))
-        if not isinstance(rec, dict):
-            return None
-        owner = str(rec.get("owner", "") or "").strip()
-        return owner or None
-
-    def try_claim(self, peer_id: int, owner_key: str, source: str, tz: ZoneInfo) -> bool:
-        if not acquire_lock(self.lock_path, ttl_sec=5):
-            return False
-        try:
-            key = str(int(peer_id))
-            owner_key = str(owner_key or "").strip()
-            if not owner_key:
-                return False
-            data = self._load()
-            current = data.get(key)
-            current_owner = ""
-            if isinstance(current, dict):
-                current_owner = str(current.get("owner", "") or "").strip()
-            if current_owner and current_owner != owner_key:
-                return False
-            data[key] = {
-                "owner": owner_key,
-                "source": str(source or "").strip() or "unknown",
-                "updated_at": datetime.now(tz).isoformat(timespec="seconds"),
-            }
-            self._save_atomic(data)
-            return True
-        finally:
-            release_lock(self.lock_path)
-
-    def set_owner(self, peer_id: int, owner_key: str, source: str, tz: ZoneInfo) -> bool:
-        if not acquire_lock(self.lock_path, ttl_sec=5):
-            return False
-        try:
-            key = str(int(peer_id))
-            owner_key = str(owner_key or "").strip()
-            if not owner_key:
-                return False
-            data = self._load()
-            data[key] = {
-                "owner": owner_key,
-                "source": str(source or "").strip() or "unknown",
-                "updated_at": datetime.now(tz).isoformat(timespec="seconds"),
-            }
-            self._save_atomic(data)
-            return True
-        finally:
-            release_lock(self.lock_path)
-
-    def release_owner(self, peer_id: int, owner_key: str) -> bool:
-        if not acquire_lock(self.lock_path, ttl_sec=5):
-            return False
-        try:
-            key = str(int(peer_id))
-            owner_key = str(owner_key or "").strip()
-            data = self._load()
-            current = data.get(key)
-            current_owner = ""
-            if isinstance(current, dict):
-                current_owner = str(current.get("owner", "") or "").strip()
-            if current_owner != owner_key:
-                return False
-            data.pop(key, None)
-            self._save_atomic(data)
-            return True
-        finally:
-            release_lock(self.lock_path)
-
-
 def parse_group_message(text: str) -> dict:
     data = {}
     for line in (text or "").splitlines():
@@ -2570,10 +2608,83 @@ def refusal_raw_from_special_start(special_reason: str) -> str:
     return f"special_start:{reason}"
 
 
+SHEETS_SESSION: Optional[SpreadsheetSession] = None
+# Objects that may be shared by every account of the process. A standalone run keeps
+# its own dict; auto_reply_host.py hands the same dict to each account it loads.
+PROCESS_SHARED: Dict[Any, Any] = {}
+PROCESS_SHARED_LOCK = threading.Lock()
+
+
+def process_shared(key: Any, factory):
+    value = PROCESS_SHARED.get(key)
+    if value is not None:
+        return value
+    with PROCESS_SHARED_LOCK:
+        value = PROCESS_SHARED.get(key)
+        if value is None:
+            value = factory()
+            PROCESS_SHARED[key] = value
+    return value
+
+
+def shared_spreadsheet_session() -> SpreadsheetSession:
+    global SHEETS_SESSION
+    if SHEETS_SESSION is None:
+        SHEETS_SESSION = process_shared(
+            ("sheets_session", GOOGLE_CREDS, SHEET_NAME),
+            lambda: SpreadsheetSession(
+                lambda: sheets_client(GOOGLE_CREDS),
+                SHEET_NAME,
+                pool_maxsize=SHEETS_HTTP_POOL_SIZE,
+                not_found_error=WorksheetNotFound,
+            ),
+        )
+    return SHEETS_SESSION
+
+
+def shared_group_leads_sheet() -> "GroupLeadsSheet":
+    return process_shared(("group_leads_sheet", SHEET_NAME, GROUP_LEADS_WORKSHEET), GroupLeadsSheet)
+
+
+def shared_upload_index() -> DriveUploadIndex:
+    return process_shared(
+        ("drive_upload_index", REGISTRATION_UPLOAD_INDEX_PATH),
+        lambda: DriveUploadIndex(REGISTRATION_UPLOAD_INDEX_PATH),
+    )
+
+
+def shared_faq_stats() -> FAQQuestionStats:
+    return process_shared(("faq_stats", FAQ_STATS_PATH), lambda: FAQQuestionStats(FAQ_STATS_PATH))
+
+
+def shared_question_clusters() -> QuestionClusterIndex:
+    return process_shared(
+        ("question_clusters", QUESTION_CLUSTERS_PATH),
+        lambda: QuestionClusterIndex(
+            QUESTION_CLUSTERS_PATH, threshold=QUESTION_CLUSTER_THRESHOLD, key_func=build_cluster_key
+        ),
+    )
+
+
+def question_cluster_key(question_norm: str) -> str:
+    """Near-duplicate cluster of a normalized question; the plain prefix key if the index fails."""
+    try:
+        return shared_question_clusters().assign(question_norm)
+    except Exception as err:
+        print(f"⚠️ QUESTION_CLUSTER_FAIL: {type(err).__name__}: {err}")
+        return build_cluster_key(question_norm)
+
+
+def shared_owner_store() -> CrossAccountOwnerStore:
+    return process_shared(
+        ("owner_registry", CROSS_ACCOUNT_OWNER_DB_PATH),
+        lambda: CrossAccountOwnerStore(CROSS_ACCOUNT_OWNER_DB_PATH, legacy_json_path=CROSS_ACCOUNT_OWNER_STATE_PATH),
+    )
+
+
 class SheetWriter:
-    def __init__(self):
-        self.gc = sheets_client(GOOGLE_CREDS)
-        self.sh = self.gc.open(SHEET_NAME)
+    def __init__(self, session: Optional[SpreadsheetSession] = None, migrate: bool = True):
+        self.session = session or shared_spreadsheet_session()
         self.today_ws = None
         self.today_key = None
         self._headers_cache = {}
@@ -2586,14 +2697,19 @@ class SheetWriter:
         self._group_leads_ws = None
         self._group_leads_lookup_cache = []
         self._group_leads_lookup_cache_ts = 0.0
-        self.migrate_sheets()
+        if migrate:
+            self.migrate_sheets()
+
+    @property
+    def gc(self):
+        return self.session.client
+
+    @property
+    def sh(self):
+        return self.session.spreadsheet
 
     def _col_letter(self, col_idx: int) -> str:
-        result = []
-        while col_idx > 0:
-            col_idx, rem = divmod(col_idx - 1, 26)
-            result.append(chr(ord("A") + rem))
-        return "".join(reversed(result))
+        return col_letter(col_idx)
 
     def _month_title(self, dt: date) -> str:
         return format_month_sheet_title(dt)
@@ -2625,38 +2741,53 @@ class SheetWriter:
         key = self._today_key(tz)
         title = self._month_title(datetime.now(tz).date())
         if self.today_ws is None:
-            self.today_ws = get_or_create_worksheet(self.sh, title, rows=1000, cols=len(TODAY_HEADERS))
+            self.today_ws = self.session.get_or_create_worksheet(title, rows=1000, cols=len(TODAY_HEADERS))
             self._ensure_today_headers(self.today_ws)
             self.today_key = key
             self._invalidate_ws_cache(self.today_ws)
             return self.today_ws
         if self.today_key != key:
-            self.today_ws = get_or_create_worksheet(self.sh, title, rows=1000, cols=len(TODAY_HEADERS))
+            self.prefetch_managed_headers(tz)
+            self.today_ws = self.session.get_or_create_worksheet(title, rows=1000, cols=len(TODAY_HEADERS))
             self._ensure_today_headers(self.today_ws)
             self.today_key = key
             self._invalidate_ws_cache(self.today_ws)
         return self.today_ws
 
+    def prefetch_managed_headers(self, tz: ZoneInfo):
+        # One values:batchGet for row 1 of every sheet we manage instead of a
+        # get_all_values() per sheet on startup and month rollover.
+        titles = [
+            self._month_title(datetime.now(tz).date()),
+            GROUP_LEADS_WORKSHEET,
+            REGISTRATION_WORKSHEET,
+            FAQ_QUESTIONS_WORKSHEET,
+            FAQ_SUGGESTIONS_WORKSHEET,
+            LIKE_TRAINING_SHEET,
+        ]
+        try:
+            self.session.prefetch_headers(titles)
+        except Exception as err:
+            print(f"⚠️ SHEETS_HEADER_PREFETCH_FAIL: {type(err).__name__}: {err}")
+
     def _ensure_today_headers(self, ws):
-        values = ws.get_all_values()
-        if not values:
-            ws.append_row(TODAY_HEADERS, value_input_option="USER_ENTERED")
-            self._invalidate_ws_cache(ws)
-            return
-        current_headers = [h.strip() for h in values[0]]
-        if current_headers == TODAY_HEADERS:
+        self._ensure_exact_header_columns(ws, TODAY_HEADERS)
+
+    def _ensure_exact_header_columns(self, ws, target_headers: List[str]):
+        session = getattr(self, "session", None)
+        current_headers = read_cached_header_row(session, ws)
+        if current_headers == target_headers:
             return
-        data_rows = values[1:]
-        remapped_rows = []
-        for row in data_rows:
-            row_map = {}
-            for idx, header in enumerate(current_headers):
-                row_map[header] = row[idx] if idx < len(row) else ""
-            remapped_rows.append([row_map.get(h, "") for h in TODAY_HEADERS])
-        ws.clear()
-        ws.append_row(TODAY_HEADERS, value_input_option="USER_ENTERED")
-        if remapped_rows:
-            ws.append_rows(remapped_rows, value_input_option="USER_ENTERED")
+        title = (ws.title or "").strip()
+        with header_fix_lock(ws):
+            current_headers = [str(h or "").strip() for h in ws.row_values(1)]
+            if current_headers != target_headers:
+                if not any(current_headers):
+                    ws.append_row(target_headers, value_input_option="USER_ENTERED")
+                else:
+                    apply_header_column_fix(ws, current_headers, target_headers, drop_extra=True)
+        if session is not None:
+            session.remember_header_row(title, target_headers)
         self._invalidate_ws_cache(ws)
 
     def _invalidate_ws_cache(self, ws):
@@ -2711,37 +2842,9 @@ class SheetWriter:
         self._row_index_cache_ts[ws_id] = now
         self._next_row_cache[ws_id] = len(values) + 1
 
-    def _history_ws(self, tz: ZoneInfo):
-        title = self._month_title(datetime.now(tz).date())
-        ws = get_or_create_worksheet(self.sh, title, rows=1000, cols=len(HISTORY_HEADERS))
-        self._ensure_history_headers(ws)
-        return ws
-
-    def _ensure_history_headers(self, ws):
-        values = ws.get_all_values()
-        if not values:
-            ws.append_row(HISTORY_HEADERS, value_input_option="USER_ENTERED")
-            self._invalidate_ws_cache(ws)
-            return
-        current_headers = [h.strip() for h in values[0]]
-        if current_headers == HISTORY_HEADERS:
-            return
-        data_rows = values[1:]
-        remapped_rows = []
-        for row in data_rows:
-            row_map = {}
-            for idx, header in enumerate(current_headers):
-                row_map[header] = row[idx] if idx < len(row) else ""
-            remapped_rows.append([row_map.get(h, "") for h in HISTORY_HEADERS])
-        ws.clear()
-        ws.append_row(HISTORY_HEADERS, value_input_option="USER_ENTERED")
-        if remapped_rows:
-            ws.append_rows(remapped_rows, value_input_option="USER_ENTERED")
-        self._invalidate_ws_cache(ws)
-
     def migrate_sheets(self):
         try:
-            worksheets = self.sh.worksheets()
+            worksheets = self.session.worksheets(refresh=True)
         except Exception:
             return
         for ws in worksheets:
@@ -2754,13 +2857,13 @@ class SheetWriter:
                 expected_title = self._month_title(date(year, month, 1))
                 if title != expected_title:
                     try:
-                        self.sh.del_worksheet(ws)
+                        self.session.delete_worksheet(ws)
                     except Exception as err:
                         print(f"⚠️ Не вдалося видалити legacy лист '{title}': {err}")
                 continue
             if title == TODAY_WORKSHEET or title in LEGACY_SHEET_NAMES or LEGACY_DAY_SHEET_RE.match(title):
                 try:
-                    self.sh.del_worksheet(ws)
+                    self.session.delete_worksheet(ws)
                 except Exception as err:
                     print(f"⚠️ Не вдалося видалити legacy лист '{title}': {err}")
         self.cleanup_old_month_sheets()
@@ -2771,7 +2874,7 @@ class SheetWriter:
         today = datetime.now(ZoneInfo(TIMEZONE)).date()
         keep_from = self._month_shift(date(today.year, today.month, 1), -(HISTORY_RETENTION_MONTHS - 1))
         try:
-            worksheets = self.sh.worksheets()
+            worksheets = self.session.worksheets()
         except Exception:
             return
         for ws in worksheets:
@@ -2782,7 +2885,7 @@ class SheetWriter:
             sheet_month = date(year, month, 1)
             if sheet_month < keep_from:
                 try:
-                    self.sh.del_worksheet(ws)
+                    self.session.delete_worksheet(ws)
                 except Exception as err:
                     print(f"⚠️ Не вдалося видалити старий лист '{ws.title}': {err}")
 
@@ -2917,74 +3020,17 @@ class SheetWriter:
             return "Изменение статуса"
         return "Служебное обновление"
 
-    def _history_line_parts(self, line: str) -> Tuple[Optional[datetime], str]:
-        raw = (line or "").strip()
-        if not raw:
-            return None, ""
-        if " | " not in raw:
-            return None, raw
-        ts_part, rest = raw.split(" | ", 1)
-        try:
-            ts = datetime.fromisoformat(ts_part.strip())
-        except Exception:
-            ts = None
-        return ts, rest.strip()
-
-    def _is_duplicate_history_event(self, prev_line: str, new_line: str, window_sec: int = 5) -> bool:
-        prev_ts, prev_payload = self._history_line_parts(prev_line)
-        new_ts, new_payload = self._history_line_parts(new_line)
-        if not prev_payload or not new_payload:
-            return False
-        if prev_payload != new_payload:
-            return False
-        if prev_ts is None or new_ts is None:
-            # Same payload and unparsable timestamps -> treat as duplicate guard.
-            return True
-        try:
-            delta = abs((new_ts - prev_ts).total_seconds())
-        except Exception:
-            return True
-        return delta <= max(1, int(window_sec))
-
-    def _is_duplicate_history_event_in_tail(self, lines: List[str], new_line: str, window_sec: int = 5, tail_size: int = 10) -> bool:
-        if not lines:
-            return False
-        window = lines[-max(1, int(tail_size or 1)) :]
-        for line in reversed(window):
-            if self._is_duplicate_history_event(line, new_line, window_sec=window_sec):
-                return True
-        return False
-
-    def _is_history_noise_event(
-        self,
-        event_type: str,
-        status: Optional[str],
-        auto_reply_enabled: Optional[bool],
-        last_in: Optional[str],
-        last_out: Optional[str],
-    ) -> bool:
-        if (event_type or "").strip() != "Служебное обновление":
-            return False
-        has_text = bool((last_in or "").strip() or (last_out or "").strip())
-        if has_text:
-            return False
-        if status is not None:
-            return False
-        if auto_reply_enabled is not None:
-            return False
-        return True
-
     def _sheet_row_link(self, ws, row_idx: int, label: str) -> str:
         return build_sheet_row_link(ws, row_idx, label)
 
     def _get_group_leads_ws(self):
         if self._group_leads_ws is not None:
             return self._group_leads_ws
-        self._group_leads_ws = self.sh.worksheet(GROUP_LEADS_WORKSHEET)
+        self._group_leads_ws = self.session.worksheet(GROUP_LEADS_WORKSHEET)
         return self._group_leads_ws
 
     def _get_registration_ws(self):
-        return self.sh.worksheet(REGISTRATION_WORKSHEET)
+        return self.session.worksheet(REGISTRATION_WORKSHEET)
 
     def _get_group_leads_lookup_rows(self):
         now = time.time()
@@ -3081,16 +3127,25 @@ class SheetWriter:
                 }
         return fallback_match
 
+    def _registration_row_cache(self) -> PeerRowCache:
+        cache = getattr(self, "_registration_rows", None)
+        if cache is None:
+            cache = self._registration_rows = PeerRowCache(GROUP_LEADS_LOOKUP_CACHE_TTL_SEC)
+        return cache
+
     def _find_registration_info_by_peer(self, peer_id: Optional[str]) -> Optional[dict]:
         peer_raw = str(peer_id or "").strip()
         if not peer_raw:
             return None
         try:
-            ws = self._get_registration_ws()
-            values = ws.get_all_values()
+            ws, row_idx, _ = self._registration_row_cache().lookup(
+                REGISTRATION_WORKSHEET,
+                lambda title: self._get_registration_ws(),
+                peer_raw,
+                WriteGeneration(f"{REGISTRATION_UPSERT_LOCK}.gen").read(),
+            )
         except Exception:
             return None
-        row_idx, _ = find_row_in_values_by_peer(values, peer_raw)
         if not row_idx:
             return None
         return {
@@ -3098,16 +3153,50 @@ class SheetWriter:
             "link": self._sheet_row_link(ws, row_idx, "Открыть регистрацию"),
         }
 
-    def refresh_today_from_group_lead(self, tz: ZoneInfo, group_data: dict) -> int:
+    def _locate_peer_row(self, ws, peer_raw: str):
+        """Month-sheet row of a peer through the peer index, confirmed by reading that row."""
+        peer_idx = header_index(self._get_headers(ws), "Пир")
+        if not peer_raw or peer_idx is None:
+            return None, None
+        for attempt in range(2):
+            row_idx, row = self._find_row(ws, peer_raw, "")
+            if not row_idx or not row:
+                return None, None
+            if peer_idx < len(row) and str(row[peer_idx] or "").strip() == peer_raw:
+                return row_idx, row
+            self._invalidate_ws_cache(ws)
+        return None, None
+
+    def _refresh_patches(self) -> CellPatchBuffer:
+        patches = getattr(self, "_pending_refresh_patches", None)
+        if patches is None:
+            patches = self._pending_refresh_patches = CellPatchBuffer()
+        return patches
+
+    def flush_refresh_patches(self) -> int:
+        """Send the cell patches queued by deferred refreshes in one batch update."""
+        return self._refresh_patches().flush()
+
+    def _patch_row_cells(self, ws, row_idx: int, row: List[str], changes: Dict[int, str], defer: bool) -> bool:
+        changed = {col: value for col, value in changes.items() if (row[col] if col < len(row) else "") != value}
+        if not changed:
+            return False
+        patches = self._refresh_patches() if defer else CellPatchBuffer()
+        for col, value in changed.items():
+            patches.add(ws, row_idx, col, value)
+        if not defer:
+            patches.flush()
+        return True
+
+    def refresh_today_from_group_lead(self, tz: ZoneInfo, group_data: dict, defer: bool = False) -> int:
+        """Copy GroupLeads data into the candidate's month-sheet row(s).
+
+        With a peer id the row comes from the peer index and only changed cells are
+        written; `defer=True` queues them for `flush_refresh_patches()`. Leads known only
+        by username/name still need one scan of the month sheet.
+        """
         ws = self._ensure_today_ws(tz)
         headers = self._get_headers(ws)
-        try:
-            values = ws.get_all_values()
-        except Exception:
-            self._invalidate_ws_cache(ws)
-            return 0
-        if not values or len(values) <= 1:
-            return 0
 
         def idx_of(name: str) -> Optional[int]:
             try:
@@ -3134,88 +3223,66 @@ class SheetWriter:
         app_ws = self._get_group_leads_ws()
         app_link = self._sheet_row_link(app_ws, int(lead_info["row_idx"]), "Открыть заявку")
         lead_phone = str(lead_info.get("phone", "") or "").strip()
-        lead_age = lead_info.get("age", "")
-        lead_pc = lead_info.get("pc", "")
         lead_note = str(lead_info.get("note", "") or "").strip()
+        registration_info = self._find_registration_info_by_peer(target_peer or lead_info.get("peer_id", ""))
+
+        changes = {app_link_idx: app_link, age_idx: lead_info.get("age", ""), pc_idx: lead_info.get("pc", "")}
+        if phone_idx is not None and lead_phone:
+            changes[phone_idx] = lead_phone
+        if note_idx is not None and lead_note:
+            changes[note_idx] = lead_note
+        if registration_link_idx is not None and registration_info:
+            changes[registration_link_idx] = registration_info["link"]
+
+        lookup_peer = target_peer or str(lead_info.get("peer_id", "") or "").strip()
+        if lookup_peer and peer_idx is not None:
+            row_idx, row = self._locate_peer_row(ws, lookup_peer)
+            if not row_idx:
+                return 0
+            return 1 if self._patch_row_cells(ws, row_idx, row, changes, defer) else 0
+
+        try:
+            values = ws.get_all_values()
+        except Exception:
+            self._invalidate_ws_cache(ws)
+            return 0
         target_uname = normalize_username(group_data.get("tg", ""))
         target_name = normalize_name(group_data.get("full_name", ""))
-        registration_info = self._find_registration_info_by_peer(target_peer or lead_info.get("peer_id", ""))
+        patches = self._refresh_patches() if defer else CellPatchBuffer()
         updated = 0
-        end_col = self._col_letter(len(headers))
-
         for idx, row in enumerate(values[1:], start=2):
-            row_peer = row[peer_idx].strip() if peer_idx is not None and peer_idx < len(row) else ""
             row_uname = normalize_username(row[username_idx]) if username_idx is not None and username_idx < len(row) else ""
             row_name = normalize_name(row[name_idx]) if name_idx is not None and name_idx < len(row) else ""
-            matches = False
-            if target_peer and row_peer == target_peer:
-                matches = True
-            elif target_uname and row_uname == target_uname:
-                matches = True
-            elif target_name and names_match(row_name, target_name):
-                matches = True
-            if not matches:
-                continue
-
-            row_full = row[:] + [""] * max(0, len(headers) - len(row))
-            changed = False
-            if row_full[app_link_idx] != app_link:
-                row_full[app_link_idx] = app_link
-                changed = True
-            if phone_idx is not None and lead_phone and row_full[phone_idx] != lead_phone:
-                row_full[phone_idx] = lead_phone
-                changed = True
-            if row_full[age_idx] != lead_age:
-                row_full[age_idx] = lead_age
-                changed = True
-            if row_full[pc_idx] != lead_pc:
-                row_full[pc_idx] = lead_pc
-                changed = True
-            if note_idx is not None and lead_note and row_full[note_idx] != lead_note:
-                row_full[note_idx] = lead_note
-                changed = True
-            if registration_link_idx is not None and registration_info and row_full[registration_link_idx] != registration_info["link"]:
-                row_full[registration_link_idx] = registration_info["link"]
-                changed = True
-            if not changed:
+            if not ((target_uname and row_uname == target_uname) or (target_name and names_match(row_name, target_name))):
                 continue
-            ws.update(range_name=f"A{idx}:{end_col}{idx}", values=[row_full], value_input_option="USER_ENTERED")
-            updated += 1
-        if updated:
-            self._invalidate_ws_cache(ws)
+            changed = {col: value for col, value in changes.items() if (row[col] if col < len(row) else "") != value}
+            for col, value in changed.items():
+                patches.add(ws, idx, col, value)
+            if changed:
+                updated += 1
+        if updated and not defer:
+            patches.flush()
         return updated
 
-    def refresh_today_from_registration(self, tz: ZoneInfo, registration_data: dict) -> int:
+    def refresh_today_from_registration(self, tz: ZoneInfo, registration_data: dict, defer: bool = False) -> int:
         peer_raw = str((registration_data or {}).get("peer_id", "") or "").strip()
         if not peer_raw:
             return 0
         ws = self._ensure_today_ws(tz)
         headers = self._get_headers(ws)
+        link_idx = header_index(headers, "Ссылка на Регистрацию")
+        if link_idx is None:
+            return 0
         try:
-            row_idx, row = self._find_row_by_peer(ws, int(peer_raw))
+            row_idx, row = self._locate_peer_row(ws, peer_raw)
         except Exception:
             row_idx, row = None, None
         if not row_idx or not row:
             return 0
-
-        registration_ws = self._get_registration_ws()
-        registration_values = registration_ws.get_all_values()
-        registration_row_idx, _ = find_row_in_values_by_peer(registration_values, peer_raw)
-        if not registration_row_idx:
+        registration_info = self._find_registration_info_by_peer(peer_raw)
+        if not registration_info:
             return 0
-
-        link_idx = header_index(headers, "Ссылка на Регистрацию")
-        if link_idx is None:
-            return 0
-        row_full = row[:] + [""] * max(0, len(headers) - len(row))
-        registration_link = self._sheet_row_link(registration_ws, registration_row_idx, "Открыть регистрацию")
-        if row_full[link_idx] == registration_link:
-            return 0
-        row_full[link_idx] = registration_link
-        end_col = self._col_letter(len(headers))
-        ws.update(range_name=f"A{row_idx}:{end_col}{row_idx}", values=[row_full], value_input_option="USER_ENTERED")
-        self._invalidate_ws_cache(ws)
-        return 1
+        return 1 if self._patch_row_cells(ws, row_idx, row, {link_idx: registration_info["link"]}, defer) else 0
 
     def _sort_today_by_updated(self, ws, headers):
         if not SORT_TODAY_BY_UPDATED:
@@ -3231,132 +3298,6 @@ class SheetWriter:
         except Exception as err:
             print(f"⚠️ Не вдалося відсортувати лист '{TODAY_WORKSHEET}': {err}")
 
-    def append_history_event(
-        self,
-        tz: ZoneInfo,
-        event_type: str,
-        peer_id: int,
-        name: str,
-        username: str,
-        chat_link: str,
-        status: Optional[str],
-        auto_reply_enabled: Optional[bool],
-        last_in: Optional[str],
-        last_out: Optional[str],
-        sender_role: Optional[str] = None,
-        dialog_mode: Optional[str] = None,
-        step_snapshot: Optional[str] = None,
-        full_text: Optional[str] = None,
-    ) -> Optional[str]:
-        ws = self._history_ws(tz)
-        now_iso = datetime.now(tz).isoformat(timespec="seconds")
-        headers = self._get_headers(ws)
-        if self._is_history_noise_event(event_type, status, auto_reply_enabled, last_in, last_out):
-            print(f"HISTORY_SKIP reason=noise account={ACCOUNT_KEY} peer={peer_id}")
-            return None
-        effective_account = self._owner_account_for_peer(peer_id, ACCOUNT_KEY)
-        row_idx, existing = self._find_row(ws, peer_id, effective_account)
-        if not row_idx:
-            legacy_idx, legacy_row = self._find_last_row_by_peer(ws, peer_id)
-            if legacy_idx and legacy_row:
-                try:
-                    account_idx = headers.index("Аккаунт")
-                except ValueError:
-                    account_idx = None
-                legacy_account = legacy_row[account_idx].strip() if (account_idx is not None and account_idx < len(legacy_row)) else ""
-                if not legacy_account:
-                    row_idx, existing = legacy_idx, legacy_row
-        existing = existing or [""] * len(headers)
-        if len(existing) < len(headers):
-            existing = existing + [""] * (len(headers) - len(existing))
-
-        def col_idx(name: str) -> Optional[int]:
-            try:
-                return headers.index(name)
-            except ValueError:
-                return None
-
-        def set_value(name: str, value: Optional[str]):
-            if value is None:
-                return
-            idx = col_idx(name)
-            if idx is None:
-                return
-            existing[idx] = value
-
-        def get_value(name: str) -> str:
-            idx = col_idx(name)
-            if idx is None or idx >= len(existing):
-                return ""
-            return existing[idx]
-
-        role_value = (sender_role or "").strip() or "unknown"
-        mode_value = (dialog_mode or "").strip() or "ON"
-        step_value = (step_snapshot or "").strip() or "-"
-        text_value = (full_text if full_text is not None else (last_in if last_in is not None else last_out)) or ""
-        text_value = str(text_value).replace("\r\n", "\n").replace("\r", "\n").replace("\n", "\\n").strip()
-        event_line = f"{now_iso} | role={role_value} | mode={mode_value} | step={step_value} | {event_type} | text={text_value}"
-
-        journal_prev = get_value("Журнал событий").strip()
-        journal_lines = [line for line in journal_prev.splitlines() if line.strip()]
-        if not self._is_duplicate_history_event_in_tail(
-            journal_lines,
-            event_line,
-            window_sec=5,
-            tail_size=max(1, JOURNAL_DEDUP_TAIL_LINES),
-        ):
-            journal_lines.append(event_line)
-        journal_lines = journal_lines[-max(50, JOURNAL_MAX_LINES_PER_CHAT):]
-        journal_text = "\n".join(journal_lines)
-
-        set_value("Время события", now_iso)
-        set_value("Дата", str(datetime.now(tz).date()))
-        set_value("Аккаунт", effective_account)
-        set_value("Тип события", event_type)
-        set_value("Имя", name)
-        set_value("Username", ("@" + username) if username else "")
-        set_value("Ссылка на чат", chat_link)
-        set_value("Статус", status or "")
-        if auto_reply_enabled is not None:
-            set_value("Автоответчик", "ON" if auto_reply_enabled else "OFF")
-        set_value("Входящее", last_in or "")
-        set_value("Исходящее", last_out or "")
-        set_value("Peer ID", str(peer_id))
-        if not get_value("Создано"):
-            set_value("Создано", now_iso)
-        set_value("Обновлено", now_iso)
-        set_value("Журнал событий", journal_text)
-
-        try:
-            if row_idx:
-                end_col = self._col_letter(len(headers))
-                ws.update(range_name=f"A{row_idx}:{end_col}{row_idx}", values=[existing], value_input_option="USER_ENTERED")
-                print(f"HISTORY_ROW_UPDATE account={effective_account} peer={peer_id} row={row_idx}")
-            else:
-                row_idx_recheck, existing_recheck = self._find_row(ws, peer_id, effective_account)
-                if row_idx_recheck:
-                    row_idx = row_idx_recheck
-                    existing = existing_recheck or [""] * len(headers)
-                    if len(existing) < len(headers):
-                        existing = existing + [""] * (len(headers) - len(existing))
-                    end_col = self._col_letter(len(headers))
-                    ws.update(range_name=f"A{row_idx}:{end_col}{row_idx}", values=[existing], value_input_option="USER_ENTERED")
-                    print(f"HISTORY_ROW_RECHECK_UPDATE account={effective_account} peer={peer_id} row={row_idx}")
-                else:
-                    # Use append_row for new peer rows to avoid cross-process row overwrite races.
-                    ws.append_row(existing, value_input_option="USER_ENTERED")
-                    self._invalidate_ws_cache(ws)
-                    print(f"HISTORY_ROW_APPEND account={effective_account} peer={peer_id}")
-        except Exception as err:
-            print(f"⚠️ Не вдалося записати історію: {err}")
-            self._invalidate_ws_cache(ws)
-            return None
-        if not row_idx:
-            row_idx, _ = self._find_last_row_by_peer(ws, peer_id, effective_account)
-        if not row_idx:
-            return None
-        return self._sheet_row_link(ws, row_idx, "Открыть журнал")
-
     def upsert(
         self,
         tz: ZoneInfo,
@@ -3502,12 +3443,24 @@ class SheetWriter:
                 app_ws = self._get_group_leads_ws()
                 lead_headers = [str(h or "").strip() for h in app_ws.row_values(1)]
                 month_link_idx = header_index(lead_headers, "Ссылка на месячный лист")
-                if month_link_idx is not None:
-                    lead_row_values = app_ws.row_values(int(lead_info["row_idx"]))
-                    lead_row_full = lead_row_values[:] + [""] * max(0, len(lead_headers) - len(lead_row_values))
-                    if final_row_idx:
+                if month_link_idx is not None and final_row_idx:
+                    # Same lock as GroupLeadsSheet.upsert, so the row is read, written and
+                    # the generation bumped without another writer in between.
+                    lead_lock = FileLock(GROUP_LEADS_UPSERT_LOCK)
+                    lead_lock.acquire(timeout_sec=3.0)
+                    try:
+                        lead_row_values = app_ws.row_values(int(lead_info["row_idx"]))
+                        lead_row_full = lead_row_values[:] + [""] * max(0, len(lead_headers) - len(lead_row_values))
+                        lead_peer_idx = header_index(lead_headers, "Пир")
+                        moved = (
+                            lead_peer_idx is not None
+                            and bool(lead_info.get("peer_id"))
+                            and lead_row_full[lead_peer_idx].strip() != lead_info["peer_id"]
+                        )
                         month_link = self._sheet_row_link(ws, final_row_idx, "Открыть месяц")
-                        if lead_row_full[month_link_idx] != month_link:
+                        if moved:
+                            self.invalidate_group_leads_lookup_cache()
+                        elif lead_row_full[month_link_idx] != month_link:
                             lead_row_full[month_link_idx] = month_link
                             end_col = self._col_letter(len(lead_headers))
                             app_ws.update(
@@ -3515,7 +3468,10 @@ class SheetWriter:
                                 values=[lead_row_full[: len(lead_headers)]],
                                 value_input_option="USER_ENTERED",
                             )
+                            group_leads_generation().bump()
                             self.invalidate_group_leads_lookup_cache()
+                    finally:
+                        lead_lock.release()
         except Exception:
             pass
 
@@ -3553,107 +3509,111 @@ class LocalPauseStore(LocalPauseStoreStore):
         )
 
 
+GROUP_LEADS_INDEX_KEYS = {
+    "source_id": (("id источника", "source id"), lambda value: str(value or "").strip()),
+    "peer": (("пир",), lambda value: str(value or "").strip()),
+    "tg": (("tg", "telegram", "тг"), normalize_username),
+    "phone": (("phone", "телефон"), normalize_phone),
+}
+
+REGISTRATION_INDEX_KEYS = {
+    "peer": (("пир",), lambda value: str(value or "").strip()),
+    "source_message_id": (("id сообщения", "source_message_id"), lambda value: str(value or "").strip()),
+    "message_link": (("ссылка на сообщение", "message_link"), lambda value: str(value or "").strip()),
+}
+
+
+def group_leads_generation() -> WriteGeneration:
+    return WriteGeneration(f"{GROUP_LEADS_UPSERT_LOCK}.gen")
+
+
+def read_sheet_row(ws, row_idx: int, width: int) -> List[str]:
+    values = ws.get(f"A{row_idx}:{col_letter(width)}{row_idx}")
+    return list(values[0]) if values else []
+
+
 class GroupLeadsSheet:
-    def __init__(self):
-        self.gc = sheets_client(GOOGLE_CREDS)
-        self.sh = self.gc.open(SHEET_NAME)
-        self.ws = get_or_create_worksheet(self.sh, GROUP_LEADS_WORKSHEET, rows=1000, cols=len(GROUP_LEADS_HEADERS))
+    def __init__(self, session: Optional[SpreadsheetSession] = None):
+        self.session = session or shared_spreadsheet_session()
+        self.gc = self.session.client
+        self.sh = self.session.spreadsheet
+        self.ws = self.session.get_or_create_worksheet(GROUP_LEADS_WORKSHEET, rows=1000, cols=len(GROUP_LEADS_HEADERS))
         self.lock_path = GROUP_LEADS_UPSERT_LOCK
         self._ensure_headers_exact()
 
     def _ensure_headers_exact(self):
         try:
-            current = self.ws.row_values(1)
-        except Exception:
-            current = []
-        if not current:
-            self.ws.update(
-                range_name=f"A1:{col_letter(len(GROUP_LEADS_HEADERS))}1",
-                values=[GROUP_LEADS_HEADERS],
-                value_input_option="USER_ENTERED",
+            ensure_worksheet_header_prefix(getattr(self, "session", None), self.ws, GROUP_LEADS_HEADERS)
+        except Exception as err:
+            print(f"⚠️ Не вдалося оновити заголовки '{GROUP_LEADS_WORKSHEET}': {err}")
+
+    def _remember_headers(self, values):
+        session = getattr(self, "session", None)
+        if session is not None and values:
+            session.remember_header_row(GROUP_LEADS_WORKSHEET, values[0])
+
+    def _generation(self) -> WriteGeneration:
+        return WriteGeneration(f"{self.lock_path}.gen")
+
+    def _current_index(self) -> SheetRowIndex:
+        """Row index of the sheet, re-read only after another writer or the TTL."""
+        index = getattr(self, "_index", None)
+        if index is None:
+            index = self._index = SheetRowIndex(
+                GROUP_LEADS_INDEX_KEYS, len(GROUP_LEADS_HEADERS), max_age_sec=GROUP_LEADS_LOOKUP_CACHE_TTL_SEC
             )
-            return
-        if current[: len(GROUP_LEADS_HEADERS)] != GROUP_LEADS_HEADERS:
+        generation = self._generation().read()
+        if not index.fresh(generation):
             try:
                 values = self.ws.get_all_values()
+                self._remember_headers(values)
             except Exception:
-                values = []
-            write_full_worksheet_values(self.ws, remap_rows_by_headers(values, GROUP_LEADS_HEADERS))
-
-    def _find_row(self, values, peer_id: str, tg_norm: str, phone_norm: str, source_id: str, source_name: str):
-        if not values:
+                values, generation = [GROUP_LEADS_HEADERS[:]], None
+            index.load(values, generation)
+        return index
+
+    def _find_row(self, index: SheetRowIndex, peer_id: str, tg_norm: str, phone_norm: str, source_id: str, source_name: str):
+        # Same precedence as a top-down scan: the first row matching any key wins, and a
+        # row whose source id matches under another source name is skipped entirely.
+        skipped = set()
+        candidates = []
+        source_name_idx = index.column("источник", "source")
+        for row_idx in index.rows_for("source_id", source_id):
+            row_source_name = normalize_name(index.cell(row_idx, source_name_idx))
+            if source_name and row_source_name and row_source_name != normalize_name(source_name):
+                skipped.add(row_idx)
+                continue
+            candidates.append(row_idx)
+            break
+        for key, value in (("peer", peer_id), ("tg", tg_norm), ("phone", phone_norm)):
+            rows = [row_idx for row_idx in index.rows_for(key, value) if row_idx not in skipped]
+            if rows:
+                candidates.append(rows[0])
+        if not candidates:
             return None, None
-        headers = [str(h or "").strip().lower() for h in values[0]]
-        data = values[1:]
-
-        def get_col(name: str) -> Optional[int]:
-            try:
-                return headers.index(name)
-            except ValueError:
-                return None
-
-        tg_idx = (
-            get_col("tg")
-            if get_col("tg") is not None
-            else (get_col("telegram") if get_col("telegram") is not None else get_col("тг"))
-        )
-        phone_idx = (
-            get_col("phone")
-            if get_col("phone") is not None
-            else get_col("телефон")
-        )
-        source_id_idx = (
-            get_col("id источника")
-            if get_col("id источника") is not None
-            else get_col("source id")
-        )
-        source_name_idx = (
-            get_col("источник")
-            if get_col("источник") is not None
-            else get_col("source")
-        )
-        peer_idx = get_col("пир")
-        for idx, row in enumerate(data, start=2):
-            if source_id and source_id_idx is not None and source_id_idx < len(row):
-                row_source_id = (row[source_id_idx] or "").strip()
-                if row_source_id == source_id:
-                    if source_name and source_name_idx is not None and source_name_idx < len(row):
-                        row_source_name = normalize_name(row[source_name_idx] or "")
-                        if row_source_name and row_source_name != normalize_name(source_name):
-                            continue
-                    return idx, row
-            if peer_id and peer_idx is not None and peer_idx < len(row):
-                if str(row[peer_idx] or "").strip() == peer_id:
-                    return idx, row
-            if tg_idx is not None and tg_idx < len(row) and tg_norm:
-                if normalize_username(row[tg_idx]) == tg_norm:
-                    return idx, row
-            if phone_idx is not None and phone_idx < len(row) and phone_norm:
-                if normalize_phone(row[phone_idx]) == phone_norm:
-                    return idx, row
-        return None, None
+        row_idx = min(candidates)
+        return row_idx, index.row(row_idx)
 
     def _find_month_link(self, tz: ZoneInfo, peer_id: str) -> str:
         peer_raw = str(peer_id or "").strip()
         if not peer_raw:
             return ""
+        month_rows = getattr(self, "_month_rows", None)
+        if month_rows is None:
+            month_rows = self._month_rows = PeerRowCache(GROUP_LEADS_LOOKUP_CACHE_TTL_SEC)
         try:
-            month_ws = self.sh.worksheet(format_month_sheet_title(datetime.now(tz).date()))
-            values = month_ws.get_all_values()
+            month_ws, row_idx, _ = month_rows.lookup(
+                format_month_sheet_title(datetime.now(tz).date()), self.session.worksheet, peer_raw
+            )
         except Exception:
             return ""
-        row_idx, _ = find_row_in_values_by_peer(values, peer_raw)
         if not row_idx:
             return ""
         return build_sheet_row_link(month_ws, row_idx, "Открыть месяц")
 
     def upsert(self, tz: ZoneInfo, data: dict, status: Optional[str]):
-        lock_acquired = False
-        for _ in range(30):
-            if acquire_lock(self.lock_path, ttl_sec=5):
-                lock_acquired = True
-                break
-            time.sleep(0.1)
+        lock = FileLock(self.lock_path)
+        lock.acquire(timeout_sec=3.0)
         try:
             self._ensure_headers_exact()
             received_at = datetime.now(tz).isoformat(timespec="seconds")
@@ -3664,12 +3624,18 @@ class GroupLeadsSheet:
             peer_id = str(data.get("peer_id", "") or "").strip()
             tg_norm = normalize_username(tg_value)
             phone_norm = normalize_phone(phone_value)
-            try:
-                values = self.ws.get_all_values()
-            except Exception:
-                values = [GROUP_LEADS_HEADERS[:]]
-            row_idx, existing = self._find_row(values, peer_id, tg_norm, phone_norm, source_id, source_name)
-            existing = existing or [""] * len(GROUP_LEADS_HEADERS)
+            wanted = {"source_id": source_id, "peer": peer_id, "tg": tg_norm, "phone": phone_norm}
+            index = self._current_index()
+            row_idx, _ = self._find_row(index, peer_id, tg_norm, phone_norm, source_id, source_name)
+            target = row_idx or index.next_row()
+            # The copy may predate a manual edit or a row move: re-read the target row and
+            # merge from it, or reload the whole sheet if it no longer holds our keys.
+            if not index.confirm(target, read_sheet_row(self.ws, target, len(GROUP_LEADS_HEADERS)), wanted if row_idx else {}):
+                index.invalidate()
+                index = self._current_index()
+                row_idx, _ = self._find_row(index, peer_id, tg_norm, phone_norm, source_id, source_name)
+                target = row_idx or index.next_row()
+            existing = (index.row(row_idx) if row_idx else []) or [""] * len(GROUP_LEADS_HEADERS)
             month_link = self._find_month_link(tz, peer_id)
 
             def take(key: str, idx: int) -> str:
@@ -3696,136 +3662,105 @@ class GroupLeadsSheet:
                 take("raw_text", 14),
             ]
             end_col = col_letter(len(GROUP_LEADS_HEADERS))
-            if row_idx:
+            row_idx = target
+            try:
                 self.ws.update(
                     range_name=f"A{row_idx}:{end_col}{row_idx}",
                     values=[row],
                     value_input_option="USER_ENTERED",
                 )
-            else:
-                next_row = max(len(values) + 1, 2)
-                self.ws.update(
-                    range_name=f"A{next_row}:{end_col}{next_row}",
-                    values=[row],
-                    value_input_option="USER_ENTERED",
-                )
+            except Exception:
+                index.invalidate()
+                raise
+            index.put(row_idx, row, self._generation().bump())
         finally:
-            if lock_acquired:
-                release_lock(self.lock_path)
+            lock.release()
 
 
 class RegistrationSheet:
-    def __init__(self):
-        self.gc = sheets_client(GOOGLE_CREDS)
-        self.sh = self.gc.open(SHEET_NAME)
-        self.ws = get_or_create_worksheet(self.sh, REGISTRATION_WORKSHEET, rows=1000, cols=len(REGISTRATION_HEADERS))
+    def __init__(self, session: Optional[SpreadsheetSession] = None):
+        self.session = session or shared_spreadsheet_session()
+        self.gc = self.session.client
+        self.sh = self.session.spreadsheet
+        self.ws = self.session.get_or_create_worksheet(REGISTRATION_WORKSHEET, rows=1000, cols=len(REGISTRATION_HEADERS))
         self.lock_path = REGISTRATION_UPSERT_LOCK
         self._ensure_headers_exact()
 
     def _ensure_headers_exact(self):
         try:
-            current = self.ws.row_values(1)
-            if not current:
-                self.ws.update(
-                    range_name=f"A1:{col_letter(len(REGISTRATION_HEADERS))}1",
-                    values=[REGISTRATION_HEADERS],
-                    value_input_option="USER_ENTERED",
-                )
-                return
-            if current[: len(REGISTRATION_HEADERS)] != REGISTRATION_HEADERS:
-                try:
-                    values = self.ws.get_all_values()
-                except Exception:
-                    values = []
-                write_full_worksheet_values(self.ws, remap_rows_by_headers(values, REGISTRATION_HEADERS))
+            ensure_worksheet_header_prefix(getattr(self, "session", None), self.ws, REGISTRATION_HEADERS)
         except Exception as err:
             print(f"⚠️ Не вдалося оновити заголовки '{REGISTRATION_WORKSHEET}': {err}")
 
-    def _find_row(self, values, peer_id: str, source_message_id: str, message_link: str):
-        if not values:
-            return None, None
-        headers = [str(h or "").strip().lower() for h in values[0]]
-        data = values[1:]
+    def _remember_headers(self, values):
+        session = getattr(self, "session", None)
+        if session is not None and values:
+            session.remember_header_row(REGISTRATION_WORKSHEET, values[0])
 
-        def get_col(name: str):
+    def _generation(self) -> WriteGeneration:
+        return WriteGeneration(f"{self.lock_path}.gen")
+
+    def _current_index(self) -> SheetRowIndex:
+        index = getattr(self, "_index", None)
+        if index is None:
+            index = self._index = SheetRowIndex(
+                REGISTRATION_INDEX_KEYS, len(REGISTRATION_HEADERS), max_age_sec=GROUP_LEADS_LOOKUP_CACHE_TTL_SEC
+            )
+        generation = self._generation().read()
+        if not index.fresh(generation):
             try:
-                return headers.index(name)
-            except ValueError:
-                return None
+                values = self.ws.get_all_values()
+                self._remember_headers(values)
+            except Exception:
+                values, generation = [REGISTRATION_HEADERS[:]], None
+            index.load(values, generation)
+        return index
 
-        message_id_idx = (
-            get_col("id сообщения")
-            if get_col("id сообщения") is not None
-            else get_col("source_message_id")
-        )
-        message_link_idx = (
-            get_col("ссылка на сообщение")
-            if get_col("ссылка на сообщение") is not None
-            else get_col("message_link")
-        )
-        peer_idx = get_col("пир")
-        peer_id = str(peer_id or "").strip()
+    def _find_row(self, index: SheetRowIndex, peer_id: str, source_message_id: str, message_link: str):
         source_message_id = str(source_message_id or "").strip()
-        message_link = str(message_link or "").strip()
-
-        for idx, row in enumerate(data, start=2):
-            if peer_id and peer_idx is not None and peer_idx < len(row):
-                if str(row[peer_idx] or "").strip() == peer_id:
-                    return idx, row
-            if source_message_id and message_id_idx is not None and message_id_idx < len(row):
-                row_message_id = str(row[message_id_idx] or "").strip()
-                if row_message_id == source_message_id:
-                    return idx, row
-            if (
-                not source_message_id
-                and message_link
-                and message_link_idx is not None
-                and message_link_idx < len(row)
-            ):
-                row_message_link = str(row[message_link_idx] or "").strip()
-                if row_message_link == message_link:
-                    return idx, row
-        return None, None
+        candidates = []
+        for key, value in (
+            ("peer", peer_id),
+            ("source_message_id", source_message_id),
+            ("message_link", "" if source_message_id else message_link),
+        ):
+            rows = index.rows_for(key, value)
+            if rows:
+                candidates.append(rows[0])
+        if not candidates:
+            return None, None
+        row_idx = min(candidates)
+        return row_idx, index.row(row_idx)
 
-    def _find_sheet_row_link_by_peer(self, sheet_title: str, peer_id: str, label: str) -> str:
+    def _linked_row(self, sheet_title: str, peer_id: str):
+        """Cached peer row of the month sheet or GroupLeads; GroupLeads follows its write generation."""
         peer_raw = str(peer_id or "").strip()
         if not peer_raw:
-            return ""
+            return None, None, None
+        linked_rows = getattr(self, "_linked_rows", None)
+        if linked_rows is None:
+            linked_rows = self._linked_rows = PeerRowCache(GROUP_LEADS_LOOKUP_CACHE_TTL_SEC)
+        generation = group_leads_generation().read() if sheet_title == GROUP_LEADS_WORKSHEET else 0
         try:
-            ws = self.sh.worksheet(sheet_title)
-            values = ws.get_all_values()
+            return linked_rows.lookup(sheet_title, self.session.worksheet, peer_raw, generation)
         except Exception:
-            return ""
-        row_idx, _ = find_row_in_values_by_peer(values, peer_raw)
+            return None, None, None
+
+    def _find_sheet_row_link_by_peer(self, sheet_title: str, peer_id: str, label: str) -> str:
+        ws, row_idx, _ = self._linked_row(sheet_title, peer_id)
         if not row_idx:
             return ""
         return build_sheet_row_link(ws, row_idx, label)
 
     def _find_group_lead_note(self, peer_id: str) -> str:
-        peer_raw = str(peer_id or "").strip()
-        if not peer_raw:
-            return ""
-        try:
-            ws = self.sh.worksheet(GROUP_LEADS_WORKSHEET)
-            values = ws.get_all_values()
-        except Exception:
-            return ""
-        row_idx, row = find_row_in_values_by_peer(values, peer_raw)
-        if not row_idx or not row:
-            return ""
-        headers = [str(h or "").strip() for h in values[0]]
-        note_idx = header_index(headers, "Примечание")
-        if note_idx is None or note_idx >= len(row):
+        _, row_idx, index = self._linked_row(GROUP_LEADS_WORKSHEET, peer_id)
+        if not row_idx:
             return ""
-        return str(row[note_idx] or "").strip()
+        return index.cell(row_idx, index.column("примечание")).strip()
 
     def upsert(self, tz: ZoneInfo, data: dict):
-        lock_acquired = False
-        for _ in range(30):
-            if acquire_lock(self.lock_path, ttl_sec=5):
-                lock_acquired = True
-                break
-            time.sleep(0.1)
+        lock = FileLock(self.lock_path)
+        lock.acquire(timeout_sec=3.0)
         try:
             self._ensure_headers_exact()
             peer_id = str(data.get("peer_id", "") or "").strip()
@@ -3862,164 +3797,154 @@ class RegistrationSheet:
                 datetime.now(tz).isoformat(timespec="seconds"),
             ]
 
-            try:
-                values = self.ws.get_all_values()
-            except Exception:
-                values = [REGISTRATION_HEADERS[:]]
-
-            row_idx, _ = self._find_row(
-                values,
-                peer_id,
-                str(data.get("source_message_id", "") or ""),
-                data.get("message_link", ""),
-            )
-            if not row_idx:
-                next_row = 2
-                for idx, existing in enumerate(values[1:], start=2):
-                    row_cells = existing[: len(REGISTRATION_HEADERS)]
-                    if all(not (cell or "").strip() for cell in row_cells):
-                        next_row = idx
-                        break
-                    next_row = idx + 1
-                row_idx = next_row
+            source_message_id = str(data.get("source_message_id", "") or "").strip()
+            message_link = data.get("message_link", "")
+            wanted = {
+                "peer": peer_id,
+                "source_message_id": source_message_id,
+                "message_link": "" if source_message_id else message_link,
+            }
+            index = self._current_index()
+            row_idx, _ = self._find_row(index, peer_id, source_message_id, message_link)
+            target = row_idx or index.first_blank_row()
+            if not index.confirm(target, read_sheet_row(self.ws, target, len(REGISTRATION_HEADERS)), wanted if row_idx else {}):
+                index.invalidate()
+                index = self._current_index()
+                row_idx, _ = self._find_row(index, peer_id, source_message_id, message_link)
+                target = row_idx or index.first_blank_row()
+            row_idx = target
 
             end_col = col_letter(len(REGISTRATION_HEADERS))
-            self.ws.update(
-                range_name=f"A{row_idx}:{end_col}{row_idx}",
-                values=[row],
-                value_input_option="USER_ENTERED",
-            )
+            try:
+                self.ws.update(
+                    range_name=f"A{row_idx}:{end_col}{row_idx}",
+                    values=[row],
+                    value_input_option="USER_ENTERED",
+                )
+            except Exception:
+                index.invalidate()
+                raise
+            index.put(row_idx, row, self._generation().bump())
         finally:
-            if lock_acquired:
-                release_lock(self.lock_path)
+            lock.release()
 
 
 class FAQQuestionsSheet:
-    def __init__(self):
-        self.gc = sheets_client(GOOGLE_CREDS)
-        self.sh = self.gc.open(SHEET_NAME)
-        self.ws = get_or_create_worksheet(self.sh, FAQ_QUESTIONS_WORKSHEET, rows=1000, cols=len(FAQ_QUESTIONS_HEADERS))
+    def __init__(self, session: Optional[SpreadsheetSession] = None):
+        self.session = session or shared_spreadsheet_session()
+        self.gc = self.session.client
+        self.sh = self.session.spreadsheet
+        self.ws = self.session.get_or_create_worksheet(FAQ_QUESTIONS_WORKSHEET, rows=1000, cols=len(FAQ_QUESTIONS_HEADERS))
         self._ensure_headers()
 
     def _ensure_headers(self):
-        try:
-            current = self.ws.row_values(1)
-        except Exception:
-            current = []
-        if current[: len(FAQ_QUESTIONS_HEADERS)] != FAQ_QUESTIONS_HEADERS:
-            self.ws.update(
-                range_name=f"A1:{col_letter(len(FAQ_QUESTIONS_HEADERS))}1",
-                values=[FAQ_QUESTIONS_HEADERS],
-                value_input_option="USER_ENTERED",
-            )
+        ensure_worksheet_header_prefix(self.session, self.ws, FAQ_QUESTIONS_HEADERS, move_columns=False)
 
-    def upsert_question(self, row: dict):
+    def upsert_clusters(self, clusters: List[ClusterStat]) -> Dict[str, int]:
+        """Write aggregated clusters with one read and one batch update; returns sheet counts."""
+        if not clusters:
+            return {}
         values = self.ws.get_all_values()
         if not values:
+            self.session.remember_header_row(FAQ_QUESTIONS_WORKSHEET, [])
             self._ensure_headers()
             values = self.ws.get_all_values()
         headers = [h.strip() for h in values[0]]
         try:
             cluster_idx = headers.index("cluster_key")
             count_idx = headers.index("count")
-            last_seen_idx = headers.index("last_seen_at")
             answer_idx = headers.index("answer_preview")
+            status_idx = headers.index("resolved_status")
         except ValueError:
-            return
-        target_row = None
+            missing = [h for h in ("cluster_key", "count", "answer_preview", "resolved_status") if h not in headers]
+            print(f"⚠️ FAQ_QUESTIONS_HEADERS_MISSING sheet='{FAQ_QUESTIONS_WORKSHEET}' missing={','.join(missing)}")
+            return {}
+        rows_by_key: Dict[str, Tuple[int, List[str]]] = {}
         for idx, existing in enumerate(values[1:], start=2):
             key = existing[cluster_idx].strip() if cluster_idx < len(existing) else ""
-            if key == row.get("cluster_key", ""):
-                target_row = (idx, existing)
-                break
-        end_col = col_letter(len(FAQ_QUESTIONS_HEADERS))
-        if target_row:
-            row_idx, existing = target_row
+            if key and key not in rows_by_key:
+                rows_by_key[key] = (idx, existing)
+        next_row = max(len(values) + 1, 2)
+        patches = CellPatchBuffer()
+        counts: Dict[str, int] = {}
+        for cluster in clusters:
+            out = [str(cluster.latest.get(h, "") or "") for h in FAQ_QUESTIONS_HEADERS]
+            out[FAQ_QUESTIONS_HEADERS.index("cluster_key")] = cluster.cluster_key
+            out[FAQ_QUESTIONS_HEADERS.index("created_at")] = cluster.first_seen_at
+            out[FAQ_QUESTIONS_HEADERS.index("last_seen_at")] = cluster.last_seen_at
+            target = rows_by_key.get(cluster.cluster_key)
             current_count = 0
-            if count_idx < len(existing):
+            if target:
+                row_idx, existing = target
                 try:
-                    current_count = int(existing[count_idx] or 0)
+                    current_count = int(existing[count_idx] or 0) if count_idx < len(existing) else 0
                 except ValueError:
                     current_count = 0
-            merged = [row.get(h, "") for h in FAQ_QUESTIONS_HEADERS]
-            merged[count_idx] = str(max(1, current_count + 1))
-            merged[last_seen_idx] = row.get("last_seen_at", row.get("created_at", ""))
-            if answer_idx < len(existing) and existing[answer_idx].strip():
-                merged[answer_idx] = existing[answer_idx]
-            self.ws.update(
-                range_name=f"A{row_idx}:{end_col}{row_idx}",
-                values=[merged],
-                value_input_option="USER_ENTERED",
-            )
-            return
-        next_row = max(len(values) + 1, 2)
-        out = [row.get(h, "") for h in FAQ_QUESTIONS_HEADERS]
-        self.ws.update(
-            range_name=f"A{next_row}:{end_col}{next_row}",
-            values=[out],
-            value_input_option="USER_ENTERED",
-        )
+                for idx in (answer_idx, status_idx):
+                    if idx < len(existing) and existing[idx].strip():
+                        out[FAQ_QUESTIONS_HEADERS.index(headers[idx])] = existing[idx]
+                created_idx = header_index(headers, "created_at")
+                if created_idx is not None and created_idx < len(existing) and existing[created_idx].strip():
+                    out[FAQ_QUESTIONS_HEADERS.index("created_at")] = existing[created_idx]
+            else:
+                row_idx = next_row
+                next_row += 1
+            counts[cluster.cluster_key] = max(1, current_count + cluster.pending)
+            out[FAQ_QUESTIONS_HEADERS.index("count")] = str(counts[cluster.cluster_key])
+            for col, value in enumerate(out):
+                patches.add(self.ws, row_idx, col, value)
+        patches.flush()
+        return counts
 
 
 class FAQSuggestionsSheet:
-    def __init__(self):
-        self.gc = sheets_client(GOOGLE_CREDS)
-        self.sh = self.gc.open(SHEET_NAME)
-        self.ws = get_or_create_worksheet(self.sh, FAQ_SUGGESTIONS_WORKSHEET, rows=1000, cols=len(FAQ_SUGGESTIONS_HEADERS))
+    def __init__(self, session: Optional[SpreadsheetSession] = None):
+        self.session = session or shared_spreadsheet_session()
+        self.gc = self.session.client
+        self.sh = self.session.spreadsheet
+        self.ws = self.session.get_or_create_worksheet(FAQ_SUGGESTIONS_WORKSHEET, rows=1000, cols=len(FAQ_SUGGESTIONS_HEADERS))
         self._ensure_headers()
 
     def _ensure_headers(self):
-        try:
-            current = self.ws.row_values(1)
-        except Exception:
-            current = []
-        if current[: len(FAQ_SUGGESTIONS_HEADERS)] != FAQ_SUGGESTIONS_HEADERS:
-            self.ws.update(
-                range_name=f"A1:{col_letter(len(FAQ_SUGGESTIONS_HEADERS))}1",
-                values=[FAQ_SUGGESTIONS_HEADERS],
-                value_input_option="USER_ENTERED",
-            )
+        ensure_worksheet_header_prefix(self.session, self.ws, FAQ_SUGGESTIONS_HEADERS, move_columns=False)
 
-    def append_if_missing(self, row: dict):
+    def append_missing(self, rows: List[dict]) -> List[str]:
+        """Append suggestions whose cluster is not on the sheet yet; returns keys now present."""
+        rows = [row for row in rows if str(row.get("question_cluster", "")).strip()]
+        if not rows:
+            return []
         values = self.ws.get_all_values()
-        key = str(row.get("question_cluster", "")).strip()
-        if not key:
-            return
-        for existing in values[1:]:
-            if existing and existing[0].strip() == key:
-                return
+        present = {existing[0].strip() for existing in values[1:] if existing}
         next_row = max(len(values) + 1, 2)
-        end_col = col_letter(len(FAQ_SUGGESTIONS_HEADERS))
-        out = [row.get(h, "") for h in FAQ_SUGGESTIONS_HEADERS]
-        self.ws.update(
-            range_name=f"A{next_row}:{end_col}{next_row}",
-            values=[out],
-            value_input_option="USER_ENTERED",
-        )
+        patches = CellPatchBuffer()
+        keys: List[str] = []
+        for row in rows:
+            key = str(row.get("question_cluster", "")).strip()
+            keys.append(key)
+            if key in present:
+                continue
+            present.add(key)
+            for col, header in enumerate(FAQ_SUGGESTIONS_HEADERS):
+                patches.add(self.ws, next_row, col, row.get(header, ""))
+            next_row += 1
+        patches.flush()
+        return keys
 
 
 class FAQLikesTrainingSheet:
-    def __init__(self):
-        self.gc = sheets_client(GOOGLE_CREDS)
-        self.sh = self.gc.open(SHEET_NAME)
-        self.ws = get_or_create_worksheet(self.sh, LIKE_TRAINING_SHEET, rows=2000, cols=len(FAQ_LIKES_TRAIN_HEADERS))
+    def __init__(self, session: Optional[SpreadsheetSession] = None):
+        self.session = session or shared_spreadsheet_session()
+        self.gc = self.session.client
+        self.sh = self.session.spreadsheet
+        self.ws = self.session.get_or_create_worksheet(LIKE_TRAINING_SHEET, rows=2000, cols=len(FAQ_LIKES_TRAIN_HEADERS))
         self._next_row = 2
         self._pair_keys = set()
         self._by_cluster: Dict[str, List[dict]] = {}
         self._ensure_headers()
-        self._load_cache()
-
-    def _ensure_headers(self):
-        try:
-            current = self.ws.row_values(1)
-        except Exception:
-            current = []
-        if current[: len(FAQ_LIKES_TRAIN_HEADERS)] != FAQ_LIKES_TRAIN_HEADERS:
-            self.ws.update(
-                range_name=f"A1:{col_letter(len(FAQ_LIKES_TRAIN_HEADERS))}1",
-                values=[FAQ_LIKES_TRAIN_HEADERS],
-                value_input_option="USER_ENTERED",
-            )
+        self._load_cache()
+
+    def _ensure_headers(self):
+        ensure_worksheet_header_prefix(self.session, self.ws, FAQ_LIKES_TRAIN_HEADERS, move_columns=False)
 
     def _load_cache(self):
         try:
@@ -4042,10 +3967,14 @@ class FAQLikesTrainingSheet:
             if active not in {"1", "true", "yes", "on"}:
                 continue
             cluster_key = str(row[index.get("cluster_key", -1)]).strip() if index.get("cluster_key", -1) < len(row) else ""
+            candidate_text_norm = str(row[index.get("candidate_text_norm", -1)]).strip() if index.get("candidate_text_norm", -1) < len(row) else ""
+            if candidate_text_norm:
+                # Rows saved with the old prefix keys are regrouped by the near-duplicate clusters.
+                cluster_key = question_cluster_key(candidate_text_norm)
             if not cluster_key:
                 continue
             item = {
-                "candidate_text_norm": str(row[index.get("candidate_text_norm", -1)]).strip() if index.get("candidate_text_norm", -1) < len(row) else "",
+                "candidate_text_norm": candidate_text_norm,
                 "operator_answer_raw": str(row[index.get("operator_answer_raw", -1)]).strip() if index.get("operator_answer_raw", -1) < len(row) else "",
                 "operator_answer_norm": str(row[index.get("operator_answer_norm", -1)]).strip() if index.get("operator_answer_norm", -1) < len(row) else "",
                 "step_snapshot": str(row[index.get("step_snapshot", -1)]).strip() if index.get("step_snapshot", -1) < len(row) else "",
@@ -4091,10 +4020,15 @@ class FAQLikesTrainingSheet:
 
 
 class GoogleDriveUploader:
-    def __init__(self, creds_path: str, folder_id: str):
+    def __init__(self, creds_path: str, folder_id: str, permission_attempts: int = 5):
         self.creds_path = creds_path
         self.folder_id = (folder_id or "").strip()
+        self.permission_attempts = max(1, int(permission_attempts))
         self._service = None
+        # file id -> failed grant attempts so far
+        self._pending_permissions: Dict[str, int] = {}
+        self._pending_since = 0.0
+        self._permissions_lock = threading.Lock()
 
     def _get_service(self):
         if self._service is not None:
@@ -4109,37 +4043,122 @@ class GoogleDriveUploader:
         self._service = build("drive", "v3", credentials=creds, cache_discovery=False)
         return self._service
 
-    def upload_file(self, file_path: str, file_name: str, mime_type: Optional[str] = None) -> str:
+    def upload_stream(self, stream, file_name: str, mime_type: Optional[str] = None, size: int = 0) -> str:
+        """Upload from an open binary stream; files above one chunk go up resumably.
+
+        The public-reader permission is queued for `flush_permissions()` instead of a
+        separate request per file.
+        """
         if not self.folder_id:
             raise ValueError("REGISTRATION_DRIVE_FOLDER_ID is empty")
-        from googleapiclient.http import MediaFileUpload
+        from googleapiclient.http import MediaIoBaseUpload
 
         service = self._get_service()
         metadata = {"name": file_name, "parents": [self.folder_id]}
-        media = MediaFileUpload(file_path, mimetype=mime_type, resumable=False)
-        created = service.files().create(
+        resumable = size > REGISTRATION_UPLOAD_CHUNK_BYTES
+        media = MediaIoBaseUpload(
+            stream,
+            mimetype=mime_type or "application/octet-stream",
+            chunksize=REGISTRATION_UPLOAD_CHUNK_BYTES,
+            resumable=resumable,
+        )
+        request = service.files().create(
             body=metadata,
             media_body=media,
             fields="id,webViewLink,webContentLink",
             supportsAllDrives=True,
-        ).execute()
+        )
+        if resumable:
+            created = None
+            while created is None:
+                _, created = request.next_chunk(num_retries=3)
+        else:
+            created = request.execute(num_retries=3)
         file_id = created.get("id")
         if not file_id:
             raise RuntimeError("Drive upload returned no file id")
-        try:
-            service.permissions().create(
-                fileId=file_id,
-                body={"role": "reader", "type": "anyone"},
-                supportsAllDrives=True,
-            ).execute()
-        except Exception:
-            pass
+        self._queue_permissions({file_id: 0})
         return (
             created.get("webViewLink")
             or created.get("webContentLink")
             or f"https://drive.google.com/file/d/{file_id}/view"
         )
 
+    def _queue_permissions(self, attempts_by_id: Dict[str, int]) -> None:
+        with self._permissions_lock:
+            if attempts_by_id and not self._pending_permissions:
+                self._pending_since = time.time()
+            for file_id, attempts in attempts_by_id.items():
+                self._pending_permissions[file_id] = max(attempts, self._pending_permissions.get(file_id, 0))
+
+    def pending_permissions(self) -> int:
+        with self._permissions_lock:
+            return len(self._pending_permissions)
+
+    def permissions_due(self, max_pending: int, max_age_sec: float) -> bool:
+        with self._permissions_lock:
+            if not self._pending_permissions:
+                return False
+            return (
+                len(self._pending_permissions) >= max(1, int(max_pending))
+                or time.time() - self._pending_since >= max(0.0, float(max_age_sec))
+            )
+
+    def flush_permissions(self) -> int:
+        """Grant "anyone with the link" on queued uploads in one batch HTTP request per 100.
+
+        Files whose grant failed, or whose batch did not go out, are queued again until
+        they have failed `permission_attempts` times.
+        """
+        with self._permissions_lock:
+            pending, self._pending_permissions = self._pending_permissions, {}
+        if not pending:
+            return 0
+        file_ids = list(pending)
+        failed: Set[str] = set()
+        sent = 0
+        error: Optional[Exception] = None
+
+        def on_done(request_id, _response, exception):
+            if exception is not None:
+                failed.add(request_id)
+
+        try:
+            service = self._get_service()
+            for start in range(0, len(file_ids), 100):
+                chunk = file_ids[start : start + 100]
+                batch = service.new_batch_http_request(callback=on_done)
+                for file_id in chunk:
+                    batch.add(
+                        service.permissions().create(
+                            fileId=file_id,
+                            body={"role": "reader", "type": "anyone"},
+                            supportsAllDrives=True,
+                        ),
+                        request_id=file_id,
+                    )
+                batch.execute()
+                sent = start + len(chunk)
+        except Exception as err:
+            # The grant is idempotent, so the whole unfinished batch is simply retried.
+            error = err
+            failed.update(file_ids[sent:])
+        granted = len(file_ids) - len(failed)
+        retry = {file_id: pending[file_id] + 1 for file_id in failed}
+        dropped = [file_id for file_id, attempts in retry.items() if attempts >= self.permission_attempts]
+        for file_id in dropped:
+            retry.pop(file_id)
+        self._queue_permissions(retry)
+        if failed:
+            print(
+                f"⚠️ DRIVE_PERMISSIONS_FAIL files={len(failed)} of {len(file_ids)} "
+                f"retry={len(retry)} dropped={','.join(dropped) or '-'}"
+                + (f" err={type(error).__name__}: {error}" if error else "")
+            )
+        if error is not None:
+            raise error
+        return granted
+
     def check_folder_access(self) -> Optional[str]:
         if not self.folder_id:
             return None
@@ -4156,30 +4175,44 @@ def build_message_link(event) -> str:
     return build_registration_message_link(getattr(event, "chat_id", None), getattr(event, "id", None))
 
 
-async def upload_media_to_drive(message, chat_id: int, message_id: int, uploader: GoogleDriveUploader) -> str:
+async def upload_media_to_drive(
+    message,
+    chat_id: int,
+    message_id: int,
+    uploader: GoogleDriveUploader,
+    index: Optional[DriveUploadIndex] = None,
+) -> str:
     if not uploader:
         return ""
-    os.makedirs(REGISTRATION_DOWNLOAD_DIR, exist_ok=True)
+    media_key = telegram_media_key(message)
+    if index is not None and media_key:
+        link = await asyncio.to_thread(index.lookup, uploader.folder_id, media_key)
+        if link:
+            print(f"REGISTRATION_UPLOAD_DEDUPE key={media_key} peer={chat_id} msg={message_id}")
+            return link
     file_obj = getattr(message, "file", None)
     ext = getattr(file_obj, "ext", None) or ""
     mime_type = getattr(file_obj, "mime_type", None)
     file_name = f"registration_{int(time.time())}_{message_id}{ext}"
-    local_path = os.path.join(REGISTRATION_DOWNLOAD_DIR, file_name)
-    downloaded_path = ""
-    try:
-        downloaded_path = await message.download_media(file=local_path)
-        if not downloaded_path:
-            raise RuntimeError("download_media returned empty path")
-        drive_name = os.path.basename(downloaded_path)
-        return await asyncio.to_thread(uploader.upload_file, downloaded_path, drive_name, mime_type)
-    finally:
-        try:
-            if downloaded_path and os.path.exists(downloaded_path):
-                os.remove(downloaded_path)
-            elif os.path.exists(local_path):
-                os.remove(local_path)
-        except Exception as err:
-            print(f"⚠️ Не вдалося видалити тимчасовий файл '{local_path}' peer={chat_id} msg={message_id}: {err}")
+    # Small documents stay in memory; larger ones spill to REGISTRATION_DOWNLOAD_DIR and
+    # the spool file disappears on close, so nothing is left behind on errors.
+    os.makedirs(REGISTRATION_DOWNLOAD_DIR, exist_ok=True)
+    with tempfile.SpooledTemporaryFile(max_size=REGISTRATION_SPOOL_MAX_BYTES, dir=REGISTRATION_DOWNLOAD_DIR) as buffer:
+        result = await message.download_media(file=buffer)
+        if result is None:
+            raise RuntimeError(f"download_media returned nothing peer={chat_id} msg={message_id}")
+        size = buffer.tell()
+        if index is None:
+            buffer.seek(0)
+            return await asyncio.to_thread(uploader.upload_stream, buffer, file_name, mime_type, size)
+        content_key = "sha256:" + await asyncio.to_thread(stream_sha256, buffer)
+        link = await asyncio.to_thread(index.lookup, uploader.folder_id, content_key)
+        if link:
+            print(f"REGISTRATION_UPLOAD_DEDUPE key=content peer={chat_id} msg={message_id}")
+        else:
+            link = await asyncio.to_thread(uploader.upload_stream, buffer, file_name, mime_type, size)
+        await asyncio.to_thread(index.remember, uploader.folder_id, link, media_key, content_key)
+        return link
 
 
 async def find_group_by_title(client: TelegramClient, title: str):
@@ -4301,6 +4334,7 @@ async def send_and_update(
     followup_state: Optional["FollowupState"] = None,
     parse_mode: Optional[str] = None,
     return_success: bool = False,
+    priority: int = PRIORITY_LIVE,
 ):
     history = []
     if use_ai:
@@ -4326,7 +4360,11 @@ async def send_and_update(
     async def _sender(message_text: str):
         final_text = enforce_formal_address(message_text)
         kwargs = {"parse_mode": parse_mode} if parse_mode else {}
-        sent_message = await client.send_message(entity, final_text, **kwargs)
+        sent_message = await SEND_SCHEDULER.submit(
+            entity.id,
+            lambda: client.send_message(entity, final_text, **kwargs),
+            priority=priority,
+        )
         sent_payload["message"] = sent_message
         sent_payload["text_used"] = final_text
 
@@ -4360,6 +4398,7 @@ async def send_and_update(
                 "username": username or "",
                 "name": name or "",
                 "text_preview": message_text[:200],
+                "outbound": SEND_SCHEDULER.stats(),
             }
         )
     except Exception:
@@ -4380,7 +4419,8 @@ async def send_and_update(
         "step_snapshot": step_name,
         "full_text": message_text,
     }
-    if not enqueue_sheet_event("today_upsert", payload):
+    coalesce_key = today_upsert_coalesce_key(payload)
+    if not enqueue_sheet_event("today_upsert", payload, coalesce_key, delay_sec=today_upsert_delay_sec(coalesce_key)):
         try:
             sheet.upsert(tz=tz, **payload)
             print(f"AUTO_REPLY_CONTINUE despite_sheet_error peer={entity.id}")
@@ -4402,7 +4442,9 @@ async def send_and_update(
                 "followup_next_at": next_dt.isoformat(timespec="seconds"),
                 "followup_last_sent_at": None,
             }
-            if not enqueue_sheet_event("today_upsert", follow_payload):
+            if not enqueue_sheet_event(
+                "today_upsert", follow_payload, coalesce_key, delay_sec=today_upsert_delay_sec(coalesce_key)
+            ):
                 try:
                     sheet.upsert(tz=tz, **follow_payload)
                     print(f"AUTO_REPLY_CONTINUE despite_sheet_error peer={entity.id}")
@@ -4445,16 +4487,7 @@ async def load_message_from_link(client: TelegramClient, link: str) -> Optional[
 
 
 def _post_json(url: str, payload: dict, timeout_sec: float) -> dict:
-    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-    req = urllib.request.Request(
-        url,
-        data=data,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-    with urllib.request.urlopen(req, timeout=timeout_sec) as resp:
-        raw = resp.read().decode("utf-8")
-    return json.loads(raw) if raw else {}
+    return process_shared(("ai_http_pool",), JsonHttpPool).post_json(url, payload, timeout_sec)
 
 
 def load_video_cache(path: str) -> Optional[Tuple[int, int]]:
@@ -4531,18 +4564,24 @@ async def dialog_suggest(
     return None
 
 
+async def recent_peer_messages(client: TelegramClient, entity: User, limit: int) -> list:
+    peer_id = int(getattr(entity, "id", 0) or 0)
+    await PEER_MESSAGES.ensure(peer_id, lambda fetch_limit: client.iter_messages(entity, limit=fetch_limit))
+    return PEER_MESSAGES.recent(peer_id, limit)
+
+
 async def build_ai_history(client: TelegramClient, entity: User, limit: int = 10) -> list:
     items = []
-    async for m in client.iter_messages(entity, limit=limit):
-        if not m.message:
+    for m in await recent_peer_messages(client, entity, limit):
+        if not m.text:
             continue
         items.append(
             {
                 "sender": "me" if m.out else "candidate",
-                "text": m.message,
+                "text": m.text,
             }
         )
-    return list(reversed(items))
+    return items
 
 
 async def rewrite_wait_followup_with_ai(
@@ -4630,35 +4669,63 @@ def save_form_import_status_fragment(fragment: dict) -> None:
     atomic_write_json(STATUS_PATH, current)
 
 
-def fetch_form_import_sheet_values() -> Tuple[str, List[List[str]]]:
+def save_startup_status_fragment(fragment: dict) -> None:
+    current = load_json_file(STATUS_PATH, {})
+    startup_status = current.get("startup", {}) if isinstance(current.get("startup"), dict) else {}
+    startup_status.update(fragment or {})
+    current["startup"] = startup_status
+    atomic_write_json(STATUS_PATH, current)
+
+
+def build_registration_drive() -> "GoogleDriveUploader":
+    registration_drive = GoogleDriveUploader(
+        GOOGLE_CREDS, REGISTRATION_DRIVE_FOLDER_ID, permission_attempts=REGISTRATION_PERMISSIONS_MAX_ATTEMPTS
+    )
+    try:
+        folder_name = registration_drive.check_folder_access()
+        print(f"✅ Drive папка доступна: {folder_name} ({REGISTRATION_DRIVE_FOLDER_ID})")
+    except Exception as err:
+        print(
+            "⚠️ Немає доступу до Drive папки "
+            f"{REGISTRATION_DRIVE_FOLDER_ID}: {type(err).__name__}: {err}"
+        )
+    return registration_drive
+
+
+def open_form_import_worksheet():
     if not FORM_IMPORT_SPREADSHEET_ID:
         raise RuntimeError("FORM_IMPORT_SPREADSHEET_ID is empty")
-    gc = sheets_client(GOOGLE_CREDS)
+    gc = shared_spreadsheet_session().client
     sh = gc.open_by_key(FORM_IMPORT_SPREADSHEET_ID)
     ws = sh.get_worksheet(FORM_IMPORT_WORKSHEET_INDEX)
     if ws is None:
         raise RuntimeError(f"Worksheet index {FORM_IMPORT_WORKSHEET_INDEX} not found")
-    return (ws.title or "").strip(), ws.get_all_values()
+    return ws
 
 
-async def main():
+async def main(stop_event: Optional[asyncio.Event] = None):
     tz = ZoneInfo(TIMEZONE)
-    sheet = SheetWriter()
-    owner_store = CrossAccountOwnerStore(CROSS_ACCOUNT_OWNER_STATE_PATH)
+    startup_started_at = time.time()
+    first_message_handled = False
+    save_startup_status_fragment(
+        {
+            "started_at": datetime.now(tz).isoformat(timespec="seconds"),
+            "telegram_ready_sec": None,
+            "sheets_ready_sec": None,
+            "first_message_handled_sec": None,
+        }
+    )
+    # Sheet objects are cheap to construct: network work happens in the background
+    # warm-up after Telegram is connected, or lazily on first use.
+    sheet = SheetWriter(migrate=False)
+    owner_store = shared_owner_store()
     pause_store = LocalPauseStore(PAUSED_STATE_PATH)
-    group_leads_sheet = GroupLeadsSheet()
+    group_leads_res = LazyResource("GroupLeadsSheet", shared_group_leads_sheet)
     hr_filter_store = HrFilterStore(HR_FILTERS_STATE_PATH, cache_ttl_sec=HR_FILTERS_CACHE_TTL_SEC)
-    hr_forward_deduper = HrForwardDeduper(HR_FORWARD_DEDUPE_PATH)
-    faq_questions_sheet = None
-    faq_suggestions_sheet = None
-    faq_likes_train_sheet = None
-    try:
-        faq_questions_sheet = FAQQuestionsSheet()
-        faq_suggestions_sheet = FAQSuggestionsSheet()
-        if LIKE_TRAINING_ENABLED:
-            faq_likes_train_sheet = FAQLikesTrainingSheet()
-    except Exception as err:
-        print(f"⚠️ Не вдалося підготувати FAQ-листи: {err}")
+    hr_forward_deduper = HrForwardDeduper(HR_FORWARD_DEDUPE_DB_PATH)
+    faq_questions_res = LazyResource("FAQQuestionsSheet", FAQQuestionsSheet)
+    faq_suggestions_res = LazyResource("FAQSuggestionsSheet", FAQSuggestionsSheet)
+    faq_likes_train_res = LazyResource("FAQLikesTrainingSheet", FAQLikesTrainingSheet) if LIKE_TRAINING_ENABLED else None
     v2_enrollment = V2EnrollmentStore(V2_ENROLLMENT_PATH)
     v2_runtime = V2RuntimeStore(V2_RUNTIME_PATH)
     content_env_map = {
@@ -4671,32 +4738,54 @@ async def main():
     v2_content_validation = validate_content_env(content_env_map)
     if v2_content_validation.get("missing"):
         print(f"⚠️ V2 content env missing: {v2_content_validation.get('missing')}")
-    registration_sheet = None
-    try:
-        registration_sheet = RegistrationSheet()
-    except Exception as err:
-        print(f"⚠️ Не вдалося підготувати лист '{REGISTRATION_WORKSHEET}': {err}")
-    registration_drive = None
+    registration_res = LazyResource("RegistrationSheet", RegistrationSheet)
+    registration_drive_res = None
     if REGISTRATION_DRIVE_FOLDER_ID:
-        try:
-            registration_drive = GoogleDriveUploader(GOOGLE_CREDS, REGISTRATION_DRIVE_FOLDER_ID)
-            try:
-                folder_name = registration_drive.check_folder_access()
-                print(f"✅ Drive папка доступна: {folder_name} ({REGISTRATION_DRIVE_FOLDER_ID})")
-            except Exception as err:
-                print(
-                    "⚠️ Немає доступу до Drive папки "
-                    f"{REGISTRATION_DRIVE_FOLDER_ID}: {type(err).__name__}: {err}"
-                )
-        except Exception as err:
-            print(f"⚠️ Не вдалося ініціалізувати Google Drive uploader: {err}")
+        registration_drive_res = LazyResource("GoogleDriveUploader", build_registration_drive)
     else:
         print("⚠️ REGISTRATION_DRIVE_FOLDER_ID не задано: документи не будуть завантажуватись у Drive")
     client = TelegramClient(SESSION_FILE, API_ID, API_HASH)
-    processing_peers = set()
-    v2_sending_peers = set()
-    buffered_incoming: Dict[int, deque] = {}
-    restart_generation: Dict[int, int] = {}
+
+    async def handle_peer_job(peer_id: int, job):
+        if isinstance(job, IncomingTurn):
+            return await process_incoming_turn(job)
+        return await job()
+
+    def merge_peer_turns(first: IncomingTurn, second: IncomingTurn) -> Optional[IncomingTurn]:
+        # Form photo and form text are separate signals on the form step: never fold them.
+        if (v2_runtime.get(int(first.sender.id)).flow_step or "") == STEP_FORM_FORWARD:
+            return None
+        return merge_incoming_turns(first, second)
+
+    reply_coalescer = AdaptiveCoalescer(
+        min_wait=COALESCE_MIN_SEC,
+        max_hold=COALESCE_MAX_HOLD_SEC,
+        typing_ttl=COALESCE_TYPING_TTL_SEC,
+    )
+
+    async def settle_peer_burst(peer_id: int) -> None:
+        max_window = REPLY_DEBOUNCE_SEC
+        if (v2_runtime.get(int(peer_id)).flow_step or "") == STEP_SCREENING_WAIT:
+            max_window = min(REPLY_DEBOUNCE_SEC, SCREENING_REPLY_DEBOUNCE_SEC)
+        await reply_coalescer.wait(peer_id, max_window)
+
+    peer_actors = PeerActorPool(handle_peer_job, merge=merge_peer_turns, settle=settle_peer_burst)
+    speculative_answers = SpeculativeAnswers()
+    last_arrival_at: Dict[int, float] = {}
+
+    def cancel_peer_turns(peer_id: int) -> None:
+        peer_actors.cancel(peer_id)
+        speculative_answers.cancel(peer_id)
+        last_arrival_at.pop(peer_id, None)
+
+    def question_reply_delay(entity: User) -> float:
+        # The answer delay runs from the candidate's last message, so AI time spent in
+        # the meantime is not added on top of it.
+        arrived_at = last_arrival_at.get(int(getattr(entity, "id", 0) or 0))
+        if not arrived_at:
+            return QUESTION_RESPONSE_DELAY_SEC
+        return max(0.0, QUESTION_RESPONSE_DELAY_SEC - (time.time() - arrived_at))
+
     paused_peers = set()
     enabled_peers = set()
     last_reply_at = {}
@@ -4730,15 +4819,20 @@ async def main():
     last_queue_progress_at = time.time()
     last_queue_heartbeat_at = time.time()
     last_queue_stall_log_at = 0.0
-    pending_registration_tasks = {}
-    stop_event = asyncio.Event()
+    registration_pool: Optional[SettlingWorkPool] = None
+    registration_permissions_task: Optional[asyncio.Task] = None
+    # auto_reply_host.py passes its own event per account and owns the signal handlers.
+    own_signals = stop_event is None
+    if stop_event is None:
+        stop_event = asyncio.Event()
 
     today_upsert_last_sent_at: Dict[int, float] = {}
     today_upsert_pending: Dict[int, dict] = {}
     today_upsert_handles: Dict[int, asyncio.TimerHandle] = {}
 
     def _enqueue_today_upsert_payload(payload: dict) -> bool:
-        if enqueue_sheet_event("today_upsert", payload):
+        coalesce_key = today_upsert_coalesce_key(payload)
+        if enqueue_sheet_event("today_upsert", payload, coalesce_key, delay_sec=today_upsert_delay_sec(coalesce_key)):
             return True
         try:
             sheet.upsert(tz=tz, **payload)
@@ -4749,12 +4843,7 @@ async def main():
             return False
 
     def _merge_today_upsert_payload(base: dict, incoming: dict) -> dict:
-        merged = dict(base)
-        for key, value in incoming.items():
-            if value is None:
-                continue
-            merged[key] = value
-        return merged
+        return merge_event_payload(base, incoming)
 
     def _flush_debounced_today_upsert(peer_id: int):
         handle = today_upsert_handles.pop(peer_id, None)
@@ -4779,7 +4868,10 @@ async def main():
             return _enqueue_today_upsert_payload(kwargs)
 
         now_ts = time.time()
-        if TODAY_UPSERT_DEBOUNCE_SEC <= 0:
+        if TODAY_UPSERT_DEBOUNCE_SEC <= 0 or (TODAY_UPSERT_COALESCE and sheets_queue):
+            # With SQLite coalescing the pending row itself is the debounce buffer: it is
+            # due TODAY_UPSERT_DEBOUNCE_SEC after the first snapshot and later ones merge
+            # into it, so it survives restarts and holds one unsent snapshot per peer.
             ok = _enqueue_today_upsert_payload(kwargs)
             if ok:
                 today_upsert_last_sent_at[peer_id] = now_ts
@@ -4814,10 +4906,6 @@ async def main():
     def mark_global_fallback_sent(now_dt: datetime, tzinfo: ZoneInfo):
         _ = now_dt, tzinfo
         fallback_quota.mark_sent(tz)
-    try:
-        enabled_peers = sheet.load_enabled_peers(tz)
-    except Exception:
-        enabled_peers = set()
     enabled_peers.update(pause_store.active_peer_ids())
 
     def is_paused(entity: User) -> bool:
@@ -4843,7 +4931,7 @@ async def main():
         stop_event.set()
 
     loop = asyncio.get_running_loop()
-    for sig in (signal.SIGINT, signal.SIGTERM):
+    for sig in (signal.SIGINT, signal.SIGTERM) if own_signals else ():
         try:
             loop.add_signal_handler(sig, handle_stop)
         except NotImplementedError:
@@ -4859,6 +4947,38 @@ async def main():
         return
 
     await client.start()
+    save_startup_status_fragment({"telegram_ready_sec": round(time.time() - startup_started_at, 3)})
+
+    async def warm_up_sheets():
+        # Independent sheet initializations run side by side on worker threads;
+        # Drive, FAQ suggestions and like-training stay lazy until first use.
+        await asyncio.to_thread(sheet.prefetch_managed_headers, tz)
+        results = await asyncio.gather(
+            asyncio.to_thread(sheet.migrate_sheets),
+            asyncio.to_thread(sheet._ensure_today_ws, tz),
+            group_leads_res.aget(),
+            registration_res.aget(),
+            faq_questions_res.aget(),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"⚠️ SHEETS_WARMUP_FAIL: {type(result).__name__}: {result}")
+        elapsed = round(time.time() - startup_started_at, 3)
+        save_startup_status_fragment({"sheets_ready_sec": elapsed})
+        print(f"SHEETS_WARMUP_DONE sec={elapsed}")
+
+    def mark_first_message_handled():
+        nonlocal first_message_handled
+        if first_message_handled:
+            return
+        first_message_handled = True
+        elapsed = round(time.time() - startup_started_at, 3)
+        try:
+            save_startup_status_fragment({"first_message_handled_sec": elapsed})
+        except Exception:
+            pass
+        print(f"STARTUP_FIRST_MESSAGE_HANDLED sec={elapsed}")
 
     leads_group = await find_group_by_title(client, LEADS_GROUP_TITLE)
     if not leads_group:
@@ -4903,13 +5023,33 @@ async def main():
     if not video_message:
         print("⚠️ Не знайшов відео у групі для пересилання")
 
+    form_reader = FormResponsesReader(open_form_import_worksheet, headers_max_age_sec=FORM_IMPORT_HEADERS_MAX_AGE_SEC)
+    form_backoff = IdleBackoff(max(5.0, float(FORM_IMPORT_POLL_SEC or 30.0)), FORM_IMPORT_MAX_POLL_SEC)
+    form_notifier = TouchNotifier(FORM_IMPORT_NOTIFY_PATH)
+
+    async def wait_next_form_poll(timeout: float) -> None:
+        # Sleep in short slices so a touch of FORM_IMPORT_NOTIFY_PATH starts the next poll at once.
+        deadline = time.monotonic() + timeout
+        while not stop_event.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if form_notifier.changed():
+                form_backoff.reset()
+                print("FORM_IMPORT_NOTIFY")
+                return
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=min(remaining, 1.0))
+            except asyncio.TimeoutError:
+                pass
+
     async def form_import_loop():
         prev_enabled = None
         while not stop_event.is_set():
             check_at = datetime.now(tz).isoformat(timespec="seconds")
             control = load_form_import_control()
             enabled = bool(control.get("enabled", FORM_IMPORT_ENABLED))
-            poll_timeout = max(5.0, float(FORM_IMPORT_POLL_SEC or 30.0))
+            poll_timeout = form_backoff.interval()
 
             if not enabled:
                 save_form_import_status_fragment(
@@ -4920,15 +5060,22 @@ async def main():
                     }
                 )
                 prev_enabled = False
-                try:
-                    await asyncio.wait_for(stop_event.wait(), timeout=poll_timeout)
-                except asyncio.TimeoutError:
-                    pass
+                form_backoff.reset()
+                await wait_next_form_poll(form_backoff.interval())
                 continue
 
+            state = load_form_import_state()
+            last_seen_row_number = int(state.get("last_seen_row_number") or 0)
+            should_baseline = prev_enabled is False or (
+                prev_enabled is None
+                and last_seen_row_number <= 0
+                and not str(state.get("last_sent_at") or "").strip()
+            )
             try:
-                sheet_title, values = await asyncio.to_thread(fetch_form_import_sheet_values)
+                headers = await asyncio.to_thread(form_reader.headers)
+                sheet_title = await asyncio.to_thread(form_reader.title)
             except Exception as err:
+                form_reader.reset()
                 save_form_import_status_fragment(
                     {
                         "enabled": True,
@@ -4938,16 +5085,14 @@ async def main():
                 )
                 print(f"⚠️ FORM_IMPORT_FETCH_FAIL: {type(err).__name__}: {err}")
                 prev_enabled = True
-                try:
-                    await asyncio.wait_for(stop_event.wait(), timeout=poll_timeout)
-                except asyncio.TimeoutError:
-                    pass
+                await wait_next_form_poll(poll_timeout)
                 continue
 
-            headers = values[0] if values else []
             normalized_headers = {FORM_IMPORT_HEADER_MAP.get(normalize_form_import_header(header)) for header in headers}
             missing = [field for field in ("name", "username", "age", "phone", "pc") if field not in normalized_headers]
             if missing:
+                # Re-read the header row next time: someone may be fixing the form right now.
+                form_reader.reset()
                 missing_text = ", ".join(missing)
                 save_form_import_status_fragment(
                     {
@@ -4959,20 +5104,28 @@ async def main():
                 )
                 print(f"⚠️ FORM_IMPORT_MISSING_HEADERS: {missing_text}")
                 prev_enabled = True
-                try:
-                    await asyncio.wait_for(stop_event.wait(), timeout=poll_timeout)
-                except asyncio.TimeoutError:
-                    pass
+                await wait_next_form_poll(poll_timeout)
                 continue
 
-            state = load_form_import_state()
-            current_row_number = len(values)
-            last_seen_row_number = int(state.get("last_seen_row_number") or 0)
-            should_baseline = prev_enabled is False or (
-                prev_enabled is None
-                and last_seen_row_number <= 0
-                and not str(state.get("last_sent_at") or "").strip()
-            )
+            try:
+                if should_baseline:
+                    current_row_number = await asyncio.to_thread(form_reader.row_count)
+                else:
+                    poll = await asyncio.to_thread(form_reader.poll, last_seen_row_number)
+            except Exception as err:
+                form_reader.reset()
+                save_form_import_status_fragment(
+                    {
+                        "enabled": True,
+                        "last_check_at": check_at,
+                        "source_title": sheet_title,
+                        "last_error": f"{type(err).__name__}: {err}",
+                    }
+                )
+                print(f"⚠️ FORM_IMPORT_FETCH_FAIL: {type(err).__name__}: {err}")
+                prev_enabled = True
+                await wait_next_form_poll(poll_timeout)
+                continue
 
             if should_baseline:
                 state["last_seen_row_number"] = current_row_number
@@ -4989,13 +5142,11 @@ async def main():
                 )
                 print(f"FORM_IMPORT_BASELINE row={current_row_number} sheet={sheet_title}")
                 prev_enabled = True
-                try:
-                    await asyncio.wait_for(stop_event.wait(), timeout=poll_timeout)
-                except asyncio.TimeoutError:
-                    pass
+                await wait_next_form_poll(poll_timeout)
                 continue
 
-            if last_seen_row_number > current_row_number:
+            if poll.shrunk:
+                current_row_number = poll.row_count
                 state["last_seen_row_number"] = current_row_number
                 save_form_import_state(state)
                 save_form_import_status_fragment(
@@ -5011,16 +5162,12 @@ async def main():
                     f"⚠️ FORM_IMPORT_SHEET_SHRUNK prev={last_seen_row_number} current={current_row_number} sheet={sheet_title}"
                 )
                 prev_enabled = True
-                try:
-                    await asyncio.wait_for(stop_event.wait(), timeout=poll_timeout)
-                except asyncio.TimeoutError:
-                    pass
+                await wait_next_form_poll(poll_timeout)
                 continue
 
             imported = 0
             last_error = ""
-            for row_number in range(max(2, last_seen_row_number + 1), current_row_number + 1):
-                row = values[row_number - 1] if row_number - 1 < len(values) else []
+            for row_number, row in poll.rows:
                 parsed = parse_form_import_row(headers, row)
                 if parsed.get("username") and not parsed.get("username_valid"):
                     print(f"⚠️ FORM_IMPORT_INVALID_USERNAME row={row_number} value={parsed.get('username')}")
@@ -5028,7 +5175,11 @@ async def main():
                     print(f"⚠️ FORM_IMPORT_NO_CONTACT row={row_number}")
                 message_text = build_form_import_message(parsed)
                 try:
-                    await client.send_message(leads_group, message_text)
+                    await SEND_SCHEDULER.submit(
+                        leads_group.id,
+                        lambda: client.send_message(leads_group, message_text),
+                        priority=PRIORITY_FOLLOWUP,
+                    )
                 except Exception as err:
                     last_error = f"{type(err).__name__}: {err}"
                     save_form_import_status_fragment(
@@ -5068,15 +5219,14 @@ async def main():
                         "last_check_at": check_at,
                         "source_title": sheet_title,
                         "last_seen_row_number": int(state.get("last_seen_row_number") or 0),
+                        "poll_interval_sec": form_backoff.interval(),
+                        "sheet_requests": form_reader.requests,
                         "last_error": "",
                     }
                 )
 
             prev_enabled = True
-            try:
-                await asyncio.wait_for(stop_event.wait(), timeout=poll_timeout)
-            except asyncio.TimeoutError:
-                pass
+            await wait_next_form_poll(form_backoff.record(bool(poll.rows)))
 
     async def handle_hr_filtered_lead(event, group_data: dict) -> bool:
         hr_rule = get_hr_filter_rule(hr_filter_store, group_data)
@@ -5104,7 +5254,10 @@ async def main():
                     f"message_id={message_id} hr={hr_username}"
                 )
                 return True
-            sent = await client.forward_messages(target_entity, event.message)
+            sent = await SEND_SCHEDULER.submit(
+                target_entity.id,
+                lambda: client.forward_messages(target_entity, event.message),
+            )
             sent_ok = bool(sent)
             if isinstance(sent, list):
                 sent_ok = bool(sent)
@@ -5214,6 +5367,7 @@ async def main():
         step_name: str,
         status: Optional[str] = None,
         delay_before: Optional[float] = None,
+        priority: int = PRIORITY_LIVE,
     ) -> bool:
         parse_mode = "md" if "[сайт](" in (text or "") else None
         ok = await send_and_update(
@@ -5232,6 +5386,7 @@ async def main():
             followup_state=followup_state,
             parse_mode=parse_mode,
             return_success=True,
+            priority=priority,
         )
         return bool(ok)
 
@@ -5263,7 +5418,7 @@ async def main():
 
     async def classify_candidate_refusal(sender: User, text: str, step_name: Optional[str]) -> Dict[str, str]:
         history = await build_ai_history(client, sender, limit=8)
-        return await classify_refusal_reason(history, text, step_name)
+        return await classify_refusal_reason(history, text, step_name, peer_id=sender.id)
 
     def record_refusal_today(
         entity: User,
@@ -5306,8 +5461,7 @@ async def main():
         v2_runtime.delete(peer_id)
         last_reply_at.pop(peer_id, None)
         last_incoming_at.pop(peer_id, None)
-        processing_peers.discard(peer_id)
-        buffered_incoming.pop(peer_id, None)
+        cancel_peer_turns(peer_id)
         name = getattr(entity, "first_name", "") or "Unknown"
         username = getattr(entity, "username", "") or ""
         chat_link = build_chat_link_app(entity, peer_id)
@@ -5338,59 +5492,24 @@ async def main():
         print(f"SPECIAL_START peer={peer_id} source={start_source} reason={special_reason}")
         return True
 
-    def buffer_v2_incoming(peer_id: int, text: str, has_photo: bool, reason: str) -> None:
-        bucket = buffered_incoming.setdefault(int(peer_id), deque())
-        bucket.append((int(restart_generation.get(peer_id, 0)), text, bool(has_photo)))
-        print(f"BUFFER account={ACCOUNT_KEY} peer={peer_id} reason={reason} size={len(bucket)}")
+    async def run_v2_send_batch(sender: User, expected_step: str, send_batch) -> bool:
+        peer_id = int(getattr(sender, "id", 0) or 0)
 
-    async def drain_v2_buffered_incoming(entity: User) -> None:
-        peer_id = int(getattr(entity, "id", 0) or 0)
-        if not peer_id or peer_id in v2_sending_peers or peer_id in processing_peers:
-            return
-        while True:
-            queued = buffered_incoming.get(peer_id)
-            if not queued:
-                break
-            item = queued.popleft()
-            if not queued:
-                buffered_incoming.pop(peer_id, None)
-            if isinstance(item, tuple):
-                if len(item) >= 3:
-                    msg_generation, next_text, next_has_photo = item[0], item[1], bool(item[2])
-                else:
-                    msg_generation, next_text = item
-                    next_has_photo = False
-            else:
-                msg_generation, next_text = int(restart_generation.get(peer_id, 0)), str(item)
-                next_has_photo = False
-            if int(msg_generation) != int(restart_generation.get(peer_id, 0)):
-                continue
-            if peer_id in v2_sending_peers:
-                buffer_v2_incoming(peer_id, str(next_text), bool(next_has_photo), "send_lock_requeue")
-                break
-            processing_peers.add(peer_id)
+        async def _run() -> bool:
             try:
-                await process_v2_turn(entity, str(next_text), has_photo=bool(next_has_photo))
-                last_reply_at[peer_id] = time.time()
-            except Exception as err:
-                print(f"⚠️ Buffered V2 process error peer={peer_id}: {type(err).__name__}: {err}")
+                return bool(await send_batch())
             finally:
-                processing_peers.discard(peer_id)
-
-    async def run_v2_send_batch(sender: User, expected_step: str, send_batch) -> bool:
-        peer_id = int(getattr(sender, "id", 0) or 0)
-        if peer_id:
-            v2_sending_peers.add(peer_id)
-        try:
-            return bool(await send_batch())
-        finally:
-            if peer_id:
-                v2_sending_peers.discard(peer_id)
-                current = v2_runtime.get(peer_id)
-                if expected_step:
+                if peer_id and expected_step:
+                    current = v2_runtime.get(peer_id)
                     current.flow_step = expected_step
                     v2_runtime.set(current)
-                await drain_v2_buffered_incoming(sender)
+
+        if not peer_id:
+            return await _run()
+        try:
+            return bool(await peer_actors.call(peer_id, _run))
+        except PeerTurnCancelled:
+            return False
 
     async def send_v2_onboarding_sequence(sender: User) -> bool:
         async def _send():
@@ -5596,13 +5715,18 @@ async def main():
         if local == "ack_continue" and step_name not in critical_steps:
             return local
         history = await build_ai_history(client, sender, limit=8)
-        ai_intent = (await classify_candidate_intent(history, text, step_name)).value
+        ai_intent = (await classify_candidate_intent(history, text, step_name, peer_id=sender.id)).value
         if ai_intent in {"question", "ack_continue", "stop"}:
             return ai_intent
         return local
 
     async def dispatch_v2_content(sender: User, content_link: str, step_name: str, status: str) -> bool:
-        res = await dispatch_content(client, sender, content_link)
+        try:
+            progress = DispatchProgress()
+            res = await SEND_SCHEDULER.submit(sender.id, lambda: dispatch_content(client, sender, content_link, progress))
+        except Exception as err:
+            print(f"⚠️ Content dispatch error account={ACCOUNT_KEY} peer={sender.id} step={step_name} err={err}")
+            return False
         if not res.ok:
             return False
         for mid in (res.message_ids or []):
@@ -5690,10 +5814,13 @@ async def main():
         return text.startswith("yes") or text.startswith("так")
 
     async def resolve_trained_answer(sender: User, step_name: str, question_raw: str) -> Optional[str]:
-        if not LIKE_TRAINING_ENABLED or not faq_likes_train_sheet:
+        if not LIKE_TRAINING_ENABLED or not faq_likes_train_res:
+            return None
+        faq_likes_train_sheet = await faq_likes_train_res.aget()
+        if not faq_likes_train_sheet:
             return None
         q_norm = normalize_question(question_raw)
-        cluster_key = build_cluster_key(q_norm)
+        cluster_key = question_cluster_key(q_norm)
         candidates = faq_likes_train_sheet.get_candidates(cluster_key, LIKE_TRAINING_MAX_CANDIDATES)
         if not candidates:
             print(f"LIKE_TRAIN_MISS peer={sender.id} cluster={cluster_key} reason=no_cluster")
@@ -5708,6 +5835,16 @@ async def main():
         print(f"LIKE_TRAIN_MISS peer={sender.id} cluster={cluster_key} reason=no_semantic_match")
         return None
 
+    async def compute_training_or_faq_answer(sender: User, step_name: str, question_text: str) -> str:
+        trained = await resolve_trained_answer(sender, step_name, question_text)
+        if trained:
+            return trained
+        history = await build_ai_history(client, sender, limit=12)
+        ans = await answer_from_faq(question_text, step_name, history, dialog_suggest, mode="detailed")
+        if ans and (ans.text or "").strip():
+            return ans.text.strip()
+        return ""
+
     async def answer_with_training_or_faq(
         sender: User,
         step_name: str,
@@ -5716,14 +5853,25 @@ async def main():
     ) -> str:
         if is_document_purpose_question(question_text):
             return DOCUMENT_PURPOSE_REPLY_TEXT
-        trained = await resolve_trained_answer(sender, step_name, question_text)
-        if trained:
-            return trained
-        history = await build_ai_history(client, sender, limit=12)
-        ans = await answer_from_faq(question_text, step_name, history, dialog_suggest, mode="detailed")
-        if ans and (ans.text or "").strip():
-            return ans.text.strip()
-        return fallback_text
+        answer = await speculative_answers.take(sender.id, step_name, question_text)
+        if answer is None:
+            answer = await compute_training_or_faq_answer(sender, step_name, question_text)
+        return answer or fallback_text
+
+    def start_speculative_answer(sender: User, text: str, has_photo: bool, step_name: str) -> None:
+        peer_id = int(sender.id)
+        if has_photo:
+            speculative_answers.cancel(peer_id)
+            return
+        burst_text = speculative_answers.extend(peer_id, text)
+        if not message_has_question(burst_text) or is_document_purpose_question(burst_text):
+            return
+        speculative_answers.start(
+            peer_id,
+            step_name,
+            burst_text,
+            lambda: compute_training_or_faq_answer(sender, step_name, burst_text),
+        )
 
     async def finalize_test_ready(sender: User, state: PeerRuntimeState, confirmation_text: str) -> bool:
         enqueue_candidate_note(sender, f"Підтвердження готовності: {confirmation_text.strip()}")
@@ -5733,7 +5881,7 @@ async def main():
 
     def enqueue_faq_question(peer_id: int, step: str, question_raw: str, answer_preview: str):
         q_norm = normalize_question(question_raw)
-        cluster_key = build_cluster_key(q_norm)
+        cluster_key = question_cluster_key(q_norm)
         qlog = build_question_log(
             tz=tz,
             peer_id=peer_id,
@@ -5743,7 +5891,10 @@ async def main():
             cluster_key=cluster_key,
             answer_preview=answer_preview,
         )
-        enqueue_sheet_event("faq_question_log", qlog.__dict__)
+        try:
+            shared_faq_stats().record(qlog.__dict__)
+        except Exception as err:
+            print(f"⚠️ FAQ_STATS_RECORD_FAIL peer={peer_id}: {type(err).__name__}: {err}")
 
     async def handle_v2_message(sender: User, text: str, intent_name: str, has_photo: bool = False) -> bool:
         if not FLOW_V2_ENABLED or not v2_enrollment.has(sender.id):
@@ -5802,7 +5953,7 @@ async def main():
                 answer_message,
                 step_name,
                 status="знак питання",
-                delay_before=QUESTION_RESPONSE_DELAY_SEC,
+                delay_before=question_reply_delay(sender),
             )
             await send_v2_message(
                 sender,
@@ -5874,7 +6025,7 @@ async def main():
                     answer_text = combine_answer_with_return_prompt(answer_text, "Коли буде зручно, надішліть, будь ласка, документ або скрін з Дії.")
                 elif state.form_photo_received and not state.form_text_received:
                     answer_text = combine_answer_with_return_prompt(answer_text, "Також очікую анкету з контактами, містом і обраною зміною.")
-                await send_v2_message(sender, answer_text, STEP_FORM_FORWARD, status="знак питання", delay_before=QUESTION_RESPONSE_DELAY_SEC)
+                await send_v2_message(sender, answer_text, STEP_FORM_FORWARD, status="знак питання", delay_before=question_reply_delay(sender))
                 enqueue_faq_question(sender.id, STEP_FORM_FORWARD, text, answer_text)
             elif state.form_text_received and not state.form_photo_received:
                 state.form_prompted_at = time.time()
@@ -5999,7 +6150,7 @@ async def main():
                     answer_text,
                     STEP_SCHEDULE_SHIFT_WAIT,
                     status="знак питання",
-                    delay_before=QUESTION_RESPONSE_DELAY_SEC,
+                    delay_before=question_reply_delay(sender),
                 )
                 state.qa_gate_active = False
                 state.qa_gate_step = ""
@@ -6022,7 +6173,7 @@ async def main():
                     answer_text,
                     state.qa_gate_step or step_name,
                     status="знак питання",
-                    delay_before=QUESTION_RESPONSE_DELAY_SEC,
+                    delay_before=question_reply_delay(sender),
                 )
                 state.qa_gate_opened_at = time.time()
                 state.qa_gate_reminder_sent = False
@@ -6089,7 +6240,7 @@ async def main():
                 answer_text,
                 STEP_SCHEDULE_SHIFT_WAIT,
                 status="знак питання",
-                delay_before=QUESTION_RESPONSE_DELAY_SEC,
+                delay_before=question_reply_delay(sender),
             )
             state.shift_prompted_at = time.time()
             arm_step_wait(state, STEP_SCHEDULE_SHIFT_WAIT, time.time())
@@ -6105,7 +6256,7 @@ async def main():
                     answer_text,
                     STEP_SCHEDULE_CONFIRM,
                     status="знак питання",
-                    delay_before=QUESTION_RESPONSE_DELAY_SEC,
+                    delay_before=question_reply_delay(sender),
                 )
                 enqueue_faq_question(sender.id, STEP_SCHEDULE_CONFIRM, text, answer_text)
             arm_step_wait(state, STEP_SCHEDULE_CONFIRM, time.time())
@@ -6120,7 +6271,7 @@ async def main():
                     answer_text,
                     STEP_BALANCE_CONFIRM,
                     status="знак питання",
-                    delay_before=QUESTION_RESPONSE_DELAY_SEC,
+                    delay_before=question_reply_delay(sender),
                 )
                 enqueue_faq_question(sender.id, STEP_BALANCE_CONFIRM, text, answer_text)
             arm_step_wait(state, STEP_BALANCE_CONFIRM, time.time())
@@ -6134,7 +6285,7 @@ async def main():
                 text,
                 "Уточню деталі по вашому питанню і повернуся з точною відповіддю.",
             )
-            await send_v2_message(sender, answer_text, step_name, status="знак питання", delay_before=QUESTION_RESPONSE_DELAY_SEC)
+            await send_v2_message(sender, answer_text, step_name, status="знак питання", delay_before=question_reply_delay(sender))
             state.qa_gate_active = True
             state.qa_gate_step = step_name
             state.qa_gate_opened_at = time.time()
@@ -6332,7 +6483,7 @@ async def main():
                         answer_text,
                         STEP_TEST_REVIEW,
                         status="знак питання",
-                        delay_before=QUESTION_RESPONSE_DELAY_SEC,
+                        delay_before=question_reply_delay(sender),
                     )
                     enqueue_faq_question(sender.id, STEP_TEST_REVIEW, text, answer_text)
                 arm_step_wait(state, STEP_TEST_REVIEW, time.time())
@@ -6399,6 +6550,7 @@ async def main():
         peer_id = event.chat_id
         if not peer_id:
             return
+        PEER_MESSAGES.record(peer_id, event.message)
         if is_tracked_message(peer_id, event.id):
             return
         text = (event.raw_text or "").strip()
@@ -6519,7 +6671,7 @@ async def main():
             group_data = parse_group_message(text)
             if not enqueue_sheet_event("group_leads_upsert", {"data": group_data, "status": group_status}):
                 try:
-                    group_leads_sheet.upsert(tz, group_data, group_status)
+                    group_leads_res.require().upsert(tz, group_data, group_status)
                     print("AUTO_REPLY_CONTINUE despite_sheet_error peer=group_lead")
                 except Exception as err:
                     print(f"⚠️ SHEETS_DIRECT_WRITE_FAIL group_leads: {type(err).__name__}: {err}")
@@ -6562,7 +6714,7 @@ async def main():
             if group_data:
                 if not enqueue_sheet_event("group_leads_upsert", {"data": group_data, "status": special_skip_status}):
                     try:
-                        group_leads_sheet.upsert(tz, group_data, special_skip_status)
+                        group_leads_res.require().upsert(tz, group_data, special_skip_status)
                         print("AUTO_REPLY_CONTINUE despite_sheet_error peer=group_lead")
                     except Exception as err:
                         print(f"⚠️ SHEETS_DIRECT_WRITE_FAIL group_leads: {type(err).__name__}: {err}")
@@ -6589,11 +6741,9 @@ async def main():
             print(f"✅ V2 onboarding message sent: {entity.id}")
 
     if traffic_group:
-        async def process_traffic_registration(chat_id: int, message_id: int):
-            key = (chat_id, message_id)
+        async def process_traffic_registration(key: Tuple[int, int]):
+            chat_id, message_id = key
             try:
-                if REGISTRATION_PARSE_DELAY_SEC > 0:
-                    await asyncio.sleep(REGISTRATION_PARSE_DELAY_SEC)
                 msg = await client.get_messages(chat_id, ids=message_id)
                 if not msg:
                     return
@@ -6602,9 +6752,12 @@ async def main():
                 text = msg.message or ""
                 parsed = parse_registration_message(text)
                 drive_link = ""
+                registration_drive = await registration_drive_res.aget() if registration_drive_res else None
                 if registration_drive:
                     try:
-                        drive_link = await upload_media_to_drive(msg, chat_id, message_id, registration_drive)
+                        drive_link = await upload_media_to_drive(
+                            msg, chat_id, message_id, registration_drive, shared_upload_index()
+                        )
                     except Exception as err:
                         print(f"⚠️ Drive upload error peer={chat_id} msg={message_id}: {type(err).__name__}: {err}")
                 payload = {
@@ -6614,19 +6767,42 @@ async def main():
                     "source_group": (getattr(getattr(msg, "chat", None), "title", None) or TRAFFIC_GROUP_TITLE),
                     "source_message_id": str(message_id),
                 }
-                if registration_sheet:
-                    if not enqueue_sheet_event("registration_upsert", payload):
-                        try:
-                            registration_sheet.upsert(tz, payload)
-                            print(f"AUTO_REPLY_CONTINUE despite_sheet_error peer={chat_id}")
-                        except Exception as err:
-                            print(f"⚠️ SHEETS_DIRECT_WRITE_FAIL registration peer={chat_id}: {type(err).__name__}: {err}")
-                else:
-                    print("⚠️ RegistrationSheet недоступний: рядок не записано")
+                if not enqueue_sheet_event("registration_upsert", payload):
+                    try:
+                        registration_sheet = await registration_res.arequire()
+                        registration_sheet.upsert(tz, payload)
+                        print(f"AUTO_REPLY_CONTINUE despite_sheet_error peer={chat_id}")
+                    except Exception as err:
+                        print(f"⚠️ SHEETS_DIRECT_WRITE_FAIL registration peer={chat_id}: {type(err).__name__}: {err}")
             except Exception as err:
                 print(f"⚠️ Registration ingest error peer={chat_id} msg={message_id}: {type(err).__name__}: {err}")
-            finally:
-                pending_registration_tasks.pop(key, None)
+
+        async def flush_registration_permissions():
+            registration_drive = registration_drive_res.peek() if registration_drive_res else None
+            if registration_drive and registration_drive.pending_permissions():
+                await asyncio.to_thread(registration_drive.flush_permissions)
+
+        async def registration_permissions_loop():
+            # Under steady traffic the pool may never go idle; grant by size and age as well.
+            while not stop_event.is_set():
+                await asyncio.sleep(min(5.0, max(1.0, REGISTRATION_PERMISSIONS_FLUSH_SEC)))
+                registration_drive = registration_drive_res.peek() if registration_drive_res else None
+                if not registration_drive or not registration_drive.permissions_due(
+                    REGISTRATION_PERMISSIONS_BATCH, REGISTRATION_PERMISSIONS_FLUSH_SEC
+                ):
+                    continue
+                try:
+                    await asyncio.to_thread(registration_drive.flush_permissions)
+                except Exception as err:
+                    print(f"⚠️ DRIVE_PERMISSIONS_FLUSH_ERROR: {type(err).__name__}: {err}")
+
+        registration_pool = SettlingWorkPool(
+            process_traffic_registration,
+            workers=REGISTRATION_WORKERS,
+            settle_sec=REGISTRATION_PARSE_DELAY_SEC,
+            on_idle=flush_registration_permissions,
+        )
+        registration_permissions_task = asyncio.create_task(registration_permissions_loop())
 
         async def schedule_traffic_registration(event):
             msg = event.message
@@ -6634,13 +6810,7 @@ async def main():
                 return
             if not is_media_registration_message(msg):
                 return
-            chat_id = event.chat_id
-            message_id = event.id
-            key = (chat_id, message_id)
-            existing = pending_registration_tasks.get(key)
-            if existing and not existing.done():
-                existing.cancel()
-            pending_registration_tasks[key] = asyncio.create_task(process_traffic_registration(chat_id, message_id))
+            registration_pool.submit((event.chat_id, event.id))
 
         @client.on(events.NewMessage(chats=traffic_group))
         async def on_traffic_registration_message(event):
@@ -6657,6 +6827,7 @@ async def main():
             return
         if event.event_type == "group_leads_upsert":
             group_data = payload.get("data") or {}
+            group_leads_sheet = await group_leads_res.arequire()
             await asyncio.to_thread(
                 group_leads_sheet.upsert,
                 tz,
@@ -6665,38 +6836,28 @@ async def main():
             )
             sheet.invalidate_group_leads_lookup_cache()
             try:
-                updated = await asyncio.to_thread(sheet.refresh_today_from_group_lead, tz, group_data)
+                updated = await asyncio.to_thread(sheet.refresh_today_from_group_lead, tz, group_data, True)
                 if updated:
-                    print(f"SHEETS_GROUP_REFRESH updated={updated} tg={group_data.get('tg', '')}")
+                    print(f"SHEETS_GROUP_REFRESH queued={updated} tg={group_data.get('tg', '')}")
             except Exception as err:
                 print(f"⚠️ SHEETS_GROUP_REFRESH_FAIL: {type(err).__name__}: {err}")
             return
         if event.event_type == "registration_upsert":
-            if registration_sheet:
-                await asyncio.to_thread(registration_sheet.upsert, tz, payload)
-                try:
-                    updated = await asyncio.to_thread(sheet.refresh_today_from_registration, tz, payload)
-                    if updated:
-                        print(f"SHEETS_REGISTRATION_REFRESH updated={updated} peer={payload.get('peer_id', '')}")
-                except Exception as err:
-                    print(f"⚠️ SHEETS_REGISTRATION_REFRESH_FAIL: {type(err).__name__}: {err}")
+            registration_sheet = await registration_res.arequire()
+            await asyncio.to_thread(registration_sheet.upsert, tz, payload)
+            try:
+                updated = await asyncio.to_thread(sheet.refresh_today_from_registration, tz, payload, True)
+                if updated:
+                    print(f"SHEETS_REGISTRATION_REFRESH queued={updated} peer={payload.get('peer_id', '')}")
+            except Exception as err:
+                print(f"⚠️ SHEETS_REGISTRATION_REFRESH_FAIL: {type(err).__name__}: {err}")
             return
         if event.event_type == "faq_question_log":
-            if faq_questions_sheet:
-                await asyncio.to_thread(faq_questions_sheet.upsert_question, payload)
-                count = int(payload.get("count", 1) or 1)
-                if count >= 3 and faq_suggestions_sheet:
-                    suggestion = {
-                        "question_cluster": payload.get("cluster_key", ""),
-                        "suggested_answer": payload.get("answer_preview", ""),
-                        "source_examples": payload.get("question_raw", ""),
-                        "review_status": "new",
-                        "reviewed_at": "",
-                        "reviewed_by": "",
-                    }
-                    await asyncio.to_thread(faq_suggestions_sheet.append_if_missing, suggestion)
+            # Events queued before local aggregation; they are counted like new ones.
+            shared_faq_stats().record(payload)
             return
         if event.event_type == "like_training_upsert":
+            faq_likes_train_sheet = (await faq_likes_train_res.arequire()) if faq_likes_train_res else None
             if faq_likes_train_sheet:
                 saved = await asyncio.to_thread(faq_likes_train_sheet.append_pair, payload)
                 if saved:
@@ -6727,6 +6888,39 @@ async def main():
                 return None
         return None
 
+    def flush_faq_stats_sync() -> Tuple[int, int]:
+        faq_stats = shared_faq_stats()
+        lock = FileLock(FAQ_FLUSH_LOCK)
+        if not lock.acquire(timeout_sec=3.0):
+            return 0, 0
+        try:
+            clusters = faq_stats.dirty()
+            if not clusters:
+                return 0, 0
+            counts = faq_questions_res.require().upsert_clusters(clusters)
+            if not counts:
+                faq_stats.mark_failed(FAQ_FLUSH_RETRY_SEC)
+                return 0, 0
+            faq_stats.mark_flushed({cluster.cluster_key: cluster.pending for cluster in clusters if cluster.cluster_key in counts})
+            suggestions = [
+                {
+                    "question_cluster": cluster.cluster_key,
+                    "suggested_answer": str(cluster.latest.get("answer_preview", "") or ""),
+                    "source_examples": " | ".join(cluster.samples),
+                    "review_status": "new",
+                    "reviewed_at": "",
+                    "reviewed_by": "",
+                }
+                for cluster in clusters
+                if not cluster.suggested and counts.get(cluster.cluster_key, 0) >= FAQ_SUGGESTION_MIN_COUNT
+            ]
+            suggested = faq_suggestions_res.require().append_missing(suggestions) if suggestions else []
+            if suggested:
+                faq_stats.mark_flushed({}, suggested)
+            return len(counts), len(suggested)
+        finally:
+            lock.release()
+
     async def sheet_flush_loop():
         nonlocal last_queue_log_at, last_queue_progress_at, last_queue_heartbeat_at
         if not sheets_queue:
@@ -6746,21 +6940,54 @@ async def main():
                     attempts = int(event.attempts) + 1
                     try:
                         await apply_sheet_event(event)
-                        sheets_queue.mark_done(event.id)
+                        done = sheets_queue.mark_done(event.id, event.revision)
                         last_queue_progress_at = time.time()
                         last_queue_heartbeat_at = last_queue_progress_at
-                        print(f"SHEETS_QUEUE_FLUSH ok id={event.id} type={event.event_type} attempts={attempts}")
+                        if done:
+                            print(f"SHEETS_QUEUE_FLUSH ok id={event.id} type={event.event_type} attempts={attempts}")
+                        else:
+                            print(f"SHEETS_QUEUE_FLUSH merged id={event.id} type={event.event_type} attempts={attempts}")
                     except Exception as err:
+                        error_text = f"{type(err).__name__}: {err}"
                         status_code = extract_status_code(err)
+                        transient = is_transient_error(err, status_code)
+                        # Quota and network outages only delay the event; the cap is for repeating payload failures.
+                        failures = int(event.failures) + (0 if transient else 1)
+                        poison = not transient and is_poison_error(err)
+                        if poison or (SHEETS_QUEUE_MAX_ATTEMPTS > 0 and failures >= SHEETS_QUEUE_MAX_ATTEMPTS):
+                            sheets_queue.mark_dead(event.id, attempts, error_text)
+                            last_queue_progress_at = time.time()
+                            last_queue_heartbeat_at = last_queue_progress_at
+                            print(
+                                f"⚠️ SHEETS_QUEUE_DEAD_LETTER id={event.id} type={event.event_type} attempts={attempts} "
+                                f"reason={'poison' if poison else 'max_attempts'} err={error_text}"
+                            )
+                            continue
                         hard_error = status_code is not None and (400 <= status_code < 500) and status_code != 429
                         backoff = calculate_backoff_sec(attempts, hard_error=hard_error)
-                        sheets_queue.mark_retry(event.id, attempts, backoff, f"{type(err).__name__}: {err}")
+                        sheets_queue.mark_retry(event.id, attempts, backoff, error_text, failures=failures)
                         last_queue_progress_at = time.time()
                         last_queue_heartbeat_at = last_queue_progress_at
                         print(
                             f"SHEETS_QUEUE_FLUSH fail id={event.id} type={event.event_type} attempts={attempts} "
-                            f"backoff={backoff:.1f}s err={type(err).__name__}: {err}"
+                            f"backoff={backoff:.1f}s err={error_text}"
                         )
+                if batch:
+                    # Month-sheet refreshes of this batch go out as one values:batchUpdate.
+                    try:
+                        patched = await asyncio.to_thread(sheet.flush_refresh_patches)
+                        if patched:
+                            print(f"SHEETS_REFRESH_FLUSH cells={patched}")
+                    except Exception as err:
+                        print(f"⚠️ SHEETS_REFRESH_FLUSH_FAIL: {type(err).__name__}: {err}")
+                try:
+                    if shared_faq_stats().due(FAQ_FLUSH_SEC, FAQ_FLUSH_EVENTS):
+                        clusters, suggested = await asyncio.to_thread(flush_faq_stats_sync)
+                        if clusters:
+                            print(f"FAQ_STATS_FLUSH clusters={clusters} suggestions={suggested}")
+                except Exception as err:
+                    shared_faq_stats().mark_failed(FAQ_FLUSH_RETRY_SEC)
+                    print(f"⚠️ FAQ_STATS_FLUSH_FAIL retry_in={FAQ_FLUSH_RETRY_SEC:.0f}s: {type(err).__name__}: {err}")
                 if (now_ts - last_queue_log_at) >= max(5, SHEETS_QUEUE_LOG_SEC):
                     stats = sheets_queue.stats(now_ts=now_ts)
                     pending = int(stats.get("pending") or 0)
@@ -6772,9 +6999,32 @@ async def main():
                     print(
                         f"SHEETS_QUEUE_BACKLOG pid={os.getpid()} path={SHEETS_QUEUE_PATH} "
                         f"pending={pending} ready_pending={ready_pending} "
-                        f"oldest_sec={oldest_fmt} next_ready_in_sec={next_ready_fmt}"
+                        f"oldest_sec={oldest_fmt} next_ready_in_sec={next_ready_fmt} "
+                        f"dead_letters={int(stats.get('dead_letters') or 0)}"
                     )
                     last_queue_log_at = now_ts
+                    try:
+                        update_status_file(
+                            {
+                                "lock_wait": lock_wait_stats(),
+                                "outbound": SEND_SCHEDULER.stats(),
+                                "peer_actors": peer_actors.stats(),
+                                "coalescer": reply_coalescer.stats(),
+                                "speculative_answers": speculative_answers.stats(),
+                                "registration_pool": registration_pool.stats() if registration_pool else None,
+                                "faq_stats": shared_faq_stats().stats(),
+                                "question_clusters": shared_question_clusters().stats(),
+                                "registration_uploads": (
+                                    shared_upload_index().stats() if REGISTRATION_DRIVE_FOLDER_ID else None
+                                ),
+                            }
+                        )
+                    except Exception:
+                        pass
+                if SHEETS_QUEUE_COMPACT_SEC > 0 and not batch:
+                    vacuumed = await asyncio.to_thread(sheets_queue.compact, SHEETS_QUEUE_COMPACT_SEC)
+                    if vacuumed:
+                        print(f"SHEETS_QUEUE_COMPACT pid={os.getpid()} path={SHEETS_QUEUE_PATH}")
             except Exception as err:
                 last_queue_heartbeat_at = time.time()
                 print(f"⚠️ SHEETS_QUEUE_LOOP_ERROR pid={os.getpid()} path={SHEETS_QUEUE_PATH}: {type(err).__name__}: {err}")
@@ -6785,20 +7035,20 @@ async def main():
         if not lead_peer_id:
             return False
         try:
-            async for msg in client.iter_messages(entity, limit=50):
-                if int(getattr(msg, "id", 0) or 0) == int(current_msg_id or 0):
-                    continue
-                if bool(getattr(msg, "out", False)):
-                    continue
-                sender_id = int(getattr(msg, "sender_id", 0) or 0)
-                if sender_id == lead_peer_id:
-                    return False
+            recent = await recent_peer_messages(client, entity, 50)
         except Exception:
             return False
+        for msg in recent:
+            if msg.id == int(current_msg_id or 0):
+                continue
+            if msg.out:
+                continue
+            if msg.sender_id == lead_peer_id:
+                return False
         return True
 
     async def handle_like_training_reaction(peer_id: int, msg_id: int):
-        if not LIKE_TRAINING_ENABLED or not faq_likes_train_sheet:
+        if not LIKE_TRAINING_ENABLED or not faq_likes_train_res:
             return
         key = (int(peer_id), int(msg_id))
         try:
@@ -6826,7 +7076,7 @@ async def main():
                 "candidate_msg_id": int(msg_id),
                 "candidate_text_raw": text_raw,
                 "candidate_text_norm": normalize_question(text_raw),
-                "cluster_key": build_cluster_key(normalize_question(text_raw)),
+                "cluster_key": question_cluster_key(normalize_question(text_raw)),
                 "ts": now_ts,
                 "step_snapshot": step_snapshot or STEP_SCREENING_WAIT,
             }
@@ -6884,10 +7134,46 @@ async def main():
         except Exception as err:
             print(f"LIKE_TRAIN_MISS reason=raw_handler_err err={type(err).__name__}: {err}")
 
+    @client.on(events.UserUpdate)
+    async def on_user_typing(event):
+        user_id = int(getattr(event, "user_id", 0) or 0)
+        if not user_id or getattr(event, "action", None) is None:
+            return
+        reply_coalescer.note_typing(user_id, not bool(getattr(event, "cancel", False)))
+
+    async def process_incoming_turn(turn: IncomingTurn) -> bool:
+        sender = turn.sender
+        peer_id = int(sender.id)
+        if turn.generation != peer_actors.generation(peer_id):
+            return False
+        speculative_answers.end_burst(peer_id)
+        reply_coalescer.record_batch(turn.count)
+        last_incoming_at[peer_id] = time.time()
+        followup_state.clear(peer_id)
+        queue_today_upsert(
+            peer_id=sender.id,
+            name=getattr(sender, "first_name", "") or "Unknown",
+            username=getattr(sender, "username", "") or "",
+            chat_link=build_chat_link_app(sender, sender.id),
+            followup_stage="",
+            followup_next_at="",
+            followup_last_sent_at="",
+        )
+        if not FLOW_V2_ENABLED:
+            return False
+        try:
+            handled_v2 = await process_v2_turn(sender, turn.text, has_photo=turn.has_photo)
+        finally:
+            speculative_answers.discard(peer_id, turn.text)
+        if handled_v2:
+            last_reply_at[peer_id] = time.time()
+        return handled_v2
+
     @client.on(events.NewMessage(incoming=True))
     async def on_private_message(event):
         if not event.is_private:
             return
+        PEER_MESSAGES.record(event.chat_id, event.message)
         sender = await event.get_sender()
         if not isinstance(sender, User) or sender.bot:
             return
@@ -6895,7 +7181,7 @@ async def main():
         text = event.raw_text or ""
         incoming_has_photo = has_photo_attachment(getattr(event, "message", None))
         test_restart = is_test_restart(sender, text)
-        local_generation = int(restart_generation.get(peer_id, 0))
+        local_generation = peer_actors.generation(peer_id)
         name = getattr(sender, "first_name", "") or "Unknown"
         username = getattr(sender, "username", "") or ""
         chat_link = build_chat_link_app(sender, sender.id)
@@ -6956,16 +7242,17 @@ async def main():
             v2_runtime.delete(peer_id)
             last_reply_at.pop(peer_id, None)
             last_incoming_at.pop(peer_id, None)
-            processing_peers.discard(peer_id)
-            buffered_incoming.pop(peer_id, None)
+            cancel_peer_turns(peer_id)
             start_source = "plus_start" if (plus_start_first_message or plus_start) else "group_incoming_start"
             handled_special_start = await handle_special_start(sender, lead_info, start_source)
             if handled_special_start:
+                mark_first_message_handled()
                 return
             pause_store.set_status(sender.id, username, name, chat_link, "ACTIVE", updated_by=start_source)
             ok = await start_v2_onboarding(sender, start_source)
             if not ok:
                 return
+            mark_first_message_handled()
             if group_incoming_autostart:
                 print(f"✅ GROUP incoming switched to V2 flow peer={peer_id}")
             else:
@@ -6973,7 +7260,7 @@ async def main():
             return
 
         if test_restart:
-            restart_generation[peer_id] = int(restart_generation.get(peer_id, 0)) + 1
+            cancel_peer_turns(peer_id)
             paused_peers.discard(peer_id)
             enabled_peers.add(peer_id)
             clear_qa_gate(peer_id)
@@ -6981,8 +7268,6 @@ async def main():
             v2_runtime.delete(peer_id)
             last_reply_at.pop(peer_id, None)
             last_incoming_at.pop(peer_id, None)
-            processing_peers.discard(peer_id)
-            buffered_incoming.pop(peer_id, None)
             pause_store.set_status(sender.id, username, name, chat_link, "ACTIVE", updated_by="test")
             v2_enrollment.add(peer_id)
             v2_state = PeerRuntimeState(
@@ -6994,6 +7279,7 @@ async def main():
             arm_step_wait(v2_state, STEP_COMPANY_INTRO, time.time())
             v2_runtime.set(v2_state)
             await send_v2_onboarding_sequence(sender)
+            mark_first_message_handled()
             print(f"✅ START8 switched to V2 flow peer={peer_id}")
             return
         is_test = is_test_user(sender)
@@ -7011,27 +7297,16 @@ async def main():
                     print(f"FILTER account={ACCOUNT_KEY} peer={peer_id} reason=not_enabled")
                     return
                 print(f"✅ Test user bypassed enabled check: {peer_id}")
-        v2_buffer_reason = v2_incoming_buffer_reason(peer_id, v2_sending_peers, processing_peers) if FLOW_V2_ENABLED else ""
-        if v2_buffer_reason:
-            buffer_v2_incoming(peer_id, text, incoming_has_photo, v2_buffer_reason)
+        turn = IncomingTurn(sender, text, incoming_has_photo, local_generation)
+        reply_coalescer.note_message(peer_id)
+        last_arrival_at[peer_id] = time.time()
+        if SPECULATIVE_ANSWERS_ENABLED and FLOW_V2_ENABLED and v2_enrollment.has(peer_id):
+            start_speculative_answer(sender, text, incoming_has_photo, v2_step_snapshot or STEP_SCREENING_WAIT)
+        if peer_actors.busy(peer_id):
+            peer_actors.post(peer_id, turn)
+            mark_first_message_handled()
+            print(f"BUFFER account={ACCOUNT_KEY} peer={peer_id} reason=busy size={peer_actors.pending(peer_id)}")
             return
-        if peer_id in processing_peers:
-            if FLOW_V2_ENABLED:
-                return
-            if not is_test:
-                print(f"FILTER account={ACCOUNT_KEY} peer={peer_id} reason=processing")
-                return
-            print(f"✅ Test user bypassed processing check: {peer_id}")
-        now_ts = time.time()
-        last_ts = last_reply_at.get(peer_id)
-        effective_debounce_sec = REPLY_DEBOUNCE_SEC
-        if current_step_snapshot == STEP_SCREENING_WAIT:
-            effective_debounce_sec = min(REPLY_DEBOUNCE_SEC, SCREENING_REPLY_DEBOUNCE_SEC)
-        if last_ts and now_ts - last_ts < effective_debounce_sec:
-            if not is_test:
-                print(f"⚠️ Filtered debounce account={ACCOUNT_KEY} peer={peer_id}")
-                return
-            print(f"✅ Test user bypassed debounce: {peer_id}")
         queue_today_upsert(
             peer_id=sender.id,
             name=name,
@@ -7046,57 +7321,8 @@ async def main():
         )
         if not IS_ALT_ACCOUNT:
             owner_store.set_owner(peer_id, PRIMARY_ACCOUNT_KEY, "incoming", tz)
-        processing_peers.add(peer_id)
-
-        try:
-            if FLOW_V2_ENABLED and local_generation != int(restart_generation.get(peer_id, 0)):
-                return
-            last_incoming_at[peer_id] = time.time()
-            followup_state.clear(peer_id)
-            queue_today_upsert(
-                peer_id=sender.id,
-                name=name,
-                username=username,
-                chat_link=chat_link,
-                followup_stage="",
-                followup_next_at="",
-                followup_last_sent_at="",
-            )
-
-            if FLOW_V2_ENABLED:
-                handled_v2 = await process_v2_turn(sender, text, has_photo=incoming_has_photo)
-                if handled_v2:
-                    last_reply_at[peer_id] = time.time()
-                return
-        finally:
-            processing_peers.discard(peer_id)
-            if FLOW_V2_ENABLED:
-                while True:
-                    queued = buffered_incoming.get(peer_id)
-                    if not queued:
-                        break
-                    item = queued.popleft()
-                    if isinstance(item, tuple):
-                        if len(item) >= 3:
-                            msg_generation, next_text, next_has_photo = item[0], item[1], bool(item[2])
-                        else:
-                            msg_generation, next_text = item
-                            next_has_photo = False
-                    else:
-                        msg_generation, next_text = int(restart_generation.get(peer_id, 0)), str(item)
-                        next_has_photo = False
-                    if not queued:
-                        buffered_incoming.pop(peer_id, None)
-                    if int(msg_generation) != int(restart_generation.get(peer_id, 0)):
-                        continue
-                    processing_peers.add(peer_id)
-                    try:
-                        await process_v2_turn(sender, next_text, has_photo=next_has_photo)
-                        last_reply_at[peer_id] = time.time()
-                    except Exception as err:
-                        print(f"⚠️ Buffered V2 process error peer={peer_id}: {type(err).__name__}: {err}")
-                    finally:
-                        processing_peers.discard(peer_id)
+        peer_actors.post(peer_id, turn)
+        mark_first_message_handled()
 
     print("🤖 Автовідповідач запущено")
     async def followup_loop():
@@ -7105,11 +7331,15 @@ async def main():
                 now = datetime.now(tz)
                 if IS_ALT_ACCOUNT and pending_group_autostart:
                     now_ts = now.timestamp()
-                    for peer_id, due_at in list(pending_group_autostart.items()):
-                        if now_ts < float(due_at or 0):
-                            continue
+                    due_peers = [
+                        peer_id
+                        for peer_id, due_at in list(pending_group_autostart.items())
+                        if now_ts >= float(due_at or 0)
+                    ]
+                    due_owners = owner_store.owners_for(due_peers) if due_peers else {}
+                    for peer_id in due_peers:
                         pending_group_autostart.pop(peer_id, None)
-                        owner = owner_store.get_owner(peer_id)
+                        owner = due_owners.get(int(peer_id))
                         if owner in PRIMARY_OWNER_KEYS:
                             print(f"ALT_DELAYED_START_CANCELLED owner=primary peer={peer_id}")
                             continue
@@ -7158,7 +7388,13 @@ async def main():
                                     and time.time() - prompted_at >= max(0.0, FORM_PHOTO_REMINDER_DELAY_SEC)
                                 ):
                                     reminder_text = FORM_MISSING_PHOTO_TEXT if missing_photo else FORM_MISSING_TEXT_TEXT
-                                    await send_v2_message(entity, reminder_text, STEP_FORM_FORWARD, status=STATUS_FORM_REQUESTED)
+                                    await send_v2_message(
+                                        entity,
+                                        reminder_text,
+                                        STEP_FORM_FORWARD,
+                                        status=STATUS_FORM_REQUESTED,
+                                        priority=PRIORITY_FOLLOWUP,
+                                    )
                                     v2s.form_photo_reminder_sent = True
                                     v2s.form_waiting_photo = missing_photo
                                     v2_runtime.set(v2s)
@@ -7176,9 +7412,7 @@ async def main():
                             continue
                         if should_skip_v2_step_followup(v2s, current_step):
                             continue
-                        if peer_id in processing_peers:
-                            continue
-                        if buffered_incoming.get(peer_id):
+                        if peer_actors.busy(peer_id):
                             continue
                         if not can_send_v2_peer_followup(v2s):
                             continue
@@ -7234,7 +7468,19 @@ async def main():
                         if abort_reason:
                             print(f"STEP_WAIT_ABORTED peer={peer_id} step={current_step} reason={abort_reason}")
                             continue
-                        await send_v2_message(entity, final_text, current_step, status=status_for_text(final_text) or "знак питання")
+                        try:
+                            await peer_actors.call(
+                                peer_id,
+                                lambda: send_v2_message(
+                                    entity,
+                                    final_text,
+                                    current_step,
+                                    status=status_for_text(final_text) or "знак питання",
+                                    priority=PRIORITY_FOLLOWUP,
+                                ),
+                            )
+                        except PeerTurnCancelled:
+                            continue
                         sent_at = time.time()
                         mark_global_fallback_sent(now, tz)
                         mark_v2_peer_followup_sent(v2s)
@@ -7254,7 +7500,9 @@ async def main():
     sheets_task = None
     followup_task = None
     form_import_task = None
+    warmup_task = None
     try:
+        warmup_task = asyncio.create_task(warm_up_sheets())
         if sheets_queue:
             sheets_task = asyncio.create_task(sheet_flush_loop())
         followup_task = asyncio.create_task(followup_loop())
@@ -7330,8 +7578,21 @@ async def main():
                 followup_task.cancel()
             if form_import_task:
                 form_import_task.cancel()
+            if warmup_task and not warmup_task.done():
+                warmup_task.cancel()
         except Exception:
             pass
+        if registration_pool is not None:
+            await registration_pool.close()
+        if registration_permissions_task is not None:
+            registration_permissions_task.cancel()
+        registration_drive = registration_drive_res.peek() if registration_drive_res else None
+        if registration_drive and registration_drive.pending_permissions():
+            # Files already linked from the sheet must not stay private after shutdown.
+            try:
+                await asyncio.to_thread(registration_drive.flush_permissions)
+            except Exception as err:
+                print(f"⚠️ DRIVE_PERMISSIONS_SHUTDOWN_FLUSH_FAIL: {type(err).__name__}: {err}")
         await client.disconnect()
         release_lock(SESSION_LOCK)
         release_lock(AUTO_REPLY_LOCK)
@@ -1,6 +1,8 @@
 import re
+import time
+from collections import OrderedDict
 from enum import Enum
-from typing import Awaitable, Callable, Optional
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
 
 
 class Decision(str, Enum):
@@ -454,3 +456,61 @@ async def classify_intent(
     if ai_intent == "stop":
         return Intent.STOP
     return Intent.OTHER
+
+
+TURN_LABELS = ("intent", "stop", "refusal_reason")
+
+
+class CombinedTurnClassifier:
+    """One `/classify_turn` round trip per candidate turn.
+
+    The labels auto_reply reads (intent, stop, refusal reason) are requested together and cached by (peer, step, normalized text), so the intent,
+    stop and refusal checks of the same turn share a single AI call.
+    """
+
+    def __init__(
+        self,
+        post: Callable[[dict], Awaitable[Optional[dict]]],
+        ttl_sec: float = 120.0,
+        max_entries: int = 512,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._post = post
+        self.ttl_sec = max(0.0, float(ttl_sec))
+        self.max_entries = max(1, int(max_entries))
+        self._clock = clock
+        self._cache: "OrderedDict[Tuple[int, str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.requests = 0
+        self.cache_hits = 0
+
+    async def classify(
+        self,
+        peer_id: int,
+        history: list,
+        text: str,
+        step_name: Optional[str],
+        allowed_reasons: Iterable[str] = (),
+    ) -> Optional[Dict[str, Any]]:
+        key = (int(peer_id or 0), (step_name or "").strip(), normalize_text(text))
+        now = self._clock()
+        cached = self._cache.get(key)
+        if cached is not None and now - cached[0] <= self.ttl_sec:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return cached[1]
+        payload = {
+            "history": history,
+            "last_message": text,
+            "step_name": (step_name or "").strip(),
+            "labels": list(TURN_LABELS),
+            "allowed_reasons": sorted(allowed_reasons),
+        }
+        self.requests += 1
+        data = await self._post(payload)
+        if not data or not data.get("ok") or not isinstance(data.get("labels"), dict):
+            return None
+        labels = dict(data["labels"])
+        self._cache[key] = (now, labels)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return labels
@@ -0,0 +1,253 @@
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import signal
+import importlib.util
+from dataclasses import dataclass
+from datetime import datetime
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from file_lock import acquire_lock, release_lock
+
+load_dotenv("/opt/tg_leads/.env")
+
+STATE_DIR = os.environ.get("TG_LEADS_STATE_DIR", "/opt/tg_leads/state")
+AUTO_REPLY_PATH = os.environ.get(
+    "AUTO_REPLY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "auto_reply.py")
+)
+HOST_CONTROL_PATH = os.environ.get("AUTO_REPLY_HOST_CONTROL_PATH", os.path.join(STATE_DIR, "auto_reply_host.json"))
+HOST_STATUS_PATH = os.environ.get(
+    "AUTO_REPLY_HOST_STATUS_PATH", os.path.join(STATE_DIR, "auto_reply_host_status.json")
+)
+HOST_POLL_SEC = float(os.environ.get("AUTO_REPLY_HOST_POLL_SEC", "1"))
+HOST_RETRY_SEC = float(os.environ.get("AUTO_REPLY_HOST_RETRY_SEC", "30"))
+HOST_STOP_TIMEOUT_SEC = float(os.environ.get("AUTO_REPLY_HOST_STOP_TIMEOUT_SEC", "15"))
+
+
+def load_account_module(
+    key: str,
+    env: Dict[str, str],
+    shared: Dict[Any, Any],
+    path: str = AUTO_REPLY_PATH,
+) -> ModuleType:
+    """Import a private copy of auto_reply.py configured by the account env overlay.
+
+    auto_reply reads its configuration from the environment at import time, so the overlay
+    is applied only while the copy executes. The copy gets the host's `shared` dict, so
+    Sheets sessions, the GroupLeads sheet, the owner registry and the AI HTTP pool are
+    built once for all accounts.
+    """
+    name = "auto_reply__" + re.sub(r"[^0-9A-Za-z_]", "_", key)
+    spec = importlib.util.spec_from_file_location(name, path)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"cannot load {path}")
+    module = importlib.util.module_from_spec(spec)
+    saved = {k: os.environ.get(k) for k in env}
+    os.environ.update(env)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        sys.modules.pop(name, None)
+        raise
+    finally:
+        for k, value in saved.items():
+            if value is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = value
+    module.PROCESS_SHARED = shared
+    return module
+
+
+@dataclass
+class _AccountRun:
+    key: str
+    env: Dict[str, str]
+    module: ModuleType
+    stop_event: asyncio.Event
+    task: "asyncio.Task[Any]"
+    started_at: float
+
+
+class AccountHost:
+    """Runs the auto-reply `main()` of several accounts side by side in one event loop."""
+
+    def __init__(
+        self,
+        loader: Callable[[str, Dict[str, str], Dict[Any, Any]], ModuleType] = load_account_module,
+        retry_sec: float = HOST_RETRY_SEC,
+        stop_timeout_sec: float = HOST_STOP_TIMEOUT_SEC,
+        clock: Callable[[], float] = time.time,
+    ):
+        self._loader = loader
+        self.retry_sec = max(0.0, float(retry_sec))
+        self.stop_timeout_sec = max(0.1, float(stop_timeout_sec))
+        self._clock = clock
+        self.shared: Dict[Any, Any] = {}
+        self._runs: Dict[str, _AccountRun] = {}
+        self._failed: Dict[str, Tuple[Dict[str, str], float, str]] = {}
+
+    def running(self) -> List[str]:
+        return sorted(key for key, run in self._runs.items() if not run.task.done())
+
+    def start(self, key: str, env: Dict[str, str]) -> bool:
+        if key in self._runs:
+            return False
+        try:
+            module = self._loader(key, dict(env), self.shared)
+        except Exception as err:
+            self._failed[key] = (dict(env), self._clock(), f"{type(err).__name__}: {err}")
+            print(f"⚠️ HOST_ACCOUNT_LOAD_FAIL account={key}: {type(err).__name__}: {err}")
+            return False
+        stop_event = asyncio.Event()
+        task = asyncio.create_task(module.main(stop_event=stop_event))
+        self._runs[key] = _AccountRun(key, dict(env), module, stop_event, task, self._clock())
+        self._failed.pop(key, None)
+        print(f"✅ HOST_ACCOUNT_START account={key}")
+        return True
+
+    async def _finish(self, run: _AccountRun) -> str:
+        error = ""
+        try:
+            await run.task
+        except asyncio.CancelledError:
+            pass
+        except Exception as err:
+            error = f"{type(err).__name__}: {err}"
+        scheduler = getattr(run.module, "SEND_SCHEDULER", None)
+        if scheduler is not None:
+            await scheduler.close()
+        sys.modules.pop(run.module.__name__, None)
+        return error
+
+    async def stop(self, key: str) -> bool:
+        run = self._runs.pop(key, None)
+        self._failed.pop(key, None)
+        if run is None:
+            return False
+        run.stop_event.set()
+        done, _ = await asyncio.wait({run.task}, timeout=self.stop_timeout_sec)
+        if not done:
+            run.task.cancel()
+        error = await self._finish(run)
+        print(f"⏹ HOST_ACCOUNT_STOP account={key}" + (f" error={error}" if error else ""))
+        return True
+
+    async def _reap(self) -> None:
+        for key, run in list(self._runs.items()):
+            if not run.task.done():
+                continue
+            self._runs.pop(key, None)
+            error = await self._finish(run) or "main exited"
+            self._failed[key] = (run.env, self._clock(), error)
+            print(f"⚠️ HOST_ACCOUNT_EXITED account={key}: {error}")
+
+    async def sync(self, wanted: Dict[str, Dict[str, str]]) -> None:
+        """Bring the running accounts in line with `wanted` (key -> env overlay)."""
+        await self._reap()
+        for key in list(self._runs):
+            if key not in wanted:
+                await self.stop(key)
+            elif self._runs[key].env != wanted[key]:
+                await self.stop(key)
+        for key in list(self._failed):
+            if key not in wanted:
+                self._failed.pop(key, None)
+        now = self._clock()
+        for key, env in wanted.items():
+            if key in self._runs:
+                continue
+            failed = self._failed.get(key)
+            if failed is not None and failed[0] == env and now - failed[1] < self.retry_sec:
+                continue
+            self.start(key, env)
+
+    def status(self) -> Dict[str, Any]:
+        accounts: Dict[str, Any] = {}
+        for key, run in self._runs.items():
+            accounts[key] = {"running": not run.task.done(), "started_at": round(run.started_at, 3), "error": ""}
+        for key, (_, failed_at, error) in self._failed.items():
+            accounts.setdefault(key, {"running": False, "failed_at": round(failed_at, 3), "error": error})
+        return {"accounts": accounts, "shared": sorted(str(key[0]) for key in self.shared)}
+
+    async def close(self) -> None:
+        for key in list(self._runs):
+            await self.stop(key)
+        pool = self.shared.get(("ai_http_pool",))
+        if pool is not None:
+            pool.close()
+
+
+def load_host_control(path: str) -> Dict[str, Dict[str, str]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    accounts = data.get("accounts") if isinstance(data, dict) else None
+    if not isinstance(accounts, dict):
+        return {}
+    wanted: Dict[str, Dict[str, str]] = {}
+    for key, entry in accounts.items():
+        env = entry.get("env") if isinstance(entry, dict) else None
+        if isinstance(env, dict):
+            wanted[str(key)] = {str(k): str(v) for k, v in env.items() if v is not None}
+    return wanted
+
+
+def write_host_status(path: str, status: Dict[str, Any]) -> None:
+    base_dir = os.path.dirname(path)
+    if base_dir:
+        os.makedirs(base_dir, exist_ok=True)
+    payload = dict(status, pid=os.getpid(), updated_at=datetime.now().isoformat(timespec="seconds"))
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+async def main(control_path: Optional[str] = None, status_path: Optional[str] = None):
+    control_path = control_path or HOST_CONTROL_PATH
+    status_path = status_path or HOST_STATUS_PATH
+    host_lock = f"{control_path}.lock"
+    if not acquire_lock(host_lock):
+        print(f"⛔ AUTO_REPLY_HOST вже запущено (lock {host_lock})")
+        return
+    host = AccountHost()
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+    print(f"✅ AUTO_REPLY_HOST_START pid={os.getpid()} control={control_path}")
+    try:
+        while not stop_event.is_set():
+            await host.sync(load_host_control(control_path))
+            try:
+                write_host_status(status_path, host.status())
+            except OSError as err:
+                print(f"⚠️ HOST_STATUS_WRITE_FAIL path={status_path}: {err}")
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=HOST_POLL_SEC)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await host.close()
+        try:
+            write_host_status(status_path, host.status())
+        except OSError:
+            pass
+        release_lock(host_lock)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
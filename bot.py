@@ -2,6 +2,8 @@ import os
 import re
 import sys
 import json
+import time
+import asyncio
 import subprocess
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
@@ -18,7 +20,8 @@ from telethon import TelegramClient
 from telethon.tl import functions as tl_functions
 from telethon.tl.types import User as TgUser
 
-from tg_to_sheets import acquire_lock, release_lock
+from chat_export import ChatExportArchive, export_stats_line, recent_user_dialogs, sync_dialogs, write_export
+from file_lock import acquire_lock, lock_held, release_lock
 from hr_filter_store import HrFilterStore, normalize_target_group
 from telegram_group_resolver import resolve_group_target_entity
 
@@ -27,6 +30,7 @@ API_ID = int(os.environ["API_ID"])
 API_HASH = os.environ["API_HASH"]
 SESSION_FILE = os.environ.get("SESSION_FILE")
 EXPORT_DAYS = int(os.environ.get("EXPORT_DAYS", "90"))
+EXPORT_CONCURRENCY = int(os.environ.get("EXPORT_CONCURRENCY", "4"))
 STATE_DIR = os.environ.get("TG_LEADS_STATE_DIR", "/opt/tg_leads/state")
 EXPORT_DIR_BASE = os.environ.get("EXPORT_DIR", "/opt/tg_leads/exports")
 
@@ -36,6 +40,17 @@ AUTO_REPLY_PROCESS: Dict[str, subprocess.Popen] = {}
 
 AUTO_REPLY_PATH = os.environ.get("AUTO_REPLY_PATH", "auto_reply.py")
 AUTO_REPLY_CMD = os.environ.get("AUTO_REPLY_CMD")
+# One auto_reply_host.py process serves every started account instead of a process each.
+AUTO_REPLY_MULTI_ACCOUNT = os.environ.get("AUTO_REPLY_MULTI_ACCOUNT", "0").strip().lower() in {"1", "true", "yes", "on"}
+AUTO_REPLY_HOST_PATH = os.environ.get("AUTO_REPLY_HOST_PATH", "auto_reply_host.py")
+AUTO_REPLY_HOST_CONTROL_PATH = os.environ.get(
+    "AUTO_REPLY_HOST_CONTROL_PATH", os.path.join(STATE_DIR, "auto_reply_host.json")
+)
+AUTO_REPLY_HOST_STATUS_PATH = os.environ.get(
+    "AUTO_REPLY_HOST_STATUS_PATH", os.path.join(STATE_DIR, "auto_reply_host_status.json")
+)
+AUTO_REPLY_HOST_STOP_WAIT_SEC = float(os.environ.get("AUTO_REPLY_HOST_STOP_WAIT_SEC", "20"))
+AUTO_REPLY_HOST_PROCESS: Optional[subprocess.Popen] = None
 
 
 @dataclass
@@ -255,7 +270,118 @@ def kb_hr_filter(acct: AccountConfig):
     return kb
 
 
+def auto_reply_env(acct: AccountConfig) -> Dict[str, str]:
+    env = {
+        "AUTO_REPLY_SESSION_FILE": acct.auto_reply_session_file,
+        "TELETHON_SESSION_LOCK": acct.session_lock,
+        "AUTO_REPLY_LOCK": acct.auto_reply_lock,
+        "AUTO_REPLY_STATUS_PATH": acct.auto_reply_status_path,
+        "AUTO_REPLY_FOLLOWUP_STATE_PATH": acct.auto_reply_followup_state_path,
+        "AUTO_REPLY_STEP_STATE_PATH": acct.auto_reply_step_state_path,
+        "AUTO_REPLY_PAUSED_STATE_PATH": acct.auto_reply_paused_state_path,
+        "AUTO_REPLY_V2_ENROLLMENT_PATH": acct.auto_reply_v2_enrollment_path,
+        "AUTO_REPLY_V2_RUNTIME_PATH": acct.auto_reply_v2_runtime_path,
+        "AUTO_REPLY_SHEETS_QUEUE_PATH": acct.auto_reply_sheets_queue_path,
+        "AUTO_REPLY_FALLBACK_QUOTA_PATH": acct.auto_reply_fallback_quota_path,
+        "FORM_IMPORT_CONTROL_PATH": acct.form_import_control_path,
+        "FORM_IMPORT_STATE_PATH": acct.form_import_state_path,
+        "AUTO_REPLY_ACCOUNT_KEY": acct.key,
+    }
+    for key in (
+        "BOT_REPLY_DELAY_SEC",
+        "REPLY_DEBOUNCE_SEC",
+        "QUESTION_GAP_SEC",
+        "QUESTION_RESPONSE_DELAY_SEC",
+        "AUTO_REPLY_CONTINUE_DELAY_SEC",
+        "AUTO_REPLY_LOCK_TTL",
+        "AUTO_REPLY_FOLLOWUP_CHECK_SEC",
+        "FOLLOWUP_WINDOW_START_HOUR",
+        "FOLLOWUP_WINDOW_END_HOUR",
+        "VIDEO_MESSAGE_LINK",
+        "VIDEO_GROUP_LINK",
+        "VIDEO_GROUP_TITLE",
+        "VIDEO_CACHE_PATH",
+        "TODAY_WORKSHEET",
+        "HISTORY_SHEET_PREFIX",
+        "GROUP_LEADS_WORKSHEET",
+        "HISTORY_RETENTION_MONTHS",
+        "FORM_IMPORT_ENABLED",
+        "FORM_IMPORT_SPREADSHEET_ID",
+        "FORM_IMPORT_WORKSHEET_INDEX",
+        "FORM_IMPORT_POLL_SEC",
+    ):
+        val = os.environ.get(acct.env_prefix + key)
+        if val is not None:
+            env[key] = val
+    return env
+
+
+def load_host_control() -> Dict[str, dict]:
+    try:
+        with open(AUTO_REPLY_HOST_CONTROL_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        accounts = data.get("accounts") if isinstance(data, dict) else None
+        return accounts if isinstance(accounts, dict) else {}
+    except Exception:
+        return {}
+
+
+def save_host_control(accounts: Dict[str, dict]):
+    ensure_dir(os.path.dirname(AUTO_REPLY_HOST_CONTROL_PATH) or STATE_DIR)
+    tmp_path = AUTO_REPLY_HOST_CONTROL_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"accounts": accounts}, f, ensure_ascii=False)
+    os.replace(tmp_path, AUTO_REPLY_HOST_CONTROL_PATH)
+
+
+def auto_reply_host_running() -> bool:
+    # The host holds the control lock for its whole life, so a host started before a bot
+    # restart is still seen; the Popen check covers the moment before it takes the lock.
+    if AUTO_REPLY_HOST_PROCESS is not None and AUTO_REPLY_HOST_PROCESS.poll() is None:
+        return True
+    return lock_held(AUTO_REPLY_HOST_CONTROL_PATH + ".lock")
+
+
+def load_host_status() -> Tuple[float, Dict[str, dict]]:
+    """(mtime, accounts) of the host status file; (0, {}) when it is missing or unreadable."""
+    try:
+        mtime = os.path.getmtime(AUTO_REPLY_HOST_STATUS_PATH)
+        with open(AUTO_REPLY_HOST_STATUS_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception:
+        return 0.0, {}
+    accounts = data.get("accounts") if isinstance(data, dict) else None
+    return mtime, (accounts if isinstance(accounts, dict) else {})
+
+
+async def wait_host_account_stopped(key: str, since: float, timeout_sec: float) -> bool:
+    """Wait until a host status written after `since` no longer shows `key` running."""
+    deadline = time.time() + max(0.0, timeout_sec)
+    while True:
+        if not auto_reply_host_running():
+            return True
+        mtime, accounts = load_host_status()
+        entry = accounts.get(key)
+        if mtime > since and not (isinstance(entry, dict) and entry.get("running")):
+            return True
+        if time.time() >= deadline:
+            return False
+        await asyncio.sleep(0.5)
+
+
+def ensure_auto_reply_host():
+    global AUTO_REPLY_HOST_PROCESS
+    if auto_reply_host_running():
+        return
+    env = os.environ.copy()
+    env["AUTO_REPLY_HOST_CONTROL_PATH"] = AUTO_REPLY_HOST_CONTROL_PATH
+    env["AUTO_REPLY_PATH"] = AUTO_REPLY_PATH
+    AUTO_REPLY_HOST_PROCESS = subprocess.Popen([sys.executable, AUTO_REPLY_HOST_PATH], env=env)
+
+
 def auto_reply_running(acct: AccountConfig) -> bool:
+    if AUTO_REPLY_MULTI_ACCOUNT:
+        return auto_reply_host_running() and acct.key in load_host_control()
     proc = AUTO_REPLY_PROCESS.get(acct.key)
     return proc is not None and proc.poll() is None
 
@@ -266,52 +392,25 @@ def start_auto_reply(acct: AccountConfig) -> Tuple[bool, str]:
     if not is_account_enabled(acct):
         return False, "Акаунт вимкнено"
 
+    if AUTO_REPLY_MULTI_ACCOUNT:
+        try:
+            # Without a live host the control file is left over from an earlier run; starting a
+            # host on it would bring back every account listed there.
+            accounts = load_host_control() if auto_reply_host_running() else {}
+            accounts[acct.key] = {"env": auto_reply_env(acct)}
+            save_host_control(accounts)
+            ensure_auto_reply_host()
+            return True, "✅ Автовідповідач запущено"
+        except Exception:
+            return False, "❌ Не вдалося запустити автовідповідач"
+
     if AUTO_REPLY_CMD:
         cmd = AUTO_REPLY_CMD.split()
     else:
         cmd = [sys.executable, AUTO_REPLY_PATH]
     try:
         env = os.environ.copy()
-        env["AUTO_REPLY_SESSION_FILE"] = acct.auto_reply_session_file
-        env["TELETHON_SESSION_LOCK"] = acct.session_lock
-        env["AUTO_REPLY_LOCK"] = acct.auto_reply_lock
-        env["AUTO_REPLY_STATUS_PATH"] = acct.auto_reply_status_path
-        env["AUTO_REPLY_FOLLOWUP_STATE_PATH"] = acct.auto_reply_followup_state_path
-        env["AUTO_REPLY_STEP_STATE_PATH"] = acct.auto_reply_step_state_path
-        env["AUTO_REPLY_PAUSED_STATE_PATH"] = acct.auto_reply_paused_state_path
-        env["AUTO_REPLY_V2_ENROLLMENT_PATH"] = acct.auto_reply_v2_enrollment_path
-        env["AUTO_REPLY_V2_RUNTIME_PATH"] = acct.auto_reply_v2_runtime_path
-        env["AUTO_REPLY_SHEETS_QUEUE_PATH"] = acct.auto_reply_sheets_queue_path
-        env["AUTO_REPLY_FALLBACK_QUOTA_PATH"] = acct.auto_reply_fallback_quota_path
-        env["FORM_IMPORT_CONTROL_PATH"] = acct.form_import_control_path
-        env["FORM_IMPORT_STATE_PATH"] = acct.form_import_state_path
-        env["AUTO_REPLY_ACCOUNT_KEY"] = acct.key
-        for key in (
-            "BOT_REPLY_DELAY_SEC",
-            "REPLY_DEBOUNCE_SEC",
-            "QUESTION_GAP_SEC",
-            "QUESTION_RESPONSE_DELAY_SEC",
-            "AUTO_REPLY_CONTINUE_DELAY_SEC",
-            "AUTO_REPLY_LOCK_TTL",
-            "AUTO_REPLY_FOLLOWUP_CHECK_SEC",
-            "FOLLOWUP_WINDOW_START_HOUR",
-            "FOLLOWUP_WINDOW_END_HOUR",
-            "VIDEO_MESSAGE_LINK",
-            "VIDEO_GROUP_LINK",
-            "VIDEO_GROUP_TITLE",
-            "VIDEO_CACHE_PATH",
-            "TODAY_WORKSHEET",
-            "HISTORY_SHEET_PREFIX",
-            "GROUP_LEADS_WORKSHEET",
-            "HISTORY_RETENTION_MONTHS",
-            "FORM_IMPORT_ENABLED",
-            "FORM_IMPORT_SPREADSHEET_ID",
-            "FORM_IMPORT_WORKSHEET_INDEX",
-            "FORM_IMPORT_POLL_SEC",
-        ):
-            val = os.environ.get(acct.env_prefix + key)
-            if val is not None:
-                env[key] = val
+        env.update(auto_reply_env(acct))
         AUTO_REPLY_PROCESS[acct.key] = subprocess.Popen(cmd, env=env)
         return True, "✅ Автовідповідач запущено"
     except Exception:
@@ -319,7 +418,24 @@ def start_auto_reply(acct: AccountConfig) -> Tuple[bool, str]:
         return False, "❌ Не вдалося запустити автовідповідач"
 
 
-def stop_auto_reply(acct: AccountConfig) -> Tuple[bool, str]:
+async def stop_auto_reply(acct: AccountConfig) -> Tuple[bool, str]:
+    if AUTO_REPLY_MULTI_ACCOUNT:
+        accounts = load_host_control()
+        if acct.key not in accounts or not auto_reply_host_running():
+            accounts.pop(acct.key, None)
+            save_host_control(accounts)
+            return False, "Автовідповідач не запущено для цього акаунта"
+        try:
+            accounts.pop(acct.key, None)
+            requested_at = time.time()
+            save_host_control(accounts)
+        except Exception:
+            return False, "❌ Не вдалося зупинити автовідповідач"
+        # The Telethon session is free only once the host has actually stopped the account.
+        if not await wait_host_account_stopped(acct.key, requested_at, AUTO_REPLY_HOST_STOP_WAIT_SEC):
+            return False, "⏳ Зупинка ще триває, перевірте статус за хвилину"
+        return True, "⏹ Автовідповідач зупинено"
+
     proc = AUTO_REPLY_PROCESS.get(acct.key)
     if not proc or proc.poll() is not None:
         AUTO_REPLY_PROCESS.pop(acct.key, None)
@@ -467,54 +583,52 @@ async def export_recent_chats(acct: AccountConfig) -> Tuple[Optional[str], Optio
     tz = ZoneInfo(os.environ.get("TIMEZONE", "Europe/Kyiv"))
     cutoff = datetime.now(tz) - timedelta(days=EXPORT_DAYS)
     stamp = datetime.now(tz).strftime("%Y%m%d_%H%M%S")
-    out_path = os.path.join(acct.export_dir, f"chats_export_{stamp}.txt")
+    out_path = os.path.join(acct.export_dir, f"chats_export_{stamp}.txt.gz")
 
+    archive = None
     client = TelegramClient(acct.session_file, API_ID, API_HASH)
+    session_locked = True
     try:
+        archive = ChatExportArchive(os.path.join(acct.export_dir, "export_archive.sqlite"))
         await client.start()
-        with open(out_path, "w", encoding="utf-8") as f:
-            f.write(f"Export generated: {datetime.now(tz).isoformat(timespec='seconds')}\n")
-            f.write(f"Period: last {EXPORT_DAYS} days\n\n")
-            async for dialog in client.iter_dialogs():
-                if not dialog.is_user:
-                    continue
-                entity = dialog.entity
-                if isinstance(entity, TgUser) and getattr(entity, "bot", False):
-                    continue
-                messages = []
-                async for m in client.iter_messages(entity):
-                    if not m.message:
-                        continue
-                    msg_dt = m.date.astimezone(tz) if m.date else None
-                    if msg_dt and msg_dt < cutoff:
-                        break
-                    messages.append(m)
-                if not messages:
-                    continue
-                name_parts = [
-                    getattr(entity, "first_name", "") or "",
-                    getattr(entity, "last_name", "") or "",
-                ]
-                name = " ".join(p for p in name_parts if p).strip() or (dialog.name or "")
-                username = getattr(entity, "username", "") or ""
-                header = f"=== CHAT: {name} {('@' + username) if username else ''} (id {entity.id}) ===\n"
-                f.write(header)
-                for m in reversed(messages):
-                    msg_dt = m.date.astimezone(tz) if m.date else None
-                    ts = msg_dt.strftime("%Y-%m-%d %H:%M") if msg_dt else "unknown time"
-                    sender = "me" if m.out else "candidate"
-                    text = normalize_message_text(m.message)
-                    f.write(f"{ts} [{sender}]: {text}\n")
-                f.write("\n")
+        dialogs, stale = recent_user_dialogs(
+            [dialog async for dialog in client.iter_dialogs()],
+            cutoff,
+            lambda entity: isinstance(entity, TgUser) and getattr(entity, "bot", False),
+        )
+        stats = await sync_dialogs(client, dialogs, archive, cutoff, concurrency=EXPORT_CONCURRENCY)
+        stats.skipped_stale = stale
+        # Telegram is no longer needed: hand the session back before writing the file.
+        await client.disconnect()
+        release_lock(acct.session_lock)
+        session_locked = False
+        archive.prune(cutoff.timestamp())
+        written = await asyncio.to_thread(
+            write_export,
+            out_path,
+            dialogs,
+            archive,
+            cutoff,
+            tz,
+            [
+                f"Export generated: {datetime.now(tz).isoformat(timespec='seconds')}",
+                f"Period: last {EXPORT_DAYS} days",
+            ],
+            normalize_message_text,
+        )
+        print(f"{export_stats_line(stats, written)} account={acct.key}")
         return out_path, None
     except Exception:
         return None, "❌ Не вдалося сформувати експорт."
     finally:
-        try:
-            await client.disconnect()
-        except Exception:
-            pass
-        release_lock(acct.session_lock)
+        if session_locked:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+            release_lock(acct.session_lock)
+        if archive is not None:
+            archive.close()
         release_lock(acct.export_lock_path)
 
 
@@ -550,7 +664,7 @@ async def cb_account_actions(call: types.CallbackQuery):
         clear_pending_input(call.message.chat.id)
         enabled = is_account_enabled(acct)
         if enabled:
-            stop_auto_reply(acct)
+            await stop_auto_reply(acct)
         set_account_enabled(acct, not enabled)
         await call.answer()
         await call.message.reply(
@@ -568,7 +682,7 @@ async def cb_account_actions(call: types.CallbackQuery):
 
     if action == "auto_stop":
         clear_pending_input(call.message.chat.id)
-        ok, msg = stop_auto_reply(acct)
+        ok, msg = await stop_auto_reply(acct)
         await call.answer()
         await call.message.reply(msg)
         return
@@ -673,7 +787,7 @@ async def cb_auto_start(call: types.CallbackQuery):
 
 @dp.callback_query_handler(lambda c: c.data == "auto_stop")
 async def cb_auto_stop(call: types.CallbackQuery):
-    ok, msg = stop_auto_reply(DEFAULT_ACCOUNT)
+    ok, msg = await stop_auto_reply(DEFAULT_ACCOUNT)
     await call.answer()
     await call.message.reply(msg)
 
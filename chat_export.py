@@ -0,0 +1,277 @@
+import asyncio
+import gzip
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime, tzinfo
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Tuple
+
+from send_scheduler import flood_wait_seconds
+
+
+@dataclass
+class DialogMark:
+    high_water: int
+    covered_from: float
+
+
+class ChatExportArchive:
+    """Local copy of exported private chats with a per-dialog high-water mark.
+
+    Each dialog is committed in one transaction together with the id of the newest
+    message fetched, so an interrupted export resumes where it stopped and a repeated
+    export asks Telegram only for messages above the mark. `covered_from` remembers how far
+    back the dialog was fetched; a longer export window triggers a full refetch.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        base_dir = os.path.dirname(path)
+        if base_dir:
+            os.makedirs(base_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS export_dialogs (
+                peer_id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL DEFAULT '',
+                username TEXT NOT NULL DEFAULT '',
+                high_water INTEGER NOT NULL DEFAULT 0,
+                covered_from REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS export_messages (
+                peer_id INTEGER NOT NULL,
+                msg_id INTEGER NOT NULL,
+                date_ts REAL NOT NULL,
+                out INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (peer_id, msg_id)
+            )
+            """
+        )
+
+    def mark(self, peer_id: int) -> Optional[DialogMark]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT high_water, covered_from FROM export_dialogs WHERE peer_id = ?",
+                (int(peer_id),),
+            ).fetchone()
+        return DialogMark(int(row[0]), float(row[1])) if row else None
+
+    def save_dialog(
+        self,
+        peer_id: int,
+        name: str,
+        username: str,
+        high_water: int,
+        covered_from: float,
+        messages: Iterable[Tuple[int, float, bool, str]],
+        replace: bool = False,
+    ) -> None:
+        peer_id = int(peer_id)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if replace:
+                    self._conn.execute("DELETE FROM export_messages WHERE peer_id = ?", (peer_id,))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO export_messages (peer_id, msg_id, date_ts, out, text) VALUES (?, ?, ?, ?, ?)",
+                    [(peer_id, int(msg_id), float(ts), int(bool(out)), text) for msg_id, ts, out, text in messages],
+                )
+                self._conn.execute(
+                    """
+                    INSERT INTO export_dialogs (peer_id, name, username, high_water, covered_from)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(peer_id) DO UPDATE SET
+                        name = excluded.name,
+                        username = excluded.username,
+                        high_water = MAX(export_dialogs.high_water, excluded.high_water),
+                        covered_from = excluded.covered_from
+                    """,
+                    (peer_id, name or "", username or "", int(high_water), float(covered_from)),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def prune(self, cutoff_ts: float) -> int:
+        """Drop messages older than `cutoff_ts`; marks move up so a longer window refetches them."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cur = self._conn.execute("DELETE FROM export_messages WHERE date_ts < ?", (float(cutoff_ts),))
+                self._conn.execute(
+                    "UPDATE export_dialogs SET covered_from = MAX(covered_from, ?)",
+                    (float(cutoff_ts),),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return int(cur.rowcount or 0)
+
+    def dialog_messages(self, peer_id: int, cutoff_ts: float) -> List[Tuple[int, float, int, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT msg_id, date_ts, out, text FROM export_messages "
+                "WHERE peer_id = ? AND date_ts >= ? ORDER BY msg_id",
+                (int(peer_id), float(cutoff_ts)),
+            ).fetchall()
+        return rows
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+@dataclass
+class ExportStats:
+    dialogs: int = 0
+    skipped_stale: int = 0
+    unchanged: int = 0
+    fetched_dialogs: int = 0
+    fetched_messages: int = 0
+    flood_waits: int = 0
+
+
+def _dialog_name(dialog: Any) -> Tuple[str, str]:
+    entity = dialog.entity
+    name_parts = [getattr(entity, "first_name", "") or "", getattr(entity, "last_name", "") or ""]
+    name = " ".join(p for p in name_parts if p).strip() or (getattr(dialog, "name", "") or "")
+    return name, getattr(entity, "username", "") or ""
+
+
+async def _with_flood_retry(
+    fetch: Callable[[], Awaitable[Any]], stats: ExportStats, max_retries: int = 3
+) -> Any:
+    attempt = 0
+    while True:
+        try:
+            return await fetch()
+        except Exception as err:
+            wait_sec = flood_wait_seconds(err)
+            if wait_sec is None or attempt >= max_retries:
+                raise
+            attempt += 1
+            stats.flood_waits += 1
+            await asyncio.sleep(wait_sec + 1)
+
+
+async def sync_dialogs(
+    client: Any,
+    dialogs: List[Any],
+    archive: ChatExportArchive,
+    cutoff: datetime,
+    concurrency: int = 4,
+) -> ExportStats:
+    """Pull messages newer than each dialog's high-water mark into the archive."""
+    stats = ExportStats(dialogs=len(dialogs))
+    cutoff_ts = cutoff.timestamp()
+    semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+
+    async def sync_one(dialog: Any) -> None:
+        entity = dialog.entity
+        name, username = _dialog_name(dialog)
+        mark = archive.mark(entity.id)
+        full = mark is None or cutoff_ts < mark.covered_from
+        min_id = 0 if full else mark.high_water
+        top_id = int(getattr(getattr(dialog, "message", None), "id", 0) or 0)
+        if not full and top_id and top_id <= min_id:
+            stats.unchanged += 1
+            return
+
+        async def fetch() -> Tuple[int, List[Tuple[int, float, bool, str]]]:
+            high_water = min_id
+            rows: List[Tuple[int, float, bool, str]] = []
+            async for m in client.iter_messages(entity, min_id=min_id):
+                if m.date and m.date.timestamp() < cutoff_ts:
+                    break
+                high_water = max(high_water, int(m.id))
+                if m.message:
+                    rows.append((int(m.id), m.date.timestamp() if m.date else cutoff_ts, bool(m.out), m.message))
+            return high_water, rows
+
+        async with semaphore:
+            high_water, rows = await _with_flood_retry(fetch, stats)
+        archive.save_dialog(
+            entity.id,
+            name,
+            username,
+            high_water,
+            cutoff_ts if full else mark.covered_from,
+            rows,
+            replace=full,
+        )
+        stats.fetched_dialogs += 1
+        stats.fetched_messages += len(rows)
+
+    # Let every dialog finish before failing, so no task is left talking to a disconnected client.
+    results = await asyncio.gather(*(sync_one(dialog) for dialog in dialogs), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return stats
+
+
+def write_export(
+    out_path: str,
+    dialogs: List[Any],
+    archive: ChatExportArchive,
+    cutoff: datetime,
+    tz: tzinfo,
+    header_lines: List[str],
+    normalize: Callable[[str], str],
+) -> int:
+    """Stream the archived window into a gzip text file; returns the number of chats written."""
+    cutoff_ts = cutoff.timestamp()
+    written = 0
+    with gzip.open(out_path, "wt", encoding="utf-8") as f:
+        for line in header_lines:
+            f.write(line + "\n")
+        f.write("\n")
+        for dialog in dialogs:
+            entity = dialog.entity
+            rows = archive.dialog_messages(entity.id, cutoff_ts)
+            if not rows:
+                continue
+            name, username = _dialog_name(dialog)
+            f.write(f"=== CHAT: {name} {('@' + username) if username else ''} (id {entity.id}) ===\n")
+            for _, date_ts, out, text in rows:
+                ts = datetime.fromtimestamp(date_ts, tz).strftime("%Y-%m-%d %H:%M")
+                sender = "me" if out else "candidate"
+                f.write(f"{ts} [{sender}]: {normalize(text)}\n")
+            f.write("\n")
+            written += 1
+    return written
+
+
+def export_stats_line(stats: ExportStats, written: int) -> str:
+    return (
+        f"EXPORT_DONE chats={written} dialogs={stats.dialogs} stale={stats.skipped_stale} "
+        f"unchanged={stats.unchanged} fetched_dialogs={stats.fetched_dialogs} "
+        f"fetched_messages={stats.fetched_messages} flood_waits={stats.flood_waits}"
+    )
+
+
+def recent_user_dialogs(dialogs: Iterable[Any], cutoff: datetime, is_bot: Callable[[Any], bool]) -> Tuple[List[Any], int]:
+    """Private non-bot dialogs whose last message is inside the window, plus the stale count."""
+    kept: List[Any] = []
+    stale = 0
+    for dialog in dialogs:
+        if not getattr(dialog, "is_user", False) or is_bot(dialog.entity):
+            continue
+        date = getattr(dialog, "date", None)
+        if date is not None and date < cutoff:
+            stale += 1
+            continue
+        kept.append(dialog)
+    return kept, stale
+
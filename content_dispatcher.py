@@ -4,6 +4,8 @@ import re
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Tuple
 
+from send_scheduler import flood_wait_seconds
+
 MESSAGE_LINK_RE = re.compile(r"https?://t\.me/(c/)?([A-Za-z0-9_]+)/([0-9]+)")
 
 
@@ -16,6 +18,15 @@ class SendResult:
     preview: str = ""
 
 
+@dataclass
+class DispatchProgress:
+    """What one dispatch has already done, so a FloodWait retry resumes instead of resending."""
+
+    source: object = None
+    message: object = None
+    result: Optional[SendResult] = None
+
+
 def parse_message_link(link: str) -> Optional[Tuple[object, int]]:
     if not link:
         return None
@@ -38,14 +49,26 @@ def validate_content_env(env_map: Dict[str, str]) -> Dict[str, str]:
     return {"missing": ",".join(missing)}
 
 
-async def dispatch_content(client, entity, content_link: str) -> SendResult:
+async def dispatch_content(client, entity, content_link: str, progress: Optional[DispatchProgress] = None) -> SendResult:
+    """Forward the linked message to `entity`.
+
+    FloodWait is re-raised for the send scheduler to retry. Pass the same `progress` to
+    the retried call: finished steps are skipped and a forward that already went out is
+    never repeated.
+    """
+    progress = progress if progress is not None else DispatchProgress()
+    if progress.result is not None:
+        return progress.result
     parsed = parse_message_link(content_link)
     if not parsed:
         return SendResult(ok=False, error="invalid_message_link")
     peer, message_id = parsed
     try:
-        source = await client.get_entity(peer)
-        msg = await client.get_messages(source, ids=message_id)
+        if progress.source is None:
+            progress.source = await client.get_entity(peer)
+        if progress.message is None:
+            progress.message = await client.get_messages(progress.source, ids=message_id)
+        msg = progress.message
         if not msg:
             return SendResult(ok=False, error="source_message_not_found")
         sent = await client.forward_messages(entity, msg, drop_author=True)
@@ -65,6 +88,9 @@ async def dispatch_content(client, entity, content_link: str) -> SendResult:
                 preview = "[forwarded media]"
             else:
                 preview = "[forwarded message]"
-        return SendResult(ok=True, message="forwarded", message_ids=ids, preview=preview)
+        progress.result = SendResult(ok=True, message="forwarded", message_ids=ids, preview=preview)
+        return progress.result
     except Exception as err:
+        if flood_wait_seconds(err) is not None:
+            raise
         return SendResult(ok=False, error=f"{type(err).__name__}: {err}")
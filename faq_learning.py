@@ -1,7 +1,13 @@
 from __future__ import annotations
 
+import json
+import os
+import sqlite3
+import threading
+import time
 from dataclasses import dataclass
 from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List
 from zoneinfo import ZoneInfo
 
 
@@ -33,3 +39,155 @@ def build_question_log(tz: ZoneInfo, peer_id: int, step: str, question_raw: str,
         answer_preview=(answer_preview or "")[:500],
         resolved_status="new",
     )
+
+
+@dataclass
+class ClusterStat:
+    cluster_key: str
+    pending: int
+    total: int
+    first_seen_at: str
+    last_seen_at: str
+    samples: List[str]
+    latest: Dict[str, Any]
+    suggested: bool
+
+
+class FAQQuestionStats:
+    """Question counts per `cluster_key`, aggregated in SQLite between sheet flushes.
+
+    `record()` is a single local upsert. `pending` counts events not yet written to
+    FAQ_Questions; `mark_flushed()` subtracts what a flush wrote, so events recorded
+    while a flush is running stay pending. `mark_failed()` holds `due()` back for a retry
+    interval so a broken sheet is not hit on every loop tick. The file may be shared by
+    several processes; callers serialize flushes with a file lock.
+    """
+
+    def __init__(self, path: str, sample_limit: int = 3, clock: Callable[[], float] = time.monotonic):
+        self.path = path
+        self.sample_limit = max(1, int(sample_limit))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_flush = clock()
+        self._retry_at = 0.0
+        base_dir = os.path.dirname(path)
+        if base_dir:
+            os.makedirs(base_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS faq_clusters (
+                cluster_key TEXT PRIMARY KEY,
+                pending INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                first_seen_at TEXT NOT NULL DEFAULT '',
+                last_seen_at TEXT NOT NULL DEFAULT '',
+                samples TEXT NOT NULL DEFAULT '[]',
+                latest TEXT NOT NULL DEFAULT '{}',
+                suggested INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+
+    def record(self, qlog: Dict[str, Any]) -> None:
+        cluster_key = str(qlog.get("cluster_key", "") or "").strip()
+        if not cluster_key:
+            return
+        seen_at = str(qlog.get("last_seen_at") or qlog.get("created_at") or "")
+        question = str(qlog.get("question_raw", "") or "").strip()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT samples FROM faq_clusters WHERE cluster_key = ?", (cluster_key,)
+                ).fetchone()
+                samples = json.loads(row[0]) if row else []
+                if question and question not in samples and len(samples) < self.sample_limit:
+                    samples.append(question)
+                self._conn.execute(
+                    """
+                    INSERT INTO faq_clusters (cluster_key, pending, total, first_seen_at, last_seen_at, samples, latest)
+                    VALUES (?, 1, 1, ?, ?, ?, ?)
+                    ON CONFLICT(cluster_key) DO UPDATE SET
+                        pending = faq_clusters.pending + 1,
+                        total = faq_clusters.total + 1,
+                        last_seen_at = excluded.last_seen_at,
+                        samples = excluded.samples,
+                        latest = excluded.latest
+                    """,
+                    (
+                        cluster_key,
+                        str(qlog.get("created_at") or seen_at),
+                        seen_at,
+                        json.dumps(samples, ensure_ascii=False),
+                        json.dumps(qlog, ensure_ascii=False, default=str),
+                    ),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def pending_events(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT COALESCE(SUM(pending), 0) FROM faq_clusters").fetchone()
+        return int(row[0] or 0)
+
+    def due(self, flush_sec: float, flush_events: int) -> bool:
+        if self._clock() < self._retry_at:
+            return False
+        pending = self.pending_events()
+        if not pending:
+            return False
+        return pending >= max(1, int(flush_events)) or (self._clock() - self._last_flush) >= flush_sec
+
+    def dirty(self) -> List[ClusterStat]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT cluster_key, pending, total, first_seen_at, last_seen_at, samples, latest, suggested "
+                "FROM faq_clusters WHERE pending > 0 ORDER BY first_seen_at, cluster_key"
+            ).fetchall()
+        return [
+            ClusterStat(
+                cluster_key=row[0],
+                pending=int(row[1]),
+                total=int(row[2]),
+                first_seen_at=row[3],
+                last_seen_at=row[4],
+                samples=list(json.loads(row[5] or "[]")),
+                latest=dict(json.loads(row[6] or "{}")),
+                suggested=bool(row[7]),
+            )
+            for row in rows
+        ]
+
+    def mark_flushed(self, flushed: Dict[str, int], suggested: Iterable[str] = ()) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "UPDATE faq_clusters SET pending = MAX(0, pending - ?) WHERE cluster_key = ?",
+                    [(int(count), key) for key, count in flushed.items()],
+                )
+                self._conn.executemany(
+                    "UPDATE faq_clusters SET suggested = 1 WHERE cluster_key = ?",
+                    [(key,) for key in suggested],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._last_flush = self._clock()
+        self._retry_at = 0.0
+
+    def mark_failed(self, retry_sec: float) -> None:
+        self._retry_at = self._clock() + max(0.0, float(retry_sec))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(pending), 0), COALESCE(SUM(suggested), 0) FROM faq_clusters"
+            ).fetchone()
+        return {"clusters": int(row[0]), "pending": int(row[1]), "suggested": int(row[2])}
@@ -0,0 +1,226 @@
+import asyncio
+import fcntl
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+
+_STATS_LOCK = threading.Lock()
+_STATS: Dict[str, Dict[str, float]] = {}
+_HELD_LOCK = threading.Lock()
+_HELD: Dict[str, "FileLock"] = {}
+
+_BACKOFF_START_SEC = 0.001
+_BACKOFF_MAX_SEC = 0.05
+
+
+def _record_wait(path: str, waited_sec: float, acquired: bool, contended: bool) -> None:
+    name = os.path.basename(path) or path
+    with _STATS_LOCK:
+        item = _STATS.setdefault(
+            name,
+            {"acquired": 0, "timeouts": 0, "contended": 0, "wait_sec_total": 0.0, "wait_sec_max": 0.0},
+        )
+        if acquired:
+            item["acquired"] += 1
+        else:
+            item["timeouts"] += 1
+        if contended:
+            item["contended"] += 1
+        item["wait_sec_total"] += waited_sec
+        item["wait_sec_max"] = max(item["wait_sec_max"], waited_sec)
+
+
+def lock_wait_stats() -> Dict[str, Dict[str, float]]:
+    """Per lock file: acquisitions, timeouts, contended attempts and wait time in seconds."""
+    with _STATS_LOCK:
+        return {
+            name: {key: (round(value, 4) if isinstance(value, float) else value) for key, value in item.items()}
+            for name, item in _STATS.items()
+        }
+
+
+def reset_lock_wait_stats() -> None:
+    with _STATS_LOCK:
+        _STATS.clear()
+
+
+class FileLock:
+    """Advisory `flock` on a lock file.
+
+    The kernel drops the lock when the holder exits, so there is no stale-lock detection
+    and no lock-file stealing. `shared=True` takes LOCK_SH: readers run side by side and
+    only exclude writers holding LOCK_EX.
+    """
+
+    def __init__(self, path: str, shared: bool = False):
+        self.path = path
+        self.shared = shared
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def _open(self) -> int:
+        base = os.path.dirname(self.path)
+        if base:
+            os.makedirs(base, exist_ok=True)
+        return os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def _try_flock(self, fd: int, blocking: bool) -> bool:
+        mode = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(fd, mode if blocking else mode | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _on_acquired(self, fd: int) -> None:
+        self._fd = fd
+        if not self.shared:
+            try:
+                os.ftruncate(fd, 0)
+                os.write(fd, f"{os.getpid()}:{time.time():.6f}".encode("utf-8"))
+            except OSError:
+                pass
+
+    def acquire(self, timeout_sec: Optional[float] = 0.0) -> bool:
+        """`timeout_sec=None` blocks in the kernel; 0 tries once; >0 retries until the deadline."""
+        if self._fd is not None:
+            return True
+        if not self.path:
+            return True
+        try:
+            fd = self._open()
+        except OSError:
+            return False
+        started_at = time.monotonic()
+        contended = False
+        try:
+            if self._try_flock(fd, blocking=False):
+                self._on_acquired(fd)
+                _record_wait(self.path, 0.0, True, False)
+                return True
+            contended = True
+            if timeout_sec is None:
+                self._try_flock(fd, blocking=True)
+                self._on_acquired(fd)
+                _record_wait(self.path, time.monotonic() - started_at, True, True)
+                return True
+            deadline = started_at + max(0.0, float(timeout_sec))
+            delay = _BACKOFF_START_SEC
+            while time.monotonic() < deadline:
+                time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+                delay = min(delay * 2, _BACKOFF_MAX_SEC)
+                if self._try_flock(fd, blocking=False):
+                    self._on_acquired(fd)
+                    _record_wait(self.path, time.monotonic() - started_at, True, True)
+                    return True
+        except BaseException:
+            if self._fd is None:
+                os.close(fd)
+            raise
+        os.close(fd)
+        _record_wait(self.path, time.monotonic() - started_at, False, contended)
+        return False
+
+    async def acquire_async(self, timeout_sec: Optional[float] = 0.0) -> bool:
+        """Like `acquire`, but waits with asyncio.sleep so the event loop keeps running."""
+        if self._fd is not None or not self.path:
+            return True
+        try:
+            fd = self._open()
+        except OSError:
+            return False
+        started_at = time.monotonic()
+        deadline = None if timeout_sec is None else started_at + max(0.0, float(timeout_sec))
+        delay = _BACKOFF_START_SEC
+        contended = False
+        try:
+            while True:
+                if self._try_flock(fd, blocking=False):
+                    self._on_acquired(fd)
+                    _record_wait(self.path, time.monotonic() - started_at, True, contended)
+                    return True
+                contended = True
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _BACKOFF_MAX_SEC)
+        except BaseException:
+            if self._fd is None:
+                os.close(fd)
+            raise
+        os.close(fd)
+        _record_wait(self.path, time.monotonic() - started_at, False, contended)
+        return False
+
+    def release(self) -> None:
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def __enter__(self) -> "FileLock":
+        if not self.acquire(timeout_sec=None):
+            raise TimeoutError(self.path)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+    async def __aenter__(self) -> "FileLock":
+        if not await self.acquire_async(timeout_sec=None):
+            raise TimeoutError(self.path)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release()
+
+
+def lock_held(lock_path: str) -> bool:
+    """True while some process holds `lock_path` exclusively; probes with LOCK_SH and writes nothing."""
+    if not lock_path:
+        return False
+    probe = FileLock(lock_path, shared=True)
+    if not probe.acquire():
+        return True
+    probe.release()
+    return False
+
+
+def acquire_lock(lock_path: str, ttl_sec: int = 300, timeout_sec: float = 0.0) -> bool:
+    """Process-wide named exclusive lock released by `release_lock(lock_path)`.
+
+    `ttl_sec` is accepted for compatibility only: a dead holder's lock is released by the
+    kernel, so nothing has to expire.
+    """
+    _ = ttl_sec
+    if not lock_path:
+        return False
+    with _HELD_LOCK:
+        if lock_path in _HELD:
+            return False
+        lock = FileLock(lock_path)
+        _HELD[lock_path] = lock
+    acquired = lock.acquire(timeout_sec=timeout_sec)
+    if not acquired:
+        with _HELD_LOCK:
+            _HELD.pop(lock_path, None)
+    return acquired
+
+
+def release_lock(lock_path: str) -> None:
+    with _HELD_LOCK:
+        lock = _HELD.pop(lock_path, None)
+    if lock is None:
+        return
+    try:
+        lock.release()
+    except OSError:
+        pass
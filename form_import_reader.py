@@ -0,0 +1,152 @@
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional, Tuple
+
+from sheets_session import col_letter
+
+
+@dataclass
+class FormPoll:
+    title: str
+    headers: List[str]
+    row_count: int
+    rows: List[Tuple[int, List[str]]] = field(default_factory=list)
+    shrunk: bool = False
+
+
+class FormResponsesReader:
+    """Reads only what changed in a form-responses worksheet.
+
+    The worksheet handle is kept until `reset()`; the header row is re-read after
+    `headers_max_age_sec`. A poll reads the range from the last seen row to the end: the
+    first returned row anchors the cursor (an empty anchor means rows were deleted,
+    confirmed by a column-A row count) and the rest are the new responses, so a quiet
+    poll transfers one row. The range is one column wider than the known headers: a
+    value there means a question was added to the form, and the headers are re-read.
+    """
+
+    def __init__(
+        self,
+        open_worksheet: Callable[[], Any],
+        headers_max_age_sec: float = 600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._open_worksheet = open_worksheet
+        self.headers_max_age_sec = max(0.0, float(headers_max_age_sec))
+        self._clock = clock
+        self._ws: Any = None
+        self._headers: Optional[List[str]] = None
+        self._headers_at = 0.0
+        self._stray_columns = False
+        self.requests = 0
+
+    def reset(self) -> None:
+        self._ws = None
+        self._headers = None
+
+    def _worksheet(self) -> Any:
+        if self._ws is None:
+            self._ws = self._open_worksheet()
+            self.requests += 1
+        return self._ws
+
+    def headers(self) -> List[str]:
+        if self._headers is None or self._clock() - self._headers_at >= self.headers_max_age_sec:
+            self._headers = list(self._worksheet().row_values(1))
+            self._headers_at = self._clock()
+            self._stray_columns = False
+            self.requests += 1
+        return self._headers
+
+    def title(self) -> str:
+        return (getattr(self._worksheet(), "title", "") or "").strip()
+
+    def row_count(self) -> int:
+        """Rows in use including the header, from column A (every response has a timestamp)."""
+        self.requests += 1
+        return len(self._worksheet().col_values(1))
+
+    def poll(self, last_seen_row: int) -> FormPoll:
+        ws = self._worksheet()
+        headers = self.headers()
+        anchored = last_seen_row >= 2
+        start = last_seen_row if anchored else 2
+        values = self._fetch(ws, start, len(headers))
+        if not self._stray_columns and any(len(row) > len(headers) for row in values):
+            known_width = len(headers)
+            self._headers = None
+            headers = self.headers()
+            if len(headers) > known_width:
+                values = self._fetch(ws, start, len(headers))
+            else:
+                # Cells past the last question (manual notes); ignore them until the next header read.
+                self._stray_columns = True
+        if anchored:
+            if not values or not any(str(cell or "").strip() for cell in values[0]):
+                return FormPoll(self.title(), headers, self.row_count(), shrunk=True)
+            new_rows = values[1:]
+            first_new = last_seen_row + 1
+        else:
+            new_rows = values
+            first_new = 2
+        rows = [(first_new + idx, row) for idx, row in enumerate(new_rows)]
+        row_count = rows[-1][0] if rows else max(last_seen_row, 1 if headers else 0)
+        return FormPoll(self.title(), headers, row_count, rows)
+
+    def _fetch(self, ws: Any, start: int, width: int) -> List[List[str]]:
+        values = ws.get(f"A{start}:{col_letter(max(1, width) + 1)}")
+        self.requests += 1
+        return [list(row) for row in (values or [])]
+
+
+class IdleBackoff:
+    """Poll interval that stretches while nothing arrives and snaps back on activity."""
+
+    def __init__(self, base_sec: float, max_sec: float, factor: float = 2.0, idle_polls: int = 3):
+        self.base_sec = max(1.0, float(base_sec))
+        self.max_sec = max(self.base_sec, float(max_sec))
+        self.factor = max(1.0, float(factor))
+        self.idle_polls = max(1, int(idle_polls))
+        self._idle = 0
+        self._interval = self.base_sec
+
+    def interval(self) -> float:
+        return self._interval
+
+    def record(self, activity: bool) -> float:
+        if activity:
+            self.reset()
+            return self._interval
+        self._idle += 1
+        if self._idle >= self.idle_polls:
+            self._idle = 0
+            self._interval = min(self.max_sec, self._interval * self.factor)
+        return self._interval
+
+    def reset(self) -> None:
+        self._idle = 0
+        self._interval = self.base_sec
+
+
+class TouchNotifier:
+    """Change notification stand-in: anything that touches `path` wakes the poller."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mtime = self._stat()
+
+    def _stat(self) -> float:
+        if not self.path:
+            return 0.0
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return 0.0
+
+    def changed(self) -> bool:
+        mtime = self._stat()
+        if mtime != self._mtime:
+            self._mtime = mtime
+            return mtime > 0
+        return False
@@ -1,11 +1,14 @@
 import json
 import os
+import sqlite3
+import threading
 import time
 import uuid
 from datetime import datetime
 from typing import Dict, List, Optional
 
-from tg_to_sheets import acquire_lock, release_lock, normalize_username
+from file_lock import FileLock
+from tg_to_sheets import normalize_username
 
 
 def normalize_target_group(value: Optional[str]) -> str:
@@ -116,7 +119,8 @@ class HrFilterStore:
         target_group = normalize_target_group(target_group_link)
         if not target_group:
             raise ValueError("target_group_required")
-        if not acquire_lock(self.lock_path, ttl_sec=5):
+        lock = FileLock(self.lock_path)
+        if not lock.acquire(timeout_sec=2.0):
             raise RuntimeError("hr_filter_lock_unavailable")
         try:
             data = self._load_data()
@@ -136,13 +140,14 @@ class HrFilterStore:
                 "updated_at": now,
             }
         finally:
-            release_lock(self.lock_path)
+            lock.release()
 
     def delete_rule(self, username: str) -> bool:
         username_norm = normalize_username(username)
         if not username_norm:
             return False
-        if not acquire_lock(self.lock_path, ttl_sec=5):
+        lock = FileLock(self.lock_path)
+        if not lock.acquire(timeout_sec=2.0):
             return False
         try:
             data = self._load_data()
@@ -153,74 +158,97 @@ class HrFilterStore:
             self._save_data(data)
             return True
         finally:
-            release_lock(self.lock_path)
+            lock.release()
 
 
 class HrForwardDeduper:
-    def __init__(self, path: str, retention_sec: float = 30 * 24 * 3600):
-        self.path = path
-        self.lock_path = f"{path}.lock" if path else ""
-        self.retention_sec = max(3600.0, float(retention_sec or 0.0))
+    """Cross-process "forward this HR lead once" guard on a SQLite table.
 
-    def _load_data(self) -> dict:
-        if not self.path or not os.path.exists(self.path):
-            return {"claims": {}}
-        try:
-            with open(self.path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except (OSError, json.JSONDecodeError):
-            return {"claims": {}}
-        if not isinstance(data, dict):
-            return {"claims": {}}
-        claims = data.get("claims")
-        if not isinstance(claims, dict):
-            data["claims"] = {}
-        return data
+    A claim is one INSERT keyed by (chat_id, message_id); expired rows are removed by an
+    indexed sweep at most once per `sweep_interval_sec` instead of on every claim.
+    """
 
-    def _save_data(self, data: dict):
-        if not self.path:
-            return
+    def __init__(self, path: str, retention_sec: float = 30 * 24 * 3600, sweep_interval_sec: float = 3600.0):
+        self.path = path
+        self.retention_sec = max(3600.0, float(retention_sec or 0.0))
+        self.sweep_interval_sec = max(0.0, float(sweep_interval_sec or 0.0))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._last_sweep_at = 0.0
+        if self.path:
+            self._ensure_db()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._conn = conn
+        return self._conn
+
+    def _ensure_db(self):
         base = os.path.dirname(self.path)
         if base:
             os.makedirs(base, exist_ok=True)
-        tmp_path = f"{self.path}.tmp.{os.getpid()}.{int(time.time() * 1000)}.{uuid.uuid4().hex}"
-        with open(tmp_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=True)
-        os.replace(tmp_path, self.path)
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS hr_forward_claims (
+                    chat_id TEXT NOT NULL,
+                    message_id TEXT NOT NULL,
+                    owner TEXT NOT NULL DEFAULT '',
+                    claimed_at REAL NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (chat_id, message_id)
+                ) WITHOUT ROWID
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_hr_forward_claims_expires ON hr_forward_claims(expires_at)")
 
-    def _prune_claims(self, claims: dict, now_ts: float):
-        cutoff = now_ts - self.retention_sec
-        expired = []
-        for key, item in claims.items():
-            if not isinstance(item, dict):
-                expired.append(key)
-                continue
-            claimed_at = float(item.get("claimed_at_ts") or 0.0)
-            if claimed_at and claimed_at >= cutoff:
-                continue
-            expired.append(key)
-        for key in expired:
-            claims.pop(key, None)
+    def sweep(self, now_ts: Optional[float] = None) -> int:
+        if not self.path:
+            return 0
+        now_ts = time.time() if now_ts is None else float(now_ts)
+        with self._lock:
+            try:
+                deleted = self._connection().execute(
+                    "DELETE FROM hr_forward_claims WHERE expires_at < ?",
+                    (now_ts,),
+                ).rowcount
+            except sqlite3.Error:
+                return 0
+            self._last_sweep_at = now_ts
+            return deleted
 
     def claim(self, source_chat_id: object, message_id: object, owner: str = "") -> bool:
         if source_chat_id in (None, "") or message_id in (None, ""):
             return False
-        if not acquire_lock(self.lock_path, ttl_sec=5):
+        if not self.path:
             return False
-        try:
-            data = self._load_data()
-            claims = data.setdefault("claims", {})
-            now_ts = time.time()
-            self._prune_claims(claims, now_ts)
-            key = f"{source_chat_id}:{message_id}"
-            if key in claims:
+        now_ts = time.time()
+        if now_ts - self._last_sweep_at >= self.sweep_interval_sec:
+            self.sweep(now_ts)
+        with self._lock:
+            try:
+                claimed = self._connection().execute(
+                    """
+                    INSERT INTO hr_forward_claims (chat_id, message_id, owner, claimed_at, expires_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(chat_id, message_id) DO UPDATE SET
+                        owner = excluded.owner,
+                        claimed_at = excluded.claimed_at,
+                        expires_at = excluded.expires_at
+                    WHERE hr_forward_claims.expires_at < excluded.claimed_at
+                    """,
+                    (
+                        str(source_chat_id),
+                        str(message_id),
+                        str(owner or "").strip(),
+                        now_ts,
+                        now_ts + self.retention_sec,
+                    ),
+                ).rowcount
+            except sqlite3.Error:
                 return False
-            claims[key] = {
-                "claimed_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
-                "claimed_at_ts": now_ts,
-                "owner": str(owner or "").strip(),
-            }
-            self._save_data(data)
-            return True
-        finally:
-            release_lock(self.lock_path)
+            return claimed > 0
@@ -0,0 +1,98 @@
+import http.client
+import json
+import threading
+import urllib.error
+import urllib.parse
+from typing import Dict, List, Tuple
+
+
+_ConnKey = Tuple[str, str, int]
+
+
+class JsonHttpPool:
+    """Keep-alive JSON POSTs to the local AI service.
+
+    Idle connections are kept per (scheme, host, port) and reused across calls and worker
+    threads, so a classifier burst no longer pays a TCP handshake per request. Errors are
+    raised as `urllib.error` / `OSError` types, matching what `urlopen` callers expect.
+    """
+
+    def __init__(self, max_idle_per_host: int = 8):
+        self.max_idle_per_host = max(1, int(max_idle_per_host))
+        self._idle: Dict[_ConnKey, List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.reused = 0
+
+    @staticmethod
+    def _key(parts: urllib.parse.SplitResult) -> _ConnKey:
+        scheme = (parts.scheme or "http").lower()
+        if scheme not in {"http", "https"}:
+            raise urllib.error.URLError(f"unsupported scheme: {scheme}")
+        port = parts.port or (443 if scheme == "https" else 80)
+        return scheme, parts.hostname or "localhost", port
+
+    def _acquire(self, key: _ConnKey, timeout_sec: float) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            conn.timeout = timeout_sec
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout_sec)
+            return conn, True
+        scheme, host, port = key
+        conn_cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return conn_cls(host, port, timeout=timeout_sec), False
+
+    def _release(self, key: _ConnKey, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def post_json(self, url: str, payload: dict, timeout_sec: float) -> dict:
+        parts = urllib.parse.urlsplit(url)
+        key = self._key(parts)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        while True:
+            conn, reused = self._acquire(key, timeout_sec)
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                resp = conn.getresponse()
+                raw = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused:
+                    # The server dropped an idle keep-alive connection; retry on a fresh one.
+                    continue
+                raise
+            except http.client.HTTPException as err:
+                conn.close()
+                raise urllib.error.URLError(f"{type(err).__name__}: {err}") from err
+            except BaseException:
+                conn.close()
+                raise
+            break
+        self.requests += 1
+        if reused:
+            self.reused += 1
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        if resp.status >= 400:
+            raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+        text = raw.decode("utf-8")
+        return json.loads(text) if text else {}
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+from typing import Callable, Generic, Optional, TypeVar
+
+
+T = TypeVar("T")
+
+
+class LazyResource(Generic[T]):
+    """Builds a network-backed component on first use and caches it.
+
+    A failed build is logged and retried after `retry_sec`, so a Sheets/Drive outage at
+    startup no longer blocks the process or disables the component until restart.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T], retry_sec: float = 60.0):
+        self.name = name
+        self._factory = factory
+        self._retry_sec = max(0.0, float(retry_sec))
+        self._lock = threading.Lock()
+        self._value: Optional[T] = None
+        self._failed_at = 0.0
+        self.last_error = ""
+        self.init_sec: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._value is not None
+
+    def peek(self) -> Optional[T]:
+        return self._value
+
+    def get(self) -> Optional[T]:
+        if self._value is not None:
+            return self._value
+        with self._lock:
+            if self._value is not None:
+                return self._value
+            if self._failed_at and (time.time() - self._failed_at) < self._retry_sec:
+                return None
+            started_at = time.time()
+            try:
+                self._value = self._factory()
+            except Exception as err:
+                self._failed_at = time.time()
+                self.last_error = f"{type(err).__name__}: {err}"
+                print(f"⚠️ LAZY_INIT_FAIL name={self.name}: {self.last_error}")
+                return None
+            self.init_sec = time.time() - started_at
+            self._failed_at = 0.0
+            self.last_error = ""
+            print(f"LAZY_INIT_OK name={self.name} sec={self.init_sec:.2f}")
+            return self._value
+
+    def require(self) -> T:
+        value = self.get()
+        if value is None:
+            raise RuntimeError(f"{self.name} is not available: {self.last_error or 'init pending'}")
+        return value
+
+    async def aget(self) -> Optional[T]:
+        if self._value is not None:
+            return self._value
+        return await asyncio.to_thread(self.get)
+
+    async def arequire(self) -> T:
+        if self._value is not None:
+            return self._value
+        return await asyncio.to_thread(self.require)
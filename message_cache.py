@@ -0,0 +1,85 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Set
+
+
+@dataclass
+class CachedMessage:
+    id: int
+    out: bool
+    sender_id: int
+    text: str
+
+
+class PeerMessageCache:
+    """Bounded ring buffer of the latest messages per private chat.
+
+    Fed from NewMessage events (incoming and outgoing); a peer seen for the first time is
+    backfilled once from Telegram history, after which reads need no history requests.
+    """
+
+    def __init__(self, capacity: int = 50, max_peers: int = 5000):
+        self.capacity = max(1, int(capacity))
+        self.max_peers = max(1, int(max_peers))
+        self._messages: "OrderedDict[int, OrderedDict[int, CachedMessage]]" = OrderedDict()
+        self._complete: Set[int] = set()
+        self._backfill_locks: Dict[int, asyncio.Lock] = {}
+        self.backfills = 0
+
+    def _bucket(self, peer_id: int) -> "OrderedDict[int, CachedMessage]":
+        bucket = self._messages.get(peer_id)
+        if bucket is None:
+            bucket = OrderedDict()
+            self._messages[peer_id] = bucket
+            while len(self._messages) > self.max_peers:
+                evicted, _ = self._messages.popitem(last=False)
+                self._complete.discard(evicted)
+                self._backfill_locks.pop(evicted, None)
+        else:
+            self._messages.move_to_end(peer_id)
+        return bucket
+
+    def record(self, peer_id: int, message: Any) -> None:
+        peer_id = int(peer_id or 0)
+        msg_id = int(getattr(message, "id", 0) or 0)
+        if not peer_id or not msg_id:
+            return
+        bucket = self._bucket(peer_id)
+        out_of_order = bool(bucket) and msg_id not in bucket and msg_id < next(reversed(bucket))
+        bucket[msg_id] = CachedMessage(
+            id=msg_id,
+            out=bool(getattr(message, "out", False)),
+            sender_id=int(getattr(message, "sender_id", 0) or 0),
+            text=getattr(message, "message", None) or "",
+        )
+        if out_of_order:
+            ordered = sorted(bucket.items())
+            bucket.clear()
+            bucket.update(ordered)
+        while len(bucket) > self.capacity:
+            bucket.popitem(last=False)
+
+    def is_complete(self, peer_id: int) -> bool:
+        return int(peer_id) in self._complete
+
+    async def ensure(self, peer_id: int, fetch: Callable[[int], AsyncIterator[Any]]) -> None:
+        """Backfill the peer once from `fetch(limit)` unless its buffer is already complete."""
+        peer_id = int(peer_id)
+        if peer_id in self._complete:
+            return
+        lock = self._backfill_locks.setdefault(peer_id, asyncio.Lock())
+        async with lock:
+            if peer_id in self._complete:
+                return
+            async for message in fetch(self.capacity):
+                self.record(peer_id, message)
+            self._bucket(peer_id)
+            self._complete.add(peer_id)
+            self.backfills += 1
+
+    def recent(self, peer_id: int, limit: int) -> List[CachedMessage]:
+        bucket = self._messages.get(int(peer_id))
+        if not bucket:
+            return []
+        return list(bucket.values())[-max(1, int(limit)):]
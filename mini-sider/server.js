@@ -98,6 +98,17 @@ const INTENT_CLASSIFY_PROMPT = `Ти класифікатор наміру ві
 
 Мови: укр/рус/англ. Без пояснень.`;
 
+const TURN_CLASSIFY_PROMPT = `Ти класифікатор відповіді кандидата. Поверни ТІЛЬКИ JSON-обʼєкт без пояснень і без markdown.
+Заповни лише ключі зі списку "Потрібні мітки":
+- "intent": "question" | "ack_continue" | "stop" | "other" — правила як для класифікатора наміру:
+  питання (навіть без "?"), коротке підтвердження/нейтральна згода ("нема", "ок", "зрозуміло", "так"),
+  чітка відмова/прохання не писати, або інше.
+- "stop": true якщо кандидат відмовляється або не хоче продовжувати, інакше false.
+  Короткі відповіді "нема", "ок", "зрозуміло", "ясно", "питань нема" — це false.
+- "refusal_reason": один код зі списку дозволених причин відмови (лише якщо "stop" = true, інакше "").
+- "format_choice": "video" | "mini_course" | "both" | "unknown".
+Мови: укр/рус/англ.`;
+
 app.get("/health", (_, res) => res.json({ ok: true, env: Boolean(OPENAI_API_KEY) }));
 
 async function callOpenAI({ model = DEFAULT_MODEL, system, user, temperature }) {
@@ -190,6 +201,51 @@ function buildIntentPrompt(history = [], lastMessage = "") {
   return `${INTENT_CLASSIFY_PROMPT}\n\nІсторія:\n${normalized || "(порожньо)"}\n${lastLine}`;
 }
 
+function buildTurnClassifyPrompt(history = [], lastMessage = "", stepName = "", labels = [], allowedReasons = []) {
+  const normalized = history
+    .slice(-10)
+    .map((item) => {
+      const sender = item?.sender === "me" ? "Я" : "Кандидат";
+      const text = (item?.text || "").trim().replace(/\s+/g, " ");
+      return `${sender}: ${text}`;
+    })
+    .join("\n");
+  const lastLine = lastMessage ? `Останнє повідомлення кандидата: ${lastMessage}` : "";
+  return `${TURN_CLASSIFY_PROMPT}\n\nПотрібні мітки: ${labels.join(", ")}\nДозволені причини відмови: ${allowedReasons.join(", ") || "other"}\nПоточний крок: ${stepName || "-"}\n\nІсторія:\n${normalized || "(порожньо)"}\n${lastLine}`;
+}
+
+function parseJsonObject(text = "") {
+  const start = text.indexOf("{");
+  const end = text.lastIndexOf("}");
+  if (start < 0 || end <= start) return {};
+  try {
+    return JSON.parse(text.slice(start, end + 1));
+  } catch (err) {
+    return {};
+  }
+}
+
+function normalizeTurnLabels(parsed = {}, labels = [], allowedReasons = []) {
+  const out = {};
+  const pick = (value, allowed, fallback) => {
+    const normalized = String(value ?? "").trim().toLowerCase();
+    return allowed.includes(normalized) ? normalized : fallback;
+  };
+  if (labels.includes("intent")) {
+    out.intent = pick(parsed.intent, ["question", "ack_continue", "stop", "other"], "other");
+  }
+  if (labels.includes("stop")) {
+    out.stop = parsed.stop === true || String(parsed.stop).toLowerCase() === "true";
+  }
+  if (labels.includes("refusal_reason")) {
+    out.refusal_reason = out.stop === false ? "" : pick(parsed.refusal_reason, allowedReasons, "");
+  }
+  if (labels.includes("format_choice")) {
+    out.format_choice = pick(parsed.format_choice, ["video", "mini_course", "both", "unknown"], "unknown");
+  }
+  return out;
+}
+
 app.post("/dialog_suggest", async (req, res) => {
   try {
     const { history = [], draft = "", no_questions = false, combined_answer_clarify = false } = req.body || {};
@@ -270,6 +326,31 @@ app.post("/intent_classify", async (req, res) => {
   }
 });
 
+app.post("/classify_turn", async (req, res) => {
+  try {
+    const {
+      history = [],
+      last_message = "",
+      step_name = "",
+      labels = ["intent", "stop", "refusal_reason"],
+      allowed_reasons = [],
+    } = req.body || {};
+    const wanted = Array.isArray(labels) ? labels.map((item) => String(item)) : [];
+    const reasons = Array.isArray(allowed_reasons) ? allowed_reasons.map((item) => String(item)) : [];
+    const prompt = buildTurnClassifyPrompt(history, last_message, step_name, wanted, reasons);
+    const { text } = await callOpenAI({
+      system: "You are a strict multi-label classifier. Output JSON only.",
+      user: prompt,
+      temperature: 0,
+    });
+    const result = normalizeTurnLabels(parseJsonObject(text || ""), wanted, reasons);
+    return res.json({ ok: true, labels: result, text: (text || "").trim() });
+  } catch (error) {
+    console.error("/classify_turn error", error);
+    return res.status(500).json({ ok: false, error: error.message });
+  }
+});
+
 app.use((err, req, res, next) => {
   console.error("Unhandled error:", err);
   if (res.headersSent) return next(err);
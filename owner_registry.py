@@ -0,0 +1,202 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, tzinfo
+from typing import Dict, Iterable, Optional
+
+
+class OwnerRegistry:
+    """Lead -> owning account map shared by all account processes through one SQLite file.
+
+    Claims are a single conditional UPSERT, so two accounts can never both win a peer.
+    Reads go through an in-process cache that is dropped whenever `PRAGMA data_version`
+    reports a commit from another connection, so lookups stay O(1) regardless of map size.
+    """
+
+    _IN_CHUNK = 500
+
+    def __init__(self, path: str, legacy_json_path: str = ""):
+        self.path = path
+        self.legacy_json_path = legacy_json_path
+        self._lock = threading.Lock()
+        self._cache: Dict[int, Optional[str]] = {}
+        self._data_version: Optional[int] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._ensure_db()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._conn = conn
+        return self._conn
+
+    def _ensure_db(self):
+        base_dir = os.path.dirname(self.path)
+        if base_dir:
+            os.makedirs(base_dir, exist_ok=True)
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS lead_owners (
+                    peer_id INTEGER PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    source TEXT NOT NULL DEFAULT '',
+                    updated_at TEXT NOT NULL DEFAULT ''
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS lead_owners_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+                """
+            )
+            self._import_legacy_json(conn)
+
+    def _import_legacy_json(self, conn: sqlite3.Connection):
+        if not self.legacy_json_path or not os.path.exists(self.legacy_json_path):
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute("SELECT value FROM lead_owners_meta WHERE key = 'legacy_imported'").fetchone()
+            if done is None:
+                try:
+                    with open(self.legacy_json_path, "r", encoding="utf-8") as f:
+                        raw = json.load(f)
+                except (OSError, json.JSONDecodeError):
+                    raw = {}
+                rows = []
+                for key, rec in (raw.items() if isinstance(raw, dict) else []):
+                    if not isinstance(rec, dict):
+                        continue
+                    owner = str(rec.get("owner", "") or "").strip()
+                    if not owner or not str(key).lstrip("-").isdigit():
+                        continue
+                    rows.append(
+                        (
+                            int(key),
+                            owner,
+                            str(rec.get("source", "") or "").strip() or "unknown",
+                            str(rec.get("updated_at", "") or ""),
+                        )
+                    )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO lead_owners (peer_id, owner, source, updated_at) VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                conn.execute(
+                    "INSERT INTO lead_owners_meta (key, value) VALUES ('legacy_imported', ?)",
+                    (str(len(rows)),),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _sync_cache(self, conn: sqlite3.Connection):
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._cache.clear()
+            self._data_version = version
+
+    def get_owner(self, peer_id: int) -> Optional[str]:
+        return self.owners_for([peer_id]).get(int(peer_id))
+
+    def owners_for(self, peer_ids: Iterable[int]) -> Dict[int, Optional[str]]:
+        wanted = list(dict.fromkeys(int(peer_id) for peer_id in peer_ids))
+        with self._lock:
+            try:
+                conn = self._connection()
+                self._sync_cache(conn)
+                missing = [peer_id for peer_id in wanted if peer_id not in self._cache]
+                for start in range(0, len(missing), self._IN_CHUNK):
+                    chunk = missing[start:start + self._IN_CHUNK]
+                    placeholders = ",".join("?" for _ in chunk)
+                    found = {
+                        int(row["peer_id"]): str(row["owner"] or "").strip() or None
+                        for row in conn.execute(
+                            f"SELECT peer_id, owner FROM lead_owners WHERE peer_id IN ({placeholders})",
+                            chunk,
+                        )
+                    }
+                    for peer_id in chunk:
+                        self._cache[peer_id] = found.get(peer_id)
+            except sqlite3.Error:
+                pass
+            return {peer_id: self._cache.get(peer_id) for peer_id in wanted}
+
+    def _write(self, peer_id: int, sql: str, params: tuple, owner_after: Optional[str]) -> bool:
+        with self._lock:
+            try:
+                conn = self._connection()
+                self._sync_cache(conn)
+                changed = conn.execute(sql, params).rowcount > 0
+            except sqlite3.Error:
+                self._cache.pop(peer_id, None)
+                return False
+            if changed:
+                self._cache[peer_id] = owner_after
+            else:
+                self._cache.pop(peer_id, None)
+            return changed
+
+    @staticmethod
+    def _timestamp(tz: Optional[tzinfo]) -> str:
+        return datetime.now(tz).isoformat(timespec="seconds")
+
+    def try_claim(self, peer_id: int, owner_key: str, source: str, tz: Optional[tzinfo] = None) -> bool:
+        owner_key = str(owner_key or "").strip()
+        if not owner_key:
+            return False
+        return self._write(
+            int(peer_id),
+            """
+            INSERT INTO lead_owners (peer_id, owner, source, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(peer_id) DO UPDATE SET
+                owner = excluded.owner,
+                source = excluded.source,
+                updated_at = excluded.updated_at
+            WHERE lead_owners.owner = excluded.owner OR lead_owners.owner = ''
+            """,
+            (int(peer_id), owner_key, str(source or "").strip() or "unknown", self._timestamp(tz)),
+            owner_key,
+        )
+
+    def set_owner(self, peer_id: int, owner_key: str, source: str, tz: Optional[tzinfo] = None) -> bool:
+        owner_key = str(owner_key or "").strip()
+        if not owner_key:
+            return False
+        return self._write(
+            int(peer_id),
+            """
+            INSERT INTO lead_owners (peer_id, owner, source, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(peer_id) DO UPDATE SET
+                owner = excluded.owner,
+                source = excluded.source,
+                updated_at = excluded.updated_at
+            """,
+            (int(peer_id), owner_key, str(source or "").strip() or "unknown", self._timestamp(tz)),
+            owner_key,
+        )
+
+    def release_owner(self, peer_id: int, owner_key: str) -> bool:
+        owner_key = str(owner_key or "").strip()
+        return self._write(
+            int(peer_id),
+            "DELETE FROM lead_owners WHERE peer_id = ? AND owner = ?",
+            (int(peer_id), owner_key),
+            None,
+        )
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,164 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+
+class PeerTurnCancelled(Exception):
+    """The queued or running job was dropped by `PeerActorPool.cancel()`."""
+
+
+@dataclass
+class _Envelope:
+    payload: Any
+    future: Optional["asyncio.Future[Any]"] = None
+
+
+class _PeerActor:
+    def __init__(self, peer_id: int):
+        self.peer_id = peer_id
+        self.mailbox: Deque[_Envelope] = deque()
+        self.current: Optional[_Envelope] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class PeerActorPool:
+    """One serialized mailbox per peer.
+
+    Every payload for a peer goes through `handler(peer_id, payload)` strictly one at a
+    time. `post()` is fire-and-forget (incoming messages), `call()` waits for the result
+    and runs inline when already inside that peer's actor. Consecutive posted payloads
+    can be folded by `merge(a, b)` (return None to keep them apart); `settle(peer_id)` is
+    awaited before a posted payload is taken so a burst can finish arriving first. An
+    actor lives only while its mailbox is non-empty, so idle peers cost nothing.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[int, Any], Awaitable[Any]],
+        merge: Optional[Callable[[Any, Any], Any]] = None,
+        settle: Optional[Callable[[int], Awaitable[None]]] = None,
+    ):
+        self._handler = handler
+        self._merge = merge
+        self._settle = settle
+        self._actors: Dict[int, _PeerActor] = {}
+        self._generations: Dict[int, int] = {}
+        self.processed = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def generation(self, peer_id: int) -> int:
+        return int(self._generations.get(int(peer_id), 0))
+
+    def busy(self, peer_id: int) -> bool:
+        return int(peer_id) in self._actors
+
+    def pending(self, peer_id: int) -> int:
+        actor = self._actors.get(int(peer_id))
+        return len(actor.mailbox) if actor else 0
+
+    def post(self, peer_id: int, payload: Any) -> None:
+        self._enqueue(int(peer_id), _Envelope(payload))
+
+    async def call(self, peer_id: int, payload: Any) -> Any:
+        peer_id = int(peer_id)
+        actor = self._actors.get(peer_id)
+        if actor is not None and actor.task is asyncio.current_task():
+            return await self._handler(peer_id, payload)
+        envelope = _Envelope(payload, asyncio.get_running_loop().create_future())
+        self._enqueue(peer_id, envelope)
+        return await envelope.future
+
+    def cancel(self, peer_id: int) -> None:
+        """Drop everything queued for the peer and cancel the running job (restart)."""
+        peer_id = int(peer_id)
+        self._generations[peer_id] = self.generation(peer_id) + 1
+        actor = self._actors.pop(peer_id, None)
+        if actor is None:
+            return
+        self.cancelled += 1
+        self._fail_pending(actor)
+        if actor.task is not None and actor.task is not asyncio.current_task():
+            actor.task.cancel()
+
+    def _enqueue(self, peer_id: int, envelope: _Envelope) -> None:
+        actor = self._actors.get(peer_id)
+        if actor is None:
+            actor = _PeerActor(peer_id)
+            self._actors[peer_id] = actor
+            actor.task = asyncio.create_task(self._run(actor))
+        actor.mailbox.append(envelope)
+
+    def _fail_pending(self, actor: _PeerActor) -> None:
+        envelopes = list(actor.mailbox)
+        if actor.current is not None:
+            envelopes.append(actor.current)
+        actor.mailbox.clear()
+        for envelope in envelopes:
+            if envelope.future is not None and not envelope.future.done():
+                envelope.future.set_exception(PeerTurnCancelled(f"peer={actor.peer_id}"))
+
+    def _next(self, actor: _PeerActor) -> Optional[_Envelope]:
+        while actor.mailbox:
+            envelope = actor.mailbox.popleft()
+            if envelope.future is not None and envelope.future.done():
+                continue
+            if envelope.future is None and self._merge is not None:
+                while actor.mailbox and actor.mailbox[0].future is None:
+                    merged = self._merge(envelope.payload, actor.mailbox[0].payload)
+                    if merged is None:
+                        break
+                    actor.mailbox.popleft()
+                    envelope.payload = merged
+                    self.coalesced += 1
+            return envelope
+        return None
+
+    async def _run(self, actor: _PeerActor) -> None:
+        try:
+            while True:
+                if self._settle is not None and actor.mailbox and actor.mailbox[0].future is None:
+                    await self._settle(actor.peer_id)
+                envelope = self._next(actor)
+                if envelope is None:
+                    break
+                actor.current = envelope
+                try:
+                    result = await self._handler(actor.peer_id, envelope.payload)
+                except Exception as err:
+                    if envelope.future is not None:
+                        if not envelope.future.done():
+                            envelope.future.set_exception(err)
+                    else:
+                        print(f"⚠️ PEER_ACTOR_ERROR peer={actor.peer_id}: {type(err).__name__}: {err}")
+                else:
+                    if envelope.future is not None and not envelope.future.done():
+                        envelope.future.set_result(result)
+                actor.current = None
+                self.processed += 1
+        finally:
+            if self._actors.get(actor.peer_id) is actor:
+                self._actors.pop(actor.peer_id, None)
+            self._fail_pending(actor)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active": len(self._actors),
+            "queued": sum(len(actor.mailbox) for actor in self._actors.values()),
+            "processed": self.processed,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+        }
+
+    async def close(self) -> None:
+        actors = list(self._actors.values())
+        for actor in actors:
+            self.cancel(actor.peer_id)
+        for actor in actors:
+            if actor.task is None:
+                continue
+            try:
+                await actor.task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,278 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 64) - 1
+
+
+def _stable_hash(text: str) -> int:
+    # hash() is salted per process; cluster ids must survive restarts.
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Character n-grams of the space-padded text; short texts are one shingle."""
+    text = " ".join((text or "").split())
+    if not text:
+        return set()
+    padded = f" {text} "
+    if len(padded) <= size:
+        return {padded}
+    return {padded[i : i + size] for i in range(len(padded) - size + 1)}
+
+
+class MinHasher:
+    """MinHash signatures over character shingles with fixed-seed permutations."""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = max(1, int(num_perm))
+        self.shingle_size = max(1, int(shingle_size))
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(self.num_perm)
+        ]
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        hashes = [_stable_hash(item) for item in shingles(text, self.shingle_size)]
+        if not hashes:
+            return tuple([_MAX_HASH] * self.num_perm)
+        return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._perms)
+
+
+def signature_similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+    """Share of equal MinHash slots, an estimate of the shingle Jaccard similarity."""
+    if not left or len(left) != len(right):
+        return 0.0
+    return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+
+class QuestionClusterIndex:
+    """Incremental near-duplicate clustering of normalized questions (MinHash + LSH).
+
+    A question joins the most similar existing cluster whose estimated similarity is at
+    least `threshold`, otherwise it starts a new one. Candidates come from LSH buckets
+    (`bands` bands of the signature), so a lookup does not compare against every cluster.
+    A cluster keeps the key and signature of the question that created it, which makes
+    ids stable: `key_func(first question)`, the same value the old prefix keys had.
+    Several processes may share the file: on a miss the index first loads clusters other
+    processes created since its last load, so they do not open duplicates.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        num_perm: int = 64,
+        bands: int = 16,
+        threshold: float = 0.5,
+        key_func: Callable[[str], str] = lambda text: text[:160],
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.path = path
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.threshold = float(threshold)
+        self._key_func = key_func
+        self._lock = threading.Lock()
+        self._signatures: Dict[str, Tuple[int, ...]] = {}
+        self._buckets: Dict[Tuple[int, int], Set[str]] = {}
+        self._questions: Dict[str, str] = {}
+        self._loaded_at = 0.0
+        self.lookups = 0
+        self.candidates_checked = 0
+        base_dir = os.path.dirname(path)
+        if base_dir:
+            os.makedirs(base_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS question_clusters (
+                cluster_key TEXT PRIMARY KEY,
+                signature TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS question_members (
+                question_norm TEXT PRIMARY KEY,
+                cluster_key TEXT NOT NULL
+            )
+            """
+        )
+        self._load()
+
+    def _load(self) -> None:
+        self._load_clusters_since(0.0)
+        self._questions = dict(self._conn.execute("SELECT question_norm, cluster_key FROM question_members"))
+
+    def _load_clusters_since(self, since: float) -> int:
+        """Add clusters created after `since`; returns how many were new to this index."""
+        added = 0
+        rows = self._conn.execute(
+            "SELECT cluster_key, signature, created_at FROM question_clusters WHERE created_at > ? ORDER BY created_at",
+            (since,),
+        )
+        for key, signature, created_at in rows:
+            self._loaded_at = max(self._loaded_at, float(created_at))
+            sig = tuple(json.loads(signature))
+            if key not in self._signatures and len(sig) == self.hasher.num_perm:
+                self._add_cluster(key, sig)
+                added += 1
+        return added
+
+    def _band_keys(self, signature: Tuple[int, ...]) -> List[Tuple[int, int]]:
+        step = self.rows_per_band
+        return [(band, _stable_hash(repr(signature[band * step : (band + 1) * step]))) for band in range(self.bands)]
+
+    def _add_cluster(self, key: str, signature: Tuple[int, ...]) -> None:
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, set()).add(key)
+
+    def _ranked(self, signature: Tuple[int, ...]) -> List[Tuple[str, float]]:
+        candidates: Set[str] = set()
+        for band_key in self._band_keys(signature):
+            candidates |= self._buckets.get(band_key, set())
+        self.lookups += 1
+        self.candidates_checked += len(candidates)
+        ranked = [(key, signature_similarity(signature, self._signatures[key])) for key in candidates]
+        ranked.sort(key=lambda item: (-item[1], item[0]))
+        return ranked
+
+    def assign(self, question_norm: str) -> str:
+        """Cluster key for a normalized question, creating a cluster when nothing is close."""
+        norm = " ".join((question_norm or "").split())
+        if not norm:
+            return ""
+        with self._lock:
+            key = self._questions.get(norm)
+            if key:
+                return key
+            row = self._conn.execute("SELECT cluster_key FROM question_members WHERE question_norm = ?", (norm,)).fetchone()
+            if row:
+                self._load_clusters_since(self._loaded_at)
+                self._questions[norm] = row[0]
+                return row[0]
+            signature = self.hasher.signature(norm)
+            ranked = self._ranked(signature)
+            if not (ranked and ranked[0][1] >= self.threshold) and self._load_clusters_since(self._loaded_at):
+                ranked = self._ranked(signature)
+            if ranked and ranked[0][1] >= self.threshold:
+                key = ranked[0][0]
+            else:
+                key = self._key_func(norm)
+                if key not in self._signatures:
+                    self._add_cluster(key, signature)
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO question_clusters (cluster_key, signature, created_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(list(signature)), time.time()),
+                    )
+            self._questions[norm] = key
+            self._conn.execute(
+                "INSERT OR REPLACE INTO question_members (question_norm, cluster_key) VALUES (?, ?)",
+                (norm, key),
+            )
+            return key
+
+    def similar(self, question_norm: str, limit: int = 5, min_similarity: float = 0.0) -> List[Tuple[str, float]]:
+        """Closest existing clusters from the LSH buckets, best first."""
+        norm = " ".join((question_norm or "").split())
+        if not norm:
+            return []
+        with self._lock:
+            ranked = self._ranked(self.hasher.signature(norm))
+        return [(key, round(score, 3)) for key, score in ranked if score >= min_similarity][: max(1, int(limit))]
+
+    def recluster(self, questions: Iterable[str]) -> Dict[str, str]:
+        """Rebuild the index from scratch over `questions` in order; returns question -> key."""
+        with self._lock:
+            self._signatures.clear()
+            self._buckets.clear()
+            self._questions.clear()
+            self._loaded_at = 0.0
+            self._conn.execute("DELETE FROM question_clusters")
+            self._conn.execute("DELETE FROM question_members")
+        mapping: Dict[str, str] = {}
+        for question in questions:
+            norm = " ".join((question or "").split())
+            if norm and norm not in mapping:
+                mapping[norm] = self.assign(norm)
+        return mapping
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "clusters": len(self._signatures),
+                "questions": len(self._questions),
+                "avg_candidates": round(self.candidates_checked / self.lookups, 2) if self.lookups else 0.0,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _read_questions(path: str) -> List[str]:
+    if path == "-":
+        return [line.strip() for line in sys.stdin if line.strip()]
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from faq_service import build_cluster_key, normalize_question
+
+    parser = argparse.ArgumentParser(description="Near-duplicate clustering of candidate questions")
+    parser.add_argument(
+        "--path",
+        default=os.environ.get(
+            "QUESTION_CLUSTERS_PATH",
+            os.path.join(os.environ.get("TG_LEADS_STATE_DIR", "/opt/tg_leads/state"), "question_clusters.sqlite"),
+        ),
+    )
+    parser.add_argument("--threshold", type=float, default=float(os.environ.get("QUESTION_CLUSTER_THRESHOLD", "0.5")))
+    sub = parser.add_subparsers(dest="command", required=True)
+    recluster_cmd = sub.add_parser(
+        "recluster",
+        help="rebuild clusters from questions, one per line; FAQ_Questions rows keep their old keys, "
+        "re-key them from the printed mapping",
+    )
+    recluster_cmd.add_argument("--input", required=True, help="file with questions or - for stdin")
+    similar_cmd = sub.add_parser("similar", help="show clusters close to a question")
+    similar_cmd.add_argument("question")
+    similar_cmd.add_argument("--limit", type=int, default=5)
+    sub.add_parser("stats")
+    args = parser.parse_args(argv)
+
+    index = QuestionClusterIndex(args.path, threshold=args.threshold, key_func=build_cluster_key)
+    try:
+        if args.command == "recluster":
+            mapping = index.recluster(normalize_question(q) for q in _read_questions(args.input))
+            for question, key in mapping.items():
+                print(f"{question}\t{key}")
+            print(json.dumps(index.stats(), ensure_ascii=False), file=sys.stderr)
+        elif args.command == "similar":
+            for key, score in index.similar(normalize_question(args.question), limit=args.limit):
+                print(f"{score:.3f}\t{key}")
+        else:
+            print(json.dumps(index.stats(), ensure_ascii=False))
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
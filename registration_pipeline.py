@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+
+class SettlingWorkPool:
+    """Keyed jobs run by a fixed number of workers once the key has been quiet for `settle_sec`.
+
+    Submitting a key again before it starts restarts its delay (an edited registration
+    message is parsed once, in its final form). Submitting a key that is already running
+    schedules one more run after it finishes. `on_idle` is awaited when the last busy
+    worker finishes and nothing else is due, which is where batched side work is flushed.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Hashable], Awaitable[Any]],
+        workers: int = 2,
+        settle_sec: float = 60.0,
+        on_idle: Optional[Callable[[], Awaitable[Any]]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._handler = handler
+        self.worker_count = max(1, int(workers))
+        self.settle_sec = max(0.0, float(settle_sec))
+        self._on_idle = on_idle
+        self._clock = clock
+        self._due: Dict[Hashable, float] = {}
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._seq = itertools.count()
+        self._running: Set[Hashable] = set()
+        self._rerun: Set[Hashable] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self._finished_at: Deque[float] = deque(maxlen=1000)
+        self.done = 0
+        self.failed = 0
+        self._busy_total = 0.0
+
+    def _ensure_workers(self) -> None:
+        self._workers = [task for task in self._workers if not task.done()]
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        while len(self._workers) < self.worker_count:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    def submit(self, key: Hashable) -> None:
+        self._ensure_workers()
+        if key in self._running:
+            self._rerun.add(key)
+            return
+        due = self._clock() + self.settle_sec
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, next(self._seq), key))
+        self._wakeup.set()
+
+    async def _next(self) -> Hashable:
+        while True:
+            while self._heap:
+                due, _, key = self._heap[0]
+                if self._due.get(key) != due:
+                    heapq.heappop(self._heap)
+                    continue
+                break
+            now = self._clock()
+            if self._heap and self._heap[0][0] <= now:
+                _, _, key = heapq.heappop(self._heap)
+                self._due.pop(key, None)
+                return key
+            timeout = (self._heap[0][0] - now) if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _idle(self) -> bool:
+        now = self._clock()
+        return not self._running and not any(due <= now for due in self._due.values())
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._next()
+            self._running.add(key)
+            started = self._clock()
+            try:
+                await self._handler(key)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                self.failed += 1
+                print(f"⚠️ WORK_POOL_JOB_FAIL key={key}: {type(err).__name__}: {err}")
+            else:
+                self.done += 1
+            finally:
+                self._running.discard(key)
+                finished = self._clock()
+                self._busy_total += finished - started
+                self._finished_at.append(finished)
+            if key in self._rerun:
+                self._rerun.discard(key)
+                self.submit(key)
+            if self._on_idle is not None and self._idle():
+                try:
+                    await self._on_idle()
+                except Exception as err:
+                    print(f"⚠️ WORK_POOL_IDLE_HOOK_FAIL: {type(err).__name__}: {err}")
+
+    def stats(self) -> Dict[str, Any]:
+        now = self._clock()
+        finished = self.done + self.failed
+        return {
+            "queued": len(self._due),
+            "running": len(self._running),
+            "workers": self.worker_count,
+            "done": self.done,
+            "failed": self.failed,
+            "avg_job_sec": round(self._busy_total / finished, 3) if finished else 0.0,
+            "per_min_10m": round(sum(1 for ts in self._finished_at if now - ts <= 600) / 10.0, 2),
+        }
+
+    async def close(self) -> None:
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        for task in workers:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+def telegram_media_key(message: Any) -> str:
+    """Stable id of the uploaded Telegram file; forwards and reposts keep it."""
+    for attr, prefix in (("document", "doc"), ("photo", "photo")):
+        media = getattr(message, attr, None)
+        media_id = getattr(media, "id", None) if media is not None else None
+        if media_id:
+            return f"{prefix}:{media_id}"
+    return ""
+
+
+def stream_sha256(stream: Any, chunk_size: int = 1024 * 1024) -> str:
+    """Hash a seekable stream from the start and rewind it for the upload."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+class DriveUploadIndex:
+    """Telegram file id / content hash -> Drive link of a document already uploaded.
+
+    Keys are scoped by Drive folder. A Telegram id hit skips download and upload; a
+    content hash hit (the same photo sent again as a new file) skips the upload.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        base_dir = os.path.dirname(path)
+        if base_dir:
+            os.makedirs(base_dir, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS drive_uploads (
+                folder_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                link TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (folder_id, key)
+            )
+            """
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, folder_id: str, *keys: str) -> str:
+        keys = tuple(key for key in keys if key)
+        if not keys:
+            return ""
+        placeholders = ",".join("?" for _ in keys)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT link FROM drive_uploads WHERE folder_id = ? AND key IN ({placeholders}) LIMIT 1",
+                (folder_id or "", *keys),
+            ).fetchone()
+            if row:
+                self.hits += 1
+                return str(row[0])
+            self.misses += 1
+        return ""
+
+    def remember(self, folder_id: str, link: str, *keys: str) -> None:
+        rows = [(folder_id or "", key, link, time.time()) for key in keys if key]
+        if not rows or not link:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO drive_uploads (folder_id, key, link, created_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class _PeerBurst:
+    __slots__ = ("gap_ewma", "last_arrival", "burst_start", "typing_until", "typing_stopped_at", "wakeup")
+
+    def __init__(self):
+        self.gap_ewma: Optional[float] = None
+        self.last_arrival = 0.0
+        self.burst_start = 0.0
+        self.typing_until = 0.0
+        self.typing_stopped_at = 0.0
+        self.wakeup: Optional[asyncio.Event] = None
+
+
+class AdaptiveCoalescer:
+    """Decides how long to hold a peer's incoming burst before replying.
+
+    The quiet window after the last message follows the peer's own inter-arrival gaps
+    (EWMA x `gap_factor`, clamped to [`min_wait`, max window]). A typing update keeps the
+    burst open for up to `typing_ttl`, a typing cancel flushes it at once, and no burst is
+    held longer than `max_hold` from its first message.
+    """
+
+    def __init__(
+        self,
+        min_wait: float = 0.5,
+        max_hold: float = 10.0,
+        typing_ttl: float = 6.0,
+        gap_factor: float = 1.5,
+        max_peers: int = 5000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.min_wait = max(0.0, float(min_wait))
+        self.max_hold = max(self.min_wait, float(max_hold))
+        self.typing_ttl = max(0.0, float(typing_ttl))
+        self.gap_factor = max(1.0, float(gap_factor))
+        self.max_peers = max(1, int(max_peers))
+        self._clock = clock
+        self._peers: "OrderedDict[int, _PeerBurst]" = OrderedDict()
+        self.batch_sizes: Counter = Counter()
+        self.early_flushes = 0
+        self._waits = 0
+        self._wait_total = 0.0
+
+    def _peer(self, peer_id: int) -> _PeerBurst:
+        peer_id = int(peer_id)
+        state = self._peers.get(peer_id)
+        if state is None:
+            state = _PeerBurst()
+            self._peers[peer_id] = state
+            while len(self._peers) > self.max_peers:
+                self._peers.popitem(last=False)
+        else:
+            self._peers.move_to_end(peer_id)
+        return state
+
+    @staticmethod
+    def _wake(state: _PeerBurst) -> None:
+        if state.wakeup is not None:
+            state.wakeup.set()
+
+    def note_message(self, peer_id: int) -> None:
+        state = self._peer(peer_id)
+        now = self._clock()
+        if state.last_arrival > 0:
+            gap = now - state.last_arrival
+            if gap <= self.max_hold:
+                state.gap_ewma = gap if state.gap_ewma is None else 0.7 * state.gap_ewma + 0.3 * gap
+        if state.burst_start <= 0:
+            state.burst_start = now
+        state.last_arrival = now
+        state.typing_until = 0.0
+        self._wake(state)
+
+    def note_typing(self, peer_id: int, typing: bool) -> None:
+        state = self._peers.get(int(peer_id))
+        if state is None or state.burst_start <= 0:
+            return
+        now = self._clock()
+        if typing:
+            state.typing_until = now + self.typing_ttl
+        else:
+            state.typing_until = 0.0
+            state.typing_stopped_at = now
+        self._wake(state)
+
+    def window(self, peer_id: int, max_window: float) -> float:
+        state = self._peers.get(int(peer_id))
+        gap = state.gap_ewma if state else None
+        if gap is None:
+            return min(self.min_wait, max_window)
+        return min(max_window, max(self.min_wait, gap * self.gap_factor))
+
+    async def wait(self, peer_id: int, max_window: float) -> None:
+        state = self._peer(peer_id)
+        if state.burst_start <= 0:
+            return
+        started = self._clock()
+        if state.wakeup is None:
+            state.wakeup = asyncio.Event()
+        while True:
+            now = self._clock()
+            deadline = state.last_arrival + self.window(peer_id, max_window)
+            if state.typing_until > now:
+                deadline = max(deadline, state.typing_until)
+            elif state.typing_stopped_at >= state.last_arrival:
+                self.early_flushes += 1
+                break
+            deadline = min(deadline, state.burst_start + self.max_hold)
+            if deadline <= now:
+                break
+            state.wakeup.clear()
+            try:
+                await asyncio.wait_for(state.wakeup.wait(), timeout=deadline - now)
+            except asyncio.TimeoutError:
+                pass
+        state.burst_start = 0.0
+        self._waits += 1
+        self._wait_total += self._clock() - started
+
+    def record_batch(self, size: int) -> None:
+        self.batch_sizes[max(1, int(size))] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        batches = sum(self.batch_sizes.values())
+        return {
+            "batches": batches,
+            "batch_sizes": {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            "early_flushes": self.early_flushes,
+            "avg_wait_sec": round(self._wait_total / self._waits, 3) if self._waits else 0.0,
+        }
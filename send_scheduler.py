@@ -0,0 +1,199 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+
+PRIORITY_LIVE = 0
+PRIORITY_FOLLOWUP = 10
+
+
+def flood_wait_seconds(err: BaseException) -> Optional[float]:
+    """Seconds Telegram asked us to wait (FloodWaitError / SlowModeWaitError), else None."""
+    name = type(err).__name__
+    if "FloodWait" not in name and "SlowModeWait" not in name:
+        return None
+    try:
+        return max(0.0, float(getattr(err, "seconds", 0) or 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+@dataclass
+class _Job:
+    peer_id: int
+    priority: int
+    seq: int
+    send: Callable[[], Awaitable[Any]]
+    future: "asyncio.Future[Any]"
+    enqueued_at: float
+    flood_retries: int = 0
+
+
+class OutboundScheduler:
+    """Single outbound lane for one Telegram account.
+
+    Sends are taken from a priority heap (live replies before follow-ups) under a token
+    bucket of `rate_per_sec` with `burst`. Only the oldest pending send of a peer is
+    eligible, so every chat keeps FIFO order. A FloodWait pauses the whole lane for the
+    requested time and the same send is retried instead of failing.
+    """
+
+    def __init__(
+        self,
+        rate_per_sec: float = 2.0,
+        burst: int = 5,
+        workers: int = 4,
+        max_flood_retries: int = 3,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate_per_sec = max(0.01, float(rate_per_sec))
+        self.burst = max(1, int(burst))
+        self.worker_count = max(1, int(workers))
+        self.max_flood_retries = max(0, int(max_flood_retries))
+        self._clock = clock
+        self._tokens = float(self.burst)
+        self._tokens_at = clock()
+        self._paused_until = 0.0
+        self._seq = itertools.count()
+        self._ready: List[Tuple[int, int, _Job]] = []
+        self._peers: Dict[int, Deque[_Job]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self._in_flight = 0
+        self._sent = 0
+        self._failed = 0
+        self._flood_waits = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def _ensure_workers(self) -> None:
+        self._workers = [task for task in self._workers if not task.done()]
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        while len(self._workers) < self.worker_count:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def submit(
+        self,
+        peer_id: int,
+        send: Callable[[], Awaitable[Any]],
+        priority: int = PRIORITY_LIVE,
+    ) -> Any:
+        self._ensure_workers()
+        job = _Job(
+            peer_id=int(peer_id or 0),
+            priority=int(priority),
+            seq=next(self._seq),
+            send=send,
+            future=asyncio.get_running_loop().create_future(),
+            enqueued_at=self._clock(),
+        )
+        queue = self._peers.setdefault(job.peer_id, deque())
+        queue.append(job)
+        if len(queue) == 1:
+            self._push_ready(job)
+        return await job.future
+
+    def _push_ready(self, job: _Job) -> None:
+        heapq.heappush(self._ready, (job.priority, job.seq, job))
+        self._wakeup.set()
+
+    def _take_token(self, now: float) -> float:
+        self._tokens = min(float(self.burst), self._tokens + (now - self._tokens_at) * self.rate_per_sec)
+        self._tokens_at = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self.rate_per_sec
+
+    async def _next_job(self) -> _Job:
+        while True:
+            now = self._clock()
+            if self._paused_until > now:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            wait = self._take_token(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, job = heapq.heappop(self._ready)
+            return job
+
+    def _finish(self, job: _Job) -> None:
+        queue = self._peers.get(job.peer_id)
+        if queue and queue[0] is job:
+            queue.popleft()
+        if queue:
+            self._push_ready(queue[0])
+        else:
+            self._peers.pop(job.peer_id, None)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._next_job()
+            if job.future.done():
+                self._finish(job)
+                continue
+            self._in_flight += 1
+            try:
+                result = await job.send()
+            except asyncio.CancelledError:
+                self._in_flight -= 1
+                if not job.future.done():
+                    job.future.cancel()
+                self._finish(job)
+                raise
+            except Exception as err:
+                self._in_flight -= 1
+                wait_sec = flood_wait_seconds(err)
+                if wait_sec is not None and job.flood_retries < self.max_flood_retries:
+                    job.flood_retries += 1
+                    self._flood_waits += 1
+                    self._paused_until = max(self._paused_until, self._clock() + wait_sec)
+                    print(f"SEND_LANE_FLOOD_WAIT sec={wait_sec:.0f} peer={job.peer_id} retry={job.flood_retries}")
+                    self._push_ready(job)
+                    continue
+                self._failed += 1
+                if not job.future.done():
+                    job.future.set_exception(err)
+            else:
+                self._in_flight -= 1
+                self._sent += 1
+                if not job.future.done():
+                    job.future.set_result(result)
+            latency = self._clock() - job.enqueued_at
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+            self._finish(job)
+
+    def stats(self) -> Dict[str, Any]:
+        done = self._sent + self._failed
+        now = self._clock()
+        return {
+            "queue_depth": sum(len(queue) for queue in self._peers.values()) - self._in_flight,
+            "in_flight": self._in_flight,
+            "sent": self._sent,
+            "failed": self._failed,
+            "flood_waits": self._flood_waits,
+            "paused_for_sec": round(max(0.0, self._paused_until - now), 1),
+            "latency_avg_sec": round(self._latency_total / done, 3) if done else 0.0,
+            "latency_max_sec": round(self._latency_max, 3),
+        }
+
+    async def close(self) -> None:
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        for task in workers:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
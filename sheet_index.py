@@ -0,0 +1,304 @@
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from file_lock import FileLock
+from sheets_session import col_letter
+
+# key name -> (header aliases, lower-case; value normalizer)
+KeySpec = Dict[str, Tuple[Tuple[str, ...], Callable[[str], str]]]
+
+PEER_KEYS: KeySpec = {"peer": (("пир", "peer id"), lambda value: str(value or "").strip())}
+
+
+class WriteGeneration:
+    """Counter in a small file that every writer of a worksheet bumps after writing.
+
+    Writers bump it while holding the worksheet's upsert lock, so an in-memory copy
+    that remembers the generation it was loaded at can tell whether another process
+    has written since. The read+1/write itself runs under `<path>.lock`, so a writer
+    that bumps without the upsert lock still cannot lose another writer's bump.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> int:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return int((f.read() or "0").strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump(self) -> int:
+        lock = FileLock(f"{self.path}.lock")
+        lock.acquire(timeout_sec=None)
+        try:
+            value = self.read() + 1
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(str(value))
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            print(f"⚠️ SHEET_GENERATION_WRITE_FAIL path={self.path}: {err}")
+        finally:
+            lock.release()
+        return value
+
+
+class SheetRowIndex:
+    """In-memory copy of one worksheet with key -> row lookups.
+
+    `load()` indexes a `get_all_values()` snapshot and `put()` records a row the caller
+    has just written, so consecutive upserts find their rows without re-reading the
+    sheet. The copy is trusted while the write generation is unchanged and it is younger
+    than `max_age_sec`; the age limit is what picks up manual edits in the Sheets UI.
+    """
+
+    def __init__(
+        self,
+        keys: KeySpec,
+        width: int,
+        max_age_sec: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.keys = keys
+        self.width = max(1, int(width))
+        self.max_age_sec = max(0.0, float(max_age_sec))
+        self._clock = clock
+        self._values: List[List[str]] = []
+        self._columns: Dict[str, Optional[int]] = {}
+        self._by_key: Dict[str, Dict[str, List[int]]] = {}
+        self._generation: Optional[int] = None
+        self._loaded_at = 0.0
+        self.loads = 0
+
+    @property
+    def headers(self) -> List[str]:
+        return list(self._values[0]) if self._values else []
+
+    def fresh(self, generation: int) -> bool:
+        return (
+            self._generation is not None
+            and self._generation == generation
+            and (self._clock() - self._loaded_at) < self.max_age_sec
+        )
+
+    def invalidate(self) -> None:
+        self._generation = None
+
+    def column(self, *names: str) -> Optional[int]:
+        headers = [str(h or "").strip().lower() for h in (self._values[0] if self._values else [])]
+        for name in names:
+            if name in headers:
+                return headers.index(name)
+        return None
+
+    def load(self, values: List[List[str]], generation: Optional[int]) -> None:
+        """Index a full snapshot; `generation=None` keeps it usable but never fresh."""
+        self._values = [list(row) for row in (values or [])]
+        self._columns = {name: self.column(*aliases) for name, (aliases, _) in self.keys.items()}
+        self._by_key = {name: {} for name in self.keys}
+        for row_idx in range(2, len(self._values) + 1):
+            self._index_row(row_idx)
+        self._generation = generation
+        self._loaded_at = self._clock()
+        self.loads += 1
+
+    def _key_values(self, row: List[str]) -> Dict[str, str]:
+        out: Dict[str, str] = {}
+        for name, (_, normalize) in self.keys.items():
+            col = self._columns.get(name)
+            if col is not None and col < len(row):
+                value = normalize(row[col])
+                if value:
+                    out[name] = value
+        return out
+
+    def _index_row(self, row_idx: int) -> None:
+        for name, value in self._key_values(self._values[row_idx - 1]).items():
+            rows = self._by_key[name].setdefault(value, [])
+            rows.append(row_idx)
+            rows.sort()
+
+    def _unindex_row(self, row_idx: int) -> None:
+        for name, value in self._key_values(self._values[row_idx - 1]).items():
+            rows = self._by_key[name].get(value)
+            if rows and row_idx in rows:
+                rows.remove(row_idx)
+                if not rows:
+                    self._by_key[name].pop(value, None)
+
+    def rows_for(self, key: str, value: str) -> List[int]:
+        """Row numbers (ascending) whose `key` column normalizes to `value`."""
+        spec = self.keys.get(key)
+        if spec is None:
+            return []
+        value = spec[1](value)
+        if not value:
+            return []
+        return list(self._by_key.get(key, {}).get(value, []))
+
+    def row(self, row_idx: int) -> List[str]:
+        if 2 <= row_idx <= len(self._values):
+            return list(self._values[row_idx - 1])
+        return []
+
+    def cell(self, row_idx: int, col: Optional[int]) -> str:
+        row = self.row(row_idx)
+        if col is None or col >= len(row):
+            return ""
+        return str(row[col] or "")
+
+    def next_row(self) -> int:
+        return max(len(self._values) + 1, 2)
+
+    def first_blank_row(self) -> int:
+        """First data row with nothing in the first `width` cells, else the next row."""
+        for row_idx in range(2, len(self._values) + 1):
+            if all(not str(cell or "").strip() for cell in self._values[row_idx - 1][: self.width]):
+                return row_idx
+        return self.next_row()
+
+    def confirm(self, row_idx: int, fresh_row: List[str], wanted: Dict[str, str]) -> bool:
+        """Record a row just re-read from the sheet; True if it is still the row the copy expected.
+
+        With `wanted` keys the row must still carry one of them; with none it must be blank
+        (a row about to be filled). A False answer means the sheet moved under the copy.
+        """
+        if row_idx < 2:
+            return False
+        while len(self._values) < row_idx:
+            self._values.append([])
+        self._unindex_row(row_idx)
+        self._values[row_idx - 1] = list(fresh_row)
+        self._index_row(row_idx)
+        if not wanted:
+            return all(not str(cell or "").strip() for cell in fresh_row[: self.width])
+        have = self._key_values(fresh_row)
+        for key, value in wanted.items():
+            spec = self.keys.get(key)
+            value = spec[1](value) if spec else ""
+            if value and have.get(key) == value:
+                return True
+        return False
+
+    def put(self, row_idx: int, row: List[str], generation: Optional[int]) -> None:
+        """Record a row written by the caller; `generation` is the bumped write generation."""
+        if row_idx < 2:
+            return
+        while len(self._values) < row_idx:
+            self._values.append([])
+        self._unindex_row(row_idx)
+        self._values[row_idx - 1] = list(row)
+        self._index_row(row_idx)
+        if self._generation is not None and generation is not None:
+            self._generation = generation
+
+
+class PeerRowCache:
+    """Read-only peer -> row copies of worksheets another writer owns, by title.
+
+    Used for cross-sheet links: the month sheet and GroupLeads rows a registration or
+    a group lead points at. `generation` is the owner's write generation when there is
+    one, otherwise the copy simply expires after `max_age_sec`.
+    """
+
+    def __init__(self, max_age_sec: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.max_age_sec = max_age_sec
+        self._clock = clock
+        self._entries: Dict[str, Tuple[Any, SheetRowIndex]] = {}
+
+    def lookup(
+        self,
+        title: str,
+        open_worksheet: Callable[[str], Any],
+        peer_id: str,
+        generation: int = 0,
+    ) -> Tuple[Any, Optional[int], SheetRowIndex]:
+        peer_raw = str(peer_id or "").strip()
+        entry = self._entries.get(title)
+        if entry is None or not entry[1].fresh(generation):
+            ws = open_worksheet(title)
+            index = SheetRowIndex(PEER_KEYS, width=1, max_age_sec=self.max_age_sec, clock=self._clock)
+            index.load(ws.get_all_values(), generation)
+            entry = (ws, index)
+            self._entries[title] = entry
+        ws, index = entry
+        rows = index.rows_for("peer", peer_raw) if peer_raw else []
+        return ws, (rows[0] if rows else None), index
+
+    def invalidate(self, title: Optional[str] = None) -> None:
+        if title is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(title, None)
+
+
+class CellPatchBuffer:
+    """Single-cell patches collected over one flush cycle and sent as one `values:batchUpdate`.
+
+    A later patch of the same cell replaces the earlier one; adjacent cells of a row are
+    sent as one range. A failed flush keeps the patches for the next cycle, up to
+    `max_attempts` tries.
+    """
+
+    def __init__(self, max_attempts: int = 3):
+        self.max_attempts = max(1, int(max_attempts))
+        self._cells: Dict[Tuple[int, int, int], str] = {}
+        self._sheets: Dict[int, Any] = {}
+        self._attempts = 0
+        self.flushes = 0
+        self.cells_written = 0
+
+    def __len__(self) -> int:
+        return len(self._cells)
+
+    def add(self, ws: Any, row_idx: int, col_idx: int, value: str) -> None:
+        """`col_idx` is 0-based like header indexes; `row_idx` is the sheet row number."""
+        self._sheets[ws.id] = ws
+        self._cells[(ws.id, int(row_idx), int(col_idx))] = value
+
+    def ranges(self) -> List[Dict[str, Any]]:
+        data: List[Dict[str, Any]] = []
+        run: List[Any] = []
+        for ws_id, row_idx, col_idx in sorted(self._cells):
+            value = self._cells[(ws_id, row_idx, col_idx)]
+            if run and run[0] == ws_id and run[1] == row_idx and run[2] + len(run[3]) == col_idx:
+                run[3].append(value)
+                continue
+            if run:
+                data.append(self._range(*run))
+            run = [ws_id, row_idx, col_idx, [value]]
+        if run:
+            data.append(self._range(*run))
+        return data
+
+    def _range(self, ws_id: int, row_idx: int, col_idx: int, values: List[str]) -> Dict[str, Any]:
+        title = str(getattr(self._sheets[ws_id], "title", "") or "").replace("'", "''")
+        start = f"{col_letter(col_idx + 1)}{row_idx}"
+        end = f"{col_letter(col_idx + len(values))}{row_idx}"
+        return {"range": f"'{title}'!{start}:{end}", "values": [values]}
+
+    def flush(self) -> int:
+        """Write everything buffered; returns the number of cells written."""
+        if not self._cells:
+            return 0
+        spreadsheet = next(iter(self._sheets.values())).spreadsheet
+        try:
+            spreadsheet.values_batch_update({"valueInputOption": "USER_ENTERED", "data": self.ranges()})
+        except Exception:
+            self._attempts += 1
+            if self._attempts >= self.max_attempts:
+                self.clear()
+            raise
+        written = len(self._cells)
+        self.clear()
+        self.flushes += 1
+        self.cells_written += written
+        return written
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._sheets.clear()
+        self._attempts = 0
@@ -1,3 +1,4 @@
+import argparse
 import json
 import os
 import random
@@ -6,7 +7,7 @@ import threading
 import time
 import uuid
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional
 
 
 @dataclass
@@ -18,12 +19,35 @@ class SheetsEvent:
     attempts: int = 0
     next_attempt_at: float = 0.0
     last_error: str = ""
+    revision: int = 0
+    failures: int = 0
+
+
+def merge_event_payload(base: Dict[str, Any], incoming: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(base)
+    for key, value in incoming.items():
+        if value is None:
+            continue
+        merged[key] = value
+    return merged
+
+
+@dataclass
+class DeadLetter:
+    id: str
+    created_at: float
+    event_type: str
+    payload: Dict[str, Any]
+    attempts: int
+    last_error: str
+    dead_at: float
 
 
 class SheetsQueueStore:
     def __init__(self, path: str):
         self.path = path
         self._lock = threading.Lock()
+        self._last_compact_at = 0.0
         self._ensure_db()
 
     def _connect(self):
@@ -46,26 +70,93 @@ class SheetsQueueStore:
                         payload TEXT NOT NULL,
                         attempts INTEGER NOT NULL DEFAULT 0,
                         next_attempt_at REAL NOT NULL,
-                        last_error TEXT NOT NULL DEFAULT ''
+                        last_error TEXT NOT NULL DEFAULT '',
+                        coalesce_key TEXT NOT NULL DEFAULT '',
+                        revision INTEGER NOT NULL DEFAULT 0,
+                        failures INTEGER NOT NULL DEFAULT 0
                     )
                     """
                 )
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(sheet_events)").fetchall()}
+                if "coalesce_key" not in columns:
+                    conn.execute("ALTER TABLE sheet_events ADD COLUMN coalesce_key TEXT NOT NULL DEFAULT ''")
+                if "revision" not in columns:
+                    conn.execute("ALTER TABLE sheet_events ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+                if "failures" not in columns:
+                    conn.execute("ALTER TABLE sheet_events ADD COLUMN failures INTEGER NOT NULL DEFAULT 0")
                 conn.execute(
                     "CREATE INDEX IF NOT EXISTS idx_sheet_events_ready ON sheet_events(next_attempt_at, created_at)"
                 )
+                conn.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS idx_sheet_events_coalesce
+                    ON sheet_events(event_type, coalesce_key)
+                    WHERE coalesce_key != ''
+                    """
+                )
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS sheet_events_dead (
+                        id TEXT PRIMARY KEY,
+                        created_at REAL NOT NULL,
+                        event_type TEXT NOT NULL,
+                        payload TEXT NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        last_error TEXT NOT NULL DEFAULT '',
+                        coalesce_key TEXT NOT NULL DEFAULT '',
+                        dead_at REAL NOT NULL
+                    )
+                    """
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_sheet_events_dead_at ON sheet_events_dead(dead_at)")
                 conn.commit()
 
-    def enqueue(self, event_type: str, payload: Dict[str, Any]) -> str:
-        event_id = str(uuid.uuid4())
+    def enqueue(self, event_type: str, payload: Dict[str, Any], coalesce_key: str = "", delay_sec: float = 0.0) -> str:
+        """Insert an event, or merge it into a pending one with the same coalesce key.
+
+        Only rows that were never attempted are merged, so an event already in backoff
+        keeps its payload and a newer snapshot is queued behind it. `delay_sec` holds a
+        new row back for a debounce window; a merge keeps the row's original due time.
+        """
+        coalesce_key = str(coalesce_key or "").strip()
         now = time.time()
         with self._lock:
             with self._connect() as conn:
+                if coalesce_key:
+                    row = conn.execute(
+                        """
+                        SELECT id, payload
+                        FROM sheet_events
+                        WHERE event_type = ? AND coalesce_key = ? AND attempts = 0
+                        ORDER BY created_at DESC
+                        LIMIT 1
+                        """,
+                        (event_type, coalesce_key),
+                    ).fetchone()
+                    if row is not None:
+                        merged = merge_event_payload(json.loads(row["payload"] or "{}"), payload)
+                        conn.execute(
+                            "UPDATE sheet_events SET payload = ?, revision = revision + 1 WHERE id = ?",
+                            (json.dumps(merged, ensure_ascii=False), row["id"]),
+                        )
+                        conn.commit()
+                        return row["id"]
+                event_id = str(uuid.uuid4())
                 conn.execute(
                     """
-                    INSERT INTO sheet_events (id, created_at, event_type, payload, attempts, next_attempt_at, last_error)
-                    VALUES (?, ?, ?, ?, 0, ?, '')
+                    INSERT INTO sheet_events (
+                        id, created_at, event_type, payload, attempts, next_attempt_at, last_error, coalesce_key, revision
+                    )
+                    VALUES (?, ?, ?, ?, 0, ?, '', ?, 0)
                     """,
-                    (event_id, now, event_type, json.dumps(payload, ensure_ascii=False), now),
+                    (
+                        event_id,
+                        now,
+                        event_type,
+                        json.dumps(payload, ensure_ascii=False),
+                        now + max(0.0, float(delay_sec)),
+                        coalesce_key,
+                    ),
                 )
                 conn.commit()
         return event_id
@@ -76,7 +167,7 @@ class SheetsQueueStore:
             with self._connect() as conn:
                 rows = conn.execute(
                     """
-                    SELECT id, created_at, event_type, payload, attempts, next_attempt_at, last_error
+                    SELECT id, created_at, event_type, payload, attempts, next_attempt_at, last_error, revision, failures
                     FROM sheet_events
                     WHERE next_attempt_at <= ?
                     ORDER BY created_at ASC
@@ -95,30 +186,145 @@ class SheetsQueueStore:
                     attempts=int(row["attempts"] or 0),
                     next_attempt_at=float(row["next_attempt_at"] or 0),
                     last_error=row["last_error"] or "",
+                    revision=int(row["revision"] or 0),
+                    failures=int(row["failures"] or 0),
                 )
             )
         return result
 
-    def mark_done(self, event_id: str):
+    def mark_done(self, event_id: str, revision: Optional[int] = None) -> bool:
+        """Delete a flushed event; returns False if it was merged with newer data meanwhile."""
         with self._lock:
             with self._connect() as conn:
-                conn.execute("DELETE FROM sheet_events WHERE id = ?", (event_id,))
+                if revision is None:
+                    cur = conn.execute("DELETE FROM sheet_events WHERE id = ?", (event_id,))
+                else:
+                    cur = conn.execute(
+                        "DELETE FROM sheet_events WHERE id = ? AND revision = ?",
+                        (event_id, int(revision)),
+                    )
                 conn.commit()
+                return cur.rowcount > 0
 
-    def mark_retry(self, event_id: str, attempts: int, backoff_sec: float, error: str):
+    def mark_retry(self, event_id: str, attempts: int, backoff_sec: float, error: str, failures: Optional[int] = None):
+        """Schedule another attempt; `failures` (non-transient failures so far) is kept when omitted."""
         next_at = time.time() + max(0.0, float(backoff_sec))
         with self._lock:
             with self._connect() as conn:
                 conn.execute(
                     """
                     UPDATE sheet_events
-                    SET attempts = ?, next_attempt_at = ?, last_error = ?
+                    SET attempts = ?, next_attempt_at = ?, last_error = ?, failures = COALESCE(?, failures)
                     WHERE id = ?
                     """,
-                    (int(attempts), next_at, (error or "")[:1000], event_id),
+                    (int(attempts), next_at, (error or "")[:1000], None if failures is None else int(failures), event_id),
                 )
                 conn.commit()
 
+    def mark_dead(self, event_id: str, attempts: int, error: str) -> bool:
+        """Move an event out of the live queue into the dead-letter table."""
+        now = time.time()
+        with self._lock:
+            with self._connect() as conn:
+                cur = conn.execute(
+                    """
+                    INSERT OR REPLACE INTO sheet_events_dead (
+                        id, created_at, event_type, payload, attempts, last_error, coalesce_key, dead_at
+                    )
+                    SELECT id, created_at, event_type, payload, ?, ?, coalesce_key, ?
+                    FROM sheet_events
+                    WHERE id = ?
+                    """,
+                    (int(attempts), (error or "")[:1000], now, event_id),
+                )
+                conn.execute("DELETE FROM sheet_events WHERE id = ?", (event_id,))
+                conn.commit()
+                return cur.rowcount > 0
+
+    def list_dead(self, limit: int = 50) -> List[DeadLetter]:
+        with self._lock:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    """
+                    SELECT id, created_at, event_type, payload, attempts, last_error, dead_at
+                    FROM sheet_events_dead
+                    ORDER BY dead_at DESC
+                    LIMIT ?
+                    """,
+                    (int(limit),),
+                ).fetchall()
+        return [
+            DeadLetter(
+                id=row["id"],
+                created_at=float(row["created_at"]),
+                event_type=row["event_type"],
+                payload=json.loads(row["payload"] or "{}"),
+                attempts=int(row["attempts"] or 0),
+                last_error=row["last_error"] or "",
+                dead_at=float(row["dead_at"]),
+            )
+            for row in rows
+        ]
+
+    def _dead_where(self, event_ids: Optional[Iterable[str]]):
+        ids = [str(item) for item in (event_ids or []) if str(item or "").strip()]
+        if not ids:
+            return "", []
+        return f" WHERE id IN ({','.join('?' for _ in ids)})", ids
+
+    def replay_dead(self, event_ids: Optional[Iterable[str]] = None) -> int:
+        """Return dead letters to the live queue with a fresh attempt counter.
+
+        Replayed events get a new `created_at`, so they run after anything queued for the
+        same row meanwhile instead of overwriting it with older data.
+        """
+        where, params = self._dead_where(event_ids)
+        now = time.time()
+        with self._lock:
+            with self._connect() as conn:
+                cur = conn.execute(
+                    f"""
+                    INSERT OR REPLACE INTO sheet_events (
+                        id, created_at, event_type, payload, attempts, next_attempt_at, last_error, coalesce_key, revision
+                    )
+                    SELECT id, ?, event_type, payload, 0, ?, '', coalesce_key, 0
+                    FROM sheet_events_dead{where}
+                    """,
+                    [now, now, *params],
+                )
+                conn.execute(f"DELETE FROM sheet_events_dead{where}", params)
+                conn.commit()
+                return cur.rowcount
+
+    def purge_dead(self, event_ids: Optional[Iterable[str]] = None, older_than_sec: Optional[float] = None) -> int:
+        where, params = self._dead_where(event_ids)
+        if older_than_sec is not None:
+            where = f"{where} {'AND' if where else 'WHERE'} dead_at <= ?"
+            params = [*params, time.time() - max(0.0, float(older_than_sec))]
+        with self._lock:
+            with self._connect() as conn:
+                cur = conn.execute(f"DELETE FROM sheet_events_dead{where}", params)
+                conn.commit()
+                return cur.rowcount
+
+    def compact(self, min_interval_sec: float = 0.0, min_free_ratio: float = 0.2) -> bool:
+        """VACUUM the database when enough pages are free; throttled by min_interval_sec."""
+        now = time.time()
+        if min_interval_sec > 0 and (now - self._last_compact_at) < min_interval_sec:
+            return False
+        self._last_compact_at = now
+        with self._lock:
+            conn = self._connect()
+            try:
+                page_count = int(conn.execute("PRAGMA page_count").fetchone()[0] or 0)
+                free_count = int(conn.execute("PRAGMA freelist_count").fetchone()[0] or 0)
+                if page_count <= 0 or (free_count / page_count) < max(0.0, float(min_free_ratio)):
+                    return False
+                conn.execute("VACUUM")
+                return True
+            finally:
+                conn.close()
+
     def stats(self, now_ts: Optional[float] = None) -> Dict[str, Optional[float]]:
         now_ts = now_ts if now_ts is not None else time.time()
         with self._lock:
@@ -135,6 +341,7 @@ class SheetsQueueStore:
                     ,
                     (now_ts,),
                 ).fetchone()
+                dead_row = conn.execute("SELECT COUNT(*) AS cnt FROM sheet_events_dead").fetchone()
         pending = int(row["cnt"] or 0)
         oldest = float(row["oldest"]) if row["oldest"] is not None else None
         oldest_age_sec = (time.time() - oldest) if oldest is not None else None
@@ -146,9 +353,29 @@ class SheetsQueueStore:
             "ready_pending": ready_pending,
             "oldest_age_sec": oldest_age_sec,
             "next_ready_in_sec": next_ready_in_sec,
+            "dead_letters": int(dead_row["cnt"] or 0),
         }
 
 
+def is_transient_error(err: Exception, status_code: Optional[int] = None) -> bool:
+    """Rate limits, server errors and network failures: they say nothing about the payload."""
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    # requests' ConnectionError/Timeout/JSONDecodeError all derive from OSError (IOError).
+    return isinstance(err, (OSError, TimeoutError, ConnectionError))
+
+
+def is_poison_error(err: Exception) -> bool:
+    """Payload/type errors that raise the same way on every attempt.
+
+    Only a plain ValueError counts: its subclasses include decode errors of a truncated
+    Google response (requests' JSONDecodeError), which are worth retrying.
+    """
+    if isinstance(err, OSError):
+        return False
+    return type(err) is ValueError or isinstance(err, (TypeError, KeyError))
+
+
 def calculate_backoff_sec(attempts: int, hard_error: bool = False) -> float:
     if hard_error:
         base = 300.0
@@ -158,3 +385,46 @@ def calculate_backoff_sec(attempts: int, hard_error: bool = False) -> float:
         base = schedule[idx]
     jitter = random.uniform(0.0, 1.0)
     return min(300.0, base + jitter)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect, replay or purge sheet_events dead letters")
+    parser.add_argument(
+        "--path",
+        default=os.environ.get("AUTO_REPLY_SHEETS_QUEUE_PATH", "/opt/tg_leads/.sheet_events.sqlite"),
+        help="Path to the SQLite queue (defaults to AUTO_REPLY_SHEETS_QUEUE_PATH)",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_parser = sub.add_parser("list", help="Show dead letters, newest first")
+    list_parser.add_argument("--limit", type=int, default=50)
+    list_parser.add_argument("--payload", action="store_true", help="Print full payloads")
+    replay_parser = sub.add_parser("replay", help="Move dead letters back to the live queue")
+    replay_parser.add_argument("ids", nargs="*", help="Event ids (all when omitted)")
+    purge_parser = sub.add_parser("purge", help="Delete dead letters")
+    purge_parser.add_argument("ids", nargs="*", help="Event ids (all when omitted)")
+    purge_parser.add_argument("--older-than-days", type=float, default=None)
+    sub.add_parser("stats", help="Show live queue and dead-letter counters")
+    sub.add_parser("compact", help="VACUUM the queue database")
+    args = parser.parse_args(argv)
+
+    store = SheetsQueueStore(args.path)
+    if args.command == "list":
+        for item in store.list_dead(limit=args.limit):
+            dead_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(item.dead_at))
+            print(f"{item.id} type={item.event_type} attempts={item.attempts} dead_at={dead_at} err={item.last_error}")
+            if args.payload:
+                print(json.dumps(item.payload, ensure_ascii=False))
+    elif args.command == "replay":
+        print(f"replayed={store.replay_dead(args.ids)}")
+    elif args.command == "purge":
+        older_than_sec = args.older_than_days * 86400 if args.older_than_days is not None else None
+        print(f"purged={store.purge_dead(args.ids, older_than_sec=older_than_sec)}")
+    elif args.command == "stats":
+        print(json.dumps(store.stats(), ensure_ascii=False))
+    elif args.command == "compact":
+        print(f"vacuumed={store.compact(min_free_ratio=0.0)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,221 @@
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class SpreadsheetSession:
+    """One authorized gspread client and spreadsheet handle shared by every sheet class.
+
+    Worksheet handles come from a single metadata fetch (`sh.worksheets()`), cached by
+    title and refreshed only on a miss or when a caller asks for it explicitly.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        sheet_name: str,
+        pool_maxsize: int = 16,
+        not_found_error: type = KeyError,
+    ):
+        self._client_factory = client_factory
+        self.sheet_name = sheet_name
+        self.pool_maxsize = max(1, int(pool_maxsize))
+        self._not_found_error = not_found_error
+        self._lock = threading.RLock()
+        self._client = None
+        self._spreadsheet = None
+        self._worksheets: Optional[Dict[str, Any]] = None
+        self._header_rows: Dict[str, List[str]] = {}
+        self.metadata_fetches = 0
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self._client_factory()
+                self._widen_http_pool(self._client)
+            return self._client
+
+    @property
+    def spreadsheet(self):
+        with self._lock:
+            if self._spreadsheet is None:
+                self._spreadsheet = self.client.open(self.sheet_name)
+            return self._spreadsheet
+
+    def _widen_http_pool(self, client) -> None:
+        # Sheet writes run from asyncio.to_thread workers; the default pool of 10
+        # connections would make them queue behind each other.
+        session = getattr(getattr(client, "http_client", None), "session", None)
+        if session is None or not hasattr(session, "mount"):
+            return
+        try:
+            from requests.adapters import HTTPAdapter
+        except Exception:
+            return
+        adapter = HTTPAdapter(pool_connections=self.pool_maxsize, pool_maxsize=self.pool_maxsize)
+        session.mount("https://", adapter)
+
+    def refresh(self) -> Dict[str, Any]:
+        with self._lock:
+            worksheets = self.spreadsheet.worksheets()
+            self.metadata_fetches += 1
+            self._worksheets = {(ws.title or "").strip(): ws for ws in worksheets}
+            return dict(self._worksheets)
+
+    def worksheets(self, refresh: bool = False) -> List[Any]:
+        with self._lock:
+            if refresh or self._worksheets is None:
+                self.refresh()
+            return list(self._worksheets.values())
+
+    def find_worksheet(self, title: str) -> Optional[Any]:
+        title = (title or "").strip()
+        with self._lock:
+            refreshed = False
+            if self._worksheets is None:
+                self.refresh()
+                refreshed = True
+            ws = self._worksheets.get(title)
+            if ws is None and not refreshed:
+                self.refresh()
+                ws = self._worksheets.get(title)
+            return ws
+
+    def worksheet(self, title: str):
+        ws = self.find_worksheet(title)
+        if ws is None:
+            raise self._not_found_error(title)
+        return ws
+
+    def get_or_create_worksheet(self, title: str, rows: int, cols: int):
+        with self._lock:
+            ws = self.find_worksheet(title)
+            if ws is not None:
+                return ws
+            ws = self.spreadsheet.add_worksheet(title=title, rows=rows, cols=cols)
+            self._worksheets[(ws.title or "").strip()] = ws
+            self._header_rows[(ws.title or "").strip()] = []
+            return ws
+
+    def delete_worksheet(self, ws) -> None:
+        with self._lock:
+            self.spreadsheet.del_worksheet(ws)
+            if self._worksheets is not None:
+                self._worksheets.pop((ws.title or "").strip(), None)
+            self._header_rows.pop((ws.title or "").strip(), None)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._worksheets = None
+
+    def prefetch_headers(self, titles: Iterable[str]) -> Dict[str, List[str]]:
+        """Read row 1 of every listed worksheet with a single values:batchGet."""
+        with self._lock:
+            if self._worksheets is None:
+                self.refresh()
+            existing = []
+            for title in titles:
+                title = (title or "").strip()
+                if title and title in self._worksheets and title not in existing:
+                    existing.append(title)
+            if not existing:
+                return {}
+            ranges = [f"'{title.replace(chr(39), chr(39) * 2)}'!1:1" for title in existing]
+            response = self.spreadsheet.values_batch_get(ranges)
+            value_ranges = (response or {}).get("valueRanges") or []
+            result: Dict[str, List[str]] = {}
+            for title, value_range in zip(existing, value_ranges):
+                values = (value_range or {}).get("values") or []
+                result[title] = [str(h or "").strip() for h in values[0]] if values else []
+            self._header_rows.update(result)
+            return result
+
+    def header_row(self, title: str) -> Optional[List[str]]:
+        with self._lock:
+            cached = self._header_rows.get((title or "").strip())
+            return list(cached) if cached is not None else None
+
+    def remember_header_row(self, title: str, headers: List[str]) -> None:
+        with self._lock:
+            self._header_rows[(title or "").strip()] = [str(h or "").strip() for h in headers]
+
+
+def plan_header_column_moves(
+    current: List[str],
+    target: List[str],
+    drop_extra: bool = False,
+) -> List[Tuple[str, int, int]]:
+    """Return ("move", src, dst) / ("insert", idx, 0) / ("delete", start, end) steps
+    that turn the `current` column order into `target` without rewriting data rows."""
+    cols = [str(h or "").strip() for h in current]
+    steps: List[Tuple[str, int, int]] = []
+    for idx, name in enumerate(target):
+        if idx < len(cols) and cols[idx] == name:
+            continue
+        src = next((k for k in range(idx + 1, len(cols)) if cols[k] == name), None)
+        if src is None:
+            steps.append(("insert", idx, 0))
+            cols.insert(idx, name)
+            continue
+        steps.append(("move", src, idx))
+        cols.insert(idx, cols.pop(src))
+    if drop_extra:
+        last_named = max((k for k in range(len(target), len(cols)) if cols[k]), default=None)
+        if last_named is not None:
+            steps.append(("delete", len(target), last_named + 1))
+    return steps
+
+
+def header_fix_requests(sheet_id: int, steps: List[Tuple[str, int, int]]) -> List[dict]:
+    requests: List[dict] = []
+    for kind, first, second in steps:
+        if kind == "move":
+            requests.append(
+                {
+                    "moveDimension": {
+                        "source": {"sheetId": sheet_id, "dimension": "COLUMNS", "startIndex": first, "endIndex": first + 1},
+                        "destinationIndex": second,
+                    }
+                }
+            )
+        elif kind == "insert":
+            requests.append(
+                {
+                    "insertDimension": {
+                        "range": {"sheetId": sheet_id, "dimension": "COLUMNS", "startIndex": first, "endIndex": first + 1},
+                        "inheritFromBefore": False,
+                    }
+                }
+            )
+        elif kind == "delete":
+            requests.append(
+                {
+                    "deleteDimension": {
+                        "range": {"sheetId": sheet_id, "dimension": "COLUMNS", "startIndex": first, "endIndex": second},
+                    }
+                }
+            )
+    return requests
+
+
+def col_letter(col_idx: int) -> str:
+    """1-based column number -> A1 letters (1 -> A, 27 -> AA)."""
+    result = []
+    while col_idx > 0:
+        col_idx, rem = divmod(col_idx - 1, 26)
+        result.append(chr(ord("A") + rem))
+    return "".join(reversed(result))
+
+
+def apply_header_column_fix(ws, current: List[str], target: List[str], drop_extra: bool = False) -> bool:
+    """Reorder columns server-side (moveDimension/insertDimension) and rewrite only row 1."""
+    steps = plan_header_column_moves(current, target, drop_extra=drop_extra)
+    requests = header_fix_requests(ws.id, steps)
+    if requests:
+        ws.spreadsheet.batch_update({"requests": requests})
+    ws.update(
+        range_name=f"A1:{col_letter(len(target))}1",
+        values=[list(target)],
+        value_input_option="USER_ENTERED",
+    )
+    return bool(requests)
@@ -0,0 +1,94 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+@dataclass
+class _Draft:
+    key: Tuple[str, str]
+    task: "asyncio.Task[Any]"
+
+
+class SpeculativeAnswers:
+    """Answer drafts started when a message arrives, before its turn is processed.
+
+    Texts of one burst accumulate per peer; every new message restarts the draft for
+    the accumulated text. `take()` hands the draft to the turn only when its key (step,
+    text) matches what the turn actually answers; `discard()` drops a draft the turn
+    did not need.
+    """
+
+    def __init__(self):
+        self._drafts: Dict[int, _Draft] = {}
+        self._burst_text: Dict[int, str] = {}
+        self.started = 0
+        self.restarted = 0
+        self.hits = 0
+        self.misses = 0
+
+    def extend(self, peer_id: int, text: str) -> str:
+        peer_id = int(peer_id)
+        parts = [part for part in (self._burst_text.get(peer_id, ""), (text or "").strip()) if part]
+        self._burst_text[peer_id] = "\n".join(parts)
+        return self._burst_text[peer_id]
+
+    def start(self, peer_id: int, step: str, text: str, factory: Callable[[], Awaitable[Any]]) -> None:
+        peer_id = int(peer_id)
+        key = (str(step or ""), str(text or "").strip())
+        existing = self._drafts.get(peer_id)
+        if existing is not None:
+            if existing.key == key:
+                return
+            existing.task.cancel()
+            self.restarted += 1
+        self._drafts[peer_id] = _Draft(key, asyncio.create_task(factory()))
+        self.started += 1
+
+    def cancel(self, peer_id: int) -> None:
+        peer_id = int(peer_id)
+        self._burst_text.pop(peer_id, None)
+        draft = self._drafts.pop(peer_id, None)
+        if draft is not None:
+            draft.task.cancel()
+
+    def end_burst(self, peer_id: int) -> None:
+        self._burst_text.pop(int(peer_id), None)
+
+    def discard(self, peer_id: int, text: str) -> None:
+        peer_id = int(peer_id)
+        draft = self._drafts.get(peer_id)
+        if draft is not None and draft.key[1] == str(text or "").strip():
+            self._drafts.pop(peer_id, None)
+            draft.task.cancel()
+
+    async def take(self, peer_id: int, step: str, text: str) -> Optional[Any]:
+        peer_id = int(peer_id)
+        draft = self._drafts.get(peer_id)
+        if draft is None:
+            return None
+        if draft.key != (str(step or ""), str(text or "").strip()):
+            self.misses += 1
+            return None
+        self._drafts.pop(peer_id, None)
+        try:
+            result = await draft.task
+        except asyncio.CancelledError:
+            if not draft.task.cancelled():
+                raise
+            self.misses += 1
+            return None
+        except Exception as err:
+            print(f"⚠️ SPECULATIVE_ANSWER_ERROR peer={peer_id}: {type(err).__name__}: {err}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._drafts),
+            "started": self.started,
+            "restarted": self.restarted,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -2,6 +2,7 @@ import asyncio
 import unittest
 
 from auto_reply_classifiers import (
+    CombinedTurnClassifier,
     Decision,
     Intent,
     classify_format_choice,
@@ -86,6 +87,41 @@ class ClassifierTests(unittest.TestCase):
         self.assertFalse(is_balance_interest_question("Зарплата нормальна"))
         self.assertFalse(is_balance_interest_question("Підкажіть, будь ласка, який графік?"))
 
+    def test_combined_turn_classifier_uses_one_request_per_turn(self):
+        payloads = []
+
+        async def post(payload):
+            payloads.append(payload)
+            return {"ok": True, "labels": {"intent": "stop", "stop": True, "refusal_reason": "schedule"}}
+
+        classifier = CombinedTurnClassifier(post)
+
+        async def scenario():
+            first = await classifier.classify(10, [], "Мені не підходить графік", "schedule_shift_wait", {"schedule", "other"})
+            second = await classifier.classify(10, [], "мені не підходить   графік", "schedule_shift_wait", {"schedule", "other"})
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        self.assertEqual(first, second)
+        self.assertEqual(first["refusal_reason"], "schedule")
+        self.assertEqual(len(payloads), 1)
+        self.assertEqual(payloads[0]["labels"], ["intent", "stop", "refusal_reason"])
+        self.assertEqual(payloads[0]["allowed_reasons"], ["other", "schedule"])
+        self.assertEqual(classifier.cache_hits, 1)
+
+    def test_combined_turn_classifier_does_not_cache_failures(self):
+        calls = []
+
+        async def post(payload):
+            calls.append(payload)
+            return None
+
+        classifier = CombinedTurnClassifier(post)
+        self.assertIsNone(asyncio.run(classifier.classify(10, [], "ок", "format")))
+        self.assertIsNone(asyncio.run(classifier.classify(10, [], "ок", "format")))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0]["labels"], ["intent", "stop", "refusal_reason"])
+
 
 if __name__ == "__main__":
     unittest.main()
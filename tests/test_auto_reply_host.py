@@ -0,0 +1,121 @@
+import asyncio
+import os
+import sys
+import tempfile
+import types
+import unittest
+
+dotenv_mod = types.ModuleType("dotenv")
+dotenv_mod.load_dotenv = lambda *args, **kwargs: None
+sys.modules.setdefault("dotenv", dotenv_mod)
+
+from auto_reply_host import AccountHost, load_account_module, load_host_control
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def fake_loader(log):
+    def loader(key, env, shared):
+        module = types.SimpleNamespace(__name__=f"fake_{key}", env=env, shared=shared)
+
+        async def main(stop_event=None):
+            log.append(("start", key, env.get("MARK")))
+            if env.get("FAIL"):
+                return
+            await stop_event.wait()
+            log.append(("stop", key))
+
+        module.main = main
+        return module
+
+    return loader
+
+
+class LoadAccountModuleTests(unittest.TestCase):
+    def test_env_overlay_is_applied_only_while_the_copy_executes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "runtime.py")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("import os\nACCOUNT = os.environ.get('HOST_TEST_ACCOUNT')\nPROCESS_SHARED = {}\n")
+            os.environ.pop("HOST_TEST_ACCOUNT", None)
+            shared = {}
+            first = load_account_module("a-1", {"HOST_TEST_ACCOUNT": "a"}, shared, path=path)
+            second = load_account_module("b", {"HOST_TEST_ACCOUNT": "b"}, shared, path=path)
+            try:
+                self.assertEqual(first.ACCOUNT, "a")
+                self.assertEqual(second.ACCOUNT, "b")
+                self.assertIsNot(first, second)
+                self.assertIs(first.PROCESS_SHARED, second.PROCESS_SHARED)
+                self.assertNotIn("HOST_TEST_ACCOUNT", os.environ)
+                self.assertIn("auto_reply__a_1", sys.modules)
+            finally:
+                sys.modules.pop(first.__name__, None)
+                sys.modules.pop(second.__name__, None)
+
+
+class AccountHostTests(unittest.TestCase):
+    def test_sync_starts_stops_and_restarts_on_env_change(self):
+        log = []
+
+        async def scenario():
+            host = AccountHost(loader=fake_loader(log), stop_timeout_sec=1)
+            await host.sync({"a": {"MARK": "1"}, "b": {"MARK": "1"}})
+            await asyncio.sleep(0)
+            self.assertEqual(host.running(), ["a", "b"])
+
+            await host.sync({"a": {"MARK": "2"}})
+            await asyncio.sleep(0)
+            self.assertEqual(host.running(), ["a"])
+            await host.close()
+            self.assertEqual(host.running(), [])
+
+        asyncio.run(scenario())
+        self.assertEqual(
+            log,
+            [
+                ("start", "a", "1"),
+                ("start", "b", "1"),
+                ("stop", "a"),
+                ("stop", "b"),
+                ("start", "a", "2"),
+                ("stop", "a"),
+            ],
+        )
+
+    def test_account_that_exits_is_retried_after_backoff(self):
+        log = []
+        clock = _Clock()
+
+        async def scenario():
+            host = AccountHost(loader=fake_loader(log), retry_sec=30, clock=clock)
+            wanted = {"a": {"FAIL": "1"}}
+            await host.sync(wanted)
+            await asyncio.sleep(0)
+            await host.sync(wanted)
+            self.assertEqual(host.status()["accounts"]["a"]["error"], "main exited")
+            await host.sync(wanted)
+            clock.now += 31
+            await host.sync(wanted)
+            await asyncio.sleep(0)
+            await host.close()
+
+        asyncio.run(scenario())
+        self.assertEqual([entry for entry in log if entry[0] == "start"], [("start", "a", None)] * 2)
+
+    def test_control_file_ignores_malformed_entries(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "control.json")
+            self.assertEqual(load_host_control(path), {})
+            with open(path, "w", encoding="utf-8") as f:
+                f.write('{"accounts": {"a": {"env": {"X": 1}}, "b": "bad"}}')
+            self.assertEqual(load_host_control(path), {"a": {"X": "1"}})
+
+
+if __name__ == "__main__":
+    unittest.main()
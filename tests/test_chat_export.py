@@ -0,0 +1,142 @@
+import asyncio
+import gzip
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from chat_export import ChatExportArchive, recent_user_dialogs, sync_dialogs, write_export
+
+
+NOW = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def msg(msg_id, hours_ago, text="hi", out=False):
+    return SimpleNamespace(id=msg_id, date=NOW - timedelta(hours=hours_ago), message=text, out=out)
+
+
+class FakeClient:
+    def __init__(self, history):
+        self.history = history
+        self.calls = []
+
+    def iter_messages(self, entity, min_id=0):
+        self.calls.append((entity.id, min_id))
+        messages = [m for m in sorted(self.history[entity.id], key=lambda m: -m.id) if m.id > min_id]
+
+        async def gen():
+            for m in messages:
+                yield m
+
+        return gen()
+
+
+def dialog(peer_id, top_id, hours_ago=0, is_user=True):
+    entity = SimpleNamespace(id=peer_id, first_name=f"User{peer_id}", last_name="", username="")
+    return SimpleNamespace(
+        entity=entity,
+        is_user=is_user,
+        name="",
+        date=NOW - timedelta(hours=hours_ago),
+        message=SimpleNamespace(id=top_id),
+    )
+
+
+class ChatExportTests(unittest.TestCase):
+    def test_repeated_export_fetches_only_above_high_water_mark(self):
+        cutoff = NOW - timedelta(days=1)
+        history = {1: [msg(1, 48, "old"), msg(2, 5, "a"), msg(3, 4, "b", out=True)], 2: [msg(7, 3, "x")]}
+        client = FakeClient(history)
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = ChatExportArchive(os.path.join(tmp, "archive.sqlite"))
+            try:
+                stats = asyncio.run(sync_dialogs(client, [dialog(1, 3), dialog(2, 7)], archive, cutoff))
+                self.assertEqual((stats.fetched_dialogs, stats.fetched_messages), (2, 3))
+                self.assertEqual(sorted(client.calls), [(1, 0), (2, 0)])
+
+                client.calls.clear()
+                history[1].append(msg(4, 1, "c"))
+                stats = asyncio.run(sync_dialogs(client, [dialog(1, 4), dialog(2, 7)], archive, cutoff))
+                self.assertEqual(client.calls, [(1, 3)])
+                self.assertEqual((stats.unchanged, stats.fetched_messages), (1, 1))
+
+                out_path = os.path.join(tmp, "export.txt.gz")
+                written = write_export(
+                    out_path, [dialog(1, 4), dialog(2, 7)], archive, cutoff, timezone.utc, ["Header"], str.strip
+                )
+                self.assertEqual(written, 2)
+                with gzip.open(out_path, "rt", encoding="utf-8") as f:
+                    text = f.read()
+                self.assertIn("[candidate]: a\n", text)
+                self.assertIn("[me]: b\n", text)
+                self.assertNotIn("old", text)
+                self.assertLess(text.index(": a\n"), text.index(": c\n"))
+            finally:
+                archive.close()
+
+    def test_wider_window_triggers_full_refetch(self):
+        history = {1: [msg(1, 30, "older"), msg(2, 1, "new")]}
+        client = FakeClient(history)
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = ChatExportArchive(os.path.join(tmp, "archive.sqlite"))
+            try:
+                asyncio.run(sync_dialogs(client, [dialog(1, 2)], archive, NOW - timedelta(days=1)))
+                client.calls.clear()
+                asyncio.run(sync_dialogs(client, [dialog(1, 2)], archive, NOW - timedelta(days=2)))
+                self.assertEqual(client.calls, [(1, 0)])
+                self.assertEqual([row[3] for row in archive.dialog_messages(1, 0)], ["older", "new"])
+            finally:
+                archive.close()
+
+    def test_prune_moves_coverage_so_a_longer_window_refetches(self):
+        history = {1: [msg(1, 40, "older"), msg(2, 1, "new")]}
+        client = FakeClient(history)
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = ChatExportArchive(os.path.join(tmp, "archive.sqlite"))
+            try:
+                asyncio.run(sync_dialogs(client, [dialog(1, 2)], archive, NOW - timedelta(days=2)))
+                archive.prune((NOW - timedelta(days=1)).timestamp())
+                self.assertEqual(archive.mark(1).covered_from, (NOW - timedelta(days=1)).timestamp())
+                client.calls.clear()
+                asyncio.run(sync_dialogs(client, [dialog(1, 2)], archive, NOW - timedelta(days=2)))
+                self.assertEqual(client.calls, [(1, 0)])
+                self.assertEqual([row[3] for row in archive.dialog_messages(1, 0)], ["older", "new"])
+            finally:
+                archive.close()
+
+    def test_failing_dialog_waits_for_the_others(self):
+        finished = []
+
+        class FailingClient(FakeClient):
+            def iter_messages(self, entity, min_id=0):
+                if entity.id == 1:
+                    raise RuntimeError("boom")
+
+                async def gen():
+                    await asyncio.sleep(0.01)
+                    finished.append(entity.id)
+                    yield msg(5, 1)
+
+                return gen()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = ChatExportArchive(os.path.join(tmp, "archive.sqlite"))
+            try:
+                with self.assertRaises(RuntimeError):
+                    asyncio.run(sync_dialogs(FailingClient({}), [dialog(1, 5), dialog(2, 5)], archive, NOW - timedelta(days=1)))
+                self.assertEqual(finished, [2])
+                self.assertIsNotNone(archive.mark(2))
+            finally:
+                archive.close()
+
+    def test_stale_and_non_user_dialogs_are_skipped(self):
+        cutoff = NOW - timedelta(days=1)
+        dialogs = [dialog(1, 1, hours_ago=2), dialog(2, 1, hours_ago=48), dialog(3, 1, is_user=False)]
+        kept, stale = recent_user_dialogs(dialogs, cutoff, lambda entity: False)
+        self.assertEqual([d.entity.id for d in kept], [1])
+        self.assertEqual(stale, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+
+from faq_learning import FAQQuestionStats
+
+
+def _qlog(cluster_key, question, seen_at, answer=""):
+    return {
+        "created_at": seen_at,
+        "peer_id": 1,
+        "step": "screening",
+        "question_raw": question,
+        "question_norm": question.lower(),
+        "cluster_key": cluster_key,
+        "count": 1,
+        "last_seen_at": seen_at,
+        "answer_preview": answer,
+        "resolved_status": "new",
+    }
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FAQQuestionStatsTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "faq.sqlite")
+        self.clock = _Clock()
+        self.stats = FAQQuestionStats(self.path, sample_limit=2, clock=self.clock)
+
+    def test_record_aggregates_counts_seen_times_and_samples(self):
+        self.stats.record(_qlog("pay", "Скільки платять?", "2026-04-01T10:00:00"))
+        self.stats.record(_qlog("pay", "Скільки платять?", "2026-04-01T11:00:00"))
+        self.stats.record(_qlog("pay", "А оплата?", "2026-04-01T12:00:00", answer="300$"))
+        self.stats.record(_qlog("pay", "Яка ставка?", "2026-04-01T13:00:00"))
+        self.stats.record(_qlog("", "ignored", "2026-04-01T13:00:00"))
+
+        [cluster] = self.stats.dirty()
+        self.assertEqual(cluster.pending, 4)
+        self.assertEqual(cluster.total, 4)
+        self.assertEqual(cluster.first_seen_at, "2026-04-01T10:00:00")
+        self.assertEqual(cluster.last_seen_at, "2026-04-01T13:00:00")
+        self.assertEqual(cluster.samples, ["Скільки платять?", "А оплата?"])
+        self.assertEqual(cluster.latest["question_raw"], "Яка ставка?")
+
+    def test_mark_flushed_keeps_events_recorded_during_flush(self):
+        self.stats.record(_qlog("pay", "q1", "t1"))
+        self.stats.record(_qlog("pay", "q2", "t2"))
+        snapshot = self.stats.dirty()
+        self.stats.record(_qlog("pay", "q3", "t3"))
+        self.stats.mark_flushed({c.cluster_key: c.pending for c in snapshot}, ["pay"])
+
+        [cluster] = self.stats.dirty()
+        self.assertEqual(cluster.pending, 1)
+        self.assertEqual(cluster.total, 3)
+        self.assertTrue(cluster.suggested)
+        self.assertEqual(self.stats.stats(), {"clusters": 1, "pending": 1, "suggested": 1})
+
+        reopened = FAQQuestionStats(self.path)
+        self.assertEqual(reopened.pending_events(), 1)
+
+    def test_due_by_event_count_or_age(self):
+        self.assertFalse(self.stats.due(flush_sec=60, flush_events=3))
+        self.stats.record(_qlog("a", "q", "t"))
+        self.stats.record(_qlog("b", "q", "t"))
+        self.assertFalse(self.stats.due(flush_sec=60, flush_events=3))
+        self.stats.record(_qlog("b", "q", "t"))
+        self.assertTrue(self.stats.due(flush_sec=60, flush_events=3))
+        self.stats.mark_flushed({"a": 1, "b": 2})
+        self.stats.record(_qlog("a", "q", "t"))
+        self.assertFalse(self.stats.due(flush_sec=60, flush_events=3))
+        self.clock.now = 61
+        self.assertTrue(self.stats.due(flush_sec=60, flush_events=3))
+
+    def test_failed_flush_waits_for_the_retry_interval(self):
+        for _ in range(3):
+            self.stats.record(_qlog("a", "q", "t"))
+        self.stats.mark_failed(retry_sec=30)
+        self.assertFalse(self.stats.due(flush_sec=60, flush_events=3))
+        self.clock.now = 29
+        self.assertFalse(self.stats.due(flush_sec=60, flush_events=3))
+        self.clock.now = 30
+        self.assertTrue(self.stats.due(flush_sec=60, flush_events=3))
+        self.stats.mark_failed(retry_sec=30)
+        self.stats.mark_flushed({"a": 1})
+        self.assertFalse(self.stats.due(flush_sec=60, flush_events=3))
+        self.clock.now = 100
+        self.assertTrue(self.stats.due(flush_sec=60, flush_events=2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from file_lock import FileLock, acquire_lock, lock_held, lock_wait_stats, release_lock, reset_lock_wait_stats
+
+
+class FileLockTests(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, "store.json.lock")
+        reset_lock_wait_stats()
+
+    def test_exclusive_lock_excludes_other_holders(self):
+        first = FileLock(self.path)
+        self.assertTrue(first.acquire())
+        self.addCleanup(first.release)
+        self.assertFalse(FileLock(self.path).acquire(timeout_sec=0.02))
+        self.assertFalse(FileLock(self.path, shared=True).acquire())
+        first.release()
+        self.assertTrue(FileLock(self.path).acquire())
+
+        stats = lock_wait_stats()["store.json.lock"]
+        self.assertEqual(stats["timeouts"], 2)
+        self.assertGreaterEqual(stats["acquired"], 2)
+
+    def test_shared_readers_do_not_serialize(self):
+        reader_a = FileLock(self.path, shared=True)
+        reader_b = FileLock(self.path, shared=True)
+        self.assertTrue(reader_a.acquire())
+        self.assertTrue(reader_b.acquire())
+        self.assertFalse(FileLock(self.path).acquire())
+        reader_a.release()
+        reader_b.release()
+        with FileLock(self.path) as writer:
+            self.assertTrue(writer.held)
+
+    def test_async_acquire_waits_without_blocking_loop(self):
+        holder = FileLock(self.path)
+        holder.acquire()
+
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            loop.call_later(0.05, holder.release)
+            waiter = FileLock(self.path)
+            acquired = await waiter.acquire_async(timeout_sec=2.0)
+            waiter.release()
+            return acquired
+
+        self.assertTrue(asyncio.run(scenario()))
+
+    def test_named_lock_is_released_by_path(self):
+        self.assertTrue(acquire_lock(self.path, ttl_sec=5))
+        self.assertFalse(acquire_lock(self.path, ttl_sec=5))
+        release_lock(self.path)
+        self.assertTrue(acquire_lock(self.path, ttl_sec=5))
+        release_lock(self.path)
+
+    def test_lock_held_probes_without_taking_the_lock(self):
+        self.assertFalse(lock_held(self.path))
+        holder = FileLock(self.path)
+        holder.acquire()
+        with open(self.path, "r", encoding="utf-8") as f:
+            owner = f.read()
+        self.assertTrue(lock_held(self.path))
+        with open(self.path, "r", encoding="utf-8") as f:
+            self.assertEqual(f.read(), owner)
+        holder.release()
+        self.assertFalse(lock_held(self.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import re
+import tempfile
+import unittest
+
+from form_import_reader import FormResponsesReader, IdleBackoff, TouchNotifier
+
+
+class FakeWorksheet:
+    title = "Form Responses 1"
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.ranges = []
+
+    def row_values(self, row):
+        return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def col_values(self, col):
+        return [row[col - 1] for row in self.rows if len(row) >= col and row[col - 1]]
+
+    def get(self, a1):
+        self.ranges.append(a1)
+        match = re.match(r"A(\d+):([A-Z])$", a1)
+        start, width = int(match.group(1)), ord(match.group(2)) - ord("A") + 1
+        return [list(row[:width]) for row in self.rows[start - 1:]]
+
+
+class FormResponsesReaderTests(unittest.TestCase):
+    def test_poll_reads_from_last_seen_row_only(self):
+        ws = FakeWorksheet([["ts", "name", "tg"], ["t1", "A", "@a"], ["t2", "B", "@b"]])
+        opened = []
+        reader = FormResponsesReader(lambda: opened.append(1) or ws)
+
+        poll = reader.poll(2)
+        self.assertEqual(poll.rows, [(3, ["t2", "B", "@b"])])
+        self.assertEqual(ws.ranges, ["A2:D"])
+
+        ws.rows.append(["t3", "C", "@c"])
+        poll = reader.poll(3)
+        self.assertEqual(poll.rows, [(4, ["t3", "C", "@c"])])
+        self.assertEqual(reader.poll(4).rows, [])
+        self.assertEqual(len(opened), 1)
+        self.assertFalse(poll.shrunk)
+
+    def test_missing_anchor_row_reports_shrink_with_row_count(self):
+        ws = FakeWorksheet([["ts", "name"], ["t1", "A"]])
+        reader = FormResponsesReader(lambda: ws)
+        poll = reader.poll(5)
+        self.assertTrue(poll.shrunk)
+        self.assertEqual(poll.row_count, 2)
+        self.assertEqual(reader.row_count(), 2)
+
+    def test_new_form_question_is_picked_up(self):
+        ws = FakeWorksheet([["ts", "name"], ["t1", "A"]])
+        reader = FormResponsesReader(lambda: ws)
+        self.assertEqual(reader.poll(1).rows, [(2, ["t1", "A"])])
+
+        ws.rows[0].extend(["tg", "city"])
+        ws.rows.append(["t2", "B", "@b", "Kyiv"])
+        poll = reader.poll(2)
+        self.assertEqual(poll.headers, ["ts", "name", "tg", "city"])
+        self.assertEqual(poll.rows, [(3, ["t2", "B", "@b", "Kyiv"])])
+        self.assertEqual(ws.ranges[-2:], ["A2:C", "A2:E"])
+
+    def test_stray_cells_do_not_refetch_every_poll(self):
+        ws = FakeWorksheet([["ts", "name"], ["t1", "A", "note"]])
+        reader = FormResponsesReader(lambda: ws)
+        reader.poll(2)
+        reader.poll(2)
+        self.assertEqual(ws.ranges, ["A2:C", "A2:C"])
+
+    def test_headers_are_reread_after_max_age(self):
+        now = [0.0]
+        ws = FakeWorksheet([["ts"], ["t1"]])
+        reader = FormResponsesReader(lambda: ws, headers_max_age_sec=60, clock=lambda: now[0])
+        reader.headers()
+        ws.rows[0].append("name")
+        self.assertEqual(reader.headers(), ["ts"])
+        now[0] = 61
+        self.assertEqual(reader.headers(), ["ts", "name"])
+
+
+class IdleBackoffTests(unittest.TestCase):
+    def test_interval_grows_when_idle_and_resets_on_activity(self):
+        backoff = IdleBackoff(30, 100, idle_polls=2)
+        self.assertEqual([backoff.record(False) for _ in range(6)], [30, 60, 60, 100, 100, 100])
+        self.assertEqual(backoff.record(True), 30)
+
+    def test_touch_notifier_fires_once_per_touch(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "notify")
+            notifier = TouchNotifier(path)
+            self.assertFalse(notifier.changed())
+            with open(path, "w"):
+                pass
+            self.assertTrue(notifier.changed())
+            self.assertFalse(notifier.changed())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -69,6 +69,7 @@ auto_reply = importlib.import_module("auto_reply")
 class _FakeWorksheet:
     def __init__(self):
         self.values = []
+        self.title = "GroupLeads"
 
     def row_values(self, row_idx):
         if row_idx != 1 or not self.values:
@@ -78,6 +79,10 @@ class _FakeWorksheet:
     def get_all_values(self):
         return [row[:] for row in self.values]
 
+    def get(self, range_name):
+        row_idx = int("".join(ch for ch in range_name.split(":")[0] if ch.isdigit()))
+        return [self.values[row_idx - 1][:]] if row_idx <= len(self.values) else []
+
     def update(self, range_name, values, value_input_option="USER_ENTERED"):
         del value_input_option
         start = range_name.split(":")[0]
@@ -97,6 +102,9 @@ class GroupLeadsHrTests(unittest.TestCase):
         tmpdir = tempfile.TemporaryDirectory()
         self.addCleanup(tmpdir.cleanup)
         sheet.lock_path = os.path.join(tmpdir.name, "group_leads.lock")
+        orig_lock_dir = auto_reply.HEADER_FIX_LOCK_DIR
+        auto_reply.HEADER_FIX_LOCK_DIR = tmpdir.name
+        self.addCleanup(setattr, auto_reply, "HEADER_FIX_LOCK_DIR", orig_lock_dir)
 
         sheet._ensure_headers_exact = auto_reply.GroupLeadsSheet._ensure_headers_exact.__get__(sheet, auto_reply.GroupLeadsSheet)
         sheet._find_row = auto_reply.GroupLeadsSheet._find_row.__get__(sheet, auto_reply.GroupLeadsSheet)
@@ -1,5 +1,6 @@
 import os
 import tempfile
+import time
 import unittest
 
 from hr_filter_store import HrFilterStore, HrForwardDeduper
@@ -38,6 +39,18 @@ class HrForwardDeduperTests(unittest.TestCase):
         self.assertTrue(deduper.claim(-100123, 55, "primary"))
         self.assertFalse(deduper.claim(-100123, 55, "alt"))
         self.assertTrue(deduper.claim(-100123, 56, "alt"))
+        self.assertFalse(HrForwardDeduper(path).claim(-100123, 56, "primary"))
+
+    def test_expired_claim_can_be_taken_again_and_is_swept(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "hr_filter_forwards.sqlite")
+        deduper = HrForwardDeduper(path, retention_sec=3600, sweep_interval_sec=10**9)
+
+        self.assertTrue(deduper.claim(-100123, 57, "primary"))
+        self.assertEqual(deduper.sweep(time.time() + 60), 0)
+        self.assertEqual(deduper.sweep(time.time() + 7200), 1)
+        self.assertTrue(deduper.claim(-100123, 57, "alt"))
 
 
 if __name__ == "__main__":
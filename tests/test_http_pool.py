@@ -0,0 +1,62 @@
+import json
+import threading
+import unittest
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from http_pool import JsonHttpPool
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    client_ports = []
+
+    def do_POST(self):
+        self.client_ports.append(self.client_address[1])
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        status = 500 if self.path == "/fail" else 200
+        raw = json.dumps({"echo": json.loads(body or b"{}")}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args):
+        pass
+
+
+class JsonHttpPoolTests(unittest.TestCase):
+    def setUp(self):
+        _Handler.client_ports = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_sequential_posts_reuse_one_connection(self):
+        pool = JsonHttpPool()
+        try:
+            for idx in range(3):
+                self.assertEqual(pool.post_json(self.base + "/classify", {"n": idx}, 5), {"echo": {"n": idx}})
+        finally:
+            pool.close()
+        self.assertEqual(len(set(_Handler.client_ports)), 1)
+        self.assertEqual((pool.requests, pool.reused), (3, 2))
+
+    def test_http_error_status_raises_http_error(self):
+        pool = JsonHttpPool()
+        try:
+            with self.assertRaises(urllib.error.HTTPError) as ctx:
+                pool.post_json(self.base + "/fail", {}, 5)
+            self.assertEqual(ctx.exception.code, 500)
+        finally:
+            pool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import asyncio
+import unittest
+
+from lazy_resource import LazyResource
+
+
+class LazyResourceTests(unittest.TestCase):
+    def test_builds_once_on_first_use(self):
+        calls = []
+
+        def factory():
+            calls.append(1)
+            return object()
+
+        res = LazyResource("sheet", factory)
+        self.assertFalse(res.ready)
+        self.assertIsNone(res.peek())
+        first = res.get()
+        self.assertIs(res.get(), first)
+        self.assertIs(asyncio.run(res.aget()), first)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(res.ready)
+        self.assertIsNotNone(res.init_sec)
+
+    def test_failure_is_retried_after_cooldown(self):
+        attempts = []
+
+        def factory():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("503")
+            return "ok"
+
+        res = LazyResource("drive", factory, retry_sec=0)
+        self.assertIsNone(res.get())
+        self.assertIn("503", res.last_error)
+        self.assertEqual(res.get(), "ok")
+        self.assertEqual(res.last_error, "")
+
+    def test_require_raises_during_cooldown(self):
+        def factory():
+            raise RuntimeError("down")
+
+        res = LazyResource("faq", factory, retry_sec=3600)
+        with self.assertRaises(RuntimeError):
+            res.require()
+        with self.assertRaises(RuntimeError):
+            asyncio.run(res.arequire())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -98,10 +98,25 @@ class ManualV2RecoveryTests(unittest.TestCase):
         self.assertTrue(auto_reply.is_document_purpose_question("Навіщо потрібен паспорт або Дія?"))
         self.assertIn("договором ГПД", auto_reply.DOCUMENT_PURPOSE_REPLY_TEXT)
 
-    def test_v2_incoming_buffer_reason_prioritizes_send_lock(self):
-        self.assertEqual(auto_reply.v2_incoming_buffer_reason(10, {10}, set()), "send_lock")
-        self.assertEqual(auto_reply.v2_incoming_buffer_reason(10, set(), {10}), "processing")
-        self.assertEqual(auto_reply.v2_incoming_buffer_reason(10, set(), set()), "")
+    def test_merge_incoming_turns_folds_text_only_messages(self):
+        sender = types.SimpleNamespace(id=10)
+        merged = auto_reply.merge_incoming_turns(
+            auto_reply.IncomingTurn(sender, "Добрий день"),
+            auto_reply.IncomingTurn(sender, "а яка зарплата?"),
+        )
+        self.assertEqual(merged.text, "Добрий день\nа яка зарплата?")
+        self.assertIsNone(
+            auto_reply.merge_incoming_turns(
+                auto_reply.IncomingTurn(sender, "анкета"),
+                auto_reply.IncomingTurn(sender, "", has_photo=True),
+            )
+        )
+        self.assertIsNone(
+            auto_reply.merge_incoming_turns(
+                auto_reply.IncomingTurn(sender, "a", generation=0),
+                auto_reply.IncomingTurn(sender, "b", generation=1),
+            )
+        )
 
     def test_v2_question_response_messages_are_separate(self):
         answer, prompt = auto_reply.v2_question_response_messages(
@@ -0,0 +1,52 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from message_cache import PeerMessageCache
+
+
+def _msg(msg_id, text="", out=False, sender_id=10):
+    return SimpleNamespace(id=msg_id, message=text, out=out, sender_id=sender_id)
+
+
+class PeerMessageCacheTests(unittest.TestCase):
+    def test_backfills_once_then_serves_events_from_memory(self):
+        cache = PeerMessageCache(capacity=3)
+        calls = []
+
+        async def fetch(limit):
+            calls.append(limit)
+            for message in [_msg(3, "c"), _msg(2, "b", out=True), _msg(1, "a")]:
+                yield message
+
+        async def scenario():
+            await cache.ensure(10, fetch)
+            cache.record(10, _msg(4, "d"))
+            await cache.ensure(10, fetch)
+            return cache.recent(10, 10)
+
+        recent = asyncio.run(scenario())
+        self.assertEqual(calls, [3])
+        self.assertEqual([m.id for m in recent], [2, 3, 4])
+        self.assertTrue(recent[0].out)
+
+    def test_out_of_order_records_stay_sorted_and_deduplicated(self):
+        cache = PeerMessageCache(capacity=5)
+        cache.record(10, _msg(5, "e"))
+        cache.record(10, _msg(3, "c"))
+        cache.record(10, _msg(5, "e2"))
+        self.assertEqual([(m.id, m.text) for m in cache.recent(10, 5)], [(3, "c"), (5, "e2")])
+        self.assertFalse(cache.is_complete(10))
+
+    def test_least_recent_peer_is_evicted(self):
+        cache = PeerMessageCache(capacity=2, max_peers=2)
+        cache.record(1, _msg(1))
+        cache.record(2, _msg(1))
+        cache.record(1, _msg(2))
+        cache.record(3, _msg(1))
+        self.assertEqual(cache.recent(2, 5), [])
+        self.assertEqual(len(cache.recent(1, 5)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+import unittest
+
+from owner_registry import OwnerRegistry
+
+
+class OwnerRegistryTests(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.dir = tmpdir.name
+        self.path = os.path.join(self.dir, "lead_owner_map.sqlite")
+
+    def _registry(self, **kwargs):
+        registry = OwnerRegistry(self.path, **kwargs)
+        self.addCleanup(registry.close)
+        return registry
+
+    def test_claim_is_compare_and_set_across_processes(self):
+        alt = self._registry()
+        other = self._registry()
+
+        self.assertTrue(alt.try_claim(101, "alt", "group"))
+        self.assertTrue(alt.try_claim(101, "alt", "group"))
+        self.assertFalse(other.try_claim(101, "alt2", "group"))
+        self.assertEqual(other.get_owner(101), "alt")
+
+        self.assertFalse(other.release_owner(101, "alt2"))
+        self.assertTrue(alt.release_owner(101, "alt"))
+        self.assertTrue(other.try_claim(101, "alt2", "group"))
+
+    def test_cache_sees_writes_from_other_connection(self):
+        reader = self._registry()
+        writer = self._registry()
+
+        self.assertIsNone(reader.get_owner(202))
+        writer.set_owner(202, "primary", "incoming")
+        self.assertEqual(reader.get_owner(202), "primary")
+        writer.set_owner(202, "alt", "manual")
+        self.assertEqual(reader.owners_for([202, 303]), {202: "alt", 303: None})
+
+    def test_imports_legacy_json_once(self):
+        legacy_path = os.path.join(self.dir, "lead_owner_map.json")
+        with open(legacy_path, "w", encoding="utf-8") as f:
+            json.dump({"404": {"owner": "primary", "source": "group"}, "bad": {"owner": "x"}}, f)
+
+        registry = self._registry(legacy_json_path=legacy_path)
+        self.assertEqual(registry.get_owner(404), "primary")
+        registry.release_owner(404, "primary")
+
+        reopened = self._registry(legacy_json_path=legacy_path)
+        self.assertIsNone(reopened.get_owner(404))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+
+from peer_actor import PeerActorPool, PeerTurnCancelled
+
+
+class PeerActorPoolTests(unittest.TestCase):
+    def test_messages_posted_mid_turn_are_coalesced_and_serialized(self):
+        handled = []
+
+        async def scenario():
+            gate = asyncio.Event()
+
+            async def handler(peer_id, payload):
+                if callable(payload):
+                    return await payload()
+                handled.append((peer_id, payload))
+                if payload == "first":
+                    await gate.wait()
+                return payload
+
+            pool = PeerActorPool(handler, merge=lambda a, b: f"{a}+{b}")
+            pool.post(1, "first")
+            await asyncio.sleep(0)
+            pool.post(1, "second")
+            pool.post(1, "third")
+            self.assertTrue(pool.busy(1))
+            self.assertEqual(pool.pending(1), 2)
+            gate.set()
+
+            async def send():
+                return "sent"
+
+            result = await pool.call(1, send)
+            await asyncio.sleep(0)
+            return result, pool.stats(), pool.busy(1)
+
+        result, stats, busy = asyncio.run(scenario())
+        self.assertEqual(result, "sent")
+        self.assertEqual(handled, [(1, "first"), (1, "second+third")])
+        self.assertEqual(stats["coalesced"], 1)
+        self.assertEqual(stats["active"], 0)
+        self.assertFalse(busy)
+
+    def test_settle_lets_burst_arrive_before_first_turn(self):
+        handled = []
+
+        async def scenario():
+            async def handler(peer_id, payload):
+                handled.append(payload)
+
+            async def settle(peer_id):
+                await asyncio.sleep(0.01)
+
+            pool = PeerActorPool(handler, merge=lambda a, b: f"{a}+{b}", settle=settle)
+            pool.post(1, "a")
+            pool.post(1, "b")
+            await asyncio.sleep(0)
+            pool.post(1, "c")
+            while pool.busy(1):
+                await asyncio.sleep(0.01)
+
+        asyncio.run(scenario())
+        self.assertEqual(handled, ["a+b+c"])
+
+    def test_call_inside_actor_runs_inline(self):
+        async def scenario():
+
+            async def handler(peer_id, payload):
+                return await payload()
+
+            pool = PeerActorPool(handler)
+
+            async def inner():
+                return "inner"
+
+            async def outer():
+                return await pool.call(5, inner)
+
+            return await pool.call(5, outer)
+
+        self.assertEqual(asyncio.run(scenario()), "inner")
+
+    def test_cancel_drops_queue_and_running_turn(self):
+        async def scenario():
+            started = asyncio.Event()
+
+            async def handler(peer_id, payload):
+                started.set()
+                await asyncio.sleep(10)
+
+            pool = PeerActorPool(handler)
+            running = asyncio.create_task(pool.call(7, "slow"))
+            queued = asyncio.create_task(pool.call(7, "next"))
+            await started.wait()
+            generation = pool.generation(7)
+            pool.cancel(7)
+            results = await asyncio.gather(running, queued, return_exceptions=True)
+            await asyncio.sleep(0)
+            return results, pool.generation(7) - generation, pool.busy(7)
+
+        results, bumped, busy = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(item, PeerTurnCancelled) for item in results))
+        self.assertEqual(bumped, 1)
+        self.assertFalse(busy)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import question_clusters
+from question_clusters import MinHasher, QuestionClusterIndex, shingles, signature_similarity
+
+
+class MinHashTests(unittest.TestCase):
+    def test_signature_is_deterministic_and_tracks_similarity(self):
+        first, second = MinHasher(64), MinHasher(64)
+        self.assertEqual(first.signature("скільки платять"), second.signature("скільки платять"))
+        close = signature_similarity(first.signature("скільки платять"), first.signature("скільки вам платять"))
+        far = signature_similarity(first.signature("скільки платять"), first.signature("чи потрібен ноутбук"))
+        self.assertGreater(close, 0.4)
+        self.assertLess(far, 0.2)
+        self.assertEqual(shingles("ok", 3), {" ok", "ok "})
+        self.assertEqual(shingles("a", 3), {" a "})
+        self.assertEqual(shingles("  ", 3), set())
+
+
+class QuestionClusterIndexTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "clusters.sqlite")
+
+    def test_near_duplicates_share_the_first_question_key(self):
+        index = QuestionClusterIndex(self.path)
+        key = index.assign("скільки платять")
+        self.assertEqual(key, "скільки платять")
+        self.assertEqual(index.assign("а скільки платять за місяць"), key)
+        self.assertEqual(index.assign("скільки  платять"), key)
+        self.assertEqual(index.assign("чи потрібен ноутбук"), "чи потрібен ноутбук")
+        self.assertEqual(index.assign(""), "")
+        self.assertEqual(index.similar("скільки платять у вас", limit=1)[0][0], key)
+        self.assertEqual(index.stats()["clusters"], 2)
+        index.close()
+
+        reopened = QuestionClusterIndex(self.path)
+        self.assertEqual(reopened.assign("а скільки платять за місяць"), key)
+        self.assertEqual(reopened.assign("скільки вам платять"), key)
+        self.assertEqual(reopened.stats()["clusters"], 2)
+
+    def test_clusters_created_by_another_process_are_picked_up_on_a_miss(self):
+        first = QuestionClusterIndex(self.path)
+        second = QuestionClusterIndex(self.path)
+        key = first.assign("скільки платять")
+        self.assertEqual(second.assign("а скільки платять за місяць"), key)
+        self.assertEqual(second.assign("скільки платять"), key)
+        first.assign("чи потрібен ноутбук")
+        self.assertEqual(second.assign("а чи потрібен ноутбук"), "чи потрібен ноутбук")
+        self.assertEqual(second.stats()["clusters"], 2)
+        self.assertEqual(first.stats()["clusters"], 2)
+
+    def test_recluster_rebuilds_from_history_in_order(self):
+        index = QuestionClusterIndex(self.path, key_func=lambda text: text[:5])
+        index.assign("чи потрібен ноутбук")
+        mapping = index.recluster(["коли виплата зарплати", "коли виплата зарплати?", "коли буде виплата зарплати"])
+        self.assertEqual(set(mapping.values()), {"коли "})
+        self.assertEqual(index.stats()["clusters"], 1)
+
+    def test_cli_recluster_prints_mapping(self):
+        questions = os.path.join(os.path.dirname(self.path), "questions.txt")
+        with open(questions, "w", encoding="utf-8") as f:
+            f.write("Скільки платять?\nА скільки платять за місяць?\n")
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(io.StringIO()):
+            question_clusters.main(["--path", self.path, "recluster", "--input", questions])
+        lines = out.getvalue().strip().splitlines()
+        self.assertEqual(lines, ["скільки платять\tскільки платять", "а скільки платять за місяць\tскільки платять"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,7 @@ import importlib
 import os
 import re
 import sys
+import tempfile
 import types
 import unittest
 
@@ -71,6 +72,42 @@ class FakeWorksheet:
         self.values = [list(row) for row in values]
         self.id = 101
         self.title = "April 2026"
+        self.spreadsheet = self
+
+    def batch_update(self, body):
+        for request in body.get("requests", []):
+            if "moveDimension" in request:
+                src = request["moveDimension"]["source"]["startIndex"]
+                dst = request["moveDimension"]["destinationIndex"]
+                for row in self.values:
+                    row.extend([""] * (src + 1 - len(row)))
+                    row.insert(dst, row.pop(src))
+            elif "insertDimension" in request:
+                idx = request["insertDimension"]["range"]["startIndex"]
+                for row in self.values:
+                    row.extend([""] * (idx - len(row)))
+                    row.insert(idx, "")
+            elif "deleteDimension" in request:
+                rng = request["deleteDimension"]["range"]
+                for row in self.values:
+                    del row[rng["startIndex"]:rng["endIndex"]]
+
+    def values_batch_update(self, body):
+        self.batch_updates = getattr(self, "batch_updates", 0) + 1
+        for item in body.get("data", []):
+            match = re.search(r"!([A-Z]+)(\d+):[A-Z]+\d+$", item["range"])
+            col = 0
+            for char in match.group(1):
+                col = col * 26 + (ord(char) - ord("A") + 1)
+            row = self.values[int(match.group(2)) - 1]
+            for offset, value in enumerate(item["values"][0]):
+                row.extend([""] * (col + offset - len(row)))
+                row[col - 1 + offset] = value
+
+    def get(self, range_name):
+        match = re.search(r"A(\d+):[A-Z]+\d+$", range_name)
+        row_idx = int(match.group(1))
+        return [list(self.values[row_idx - 1])] if row_idx <= len(self.values) else []
 
     def row_values(self, idx):
         if idx <= len(self.values):
@@ -78,6 +115,7 @@ class FakeWorksheet:
         return []
 
     def get_all_values(self):
+        self.full_reads = getattr(self, "full_reads", 0) + 1
         return [list(row) for row in self.values]
 
     def clear(self):
@@ -112,7 +150,27 @@ def build_today_row(**overrides):
     return build_row(auto_reply.TODAY_HEADERS, **overrides)
 
 
+class _HeaderSession:
+    def __init__(self, headers):
+        self.headers = list(headers)
+
+    def header_row(self, title):
+        return list(self.headers)
+
+    def remember_header_row(self, title, headers):
+        self.headers = list(headers)
+
+
 class RefusalReasonTrackingTests(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self._orig_lock_dir = auto_reply.HEADER_FIX_LOCK_DIR
+        auto_reply.HEADER_FIX_LOCK_DIR = tmpdir.name
+
+    def tearDown(self):
+        auto_reply.HEADER_FIX_LOCK_DIR = self._orig_lock_dir
+
     def test_today_headers_include_refusal_columns(self):
         self.assertIn("Причина отказа", auto_reply.TODAY_HEADERS)
         self.assertIn("Фраза отказа", auto_reply.TODAY_HEADERS)
@@ -229,6 +287,25 @@ class RefusalReasonTrackingTests(unittest.TestCase):
         phone_idx = ws.values[0].index("Телефон")
         self.assertEqual(ws.values[1][phone_idx], "+380991112233")
 
+    def test_header_fix_plans_from_row_one_not_the_stale_cache(self):
+        old_headers = [h for h in auto_reply.TODAY_HEADERS if h not in {"Причина отказа", "Фраза отказа"}]
+        row = build_today_row(**{"Дата": "2026-04-01", "Имя": "Test", "Телефон": "+380991112233", "Пир": "123"})
+        ws = FakeWorksheet([auto_reply.TODAY_HEADERS, row])
+        ws.batch_update = lambda body: self.fail("columns moved although the sheet was already fixed")
+        writer = auto_reply.SheetWriter.__new__(auto_reply.SheetWriter)
+        writer.session = _HeaderSession(old_headers)
+        writer._invalidate_ws_cache = lambda ws_obj: None
+
+        writer._ensure_today_headers(ws)
+
+        self.assertEqual(ws.values, [auto_reply.TODAY_HEADERS, row])
+        self.assertEqual(writer.session.headers, auto_reply.TODAY_HEADERS)
+
+        session = _HeaderSession(old_headers)
+        self.assertFalse(auto_reply.ensure_worksheet_header_prefix(session, ws, auto_reply.TODAY_HEADERS))
+        self.assertEqual(ws.values, [auto_reply.TODAY_HEADERS, row])
+        self.assertEqual(session.headers, auto_reply.TODAY_HEADERS)
+
     def test_upsert_preserves_existing_refusal_when_new_payload_is_empty(self):
         ws = FakeWorksheet(
             [
@@ -419,6 +496,51 @@ class RefusalReasonTrackingTests(unittest.TestCase):
         self.assertEqual(updated, 1)
         self.assertEqual(ws.values[1][phone_idx], "+380991112233")
 
+    def test_deferred_refreshes_by_peer_patch_cells_in_one_batch(self):
+        ws = FakeWorksheet(
+            [
+                auto_reply.TODAY_HEADERS,
+                build_today_row(**{"Имя": "One", "Пир": "123"}),
+                build_today_row(**{"Имя": "Two", "Пир": "456"}),
+            ]
+        )
+        writer = auto_reply.SheetWriter.__new__(auto_reply.SheetWriter)
+        writer._headers_cache = {}
+        writer._headers_cache_ts = {}
+        writer._headers_cache_ttl_sec = 30
+        writer._row_index_cache = {}
+        writer._row_index_cache_ts = {}
+        writer._row_index_cache_ttl_sec = 30
+        writer._next_row_cache = {}
+        writer._ensure_today_ws = lambda tz: ws
+        writer._find_group_lead_info = lambda peer_id, username, name: {
+            "row_idx": 8,
+            "peer_id": peer_id,
+            "phone": "+380991112233",
+            "age": "19",
+            "pc": "Так",
+            "note": "",
+        }
+        writer._find_registration_info_by_peer = lambda peer_id: {"row_idx": 3, "link": f"reg:{peer_id}"}
+        writer._get_group_leads_ws = lambda: types.SimpleNamespace(id=77)
+        writer._sheet_row_link = lambda ws_obj, row_idx, label: f"link:{ws_obj.id}:{row_idx}:{label}"
+        tz = auto_reply.ZoneInfo("Europe/Kiev")
+
+        self.assertEqual(writer.refresh_today_from_group_lead(tz, {"peer_id": "123"}, defer=True), 1)
+        self.assertEqual(writer.refresh_today_from_registration(tz, {"peer_id": "456"}, defer=True), 1)
+        headers = ws.values[0]
+        self.assertEqual(ws.values[1][headers.index("Возраст")], "")
+        self.assertEqual(ws.full_reads, 1)
+
+        self.assertEqual(writer.flush_refresh_patches(), 6)
+        self.assertEqual(ws.batch_updates, 1)
+        self.assertEqual(ws.values[1][headers.index("Возраст")], "19")
+        self.assertEqual(ws.values[1][headers.index("Ссылка на заявку")], "link:77:8:Открыть заявку")
+        self.assertEqual(ws.values[1][headers.index("Ссылка на Регистрацию")], "reg:123")
+        self.assertEqual(ws.values[2][headers.index("Ссылка на Регистрацию")], "reg:456")
+        self.assertEqual(ws.values[2][headers.index("Возраст")], "")
+        self.assertEqual(writer.flush_refresh_patches(), 0)
+
 
 if __name__ == "__main__":
     unittest.main()
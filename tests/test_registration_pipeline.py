@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from registration_pipeline import DriveUploadIndex, SettlingWorkPool, stream_sha256, telegram_media_key
+
+
+class SettlingWorkPoolTests(unittest.TestCase):
+    def test_resubmit_restarts_settle_delay_and_runs_once(self):
+        handled = []
+
+        async def scenario():
+            async def handler(key):
+                handled.append(key)
+
+            pool = SettlingWorkPool(handler, workers=2, settle_sec=0.05)
+            pool.submit("a")
+            await asyncio.sleep(0.03)
+            pool.submit("a")
+            await asyncio.sleep(0.03)
+            self.assertEqual(handled, [])
+            await asyncio.sleep(0.05)
+            self.assertEqual(handled, ["a"])
+            self.assertEqual(pool.stats()["done"], 1)
+            await pool.close()
+
+        asyncio.run(scenario())
+
+    def test_workers_are_bounded_and_running_key_is_rerun(self):
+        active = []
+        peak = []
+        runs = []
+
+        async def scenario():
+            gate = asyncio.Event()
+            idle_calls = []
+
+            async def handler(key):
+                active.append(key)
+                peak.append(len(active))
+                runs.append(key)
+                if key == 1 and runs.count(1) == 1:
+                    await gate.wait()
+                await asyncio.sleep(0)
+                active.remove(key)
+
+            async def on_idle():
+                idle_calls.append(len(runs))
+
+            pool = SettlingWorkPool(handler, workers=2, settle_sec=0, on_idle=on_idle)
+            for key in (1, 2, 3, 4):
+                pool.submit(key)
+            await asyncio.sleep(0.01)
+            pool.submit(1)
+            self.assertEqual(pool.stats()["running"], 1)
+            gate.set()
+            await asyncio.sleep(0.05)
+            self.assertEqual(sorted(runs), [1, 1, 2, 3, 4])
+            self.assertLessEqual(max(peak), 2)
+            self.assertTrue(idle_calls)
+            stats = pool.stats()
+            self.assertEqual((stats["queued"], stats["running"], stats["done"]), (0, 0, 5))
+            await pool.close()
+
+        asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class DriveUploadIndexTests(unittest.TestCase):
+    def test_lookup_by_any_key_scoped_by_folder_and_persisted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "uploads.sqlite")
+            index = DriveUploadIndex(path)
+            self.assertEqual(index.lookup("folder", "doc:1"), "")
+            index.remember("folder", "https://drive/x", "doc:1", "sha256:abc", "")
+            self.assertEqual(index.lookup("folder", "doc:2", "sha256:abc"), "https://drive/x")
+            self.assertEqual(index.lookup("other", "doc:1"), "")
+            self.assertEqual(index.stats(), {"hits": 1, "misses": 2})
+
+            reopened = DriveUploadIndex(path)
+            self.assertEqual(reopened.lookup("folder", "doc:1"), "https://drive/x")
+
+    def test_media_key_and_stream_hash(self):
+        self.assertEqual(telegram_media_key(SimpleNamespace(document=SimpleNamespace(id=7), photo=None)), "doc:7")
+        self.assertEqual(telegram_media_key(SimpleNamespace(document=None, photo=SimpleNamespace(id=9))), "photo:9")
+        self.assertEqual(telegram_media_key(SimpleNamespace()), "")
+        stream = io.BytesIO(b"passport")
+        stream.seek(0, io.SEEK_END)
+        self.assertEqual(stream_sha256(stream, chunk_size=3), hashlib.sha256(b"passport").hexdigest())
+        self.assertEqual(stream.tell(), 0)
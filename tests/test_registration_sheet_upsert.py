@@ -1,6 +1,7 @@
 import importlib
 import os
 import sys
+import tempfile
 import types
 import unittest
 from zoneinfo import ZoneInfo
@@ -68,6 +69,7 @@ auto_reply = importlib.import_module("auto_reply")
 class _FakeWorksheet:
     def __init__(self, rows=None):
         self.rows = [list(row) for row in (rows or [auto_reply.REGISTRATION_HEADERS[:]])]
+        self.reads = 0
 
     def row_values(self, idx):
         if 1 <= idx <= len(self.rows):
@@ -75,8 +77,13 @@ class _FakeWorksheet:
         return []
 
     def get_all_values(self):
+        self.reads += 1
         return [list(row) for row in self.rows]
 
+    def get(self, range_name):
+        row_idx = int(range_name.split(":")[0][1:])
+        return [list(self.rows[row_idx - 1])] if row_idx <= len(self.rows) else []
+
     def update(self, range_name=None, values=None, value_input_option=None):
         start_row = int(range_name.split(":")[0][1:])
         row = list(values[0])
@@ -89,7 +96,9 @@ class RegistrationSheetUpsertTests(unittest.TestCase):
     def setUp(self):
         self.sheet = auto_reply.RegistrationSheet.__new__(auto_reply.RegistrationSheet)
         self.sheet.ws = _FakeWorksheet()
-        self.sheet.lock_path = "/tmp/test-registration.lock"
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.sheet.lock_path = os.path.join(tmpdir.name, "registration.lock")
         self.sheet._ensure_headers_exact = lambda: None
         self.sheet._find_sheet_row_link_by_peer = lambda sheet_title, peer_id, label: ""
         self.sheet._find_group_lead_note = lambda peer_id: ""
@@ -162,6 +171,106 @@ class RegistrationSheetUpsertTests(unittest.TestCase):
         self.assertEqual(rows[1][0], "One")
         self.assertEqual(rows[2][0], "Two")
 
+    def test_consecutive_upserts_reuse_the_row_index(self):
+        self.sheet.upsert(self.tz, {"full_name": "One", "source_message_id": "10", "peer_id": "5"})
+        self.sheet.upsert(self.tz, {"full_name": "Two", "source_message_id": "11"})
+        self.sheet.upsert(self.tz, {"full_name": "One again", "peer_id": "5"})
+        self.assertEqual(self.sheet.ws.reads, 1)
+
+        rows = self.sheet.ws.get_all_values()
+        self.assertEqual([row[0] for row in rows[1:]], ["One again", "Two"])
+
+    def test_write_by_another_process_forces_reload(self):
+        self.sheet.upsert(self.tz, {"full_name": "One", "source_message_id": "10"})
+        other_row = [""] * len(auto_reply.REGISTRATION_HEADERS)
+        other_row[0] = "Other"
+        other_row[auto_reply.REGISTRATION_HEADERS.index("ID сообщения")] = "12"
+        self.sheet.ws.rows.append(other_row)
+        auto_reply.WriteGeneration(self.sheet.lock_path + ".gen").bump()
+
+        self.sheet.upsert(self.tz, {"full_name": "Other updated", "source_message_id": "12"})
+
+        rows = self.sheet.ws.get_all_values()
+        self.assertEqual(self.sheet.ws.reads, 3)
+        self.assertEqual([row[0] for row in rows[1:]], ["One", "Other updated"])
+
+    def test_row_moved_in_the_sheet_is_found_again(self):
+        self.sheet.upsert(self.tz, {"full_name": "One", "source_message_id": "10", "note": "keep"})
+        blank = [""] * len(auto_reply.REGISTRATION_HEADERS)
+        self.sheet.ws.rows.insert(1, blank)
+
+        self.sheet.upsert(self.tz, {"full_name": "One updated", "source_message_id": "10"})
+
+        rows = self.sheet.ws.get_all_values()
+        self.assertEqual(self.sheet.ws.reads, 3)
+        self.assertEqual(rows[1], blank)
+        self.assertEqual(rows[2][0], "One updated")
+        self.assertEqual(len(rows), 3)
+
+
+class _FakeDriveService:
+    def __init__(self):
+        self.reject = set()
+        self.fail_batches = 0
+        self.granted = []
+
+    def permissions(self):
+        return types.SimpleNamespace(create=lambda fileId, body, supportsAllDrives: fileId)
+
+    def new_batch_http_request(self, callback):
+        service = self
+        requests = []
+
+        class _Batch:
+            def add(self, request, request_id):
+                requests.append(request_id)
+
+            def execute(self):
+                if service.fail_batches:
+                    service.fail_batches -= 1
+                    raise OSError("connection reset")
+                for file_id in requests:
+                    if file_id in service.reject:
+                        callback(file_id, None, RuntimeError("403"))
+                    else:
+                        service.granted.append(file_id)
+                        callback(file_id, {}, None)
+
+        return _Batch()
+
+
+class DrivePermissionQueueTests(unittest.TestCase):
+    def setUp(self):
+        self.drive = auto_reply.GoogleDriveUploader("/tmp/creds.json", "folder", permission_attempts=2)
+        self.service = _FakeDriveService()
+        self.drive._service = self.service
+
+    def test_failed_batch_keeps_ids_for_the_next_flush(self):
+        self.drive._queue_permissions({"a": 0, "b": 0})
+        self.service.fail_batches = 1
+        with self.assertRaises(OSError):
+            self.drive.flush_permissions()
+        self.assertEqual(self.drive.pending_permissions(), 2)
+        self.assertEqual(self.drive.flush_permissions(), 2)
+        self.assertEqual(sorted(self.service.granted), ["a", "b"])
+        self.assertEqual(self.drive.pending_permissions(), 0)
+
+    def test_rejected_grant_is_retried_then_dropped(self):
+        self.drive._queue_permissions({"a": 0, "bad": 0})
+        self.service.reject.add("bad")
+        self.assertEqual(self.drive.flush_permissions(), 1)
+        self.assertEqual(self.drive.pending_permissions(), 1)
+        self.assertEqual(self.drive.flush_permissions(), 0)
+        self.assertEqual(self.drive.pending_permissions(), 0)
+
+    def test_due_by_size_or_age(self):
+        self.assertFalse(self.drive.permissions_due(2, 60))
+        self.drive._queue_permissions({"a": 0})
+        self.assertFalse(self.drive.permissions_due(2, 60))
+        self.assertTrue(self.drive.permissions_due(2, 0))
+        self.drive._queue_permissions({"b": 0})
+        self.assertTrue(self.drive.permissions_due(2, 60))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,50 @@
+import asyncio
+import time
+import unittest
+
+from reply_coalescer import AdaptiveCoalescer
+
+
+class AdaptiveCoalescerTests(unittest.TestCase):
+    def test_window_follows_peer_inter_arrival_gaps(self):
+        now = [100.0]
+        coalescer = AdaptiveCoalescer(min_wait=0.5, max_hold=10, gap_factor=1.5, clock=lambda: now[0])
+        coalescer.note_message(1)
+        self.assertEqual(coalescer.window(1, max_window=3.0), 0.5)
+        now[0] += 1.0
+        coalescer.note_message(1)
+        self.assertAlmostEqual(coalescer.window(1, max_window=3.0), 1.5)
+        self.assertAlmostEqual(coalescer.window(1, max_window=1.0), 1.0)
+        now[0] += 60.0
+        coalescer.note_message(1)
+        self.assertAlmostEqual(coalescer.window(1, max_window=3.0), 1.5)
+
+    def test_typing_holds_burst_and_cancel_flushes_early(self):
+        coalescer = AdaptiveCoalescer(min_wait=0.05, max_hold=5, typing_ttl=5)
+
+        async def scenario():
+            coalescer.note_message(7)
+            coalescer.note_typing(7, True)
+            started = time.monotonic()
+            waiter = asyncio.create_task(coalescer.wait(7, max_window=0.05))
+            await asyncio.sleep(0.2)
+            self.assertFalse(waiter.done())
+            coalescer.note_typing(7, False)
+            await waiter
+            return time.monotonic() - started
+
+        elapsed = asyncio.run(scenario())
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(coalescer.early_flushes, 1)
+
+    def test_batch_size_distribution(self):
+        coalescer = AdaptiveCoalescer()
+        for size in (1, 1, 3):
+            coalescer.record_batch(size)
+        stats = coalescer.stats()
+        self.assertEqual(stats["batches"], 3)
+        self.assertEqual(stats["batch_sizes"], {"1": 2, "3": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
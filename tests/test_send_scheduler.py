@@ -0,0 +1,132 @@
+import asyncio
+import unittest
+
+from content_dispatcher import DispatchProgress, dispatch_content
+from send_scheduler import PRIORITY_FOLLOWUP, PRIORITY_LIVE, OutboundScheduler, flood_wait_seconds
+
+
+class FloodWaitError(Exception):
+    def __init__(self, seconds):
+        super().__init__(f"wait {seconds}")
+        self.seconds = seconds
+
+
+class OutboundSchedulerTests(unittest.TestCase):
+    def test_live_replies_go_before_followups_and_peer_order_is_kept(self):
+        sent = []
+
+        async def scenario():
+            scheduler = OutboundScheduler(rate_per_sec=1000, burst=1, workers=1)
+            gate = asyncio.Event()
+
+            async def blocker():
+                await gate.wait()
+                sent.append("blocker")
+
+            def send(label):
+                async def _send():
+                    sent.append(label)
+                    return label
+                return _send
+
+            first = asyncio.create_task(scheduler.submit(1, blocker))
+            await asyncio.sleep(0)
+            tasks = [
+                asyncio.create_task(scheduler.submit(2, send("followup-2"), priority=PRIORITY_FOLLOWUP)),
+                asyncio.create_task(scheduler.submit(3, send("live-3a"), priority=PRIORITY_LIVE)),
+                asyncio.create_task(scheduler.submit(3, send("live-3b"), priority=PRIORITY_LIVE)),
+            ]
+            await asyncio.sleep(0)
+            gate.set()
+            await asyncio.gather(first, *tasks)
+            stats = scheduler.stats()
+            await scheduler.close()
+            return stats
+
+        stats = asyncio.run(scenario())
+        self.assertEqual(sent, ["blocker", "live-3a", "live-3b", "followup-2"])
+        self.assertEqual(stats["sent"], 4)
+        self.assertEqual(stats["queue_depth"], 0)
+
+    def test_flood_wait_pauses_lane_and_retries_same_send(self):
+        attempts = []
+
+        async def scenario():
+            scheduler = OutboundScheduler(rate_per_sec=1000, burst=5, workers=2)
+
+            async def flaky():
+                attempts.append("flaky")
+                if len(attempts) == 1:
+                    raise FloodWaitError(0)
+                return "ok"
+
+            result = await scheduler.submit(1, flaky)
+            stats = scheduler.stats()
+            await scheduler.close()
+            return result, stats
+
+        result, stats = asyncio.run(scenario())
+        self.assertEqual(result, "ok")
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(stats["flood_waits"], 1)
+        self.assertEqual(stats["failed"], 0)
+
+    def test_other_errors_are_raised_to_caller(self):
+        async def scenario():
+            scheduler = OutboundScheduler(rate_per_sec=1000)
+
+            async def broken():
+                raise ValueError("bad peer")
+
+            try:
+                await scheduler.submit(1, broken)
+            finally:
+                await scheduler.close()
+
+        with self.assertRaises(ValueError):
+            asyncio.run(scenario())
+        self.assertIsNone(flood_wait_seconds(ValueError("x")))
+        self.assertEqual(flood_wait_seconds(FloodWaitError(7)), 7.0)
+
+
+class DispatchContentRetryTests(unittest.TestCase):
+    def test_flood_wait_retry_resumes_without_forwarding_twice(self):
+        class Client:
+            def __init__(self):
+                self.calls = []
+                self.flood_on = {"get_messages"}
+
+            async def get_entity(self, peer):
+                self.calls.append("get_entity")
+                return peer
+
+            async def get_messages(self, source, ids):
+                self.calls.append("get_messages")
+                if "get_messages" in self.flood_on:
+                    self.flood_on.discard("get_messages")
+                    raise FloodWaitError(0)
+                return type("Msg", (), {"id": ids, "message": "hello"})()
+
+            async def forward_messages(self, entity, msg, drop_author=True):
+                self.calls.append("forward")
+                return type("Sent", (), {"id": 77})()
+
+        client = Client()
+
+        async def scenario():
+            scheduler = OutboundScheduler(rate_per_sec=1000, burst=5, workers=1)
+            progress = DispatchProgress()
+            result = await scheduler.submit(1, lambda: dispatch_content(client, 1, "https://t.me/source/5", progress))
+            again = await dispatch_content(client, 1, "https://t.me/source/5", progress)
+            await scheduler.close()
+            return result, again
+
+        result, again = asyncio.run(scenario())
+        self.assertTrue(result.ok)
+        self.assertEqual(result.message_ids, [77])
+        self.assertIs(again, result)
+        self.assertEqual(client.calls, ["get_entity", "get_messages", "get_messages", "forward"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from sheet_index import CellPatchBuffer, PeerRowCache, SheetRowIndex, WriteGeneration
+
+
+KEYS = {
+    "peer": (("пир",), lambda value: str(value or "").strip()),
+    "tg": (("telegram",), lambda value: str(value or "").strip().lstrip("@").lower()),
+}
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SheetRowIndexTests(unittest.TestCase):
+    def test_lookup_put_and_blank_rows(self):
+        index = SheetRowIndex(KEYS, width=3)
+        index.load(
+            [
+                ["Имя", "Telegram", "Пир"],
+                ["A", "@Alice", "1"],
+                ["", "", ""],
+                ["B", "@bob", "2"],
+                ["C", "alice", ""],
+            ],
+            generation=1,
+        )
+        self.assertEqual(index.rows_for("tg", "@ALICE"), [2, 5])
+        self.assertEqual(index.rows_for("peer", "2"), [4])
+        self.assertEqual(index.rows_for("peer", ""), [])
+        self.assertEqual(index.first_blank_row(), 3)
+        self.assertEqual(index.next_row(), 6)
+
+        index.put(3, ["D", "@dan", "3"], generation=2)
+        index.put(4, ["B", "@bob", "20"], generation=2)
+        self.assertEqual(index.rows_for("peer", "3"), [3])
+        self.assertEqual(index.rows_for("peer", "2"), [])
+        self.assertEqual(index.rows_for("peer", "20"), [4])
+        self.assertEqual(index.first_blank_row(), 6)
+        index.put(6, ["E", "", "6"], generation=3)
+        self.assertEqual(index.next_row(), 7)
+        self.assertTrue(index.fresh(3))
+
+    def test_confirm_checks_the_re_read_row(self):
+        index = SheetRowIndex(KEYS, width=3)
+        index.load([["Имя", "Telegram", "Пир"], ["A", "@alice", "1"]], generation=1)
+        self.assertTrue(index.confirm(2, ["A2", "@alice", "1"], {"peer": "1"}))
+        self.assertEqual(index.row(2), ["A2", "@alice", "1"])
+        self.assertFalse(index.confirm(2, ["B", "@bob", "2"], {"peer": "1", "tg": "@alice"}))
+        self.assertEqual(index.rows_for("peer", "2"), [2])
+        self.assertTrue(index.confirm(3, [], {}))
+        self.assertFalse(index.confirm(3, ["C", "", ""], {}))
+
+    def test_fresh_follows_generation_and_age(self):
+        clock = _Clock()
+        index = SheetRowIndex(KEYS, width=3, max_age_sec=10, clock=clock)
+        self.assertFalse(index.fresh(0))
+        index.load([["Пир"]], generation=4)
+        self.assertTrue(index.fresh(4))
+        self.assertFalse(index.fresh(5))
+        clock.now = 11
+        self.assertFalse(index.fresh(4))
+        index.load([["Пир"]], generation=None)
+        self.assertFalse(index.fresh(0))
+
+
+class WriteGenerationTests(unittest.TestCase):
+    def test_bump_is_shared_through_the_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "sheet.lock.gen")
+            first, second = WriteGeneration(path), WriteGeneration(path)
+            self.assertEqual(first.read(), 0)
+            self.assertEqual(first.bump(), 1)
+            self.assertEqual(second.read(), 1)
+
+    def test_concurrent_bumps_are_not_lost(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "sheet.lock.gen")
+
+            def bump_many():
+                generation = WriteGeneration(path)
+                for _ in range(25):
+                    generation.bump()
+
+            threads = [threading.Thread(target=bump_many) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(WriteGeneration(path).read(), 100)
+
+
+class PeerRowCacheTests(unittest.TestCase):
+    def test_reloads_only_when_stale(self):
+        opened = []
+
+        class _Ws:
+            def get_all_values(self):
+                return [["Имя", "Пир"], ["A", "7"]]
+
+        def open_worksheet(title):
+            opened.append(title)
+            return _Ws()
+
+        cache = PeerRowCache(max_age_sec=60)
+        ws, row_idx, _ = cache.lookup("Март", open_worksheet, "7")
+        self.assertEqual(row_idx, 2)
+        self.assertEqual(cache.lookup("Март", open_worksheet, "8")[1], None)
+        self.assertEqual(opened, ["Март"])
+        cache.lookup("Март", open_worksheet, "7", generation=1)
+        self.assertEqual(opened, ["Март", "Март"])
+
+
+class CellPatchBufferTests(unittest.TestCase):
+    def test_merges_adjacent_cells_and_keeps_last_value(self):
+        sent = []
+        ws = type("Ws", (), {"id": 1, "title": "Апрель 2026", "spreadsheet": None})()
+        ws.spreadsheet = type("Sh", (), {"values_batch_update": lambda self, body: sent.append(body)})()
+        patches = CellPatchBuffer()
+        patches.add(ws, 5, 2, "old")
+        patches.add(ws, 5, 3, "d")
+        patches.add(ws, 5, 2, "c")
+        patches.add(ws, 5, 7, "h")
+        patches.add(ws, 2, 0, "a")
+        self.assertEqual(patches.flush(), 4)
+        self.assertEqual(
+            sent[0]["data"],
+            [
+                {"range": "'Апрель 2026'!A2:A2", "values": [["a"]]},
+                {"range": "'Апрель 2026'!C5:D5", "values": [["c", "d"]]},
+                {"range": "'Апрель 2026'!H5:H5", "values": [["h"]]},
+            ],
+        )
+        self.assertEqual(len(patches), 0)
+
+    def test_failed_flush_keeps_patches_until_max_attempts(self):
+        ws = type("Ws", (), {"id": 1, "title": "S"})()
+
+        def fail(body):
+            raise RuntimeError("quota")
+
+        ws.spreadsheet = type("Sh", (), {"values_batch_update": lambda self, body: fail(body)})()
+        patches = CellPatchBuffer(max_attempts=2)
+        patches.add(ws, 2, 0, "a")
+        with self.assertRaises(RuntimeError):
+            patches.flush()
+        self.assertEqual(len(patches), 1)
+        with self.assertRaises(RuntimeError):
+            patches.flush()
+        self.assertEqual(len(patches), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
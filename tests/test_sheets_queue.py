@@ -1,9 +1,11 @@
+import json
 import os
 import tempfile
 import threading
+import time
 import unittest
 
-from sheets_queue import SheetsQueueStore, calculate_backoff_sec
+from sheets_queue import SheetsQueueStore, calculate_backoff_sec, is_poison_error, is_transient_error
 
 
 class SheetsQueueTests(unittest.TestCase):
@@ -65,6 +67,118 @@ class SheetsQueueTests(unittest.TestCase):
         self.assertGreaterEqual(hard, 300.0 - 1.0)
         self.assertLessEqual(hard, 300.0)
 
+    def test_coalesce_merges_pending_event(self):
+        first_id = self.store.enqueue("today_upsert", {"peer_id": 7, "name": "A", "status": "new"}, coalesce_key="7")
+        second_id = self.store.enqueue("today_upsert", {"peer_id": 7, "status": "done", "shift": None}, coalesce_key="7")
+        self.assertEqual(first_id, second_id)
+        batch = self.store.fetch_batch(limit=10)
+        self.assertEqual(len(batch), 1)
+        self.assertEqual(batch[0].payload, {"peer_id": 7, "name": "A", "status": "done"})
+        self.assertEqual(batch[0].revision, 1)
+
+    def test_debounced_enqueues_inside_the_window_give_one_write(self):
+        first_id = self.store.enqueue("today_upsert", {"peer_id": 6, "status": "a"}, coalesce_key="6", delay_sec=3.0)
+        now = time.time()
+        self.assertEqual(self.store.fetch_batch(10, now), [])
+        second_id = self.store.enqueue(
+            "today_upsert", {"peer_id": 6, "name": "B"}, coalesce_key="6", delay_sec=3.0
+        )
+        self.assertEqual(first_id, second_id)
+        self.assertEqual(self.store.fetch_batch(10, now + 1.0), [])
+        batch = self.store.fetch_batch(10, now + 3.0)
+        self.assertEqual([event.id for event in batch], [first_id])
+        self.assertEqual(batch[0].payload, {"peer_id": 6, "status": "a", "name": "B"})
+
+    def test_coalesce_skips_attempted_event(self):
+        first_id = self.store.enqueue("today_upsert", {"peer_id": 8, "status": "a"}, coalesce_key="8")
+        self.store.mark_retry(first_id, attempts=1, backoff_sec=0, error="429")
+        second_id = self.store.enqueue("today_upsert", {"peer_id": 8, "status": "b"}, coalesce_key="8")
+        self.assertNotEqual(first_id, second_id)
+        self.assertEqual(self.store.stats()["pending"], 2)
+
+    def test_mark_done_keeps_event_merged_in_flight(self):
+        event_id = self.store.enqueue("today_upsert", {"peer_id": 9, "status": "a"}, coalesce_key="9")
+        in_flight = self.store.fetch_batch(limit=10)[0]
+        self.store.enqueue("today_upsert", {"peer_id": 9, "status": "b"}, coalesce_key="9")
+        self.assertFalse(self.store.mark_done(event_id, in_flight.revision))
+        again = self.store.fetch_batch(limit=10)
+        self.assertEqual(len(again), 1)
+        self.assertEqual(again[0].payload["status"], "b")
+        self.assertTrue(self.store.mark_done(event_id, again[0].revision))
+        self.assertEqual(self.store.fetch_batch(limit=10), [])
+
+    def test_coalesce_survives_reopen(self):
+        self.store.enqueue("today_upsert", {"peer_id": 10, "status": "a"}, coalesce_key="10")
+        reopened = SheetsQueueStore(self.db_path)
+        reopened.enqueue("today_upsert", {"peer_id": 10, "name": "B"}, coalesce_key="10")
+        batch = reopened.fetch_batch(limit=10)
+        self.assertEqual(len(batch), 1)
+        self.assertEqual(batch[0].payload, {"peer_id": 10, "status": "a", "name": "B"})
+
+    def test_dead_letter_roundtrip(self):
+        event_id = self.store.enqueue("unknown_type", {"peer_id": 11})
+        self.assertTrue(self.store.mark_dead(event_id, attempts=1, error="ValueError: Unknown sheet event type"))
+        self.assertEqual(self.store.fetch_batch(limit=10), [])
+        stats = self.store.stats()
+        self.assertEqual(stats["pending"], 0)
+        self.assertEqual(stats["dead_letters"], 1)
+        dead = self.store.list_dead()
+        self.assertEqual([item.id for item in dead], [event_id])
+        self.assertIn("Unknown", dead[0].last_error)
+
+        self.assertEqual(self.store.replay_dead([event_id]), 1)
+        batch = self.store.fetch_batch(limit=10)
+        self.assertEqual([item.id for item in batch], [event_id])
+        self.assertEqual(batch[0].attempts, 0)
+        self.assertEqual(self.store.stats()["dead_letters"], 0)
+
+    def test_replay_queues_behind_newer_events(self):
+        old_id = self.store.enqueue("today_upsert", {"peer_id": 14, "status": "old"})
+        self.store.mark_dead(old_id, attempts=12, error="500")
+        time.sleep(0.01)
+        new_id = self.store.enqueue("today_upsert", {"peer_id": 14, "status": "new"})
+        self.store.replay_dead([old_id])
+        batch = self.store.fetch_batch(limit=10)
+        self.assertEqual([item.id for item in batch], [new_id, old_id])
+
+    def test_mark_retry_keeps_failures_unless_given(self):
+        event_id = self.store.enqueue("today_upsert", {"peer_id": 15})
+        self.store.mark_retry(event_id, attempts=1, backoff_sec=0, error="ValueError", failures=1)
+        self.store.mark_retry(event_id, attempts=2, backoff_sec=0, error="APIError 429")
+        event = self.store.fetch_batch(limit=10)[0]
+        self.assertEqual((event.attempts, event.failures), (2, 1))
+
+    def test_error_classification(self):
+        try:
+            json.loads('{"values": [')
+        except ValueError as err:
+            truncated = err
+        self.assertTrue(is_transient_error(RuntimeError("quota"), 429))
+        self.assertTrue(is_transient_error(RuntimeError("backend"), 503))
+        self.assertFalse(is_transient_error(RuntimeError("bad range"), 400))
+        self.assertTrue(is_transient_error(ConnectionResetError()))
+        self.assertTrue(is_poison_error(ValueError("Unknown sheet event type: x")))
+        self.assertTrue(is_poison_error(KeyError("peer_id")))
+        self.assertFalse(is_poison_error(truncated))
+        self.assertFalse(is_poison_error(ConnectionResetError()))
+
+    def test_purge_dead(self):
+        first = self.store.enqueue("today_upsert", {"peer_id": 12})
+        second = self.store.enqueue("today_upsert", {"peer_id": 13})
+        self.store.mark_dead(first, attempts=12, error="500")
+        self.store.mark_dead(second, attempts=12, error="500")
+        self.assertEqual(self.store.purge_dead(older_than_sec=3600), 0)
+        self.assertEqual(self.store.purge_dead([first]), 1)
+        self.assertEqual(self.store.purge_dead(), 1)
+        self.assertEqual(self.store.list_dead(), [])
+
+    def test_compact_runs_when_pages_are_free(self):
+        ids = [self.store.enqueue("today_upsert", {"peer_id": i, "blob": "x" * 2000}) for i in range(200)]
+        for event_id in ids:
+            self.store.mark_done(event_id)
+        self.assertTrue(self.store.compact())
+        self.assertFalse(self.store.compact(min_interval_sec=3600))
+
     def test_concurrent_enqueue(self):
         total_threads = 5
         per_thread = 50
@@ -0,0 +1,118 @@
+import unittest
+
+from sheets_session import SpreadsheetSession, plan_header_column_moves
+
+
+class _FakeWorksheet:
+    def __init__(self, title):
+        self.title = title
+
+
+class _FakeSpreadsheet:
+    def __init__(self, titles):
+        self.items = [_FakeWorksheet(title) for title in titles]
+        self.metadata_calls = 0
+        self.batch_get_calls = []
+
+    def values_batch_get(self, ranges):
+        self.batch_get_calls.append(list(ranges))
+        return {"valueRanges": [{"range": rng, "values": [[" A ", "B"]]} for rng in ranges]}
+
+    def worksheets(self):
+        self.metadata_calls += 1
+        return list(self.items)
+
+    def add_worksheet(self, title, rows, cols):
+        ws = _FakeWorksheet(title)
+        self.items.append(ws)
+        return ws
+
+    def del_worksheet(self, ws):
+        self.items = [item for item in self.items if item is not ws]
+
+
+class _FakeClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+        self.open_calls = 0
+
+    def open(self, name):
+        self.open_calls += 1
+        return self.spreadsheet
+
+
+class SpreadsheetSessionTests(unittest.TestCase):
+    def setUp(self):
+        self.spreadsheet = _FakeSpreadsheet(["GroupLeads", "Регистрация"])
+        self.factory_calls = 0
+
+        def factory():
+            self.factory_calls += 1
+            self.client = _FakeClient(self.spreadsheet)
+            return self.client
+
+        self.session = SpreadsheetSession(factory, "test-sheet")
+
+    def test_one_metadata_fetch_serves_every_lookup(self):
+        self.session.get_or_create_worksheet("GroupLeads", rows=10, cols=2)
+        self.session.get_or_create_worksheet("Регистрация", rows=10, cols=2)
+        self.session.worksheet("GroupLeads")
+        self.assertEqual(self.factory_calls, 1)
+        self.assertEqual(self.client.open_calls, 1)
+        self.assertEqual(self.spreadsheet.metadata_calls, 1)
+
+    def test_create_missing_worksheet_is_cached(self):
+        ws = self.session.get_or_create_worksheet("FAQ_Questions", rows=10, cols=2)
+        self.assertEqual(ws.title, "FAQ_Questions")
+        self.assertIs(self.session.worksheet("FAQ_Questions"), ws)
+        self.assertEqual(self.spreadsheet.metadata_calls, 1)
+
+    def test_miss_refreshes_metadata_once(self):
+        self.session.worksheets()
+        self.spreadsheet.items.append(_FakeWorksheet("Апрель 2026"))
+        self.assertIsNotNone(self.session.find_worksheet("Апрель 2026"))
+        self.assertEqual(self.spreadsheet.metadata_calls, 2)
+        with self.assertRaises(KeyError):
+            self.session.worksheet("missing")
+
+    def test_delete_drops_cached_handle(self):
+        ws = self.session.worksheet("GroupLeads")
+        self.session.delete_worksheet(ws)
+        self.assertNotIn("GroupLeads", [item.title for item in self.session.worksheets()])
+
+    def test_prefetch_headers_uses_one_batch_get_for_existing_sheets(self):
+        headers = self.session.prefetch_headers(["GroupLeads", "Регистрация", "missing"])
+        self.assertEqual(self.spreadsheet.batch_get_calls, [["'GroupLeads'!1:1", "'Регистрация'!1:1"]])
+        self.assertEqual(headers["GroupLeads"], ["A", "B"])
+        self.assertEqual(self.session.header_row("Регистрация"), ["A", "B"])
+        self.assertIsNone(self.session.header_row("missing"))
+        self.session.get_or_create_worksheet("FAQ_Questions", rows=10, cols=2)
+        self.assertEqual(self.session.header_row("FAQ_Questions"), [])
+
+
+class HeaderColumnPlanTests(unittest.TestCase):
+    @staticmethod
+    def _apply(columns, steps):
+        columns = list(columns)
+        for kind, first, second in steps:
+            if kind == "move":
+                columns.insert(second, columns.pop(first))
+            elif kind == "insert":
+                columns.insert(first, "")
+            elif kind == "delete":
+                del columns[first:second]
+        return columns
+
+    def test_matching_headers_need_no_steps(self):
+        self.assertEqual(plan_header_column_moves(["a", "b"], ["a", "b"]), [])
+
+    def test_moves_inserts_and_drops_extra_columns(self):
+        current = ["b", "legacy", "a", "d"]
+        target = ["a", "b", "c", "d"]
+        steps = plan_header_column_moves(current, target, drop_extra=True)
+        self.assertEqual(self._apply(current, steps), ["a", "b", "", "d"])
+        self.assertNotIn("delete", [kind for kind, _, _ in plan_header_column_moves(current, target)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+
+from speculative_answers import SpeculativeAnswers
+
+
+class SpeculativeAnswersTests(unittest.TestCase):
+    def test_new_message_restarts_draft_for_whole_burst(self):
+        calls = []
+
+        async def scenario():
+            drafts = SpeculativeAnswers()
+
+            def factory(text):
+                async def _run():
+                    calls.append(text)
+                    await asyncio.sleep(0.01)
+                    return f"answer:{text}"
+                return _run
+
+            first = drafts.extend(1, "Добрий день")
+            drafts.start(1, "step", first, factory(first))
+            await asyncio.sleep(0)
+            burst = drafts.extend(1, "скільки платять?")
+            drafts.start(1, "step", burst, factory(burst))
+            answer = await drafts.take(1, "step", "Добрий день\nскільки платять?")
+            return answer, drafts.stats()
+
+        answer, stats = asyncio.run(scenario())
+        self.assertEqual(answer, "answer:Добрий день\nскільки платять?")
+        self.assertEqual(stats["restarted"], 1)
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_mismatched_turn_does_not_use_draft(self):
+        async def scenario():
+            drafts = SpeculativeAnswers()
+
+            async def slow():
+                await asyncio.sleep(10)
+
+            drafts.start(1, "step_a", "як оформитись?", slow)
+            missed = await drafts.take(1, "step_b", "як оформитись?")
+            drafts.discard(1, "як оформитись?")
+            return missed, drafts.stats()
+
+        missed, stats = asyncio.run(scenario())
+        self.assertIsNone(missed)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["in_flight"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
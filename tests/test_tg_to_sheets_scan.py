@@ -0,0 +1,142 @@
+import asyncio
+import sys
+import types
+import unittest
+from types import SimpleNamespace
+
+dotenv_mod = types.ModuleType("dotenv")
+dotenv_mod.load_dotenv = lambda *args, **kwargs: None
+sys.modules.setdefault("dotenv", dotenv_mod)
+
+telethon_mod = types.ModuleType("telethon")
+telethon_mod.TelegramClient = object
+telethon_mod.events = types.SimpleNamespace(NewMessage=object)
+sys.modules.setdefault("telethon", telethon_mod)
+telethon_tl_mod = types.ModuleType("telethon.tl")
+telethon_tl_mod.functions = types.SimpleNamespace()
+sys.modules.setdefault("telethon.tl", telethon_tl_mod)
+telethon_tl_types_mod = types.ModuleType("telethon.tl.types")
+telethon_tl_types_mod.User = type("User", (), {})
+sys.modules.setdefault("telethon.tl.types", telethon_tl_types_mod)
+gspread_mod = types.ModuleType("gspread")
+gspread_mod.authorize = lambda *args, **kwargs: None
+sys.modules.setdefault("gspread", gspread_mod)
+gspread_exceptions_mod = types.ModuleType("gspread.exceptions")
+gspread_exceptions_mod.APIError = type("APIError", (Exception,), {})
+gspread_exceptions_mod.WorksheetNotFound = type("WorksheetNotFound", (Exception,), {})
+sys.modules.setdefault("gspread.exceptions", gspread_exceptions_mod)
+sys.modules.setdefault("google", types.ModuleType("google"))
+sys.modules.setdefault("google.oauth2", types.ModuleType("google.oauth2"))
+google_service_account_mod = types.ModuleType("google.oauth2.service_account")
+
+
+class _Credentials:
+    @classmethod
+    def from_service_account_file(cls, *args, **kwargs):
+        return cls()
+
+    def with_scopes(self, *args, **kwargs):
+        return self
+
+
+google_service_account_mod.Credentials = _Credentials
+sys.modules.setdefault("google.oauth2.service_account", google_service_account_mod)
+
+import tg_to_sheets  # noqa: E402
+from tg_to_sheets import PeerScanState, absorb_own_exclusions, load_exclusions_cached, scan_peer  # noqa: E402
+
+
+def m(msg_id, text, out):
+    return SimpleNamespace(id=msg_id, message=text, out=out)
+
+
+class FakeClient:
+    def __init__(self, messages):
+        self.messages = messages
+        self.calls = []
+
+    def iter_messages(self, entity, limit=None, min_id=0):
+        self.calls.append(min_id)
+        picked = [x for x in sorted(self.messages, key=lambda x: -x.id) if x.id > min_id][:limit]
+
+        async def gen():
+            for x in picked:
+                yield x
+
+        return gen()
+
+
+class PeerScanTests(unittest.TestCase):
+    def test_incremental_scan_matches_full_rebuild(self):
+        history = [
+            m(1, tg_to_sheets.CONTACT_TEXT, True),
+            m(2, "Привіт", False),
+            m(3, None, False),
+            m(4, tg_to_sheets.SHIFTS_TEXT, True),
+        ]
+        client = FakeClient(history)
+        state = asyncio.run(scan_peer(client, None, None, 4))
+        self.assertEqual((state.last_id, state.last_in, state.consecutive_out), (4, "Привіт", 1))
+
+        self.assertIs(asyncio.run(scan_peer(client, None, state, 4)), state)
+        self.assertEqual(client.calls, [0])
+
+        history += [m(5, "Ок", False), m(6, tg_to_sheets.FORMAT_TEXT, True), m(7, "ще", True)]
+        incremental = asyncio.run(scan_peer(client, None, PeerScanState.from_dict(vars(state).copy()), 7))
+        full = asyncio.run(scan_peer(FakeClient(history), None, None, 7))
+        self.assertEqual(client.calls, [0, 4])
+        self.assertEqual(incremental, full)
+        self.assertEqual((full.last_in, full.consecutive_out, full.last_msg_from_me), ("Ок", 2, True))
+        self.assertEqual(full.template_out, tg_to_sheets.FORMAT_TEXT)
+
+
+class _ExcludedSheet:
+    def __init__(self, values):
+        self.values = values
+        self.full_reads = 0
+        self.probes = 0
+
+    def get_all_values(self):
+        self.full_reads += 1
+        return [list(row) for row in self.values]
+
+    def get(self, range_name):
+        self.probes += 1
+        return [list(row[:2]) for row in self.values]
+
+
+class ExclusionCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.ws = _ExcludedSheet([["peer_id", "username", "name"], ["10", "@Bob", "Bob"]])
+        self.sh = SimpleNamespace(worksheet=lambda name: self.ws)
+
+    def test_exclusions_are_reused_while_key_columns_are_unchanged(self):
+        cache = {}
+        self.assertEqual(load_exclusions_cached(self.sh, "Excluded", cache), ({10}, {"bob"}))
+        self.ws.values[1][2] = "Bob renamed"
+        self.assertEqual(load_exclusions_cached(self.sh, "Excluded", cache), ({10}, {"bob"}))
+        self.assertEqual(self.ws.full_reads, 1)
+        self.ws.values.append(["11", "", ""])
+        self.assertEqual(load_exclusions_cached(self.sh, "Excluded", cache), ({10, 11}, {"bob"}))
+        self.assertEqual(self.ws.full_reads, 2)
+
+    def test_own_appends_are_merged_without_a_download(self):
+        cache = {}
+        load_exclusions_cached(self.sh, "Excluded", cache)
+        self.ws.values.append(["12", "@carol", "Carol"])
+        absorb_own_exclusions(self.sh, "Excluded", cache, [(12, "carol")])
+        self.assertEqual(load_exclusions_cached(self.sh, "Excluded", cache), ({10, 12}, {"bob", "carol"}))
+        self.assertEqual(self.ws.full_reads, 1)
+
+    def test_manual_edit_during_the_run_is_not_hidden(self):
+        cache = {}
+        load_exclusions_cached(self.sh, "Excluded", cache)
+        self.ws.values.append(["12", "@carol", "Carol"])
+        self.ws.values.append(["13", "", "manual"])
+        absorb_own_exclusions(self.sh, "Excluded", cache, [(12, "carol")])
+        self.assertEqual(load_exclusions_cached(self.sh, "Excluded", cache), ({10, 12, 13}, {"bob", "carol"}))
+        self.assertEqual(self.ws.full_reads, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,10 @@
-import json
 import os
-import socket
-import time
-import uuid
+import json
+import hashlib
+from dataclasses import asdict, dataclass, fields
 from datetime import datetime, date
 from zoneinfo import ZoneInfo
-from typing import Optional, Tuple, List, Set
+from typing import Any, Dict, Optional, Tuple, List, Set
 
 # Legacy module: manual sheet update/exclusion flows are preserved for compatibility,
 # but runtime auto-reply now writes directly via auto_reply.py to the active monthly leads sheet model.
@@ -26,6 +25,8 @@ import gspread
 from google.oauth2.service_account import Credentials
 from gspread.exceptions import WorksheetNotFound
 
+from file_lock import acquire_lock, release_lock
+
 
 RU_MONTHS = {
     1: "Январь",
@@ -135,6 +136,10 @@ CONFIRM_TEXT = "Дякую.\nПередаю Вас тімліду на наст
 REFERRAL_TEXT = "Також хочу повідомити, що в нашій компанії діє реферальна програма 💰."
 
 STATUS_RULES_WORKSHEET = os.environ.get("STATUS_RULES_WORKSHEET", "StatusRules")
+LEGACY_SCAN_STATE_PATH = os.environ.get("LEGACY_SCAN_STATE_PATH", "/opt/tg_leads/.legacy_scan_state.json")
+# peer_id and username, the only Excluded columns the exclusion lookups use.
+EXCLUSIONS_PROBE_RANGE = "A1:B"
+SCAN_HISTORY_LIMIT = 40
 STATUS_RULES_HEADERS = ["template", "status"]
 
 DEFAULT_STATUS_RULES = [
@@ -329,6 +334,173 @@ def load_exclusions(sh, worksheet_name: str) -> Tuple[Set[int], Set[str]]:
     return peer_ids, usernames
 
 
+def probe_exclusions(sh, worksheet_name: str) -> Optional[List[List[str]]]:
+    """Key columns (peer_id, username) of the exclusions sheet in one narrow read.
+
+    Their hash is the sheet's change token: unlike the spreadsheet's `modifiedTime`
+    it does not move when other worksheets of the same spreadsheet are written.
+    """
+    try:
+        ws = sh.worksheet(worksheet_name)
+        return [[str(cell or "") for cell in row] for row in (ws.get(EXCLUSIONS_PROBE_RANGE) or [])]
+    except Exception:
+        return None
+
+
+def exclusions_token(probe: Optional[List[List[str]]]) -> str:
+    if probe is None:
+        return ""
+    return hashlib.sha1(json.dumps(probe, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def load_exclusions_cached(sh, worksheet_name: str, cache: Dict[str, Any]) -> Tuple[Set[int], Set[str]]:
+    """`load_exclusions` that reuses the local copy while the key columns of the
+    sheet are unchanged; without a probe it always downloads."""
+    probe = probe_exclusions(sh, worksheet_name)
+    token = exclusions_token(probe)
+    entry = cache.get(worksheet_name)
+    if token and isinstance(entry, dict) and entry.get("token") == token:
+        return {int(x) for x in entry.get("peer_ids", [])}, set(entry.get("usernames", []))
+    peer_ids, usernames = load_exclusions(sh, worksheet_name)
+    remember_exclusions(worksheet_name, cache, peer_ids, usernames, token=token, rows=len(probe or []))
+    return peer_ids, usernames
+
+
+def remember_exclusions(
+    worksheet_name: str,
+    cache: Dict[str, Any],
+    peer_ids: Set[int],
+    usernames: Set[str],
+    token: str,
+    rows: int,
+) -> None:
+    """Cache a download of the sheet under the token probed *before* that download."""
+    if not token:
+        cache.pop(worksheet_name, None)
+        return
+    cache[worksheet_name] = {
+        "token": token,
+        "rows": int(rows),
+        "peer_ids": sorted(peer_ids),
+        "usernames": sorted(usernames),
+    }
+
+
+def absorb_own_exclusions(
+    sh,
+    worksheet_name: str,
+    cache: Dict[str, Any],
+    added: List[Tuple[Optional[int], Optional[str]]],
+) -> None:
+    """Merge rows this run appended into the cached copy without downloading the sheet.
+
+    The key columns are probed again: the cache is kept only if the rows it was built
+    from are untouched and every new row is one of `added`, so a manual edit made to
+    the sheet during the run still forces the next run to download it.
+    """
+    entry = cache.get(worksheet_name)
+    if not isinstance(entry, dict) or "rows" not in entry:
+        cache.pop(worksheet_name, None)
+        return
+    probe = probe_exclusions(sh, worksheet_name)
+    known_rows = int(entry["rows"])
+    if probe is None or exclusions_token(probe[:known_rows]) != entry.get("token"):
+        cache.pop(worksheet_name, None)
+        return
+    added_ids = {peer_id for peer_id, _ in added if peer_id is not None}
+    added_usernames = {normalize_username(uname) for _, uname in added if uname}
+    peer_ids = {int(x) for x in entry.get("peer_ids", [])}
+    usernames = set(entry.get("usernames", []))
+    for row in probe[known_rows:]:
+        raw_id = row[0].strip() if row else ""
+        uname = normalize_username(row[1]) if len(row) > 1 else ""
+        ours = (raw_id.isdigit() and int(raw_id) in added_ids) or (not raw_id and uname in added_usernames)
+        if not ours or (not raw_id and not uname):
+            cache.pop(worksheet_name, None)
+            return
+        if raw_id:
+            peer_ids.add(int(raw_id))
+        if uname:
+            usernames.add(uname)
+    remember_exclusions(worksheet_name, cache, peer_ids, usernames, token=exclusions_token(probe), rows=len(probe))
+
+
+@dataclass
+class PeerScanState:
+    """Status inputs of one dialog folded from its messages, oldest to newest.
+
+    `last_id` is the newest message already folded in, so the next scan only asks
+    Telegram for messages above it.
+    """
+
+    last_id: int = 0
+    last_in: str = ""
+    last_out: str = ""
+    template_out: str = ""
+    last_msg_from_me: Optional[bool] = None
+    consecutive_out: int = 0
+    has_referral_template: bool = False
+
+    def apply(self, msg_id: int, text: Optional[str], out: bool) -> None:
+        self.last_id = max(self.last_id, int(msg_id))
+        if not text:
+            return
+        self.last_msg_from_me = bool(out)
+        if out:
+            self.consecutive_out += 1
+            self.last_out = text
+            if is_script_template(text):
+                self.template_out = text
+            if normalize_text(REFERRAL_TEXT) in normalize_text(text):
+                self.has_referral_template = True
+        else:
+            self.consecutive_out = 0
+            self.last_in = text
+
+    @classmethod
+    def from_dict(cls, raw: Any) -> "PeerScanState":
+        if not isinstance(raw, dict):
+            return cls()
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in raw.items() if k in names})
+
+
+def load_scan_state(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_scan_state(path: str, state: Dict[str, Any]) -> None:
+    base_dir = os.path.dirname(path)
+    if base_dir:
+        os.makedirs(base_dir, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+async def scan_peer(client, entity, state: Optional[PeerScanState], top_id: int) -> PeerScanState:
+    """Fold messages newer than `state.last_id` into the dialog state.
+
+    Without a cursor, or when more than `SCAN_HISTORY_LIMIT` new messages arrived, the
+    state is rebuilt from the latest `SCAN_HISTORY_LIMIT` messages as before.
+    """
+    if state is not None and top_id and top_id <= state.last_id:
+        return state
+    min_id = state.last_id if state is not None else 0
+    fetched = [m async for m in client.iter_messages(entity, limit=SCAN_HISTORY_LIMIT, min_id=min_id)]
+    if state is None or len(fetched) >= SCAN_HISTORY_LIMIT:
+        state = PeerScanState()
+    for m in reversed(fetched):
+        state.apply(m.id, m.message, bool(m.out))
+    return state
+
+
 def add_exclusion_entry(
     peer_id: Optional[int],
     username: Optional[str],
@@ -418,75 +590,6 @@ def add_exclusion_entries_bulk(entries: List[Tuple[Optional[int], Optional[str],
     return len(rows)
 
 
-def _read_lock_meta(lock_path: str) -> dict:
-    try:
-        with open(lock_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        if isinstance(data, dict):
-            return data
-    except Exception:
-        pass
-    return {}
-
-
-def _is_lock_stale(lock_path: str, ttl_sec: int) -> bool:
-    ttl = max(1, int(ttl_sec or 0))
-    now = time.time()
-    meta = _read_lock_meta(lock_path)
-    created_at = meta.get("created_at")
-    if isinstance(created_at, (int, float)) and (now - float(created_at)) >= ttl:
-        return True
-    try:
-        return (now - os.path.getmtime(lock_path)) >= ttl
-    except Exception:
-        return True
-
-
-def _try_create_lock_file(lock_path: str, payload: dict) -> bool:
-    flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY
-    fd = os.open(lock_path, flags, 0o644)
-    try:
-        data = json.dumps(payload, ensure_ascii=True)
-        os.write(fd, data.encode("utf-8"))
-        os.fsync(fd)
-    finally:
-        os.close(fd)
-    return True
-
-
-def acquire_lock(lock_path: str, ttl_sec: int = 300) -> bool:
-    now = time.time()
-    payload = {
-        "pid": os.getpid(),
-        "host": socket.gethostname(),
-        "token": str(uuid.uuid4()),
-        "created_at": now,
-    }
-    for _ in range(2):
-        try:
-            return _try_create_lock_file(lock_path, payload)
-        except FileExistsError:
-            if not _is_lock_stale(lock_path, ttl_sec):
-                return False
-            try:
-                os.remove(lock_path)
-            except FileNotFoundError:
-                continue
-            except Exception:
-                return False
-        except Exception:
-            return False
-    return False
-
-
-def release_lock(lock_path: str):
-    try:
-        if os.path.exists(lock_path):
-            os.remove(lock_path)
-    except Exception:
-        pass
-
-
 async def update_google_sheet(
     target_date: Optional[date] = None,
     worksheet_override: Optional[str] = None,
@@ -523,9 +626,11 @@ async def update_google_sheet(
     else:
         ensure_headers(ws, headers)
 
-    excluded_ids, excluded_usernames = load_exclusions(
-        sh, os.environ.get("EXCLUDED_WORKSHEET", "Excluded")
-    )
+    excluded_worksheet = os.environ.get("EXCLUDED_WORKSHEET", "Excluded")
+    scan_state = load_scan_state(LEGACY_SCAN_STATE_PATH)
+    exclusions_cache = scan_state.setdefault("exclusions", {}).setdefault(sheet_name, {})
+    peer_states = scan_state.setdefault("peers", {}).setdefault(session_file, {})
+    excluded_ids, excluded_usernames = load_exclusions_cached(sh, excluded_worksheet, exclusions_cache)
     status_rules = load_status_rules(sh)
 
     if not acquire_lock(session_lock, ttl_sec=300):
@@ -568,40 +673,16 @@ async def update_google_sheet(
 
         chat_link = build_chat_link_app(entity, peer_id)
 
-        last_in = ""
-        last_out = ""
-        template_out = ""
-        last_msg_from_me: Optional[bool] = None
-        has_referral_template = False
-        saw_incoming_no_question = False
-        consecutive_out = 0
-        counting_consecutive_out = True
-        async for m in client.iter_messages(entity, limit=40):
-            if not m.message:
-                continue
-            if last_msg_from_me is None:
-                last_msg_from_me = m.out
-            if counting_consecutive_out:
-                if m.out:
-                    consecutive_out += 1
-                else:
-                    counting_consecutive_out = False
-
-            if not m.out and not saw_incoming_no_question:
-                if "?" not in m.message:
-                    saw_incoming_no_question = True
-
-            if m.out and not last_out:
-                last_out = m.message
-            if not m.out and not last_in:
-                last_in = m.message
-            if m.out and not template_out and is_script_template(m.message):
-                template_out = m.message
-            if m.out and not has_referral_template:
-                if normalize_text(REFERRAL_TEXT) in normalize_text(m.message):
-                    has_referral_template = True
-            if last_in and last_out and template_out and not counting_consecutive_out:
-                break
+        state = await scan_peer(
+            client,
+            entity,
+            PeerScanState.from_dict(peer_states[str(peer_id)]) if str(peer_id) in peer_states else None,
+            int(getattr(last_msg, "id", 0) or 0),
+        )
+        peer_states[str(peer_id)] = asdict(state)
+        last_in = state.last_in
+        last_out = state.last_out
+        template_out = state.template_out
 
         if not template_out:
             exclusions.append(
@@ -611,13 +692,13 @@ async def update_google_sheet(
         if not last_in and not last_out:
             continue
 
-        if has_referral_template:
+        if state.has_referral_template:
             status = "🎁 Реферал"
         else:
             status = classify_status(
                 template_out,
-                last_msg_from_me,
-                consecutive_out,
+                state.last_msg_from_me,
+                state.consecutive_out,
                 status_rules,
                 last_in,
             )
@@ -638,6 +719,12 @@ async def update_google_sheet(
 
     if exclusions:
         add_exclusion_entries_bulk(exclusions)
+        excluded_ids.update(peer_id for peer_id, *_ in exclusions)
+        excluded_usernames.update(uname for _, uname, *_ in exclusions if uname)
+        absorb_own_exclusions(
+            sh, excluded_worksheet, exclusions_cache, [(peer_id, uname) for peer_id, uname, *_ in exclusions]
+        )
+    save_scan_state(LEGACY_SCAN_STATE_PATH, scan_state)
 
     await client.disconnect()
     release_lock(session_lock)
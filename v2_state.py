@@ -7,6 +7,7 @@ import uuid
 from dataclasses import asdict, fields
 from typing import Dict, Iterable, Set
 
+from file_lock import FileLock
 from flow_engine import PeerRuntimeState, canonical_checkpoint_name, canonical_step_name
 
 
@@ -16,42 +17,6 @@ class V2EnrollmentStore:
         self.lock_path = f"{path}.lock" if path else ""
         self.data = self._load()
 
-    def _acquire_lock(self, timeout_sec: float = 2.0, stale_sec: float = 10.0) -> bool:
-        if not self.lock_path:
-            return True
-        deadline = time.time() + max(0.1, float(timeout_sec or 0))
-        payload = f"{os.getpid()}:{time.time():.6f}"
-        while time.time() < deadline:
-            try:
-                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
-                try:
-                    os.write(fd, payload.encode("utf-8"))
-                finally:
-                    os.close(fd)
-                return True
-            except FileExistsError:
-                try:
-                    age = time.time() - os.path.getmtime(self.lock_path)
-                    if age >= max(1.0, float(stale_sec or 0)):
-                        os.remove(self.lock_path)
-                        continue
-                except Exception:
-                    pass
-                time.sleep(0.02)
-            except Exception:
-                return False
-        return False
-
-    def _release_lock(self):
-        if not self.lock_path:
-            return
-        try:
-            os.remove(self.lock_path)
-        except FileNotFoundError:
-            pass
-        except OSError:
-            pass
-
     def _load(self) -> Set[int]:
         if not self.path or not os.path.exists(self.path):
             return set()
@@ -74,7 +39,8 @@ class V2EnrollmentStore:
         base = os.path.dirname(self.path)
         if base:
             os.makedirs(base, exist_ok=True)
-        if not self._acquire_lock():
+        lock = FileLock(self.lock_path)
+        if not lock.acquire(timeout_sec=2.0):
             return
         try:
             tmp_path = f"{self.path}.tmp.{os.getpid()}.{int(time.time() * 1000)}.{uuid.uuid4().hex}"
@@ -82,7 +48,7 @@ class V2EnrollmentStore:
                 json.dump(sorted(self.data), f, ensure_ascii=True)
             os.replace(tmp_path, self.path)
         finally:
-            self._release_lock()
+            lock.release()
 
     def has(self, peer_id: int) -> bool:
         return int(peer_id) in self.data
@@ -109,42 +75,6 @@ class V2RuntimeStore:
         self.data: Dict[str, dict] = self._load()
         self._state_field_names = {f.name for f in fields(PeerRuntimeState)}
 
-    def _acquire_lock(self, timeout_sec: float = 2.0, stale_sec: float = 10.0) -> bool:
-        if not self.lock_path:
-            return True
-        deadline = time.time() + max(0.1, float(timeout_sec or 0))
-        payload = f"{os.getpid()}:{time.time():.6f}"
-        while time.time() < deadline:
-            try:
-                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
-                try:
-                    os.write(fd, payload.encode("utf-8"))
-                finally:
-                    os.close(fd)
-                return True
-            except FileExistsError:
-                try:
-                    age = time.time() - os.path.getmtime(self.lock_path)
-                    if age >= max(1.0, float(stale_sec or 0)):
-                        os.remove(self.lock_path)
-                        continue
-                except Exception:
-                    pass
-                time.sleep(0.02)
-            except Exception:
-                return False
-        return False
-
-    def _release_lock(self):
-        if not self.lock_path:
-            return
-        try:
-            os.remove(self.lock_path)
-        except FileNotFoundError:
-            pass
-        except OSError:
-            pass
-
     def _load(self) -> Dict[str, dict]:
         if not self.path or not os.path.exists(self.path):
             return {}
@@ -159,7 +89,8 @@ class V2RuntimeStore:
         base = os.path.dirname(self.path)
         if base:
             os.makedirs(base, exist_ok=True)
-        if not self._acquire_lock():
+        lock = FileLock(self.lock_path)
+        if not lock.acquire(timeout_sec=2.0):
             return
         try:
             tmp_path = f"{self.path}.tmp.{os.getpid()}.{int(time.time() * 1000)}.{uuid.uuid4().hex}"
@@ -167,7 +98,7 @@ class V2RuntimeStore:
                 json.dump(self.data, f, ensure_ascii=True)
             os.replace(tmp_path, self.path)
         finally:
-            self._release_lock()
+            lock.release()
 
     def get(self, peer_id: int) -> PeerRuntimeState:
         key = str(int(peer_id))